@@ -0,0 +1,226 @@
+# backend/app/admision.py
+# Control de admisión: cuando muchos cobradores sincronizan a la vez, las escrituras se apilan sobre
+# el único escritor de SQLite y vencen juntas. Este middleware las ordena ANTES de tomar un hilo:
+# - Escrituras (POST/PUT/PATCH/DELETE): un cupo por grupo de endpoint (pago, abono, crear_prestamo,
+#   lote, otras) y uno global. Quien no tiene cupo espera en una cola FIFO acotada
+#   (ADMISION_COLA_MAX) a lo sumo ADMISION_ESPERA_MS; cola llena o espera agotada -> 503 + Retry-After.
+# - Lecturas: cupo propio (ADMISION_LECTURAS_MAX) y cola propia, así nunca esperan detrás de
+#   escrituras encoladas. El pool de hilos de AnyIO se agranda para que cupos de lectura + escritura
+#   siempre tengan hilo (ajustar_hilos, al arrancar).
+# - Pagos y abonos con commit agrupado (app.agrupador): no toman el cupo global; los aplica un solo
+#   hilo escritor, así que su grupo admite más en paralelo (lo que espera se junta en el mismo commit).
+# - Exentas: /health (el balanceador debe ver el estado real), /metrics, /mantenimiento, /debug.
+# - Métricas: admission_* en /metrics; estado de cada cupo en GET /mantenimiento/admision.
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app import agrupador, metrics
+
+log = logging.getLogger("admision")
+
+
+def _flag(name: str, default: str = "") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+
+
+ACTIVA = _flag("ADMISION", "on")
+ESPERA_S = float(os.getenv("ADMISION_ESPERA_MS", "2000")) / 1000.0
+COLA_MAX = int(os.getenv("ADMISION_COLA_MAX", "64"))
+ESCRITURAS_MAX = int(os.getenv("ADMISION_ESCRITURAS_MAX", "4"))
+LECTURAS_MAX = int(os.getenv("ADMISION_LECTURAS_MAX", "32"))
+LECTURAS_COLA_MAX = int(os.getenv("ADMISION_LECTURAS_COLA_MAX", "256"))
+RETRY_AFTER_S = os.getenv("ADMISION_RETRY_AFTER_S", "1")
+EXENTAS = tuple(p.strip() for p in os.getenv("ADMISION_EXENTAS", "/health,/metrics,/mantenimiento,/debug").split(",")
+                if p.strip())
+METODOS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Grupos que pasan por el escritor agrupado (sin cupo global)
+AGRUPADOS = {"pago", "abono"} if agrupador.ACTIVO else set()
+_CUPO_AGRUPADO = 16
+
+# Grupos de escritura: (nombre, patrón de ruta, cupo por defecto; ADMISION_<NOMBRE>_MAX lo cambia)
+GRUPOS: List[Tuple[str, "re.Pattern[str]", int]] = [
+    (nombre, re.compile(patron), int(os.getenv(f"ADMISION_{nombre.upper()}_MAX", str(cupo))))
+    for nombre, patron, cupo in (
+        ("pago", r"^/cuotas/\d+/pago/?$", _CUPO_AGRUPADO if "pago" in AGRUPADOS else 2),
+        ("abono", r"^/cuotas/\d+/abono-capital/?$", _CUPO_AGRUPADO if "abono" in AGRUPADOS else 2),
+        ("crear_prestamo", r"^/prestamos(/manual)?/?$", 1),
+        ("lote", r"^/cuotas/lote/?$", 1),
+    )
+]
+OTRAS_MAX = int(os.getenv("ADMISION_OTRAS_MAX", "2"))
+
+
+# ------------------ cupos ------------------
+
+class _Espera:
+    __slots__ = ("loop", "fut", "asignado")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.fut = loop.create_future()
+        self.asignado = False
+
+
+def _despertar(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class Cupo:
+    """
+    Semáforo FIFO con cola acotada. El cupo se pasa directo al primero de la cola (asignado=True),
+    así nadie se cuela. Sirve a varios event loops (TestClient abre uno por petición).
+    """
+
+    def __init__(self, nombre: str, limite: int, cola_max: int):
+        self.nombre = nombre
+        self.limite = max(limite, 1)
+        self.cola_max = cola_max
+        self.en_uso = 0
+        self._cola: Deque[_Espera] = deque()
+        self._lock = threading.Lock()
+
+    def _publicar(self) -> None:
+        metrics.ADMISION_EN_CURSO.set(self.nombre, valor=self.en_uso)
+        metrics.ADMISION_EN_COLA.set(self.nombre, valor=len(self._cola))
+
+    async def tomar(self, espera_s: float) -> Optional[str]:
+        """None si obtuvo el cupo; si no, el motivo del rechazo ('cola_llena' o 'espera')."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.en_uso < self.limite and not self._cola:
+                self.en_uso += 1
+                self._publicar()
+                return None
+            if len(self._cola) >= self.cola_max or espera_s <= 0:
+                return "cola_llena" if len(self._cola) >= self.cola_max else "espera"
+            e = _Espera(loop)
+            self._cola.append(e)
+            self._publicar()
+        try:
+            await asyncio.wait_for(e.fut, espera_s)
+            return None
+        except BaseException as exc:  # TimeoutError o cancelación (el cliente se fue)
+            with self._lock:
+                if not e.asignado:
+                    self._cola.remove(e)
+                    self._publicar()
+            if e.asignado:  # el cupo llegó justo al vencer
+                if isinstance(exc, asyncio.TimeoutError):
+                    return None
+                self.soltar()
+            if isinstance(exc, asyncio.TimeoutError):
+                return "espera"
+            raise
+
+    def soltar(self) -> None:
+        while True:
+            with self._lock:
+                if not self._cola:
+                    self.en_uso -= 1
+                    self._publicar()
+                    return
+                e = self._cola.popleft()
+                e.asignado = True  # en_uso no cambia: el cupo pasa al siguiente
+                self._publicar()
+            try:
+                e.loop.call_soon_threadsafe(_despertar, e.fut)
+                return
+            except RuntimeError:  # su event loop ya cerró: el cupo pasa al que sigue
+                continue
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"limite": self.limite, "en_uso": self.en_uso, "en_cola": len(self._cola),
+                    "cola_max": self.cola_max}
+
+
+_ESCRITURAS = Cupo("escrituras", ESCRITURAS_MAX, COLA_MAX)
+_LECTURAS = Cupo("lecturas", LECTURAS_MAX, LECTURAS_COLA_MAX)
+_POR_GRUPO: Dict[str, Cupo] = {nombre: Cupo(nombre, cupo, COLA_MAX) for nombre, _, cupo in GRUPOS}
+_POR_GRUPO["otras"] = Cupo("otras", OTRAS_MAX, COLA_MAX)
+
+
+def _clasificar(metodo: str, ruta: str) -> Tuple[str, List[Cupo]]:
+    """Grupo de la petición y los cupos a tomar, en orden (siempre el del grupo antes que el global)."""
+    if metodo not in METODOS:
+        return "lecturas", [_LECTURAS]
+    grupo = next((nombre for nombre, patron, _ in GRUPOS if patron.match(ruta)), "otras")
+    if grupo in AGRUPADOS:
+        return grupo, [_POR_GRUPO[grupo]]
+    return grupo, [_POR_GRUPO[grupo], _ESCRITURAS]
+
+
+def estado() -> Dict[str, Any]:
+    return {
+        "activa": ACTIVA,
+        "espera_max_ms": round(ESPERA_S * 1000.0),
+        "sin_cupo_global": sorted(AGRUPADOS),
+        "commit_agrupado": agrupador.estado(),
+        "exentas": list(EXENTAS),
+        "cupos": {c.nombre: c.estado() for c in [_LECTURAS, _ESCRITURAS, *_POR_GRUPO.values()]},
+    }
+
+
+def ajustar_hilos() -> None:
+    """Hilos de AnyIO suficientes para todos los cupos (los endpoints síncronos corren en ese pool)."""
+    try:
+        import anyio.to_thread
+
+        limitador = anyio.to_thread.current_default_thread_limiter()
+        necesarios = LECTURAS_MAX + ESCRITURAS_MAX + 4  # margen: tareas en segundo plano, exentas
+        necesarios += sum(cupo for nombre, _, cupo in GRUPOS if nombre in AGRUPADOS)
+        if limitador.total_tokens < necesarios:
+            limitador.total_tokens = necesarios
+    except Exception as e:
+        log.warning("No se pudo ajustar el pool de hilos: %s", e)
+
+
+# ------------------ middleware ------------------
+
+async def _rechazar(send, grupo: str, motivo: str) -> None:
+    metrics.ADMISION_RECHAZOS.inc(grupo, motivo)
+    cuerpo = json.dumps({"detail": "Servidor ocupado; reintente en unos segundos"}).encode()
+    await send({"type": "http.response.start", "status": 503, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode()),
+        (b"retry-after", RETRY_AFTER_S.encode()),
+    ]})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+class AdmisionMiddleware:
+    """ASGI: toma los cupos de la petición (grupo + global, o lecturas) antes de pasarla a la app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ACTIVA or scope["path"].startswith(EXENTAS):
+            await self.app(scope, receive, send)
+            return
+
+        grupo, cupos = _clasificar(scope["method"], scope["path"])
+        t0 = time.perf_counter()
+        tomados: List[Cupo] = []
+        try:
+            for cupo in cupos:
+                motivo = await cupo.tomar(ESPERA_S - (time.perf_counter() - t0))
+                if motivo:
+                    await _rechazar(send, grupo, motivo)
+                    return
+                tomados.append(cupo)
+            metrics.ADMISION_ESPERA.observe(time.perf_counter() - t0, grupo)
+            await self.app(scope, receive, send)
+        finally:
+            for cupo in reversed(tomados):
+                cupo.soltar()
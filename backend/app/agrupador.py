@@ -0,0 +1,233 @@
+# backend/app/agrupador.py
+# Commit agrupado (group commit) de pagos y abonos: cada posteo suelto era una transacción con su
+# propio commit, y con synchronous=FULL cada commit es un fsync del WAL.
+# - registrar_pago y registrar_abono_capital encolan su mutación (fn(conn)) y esperan; un único hilo
+#   escritor por proceso toma lo encolado y lo aplica en UNA transacción (BEGIN IMMEDIATE), cada
+#   operación en su propio SAVEPOINT, y confirma una sola vez.
+# - Lote: lo que llega durante COMMIT_AGRUPADO_VENTANA_MS desde la primera operación, o antes si se
+#   juntan COMMIT_AGRUPADO_MAX_OPS. Mientras un lote confirma, lo nuevo se acumula para el siguiente.
+#   La ventana solo se espera con concurrencia (lote anterior de más de una operación o cola no
+#   vacía): sin ella, un posteo suelto se confirma enseguida como antes.
+# - Cada llamador recibe SU resultado o SU error recién después del commit: si una operación falla
+#   se revierte solo su SAVEPOINT; si falla el BEGIN o el commit, todas las del lote reciben el error.
+# - La operación corre con el contexto (contextvars) del llamador: las sentencias siguen contando
+#   en las métricas y la traza SQL de su petición.
+# - Con shards (DB_SHARDS) un lote se parte por archivo: un commit por shard presente en el lote.
+# - El llamador espera su resultado a lo sumo COMMIT_AGRUPADO_ESPERA_S (default 30): si el escritor se
+#   traba (p.ej. un BEGIN IMMEDIATE colgado en un disco lento) responde 503 con Retry-After en vez de
+#   agotar el threadpool. La operación puede confirmarse igual después: el cliente resuelve el
+#   resultado reintentando con su Idempotency-Key.
+# - COMMIT_AGRUPADO=off vuelve a una transacción por llamada (mismo fn, misma semántica).
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as EsperaAgotada
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+
+from app import deps, idempotencia, metrics, sqltrace
+
+log = logging.getLogger("agrupador")
+
+T = TypeVar("T")
+
+
+def _flag(name: str, default: str = "") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+
+
+ACTIVO = _flag("COMMIT_AGRUPADO", "on")
+VENTANA_S = float(os.getenv("COMMIT_AGRUPADO_VENTANA_MS", "1")) / 1000.0
+MAX_OPS = max(int(os.getenv("COMMIT_AGRUPADO_MAX_OPS", "64")), 1)
+ESPERA_S = float(os.getenv("COMMIT_AGRUPADO_ESPERA_S", "30"))
+
+
+class _Operacion:
+    __slots__ = ("fn", "respuesta", "ctx", "fut", "t0", "shard")
+
+    def __init__(self, fn: Callable[[Any], Any], respuesta: Callable[[Any], Any]):
+        self.fn = fn
+        self.respuesta = respuesta
+        self.ctx = contextvars.copy_context()
+        self.shard = deps.shard_actual()
+        self.fut: Future = Future()
+        self.t0 = time.perf_counter()
+
+
+_FIN = None  # centinela: el hilo termina lo encolado antes y sale
+
+_cola: "queue.Queue[Optional[_Operacion]]" = queue.Queue()
+_hilo: Optional[threading.Thread] = None
+_hilo_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+# ------------------ hilo escritor ------------------
+
+def _juntar(primera: _Operacion, esperar: bool) -> Tuple[List[_Operacion], bool]:
+    """
+    Lote que empieza en 'primera'; True si apareció el centinela (hay que salir tras aplicarlo).
+    Sin 'esperar' solo toma lo ya encolado: un llamador solo no paga la ventana.
+    """
+    lote = [primera]
+    limite = time.monotonic() + (VENTANA_S if esperar else 0.0)
+    while len(lote) < MAX_OPS:
+        resto = limite - time.monotonic()
+        try:
+            op = _cola.get(timeout=resto) if resto > 0 else _cola.get_nowait()
+        except queue.Empty:
+            break
+        if op is _FIN:
+            return lote, True
+        lote.append(op)
+    return lote, False
+
+
+def _correr(op: _Operacion, conn) -> Any:
+    """
+    fn del llamador (ya dentro de su contexto) con su traza SQL, si la tiene, enganchada a la conexión.
+    Con Idempotency-Key su respuesta se guarda en el mismo SAVEPOINT (se confirma junto con el lote).
+    """
+    traza = sqltrace.traza_actual()
+    if traza is not None:
+        traza.instalar(conn)
+    try:
+        res = op.fn(conn)
+        idempotencia.registrar(conn, op.respuesta(res))
+        return res
+    finally:
+        if traza is not None:
+            conn.set_trace_callback(None)
+            conn.set_progress_handler(None, 0)
+
+
+def _aplicar(lote: List[_Operacion]) -> None:
+    resultados: List[Tuple[_Operacion, Any, Optional[BaseException]]] = []
+    try:
+        with deps.get_conn() as conn:
+            deps.begin_immediate(conn)
+            try:
+                for op in lote:
+                    conn.execute("SAVEPOINT op")
+                    try:
+                        res = op.ctx.run(_correr, op, conn)
+                    except Exception as e:  # solo esta operación se revierte
+                        conn.execute("ROLLBACK TO SAVEPOINT op")
+                        conn.execute("RELEASE SAVEPOINT op")
+                        resultados.append((op, None, e))
+                    else:
+                        conn.execute("RELEASE SAVEPOINT op")
+                        resultados.append((op, res, None))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    except Exception as e:  # BEGIN, SAVEPOINT o commit: nada del lote quedó escrito
+        metrics.COMMIT_AGRUPADO_COMMITS.inc("error")
+        log.warning("Falló el commit agrupado de %s operaciones: %s", len(lote), e)
+        for op in lote:
+            op.fut.set_exception(e)
+        return
+
+    metrics.COMMIT_AGRUPADO_COMMITS.inc("ok")
+    metrics.COMMIT_AGRUPADO_LOTE.observe(len(lote))
+    fin = time.perf_counter()
+    for op, res, error in resultados:
+        metrics.COMMIT_AGRUPADO_ESPERA.observe(fin - op.t0)
+        if error is not None:
+            op.fut.set_exception(error)
+        else:
+            op.fut.set_result(res)
+
+
+def _loop() -> None:
+    salir = False
+    acompanado = False  # el lote anterior tuvo más de una operación: hay concurrencia, vale esperar
+    while not salir:
+        primera = _cola.get()
+        if primera is _FIN:
+            break
+        lote, salir = _juntar(primera, acompanado or not _cola.empty())
+        acompanado = len(lote) > 1
+        metrics.COMMIT_AGRUPADO_COLA.set(valor=_cola.qsize())
+        por_shard: Dict[Optional[str], List[_Operacion]] = {}
+        for op in lote:
+            por_shard.setdefault(op.shard, []).append(op)
+        for shard, ops in por_shard.items():
+            try:
+                with deps.en_shard(shard):
+                    _aplicar(ops)
+            except BaseException as e:  # el hilo no debe morir con llamadores esperando
+                log.exception("Error inesperado en el escritor agrupado")
+                for op in ops:
+                    if not op.fut.done():
+                        op.fut.set_exception(e)
+
+
+def _asegurar_hilo() -> None:
+    """Arranca el escritor de este proceso (también tras un fork: los hilos no se heredan)."""
+    global _hilo, _hilo_pid
+    if _hilo is not None and _hilo_pid == os.getpid() and _hilo.is_alive():
+        return
+    with _lock:
+        if _hilo is not None and _hilo_pid == os.getpid() and _hilo.is_alive():
+            return
+        _hilo = threading.Thread(target=_loop, name="commit-agrupado", daemon=True)
+        _hilo_pid = os.getpid()
+        _hilo.start()
+
+
+# ------------------ API ------------------
+
+def _identidad(res: Any) -> Any:
+    return res
+
+
+def ejecutar(fn: Callable[[Any], T], respuesta: Callable[[T], Any] = _identidad) -> T:
+    """
+    Aplica fn(conn) (SIN commit propio) y devuelve su resultado cuando la transacción que lo
+    contiene ya confirmó; si fn lanza, se relanza aquí tras revertir solo su parte.
+    'respuesta' arma, a partir del resultado, el cuerpo que el endpoint va a devolver (lo que se
+    guarda para la Idempotency-Key dentro de la misma transacción).
+    """
+    if not ACTIVO:
+        with deps.get_conn() as conn, deps.escritura(conn):
+            res = fn(conn)
+            idempotencia.registrar(conn, respuesta(res))
+            return res
+    op = _Operacion(fn, respuesta)
+    _asegurar_hilo()
+    _cola.put(op)
+    try:
+        return op.fut.result(timeout=ESPERA_S)
+    except EsperaAgotada:
+        # No se cancela: si el escritor se destraba, la operación se confirma con su lote
+        idempotencia.marcar_pendiente()
+        metrics.COMMIT_AGRUPADO_ESPERAS_AGOTADAS.inc()
+        log.warning("Sin respuesta del escritor agrupado tras %.1f s (%s en cola)", ESPERA_S, _cola.qsize())
+        raise HTTPException(
+            status_code=503,
+            detail="Escritura sin confirmar todavía; reintente con la misma Idempotency-Key para conocer el resultado",
+            headers={"Retry-After": "1"},
+        )
+
+
+def detener() -> None:
+    """Aplica lo encolado y detiene el escritor (se llama al apagar la app)."""
+    global _hilo
+    with _lock:
+        hilo, _hilo = _hilo, None
+    if hilo is not None and hilo.is_alive():
+        _cola.put(_FIN)
+        hilo.join(timeout=10)
+
+
+def estado() -> Dict[str, Any]:
+    return {"activo": ACTIVO, "ventana_ms": VENTANA_S * 1000.0, "max_ops": MAX_OPS, "espera_s": ESPERA_S,
+            "en_cola": _cola.qsize(), "hilo_vivo": bool(_hilo and _hilo.is_alive())}
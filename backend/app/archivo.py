@@ -0,0 +1,354 @@
+# backend/app/archivo.py
+# Archivo histórico: préstamos cerrados (y sus cuotas y abonos) fuera de las tablas calientes.
+#
+#   cd backend
+#   python -m app.archivo archivar --dias 90        # mueve préstamos PAGADOS sin movimiento hace 90+ días
+#   python -m app.archivo estado
+#
+# - El archivo es otra base SQLite (DB_ARCHIVO_PATH; default: '<base>_archivo.db' junto a DB_PATH)
+#   con las mismas tablas e índices que la principal. Se adjunta con ATTACH ... AS archivo.
+#   Con shards (DB_SHARDS) cada shard tiene el suyo junto a su archivo y DB_ARCHIVO_PATH no aplica.
+# - Se archiva un préstamo cuando todas sus cuotas están PAGADAS, no queda capital pendiente y su
+#   último movimiento (pago, vencimiento o abono) es anterior a hoy - ARCHIVO_DIAS.
+#   Se mueve en lotes de ARCHIVO_LOTE préstamos, cada uno en su propia transacción de escritura.
+# - Lecturas: la cartera activa lee solo la base caliente. Con historial, la misma consulta se corre
+#   además dentro de leyendo_archivo(conn) (vistas TEMP con el nombre de cada tabla sobre el archivo)
+#   y se unen los resultados; un préstamo archivado se lee entero del archivo (usar_si_archivado).
+# - En WAL una transacción con bases adjuntas no es atómica entre archivos: si el proceso muere entre
+#   ambos commits, un préstamo puede quedar en las dos bases; la siguiente corrida lo limpia.
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from app import deps, metrics, migraciones, sentencias
+
+log = logging.getLogger("archivo")
+
+
+def _flag(name: str, default: str = "") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+
+
+RUTA = (os.getenv("DB_ARCHIVO_PATH") or "").strip()
+DIAS = int(os.getenv("ARCHIVO_DIAS", "90"))
+LOTE = int(os.getenv("ARCHIVO_LOTE", "200"))
+INTERVALO_S = float(os.getenv("ARCHIVO_INTERVALO_H", "24")) * 3600.0
+
+ALIAS = "archivo"
+TABLAS = ("prestamos", "cuotas", "abonos_capital")
+TOL = 0.005
+
+_lock = threading.Lock()  # una corrida de archivado a la vez por proceso
+
+
+def ruta() -> str:
+    if RUTA and not deps.SHARDS:
+        return RUTA
+    base, _ = os.path.splitext(os.path.abspath(deps.ruta()))
+    return f"{base}_archivo.db"
+
+
+def existe() -> bool:
+    return os.path.exists(ruta())
+
+
+def _table_exists(conn, name: str, schema: str = "main") -> bool:
+    return conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type='table' AND name=?;", (name,)
+    ).fetchone() is not None
+
+
+def _cols(conn, table: str, schema: str = "main") -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table});").fetchall()]
+
+
+def _adjunto(conn) -> bool:
+    return any(r[1] == ALIAS for r in conn.execute("PRAGMA database_list;").fetchall())
+
+
+def _adjuntar(conn) -> None:
+    if not _adjunto(conn):
+        conn.execute(f"ATTACH DATABASE ? AS {ALIAS};", (ruta(),))
+        deps.al_devolver(conn, _soltar)  # la conexión vuelve al pool como salió de él
+
+
+def _soltar(conn) -> None:
+    """Quita vistas, tabla de trabajo y ATTACH antes de que la conexión vuelva al pool de deps."""
+    _quitar_vistas(conn)
+    conn.execute("DROP TABLE IF EXISTS temp._archivar;")
+    if _adjunto(conn):
+        conn.execute(f"DETACH DATABASE {ALIAS};")
+
+
+# ------------------ lectura con historial ------------------
+
+def _vistas(conn) -> bool:
+    """
+    Vistas TEMP 'prestamos'/'cuotas'/'abonos_capital' sobre las tablas del archivo. TEMP se resuelve
+    antes que main, así que las consultas existentes leen el archivo sin reescribirse; son vistas
+    simples (SQLite las aplana y usa los índices del archivo). 'clientes' sigue en la principal.
+    """
+    if conn.in_transaction:  # ATTACH no se permite dentro de una transacción
+        conn.commit()
+    _adjuntar(conn)
+    for t in TABLAS:
+        if not _table_exists(conn, t, ALIAS):
+            continue
+        en_archivo = set(_cols(conn, t, ALIAS))
+        # Columnas agregadas a la principal después de archivar: NULL en el archivo
+        lista = ", ".join(c if c in en_archivo else f"NULL AS {c}" for c in _cols(conn, t))
+        conn.execute(f"DROP VIEW IF EXISTS temp.{t};")
+        conn.execute(f"CREATE TEMP VIEW {t} AS SELECT {lista} FROM {ALIAS}.{t};")
+    return True
+
+
+def _quitar_vistas(conn) -> None:
+    for t in TABLAS:
+        conn.execute(f"DROP VIEW IF EXISTS temp.{t};")
+
+
+@contextmanager
+def leyendo_archivo(conn):
+    """
+    Dentro del bloque, 'prestamos'/'cuotas'/'abonos_capital' son las del archivo (True) o no hay
+    archivo (False: el bloque debe omitir la consulta). Un préstamo está entero en una sola base,
+    así que el historial = consulta en la principal + la misma consulta aquí.
+    """
+    if not existe():
+        yield False
+        return
+    _vistas(conn)
+    try:
+        yield True
+    finally:
+        _quitar_vistas(conn)
+
+
+def archivados(conn, tabla: str, ids: Iterable[int]) -> Set[int]:
+    """Ids (de 'prestamos' o 'cuotas') que no están en la base caliente pero sí en el archivo."""
+    ids = sorted({int(i) for i in ids})
+    if not ids or not existe():
+        return set()
+    marcas = ",".join("?" * len(ids))
+    calientes = {r[0] for r in conn.execute(f"SELECT id FROM main.{tabla} WHERE id IN ({marcas});", ids)}
+    faltan = [i for i in ids if i not in calientes]
+    if not faltan:
+        return set()
+    if conn.in_transaction:
+        conn.commit()
+    _adjuntar(conn)
+    if not _table_exists(conn, tabla, ALIAS):
+        return set()
+    marcas = ",".join("?" * len(faltan))
+    return {r[0] for r in conn.execute(f"SELECT id FROM {ALIAS}.{tabla} WHERE id IN ({marcas});", faltan)}
+
+
+def por_base(conn, tabla: str, ids: Iterable[int], fn: Callable[[int], Any]) -> Dict[int, Any]:
+    """{id: fn(id)} evaluando los ids calientes en la principal y los archivados dentro del archivo."""
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    en_archivo = archivados(conn, tabla, ids)
+    out = {i: fn(i) for i in ids if i not in en_archivo}
+    if en_archivo:
+        with leyendo_archivo(conn):
+            out.update({i: fn(i) for i in ids if i in en_archivo})
+    return out
+
+
+def usar_si_archivado(conn, tabla: str, id_: int) -> bool:
+    """Para endpoints de un solo préstamo/cuota: si está archivado, la conexión pasa a leer el archivo."""
+    if archivados(conn, tabla, [id_]):
+        return _vistas(conn)
+    return False
+
+
+# ------------------ esquema del archivo ------------------
+
+_CREATE = re.compile(r"^\s*CREATE\s+(UNIQUE\s+)?(TABLE|INDEX)\s+(IF\s+NOT\s+EXISTS\s+)?", re.IGNORECASE)
+
+
+def _asegurar_esquema(conn) -> None:
+    """Crea en el archivo las tablas/índices de la principal y agrega columnas nuevas."""
+    # Un archivo creado antes de la migración 2 conserva los nombres viejos: se renombran igual que en la principal
+    migraciones.normalizar_columnas(conn, ALIAS)
+    for t in TABLAS:
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?;", (t,)).fetchone()[0]
+        if "AUTOINCREMENT" not in sql.upper():
+            # Sin AUTOINCREMENT SQLite reutiliza ids borrados: un préstamo nuevo chocaría con uno archivado
+            raise ValueError(f"La tabla '{t}' no usa AUTOINCREMENT; archivar reutilizaría ids")
+        if not _table_exists(conn, t, ALIAS):
+            m = _CREATE.match(sql)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {ALIAS}." + sql[m.end():].lstrip())
+        en_archivo = set(_cols(conn, t, ALIAS))
+        for r in conn.execute(f"PRAGMA main.table_info({t});").fetchall():
+            if r[1] not in en_archivo:
+                conn.execute(f"ALTER TABLE {ALIAS}.{t} ADD COLUMN {r[1]} {r[2] or ''};")
+        for (isql,) in conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL;", (t,)
+        ).fetchall():
+            m = _CREATE.match(isql)
+            unico = "UNIQUE " if m.group(1) else ""
+            conn.execute(f"CREATE {unico}INDEX IF NOT EXISTS {ALIAS}." + isql[m.end():].lstrip())
+    conn.commit()
+
+
+# ------------------ archivado ------------------
+
+def _candidatos(conn, corte: str, limite: Optional[int], en_lote: bool = False) -> List[int]:
+    """Préstamos archivables; con en_lote=True solo entre los ids cargados en temp._archivar."""
+    sql = sentencias.sql("archivo.candidatos", en_lote, lambda: f"""
+    SELECT p.id FROM main.prestamos p
+    WHERE COALESCE(p.capital_pendiente, 0) <= {TOL}
+      AND EXISTS (SELECT 1 FROM main.cuotas c WHERE c.id_prestamo = p.id)
+      AND NOT EXISTS (SELECT 1 FROM main.cuotas c WHERE c.id_prestamo = p.id AND UPPER(COALESCE(c.estado, '')) <> 'PAGADO')
+      AND (SELECT MAX(MAX(COALESCE(date(c.fecha_pago), '')), MAX(COALESCE(date(c.fecha_vencimiento), '')))
+             FROM main.cuotas c WHERE c.id_prestamo = p.id) < date(:corte)
+      AND NOT EXISTS (SELECT 1 FROM main.abonos_capital a WHERE a.id_prestamo = p.id AND date(a.fecha) >= date(:corte))
+      {"AND p.id IN (SELECT id FROM temp._archivar)" if en_lote else ""}
+    ORDER BY p.id
+    LIMIT :limite
+    """)
+    params = {"corte": corte, "limite": -1 if limite is None else limite}
+    return [r[0] for r in conn.execute(sql, params).fetchall()]
+
+
+def _cargar_lote(conn, ids: List[int]) -> None:
+    conn.execute("DELETE FROM temp._archivar;")
+    conn.executemany("INSERT INTO temp._archivar (id) VALUES (?);", [(i,) for i in ids])
+
+
+def _copiar_y_borrar(conn) -> Dict[str, int]:
+    """Mueve los préstamos de temp._archivar (dentro de la transacción de escritura). Re-ejecutable."""
+    filtros = {"prestamos": "id", "cuotas": "id_prestamo", "abonos_capital": "id_prestamo"}
+    movidos = {}
+    for t in TABLAS:
+        lista = ", ".join(_cols(conn, t))
+        donde = f"{filtros[t]} IN (SELECT id FROM temp._archivar)"
+        conn.execute(f"INSERT OR REPLACE INTO {ALIAS}.{t} ({lista}) SELECT {lista} FROM main.{t} WHERE {donde};")
+        movidos[t] = conn.execute(f"DELETE FROM main.{t} WHERE {donde};").rowcount
+    return movidos
+
+
+def _recuperar(conn) -> int:
+    """Préstamos que quedaron en ambas bases (corte entre los dos commits): se borran de la principal."""
+    ids = [r[0] for r in conn.execute(
+        f"SELECT p.id FROM main.prestamos p WHERE p.id IN (SELECT id FROM {ALIAS}.prestamos);"
+    ).fetchall()]
+    if ids:
+        with deps.escritura(conn):
+            _cargar_lote(conn, ids)
+            _copiar_y_borrar(conn)
+        log.warning("Archivo: %s préstamo(s) duplicados tras una corrida interrumpida; limpiados", len(ids))
+    return len(ids)
+
+
+def archivar(dias: Optional[int] = None, corte: Optional[date] = None, limite: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Mueve al archivo los préstamos cerrados sin movimiento desde 'corte' (default: hoy - ARCHIVO_DIAS).
+    'limite' acota cuántos préstamos se mueven en esta corrida (default: todos los candidatos).
+    """
+    corte_iso = (corte or (date.today() - timedelta(days=DIAS if dias is None else dias))).isoformat()
+    with _lock, deps.get_conn() as conn:
+        _adjuntar(conn)
+        _asegurar_esquema(conn)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _archivar (id INTEGER PRIMARY KEY);")
+        recuperados = _recuperar(conn)
+
+        # Una sola pasada de lectura elige los candidatos; cada lote se vuelve a verificar dentro de su
+        # transacción (un pago o abono concurrente lo saca del lote)
+        candidatos = _candidatos(conn, corte_iso, limite)
+        conn.commit()
+        total: Dict[str, int] = {t: 0 for t in TABLAS}
+        lotes = 0
+        for i in range(0, len(candidatos), max(LOTE, 1)):
+            with deps.escritura(conn):  # BEGIN IMMEDIATE: el lock de escritura solo dura un lote
+                _cargar_lote(conn, candidatos[i:i + LOTE])
+                vigentes = _candidatos(conn, corte_iso, None, en_lote=True)
+                _cargar_lote(conn, vigentes)
+                movidos = _copiar_y_borrar(conn)
+            for t, k in movidos.items():
+                total[t] += k
+            lotes += 1
+            metrics.ARCHIVO_PRESTAMOS.inc(valor=len(vigentes))
+
+    res = {"estado": "ok", "corte": corte_iso, "lotes": lotes, "prestamos": total["prestamos"],
+           "cuotas": total["cuotas"], "abonos_capital": total["abonos_capital"], "recuperados": recuperados,
+           "archivo": ruta()}
+    log.info("Archivo: %s", res)
+    return res
+
+
+def estado() -> Dict[str, Any]:
+    out: Dict[str, Any] = {"archivo": ruta(), "existe": existe(), "dias": DIAS, "lote": LOTE}
+    with deps.get_conn() as conn:
+        out["principal"] = {t: conn.execute(f"SELECT COUNT(*) FROM main.{t};").fetchone()[0]
+                            for t in TABLAS}
+        if out["existe"]:
+            _adjuntar(conn)
+            out["archivados"] = {t: conn.execute(f"SELECT COUNT(*) FROM {ALIAS}.{t};").fetchone()[0]
+                                 for t in TABLAS if _table_exists(conn, t, ALIAS)}
+            out["bytes"] = os.path.getsize(ruta())
+    return out
+
+
+# ------------------ programador en proceso ------------------
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _loop() -> None:
+    while not _stop.wait(INTERVALO_S):
+        for shard in deps.SHARDS or [None]:
+            try:
+                with deps.en_shard(shard):
+                    archivar()
+            except Exception as e:
+                log.warning("Fallo en archivado programado%s: %s", f" (shard {shard})" if shard else "", e)
+
+
+def iniciar_programador() -> None:
+    """Archiva cada ARCHIVO_INTERVALO_H horas si ARCHIVO_AUTO=on."""
+    global _thread
+    if not _flag("ARCHIVO_AUTO") or (_thread and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="archivo", daemon=True)
+    _thread.start()
+
+
+def detener_programador() -> None:
+    _stop.set()
+
+
+# ------------------ CLI ------------------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Archivo histórico de préstamos cerrados")
+    sub = ap.add_subparsers(dest="comando", required=True)
+    a = sub.add_parser("archivar", help="Mueve préstamos cerrados al archivo")
+    a.add_argument("--dias", type=int, default=None, help=f"Días sin movimiento (default: {DIAS})")
+    a.add_argument("--limite", type=int, default=None, help="Máximo de préstamos en esta corrida")
+    sub.add_parser("estado", help="Conteos en la base principal y en el archivo")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    try:
+        res = archivar(dias=args.dias, limite=args.limite) if args.comando == "archivar" else estado()
+    except (ValueError, sqlite3.Error) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
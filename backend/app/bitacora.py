@@ -0,0 +1,284 @@
+# backend/app/bitacora.py
+# Bitácora CSV de abonos a capital con escritor en segundo plano.
+# - Los endpoints solo encolan la fila (sin abrir archivos por petición).
+# - Un hilo vacía la cola por lotes (cada ABONOS_LOG_FLUSH_S o al llegar a ABONOS_LOG_LOTE filas).
+# - Rotación por tamaño y por día, con gzip opcional de los archivos rotados.
+# - Cada lote se escribe bajo un lock de archivo exclusivo: seguro con varios procesos/workers.
+# - Si un lote no se puede escribir, sus filas vuelven al frente de la cola y se reintentan en el
+#   siguiente vaciado (hasta ABONOS_LOG_MAX_PENDIENTES); las que exceden ese tope, y las que siguen sin
+#   escribirse al apagar, van al archivo de respaldo (ABONOS_LOG_RESPALDO, default en el directorio
+#   temporal). Nada se descarta en silencio: fallos y filas por destino quedan en /metrics.
+# - Al apagar la app se vacía lo pendiente.
+from __future__ import annotations
+
+import atexit
+import csv
+import gzip
+import io
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app import deps, metrics
+
+log = logging.getLogger("bitacora")
+
+ARCHIVO = "abonos_capital_log.csv"
+CABECERA = ["fecha", "id_prestamo", "nombre_cliente", "monto", "cuota_id"]
+
+
+def _flag(name: str, default: str = "") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+
+
+# ------------------ lock de archivo (multi-proceso) ------------------
+
+try:  # POSIX
+    import fcntl
+
+    def _lock(fh) -> None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(fh) -> None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+except ImportError:  # pragma: no cover - Windows
+    import msvcrt
+
+    def _lock(fh) -> None:
+        fh.seek(0)
+        while True:
+            try:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)
+
+    def _unlock(fh) -> None:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# ------------------ escritor ------------------
+
+class EscritorBitacora:
+    def __init__(
+        self,
+        ruta: Path,
+        cabecera: List[str],
+        max_bytes: int = 5 * 1024 * 1024,
+        rotar_diario: bool = True,
+        comprimir: bool = False,
+        max_archivos: int = 30,
+        flush_s: float = 1.0,
+        lote: int = 500,
+        max_pendientes: int = 50000,
+        respaldo: Optional[Path] = None,
+    ):
+        self.ruta = ruta
+        self.cabecera = cabecera
+        self.max_bytes = max_bytes
+        self.rotar_diario = rotar_diario
+        self.comprimir = comprimir
+        self.max_archivos = max_archivos
+        self.flush_s = flush_s
+        self.lote = lote
+        self.max_pendientes = max_pendientes
+        self.respaldo = respaldo or Path(tempfile.gettempdir()) / f"{ruta.stem}.respaldo{ruta.suffix}"
+        self._reintentos: List[List[Any]] = []  # filas de lotes fallidos, en orden, antes que la cola
+        self._cola: "queue.Queue[List[Any]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._hay_lote = threading.Event()
+        self._escritura = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name=f"bitacora-{ruta.name}", daemon=True)
+        self._thread.start()
+
+    # --- API ---
+    def registrar(self, fila: List[Any]) -> None:
+        self._cola.put(fila)
+        if self._cola.qsize() >= self.lote:
+            self._hay_lote.set()
+
+    def pendientes(self) -> int:
+        return self._cola.qsize() + len(self._reintentos)
+
+    def vaciar(self) -> int:
+        """Escribe todo lo encolado (primero lo que quedó de lotes fallidos). Devuelve filas escritas."""
+        with self._escritura:
+            filas, self._reintentos = self._reintentos, []
+            while True:
+                try:
+                    filas.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            if not filas:
+                return 0
+            try:
+                self._escribir(filas)
+            except Exception as e:
+                metrics.BITACORA_FALLOS.inc(self.ruta.name)
+                conservar, sobrantes = filas[: self.max_pendientes], filas[self.max_pendientes:]
+                self._reintentos = conservar
+                metrics.BITACORA_FILAS.inc(self.ruta.name, "reintento", valor=len(conservar))
+                log.warning("No se pudo escribir la bitácora %s (%s filas, se reintentan %s): %s",
+                            self.ruta, len(filas), len(conservar), e)
+                if sobrantes:
+                    self._al_respaldo(sobrantes)
+                return 0
+            metrics.BITACORA_FILAS.inc(self.ruta.name, "escritas", valor=len(filas))
+            return len(filas)
+
+    def detener(self) -> None:
+        self._stop.set()
+        self._hay_lote.set()
+        self._thread.join(timeout=5)
+        self.vaciar()
+        with self._escritura:
+            filas, self._reintentos = self._reintentos, []
+            if filas:
+                self._al_respaldo(filas)
+
+    # --- internos ---
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._hay_lote.wait(self.flush_s)
+            self._hay_lote.clear()
+            self.vaciar()
+
+    def _al_respaldo(self, filas: List[List[Any]]) -> None:
+        """Último recurso (con self._escritura tomado): agrega las filas al archivo de respaldo."""
+        try:
+            self.respaldo.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.respaldo, "a", encoding="utf-8", newline="") as fh:
+                w = csv.writer(fh)
+                if fh.tell() == 0:
+                    w.writerow(self.cabecera)
+                w.writerows(filas)
+        except Exception as e:
+            metrics.BITACORA_FILAS.inc(self.ruta.name, "perdidas", valor=len(filas))
+            log.error("Bitácora %s: %s filas sin escribir ni respaldar (%s): %r", self.ruta, len(filas), e, filas)
+            return
+        metrics.BITACORA_FILAS.inc(self.ruta.name, "respaldo", valor=len(filas))
+        log.error("Bitácora %s: %s filas escritas en el respaldo %s", self.ruta, len(filas), self.respaldo)
+
+    def _escribir(self, filas: List[List[Any]]) -> None:
+        buf = io.StringIO()
+        csv.writer(buf).writerows(filas)
+        datos = buf.getvalue().encode("utf-8")
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.ruta.with_name(self.ruta.name + ".lock")
+        with open(lock_path, "a+b") as lk:
+            _lock(lk)
+            try:
+                self._rotar_si_corresponde(len(datos))
+                with open(self.ruta, "ab") as fh:
+                    if fh.tell() == 0:
+                        hbuf = io.StringIO()
+                        csv.writer(hbuf).writerow(self.cabecera)
+                        fh.write(hbuf.getvalue().encode("utf-8"))
+                    fh.write(datos)
+            finally:
+                _unlock(lk)
+
+    def _rotar_si_corresponde(self, entrantes: int) -> None:
+        try:
+            st = self.ruta.stat()
+        except FileNotFoundError:
+            return
+        if st.st_size == 0:
+            return
+        por_tamano = self.max_bytes > 0 and st.st_size + entrantes > self.max_bytes
+        por_dia = self.rotar_diario and date.fromtimestamp(st.st_mtime) != date.today()
+        if not (por_tamano or por_dia):
+            return
+        sello = datetime.fromtimestamp(st.st_mtime).strftime("%Y%m%d-%H%M%S")
+        destino = self.ruta.with_name(f"{self.ruta.stem}.{sello}{self.ruta.suffix}")
+        n = 1
+        while destino.exists() or destino.with_name(destino.name + ".gz").exists():
+            destino = self.ruta.with_name(f"{self.ruta.stem}.{sello}-{n}{self.ruta.suffix}")
+            n += 1
+        os.replace(self.ruta, destino)
+        if self.comprimir:
+            with open(destino, "rb") as src, gzip.open(str(destino) + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            destino.unlink()
+        self._limpiar_rotados()
+
+    def _limpiar_rotados(self) -> None:
+        if self.max_archivos <= 0:
+            return
+        rotados = sorted(self.ruta.parent.glob(f"{self.ruta.stem}.*{self.ruta.suffix}*"))
+        rotados = [p for p in rotados if p != self.ruta and not p.name.endswith(".lock")]
+        for viejo in rotados[: max(len(rotados) - self.max_archivos, 0)]:
+            try:
+                viejo.unlink()
+            except OSError:
+                pass
+
+
+# ------------------ registro por proceso ------------------
+
+_escritores: Dict[str, EscritorBitacora] = {}
+_reg_lock = threading.Lock()
+
+
+def escritor_abonos(ruta: Optional[Path] = None) -> EscritorBitacora:
+    """Escritor de la bitácora de abonos (junto a la BD), creado una vez por proceso."""
+    ruta = ruta or Path(deps.DB_PATH).resolve().parent / ARCHIVO
+    clave = str(ruta)
+    esc = _escritores.get(clave)
+    if esc is None:
+        with _reg_lock:
+            esc = _escritores.get(clave)
+            if esc is None:
+                esc = EscritorBitacora(
+                    ruta,
+                    CABECERA,
+                    max_bytes=int(os.getenv("ABONOS_LOG_MAX_BYTES", str(5 * 1024 * 1024))),
+                    rotar_diario=_flag("ABONOS_LOG_ROTAR_DIARIO", "on"),
+                    comprimir=_flag("ABONOS_LOG_GZIP"),
+                    max_archivos=int(os.getenv("ABONOS_LOG_MAX_ARCHIVOS", "30")),
+                    flush_s=float(os.getenv("ABONOS_LOG_FLUSH_S", "1.0")),
+                    lote=int(os.getenv("ABONOS_LOG_LOTE", "500")),
+                    max_pendientes=int(os.getenv("ABONOS_LOG_MAX_PENDIENTES", "50000")),
+                    respaldo=Path(os.environ["ABONOS_LOG_RESPALDO"]) if os.getenv("ABONOS_LOG_RESPALDO") else None,
+                )
+                _escritores[clave] = esc
+    return esc
+
+
+def registrar_abonos(filas: List[List[Any]]) -> None:
+    """Encola filas de la bitácora de abonos (best-effort: nunca bloquea ni falla el abono)."""
+    if not filas:
+        return
+    try:
+        esc = escritor_abonos()
+        for fila in filas:
+            esc.registrar(fila)
+    except Exception as e:
+        log.warning("No se pudo encolar la bitácora de abonos: %s", e)
+
+
+def pendientes() -> int:
+    """Filas encoladas aún sin escribir, sumando todos los escritores del proceso."""
+    with _reg_lock:
+        escritores = list(_escritores.values())
+    return sum(esc.pendientes() for esc in escritores)
+
+
+def detener_todos() -> None:
+    """Vacía y detiene todos los escritores (se llama al apagar la app)."""
+    with _reg_lock:
+        escritores = list(_escritores.values())
+        _escritores.clear()
+    for esc in escritores:
+        esc.detener()
+
+
+atexit.register(detener_todos)
@@ -0,0 +1,267 @@
+# backend/app/compresion.py
+# Compresión negociada de respuestas (Accept-Encoding) para los listados grandes que viajan por datos
+# móviles (/cuotas/resumen-prestamos, /cuotas, /clientes, ...).
+# - Codificaciones: gzip siempre; br si está instalado 'brotli' (o 'brotlicffi') y zstd si está
+#   'zstandard'. Gana la de mayor q del cliente; a igual q, el orden de COMPRESION_ORDEN.
+#   La app móvil (Dio sobre dart:io) ya manda 'Accept-Encoding: gzip' y descomprime sola.
+# - Umbral: respuestas de menos de COMPRESION_MIN_BYTES salen tal cual (no ahorran ni un paquete).
+# - Se omiten: tipos ya comprimidos o binarios (PDF, imágenes; solo texto/JSON/CSV/XML), respuestas
+#   que ya traen Content-Encoding (p.ej. reenviadas por el proceso escritor), 'Cache-Control:
+#   no-transform' (opt-out desde el endpoint) y rutas de COMPRESION_EXCLUIR (prefijos).
+# - Streaming: con more_body (StreamingResponse, exportaciones) se comprime por trozos, sin
+#   Content-Length, con un flush cada COMPRESION_FLUSH_BYTES de entrada para que el cliente vaya
+#   recibiendo. Cuerpos de una pieza grandes (>= COMPRESION_HILO_BYTES) se comprimen en un hilo para
+#   no frenar el event loop.
+# - Métricas: http_compression_* en /metrics (bytes de entrada/salida y segundos por codificación,
+#   respuestas omitidas por motivo).
+from __future__ import annotations
+
+import os
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app import metrics
+
+try:  # opcional
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover - depende del entorno
+    try:
+        import brotlicffi as brotli  # type: ignore
+    except ImportError:
+        brotli = None  # type: ignore
+
+try:  # opcional
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover - depende del entorno
+    zstandard = None  # type: ignore
+
+
+def _flag(name: str, default: str = "") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+
+
+ACTIVA = _flag("COMPRESION", "on")
+MIN_BYTES = int(os.getenv("COMPRESION_MIN_BYTES", "1024"))
+FLUSH_BYTES = int(os.getenv("COMPRESION_FLUSH_BYTES", str(64 * 1024)))
+HILO_BYTES = int(os.getenv("COMPRESION_HILO_BYTES", str(256 * 1024)))
+NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "6"))
+NIVEL_BR = int(os.getenv("COMPRESION_NIVEL_BR", "4"))
+NIVEL_ZSTD = int(os.getenv("COMPRESION_NIVEL_ZSTD", "3"))
+ORDEN = [c.strip().lower() for c in os.getenv("COMPRESION_ORDEN", "zstd,br,gzip").split(",") if c.strip()]
+EXCLUIR = tuple(p.strip() for p in os.getenv("COMPRESION_EXCLUIR", "/health").split(",") if p.strip())
+
+_TIPOS = ("text/", "application/json", "application/javascript", "application/xml", "application/x-ndjson",
+          "application/problem+json")
+_SUFIJOS = ("+json", "+xml")
+
+
+# ------------------ codificadores ------------------
+
+class _Gzip:
+    def __init__(self, nivel: int):
+        self._z = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # 31: cabecera y cola gzip
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._z.compress(datos)
+
+    def vaciar(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self) -> bytes:
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, nivel: int):
+        self._b = brotli.Compressor(quality=nivel)
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._b.process(datos)
+
+    def vaciar(self) -> bytes:
+        return self._b.flush()
+
+    def terminar(self) -> bytes:
+        return self._b.finish()
+
+
+class _Zstd:
+    def __init__(self, nivel: int):
+        self._z = zstandard.ZstdCompressor(level=nivel).compressobj()
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._z.compress(datos)
+
+    def vaciar(self) -> bytes:
+        return self._z.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def terminar(self) -> bytes:
+        return self._z.flush()
+
+
+# Codificaciones disponibles en este proceso: nombre -> fábrica(nivel) y nivel por defecto
+CODIFICADORES: Dict[str, Tuple[Callable[[int], Any], int]] = {"gzip": (_Gzip, NIVEL_GZIP)}
+if brotli is not None:
+    CODIFICADORES["br"] = (_Brotli, NIVEL_BR)
+if zstandard is not None:
+    CODIFICADORES["zstd"] = (_Zstd, NIVEL_ZSTD)
+
+
+def nuevo(nombre: str, nivel: Optional[int] = None):
+    fabrica, por_defecto = CODIFICADORES[nombre]
+    return fabrica(por_defecto if nivel is None else nivel)
+
+
+def comprimir(nombre: str, datos: bytes, nivel: Optional[int] = None) -> bytes:
+    """Cuerpo completo comprimido (también lo usa benchmarks.compresion)."""
+    c = nuevo(nombre, nivel)
+    return c.comprimir(datos) + c.terminar()
+
+
+# ------------------ negociación ------------------
+
+def elegir(accept_encoding: str) -> Optional[str]:
+    """Codificación a usar según Accept-Encoding (q-values y '*'), o None para enviar sin comprimir."""
+    pesos: Dict[str, float] = {}
+    for parte in accept_encoding.split(","):
+        token, _, params = parte.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.partition("=")
+            if k.strip().lower() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        pesos[token] = q
+    comodin = pesos.get("*")
+    mejor, mejor_q = None, 0.0
+    for nombre in ORDEN:
+        if nombre not in CODIFICADORES:
+            continue
+        q = pesos.get(nombre, comodin if comodin is not None else 0.0)
+        if q > mejor_q:
+            mejor, mejor_q = nombre, q
+    return mejor
+
+
+def _omitir(status: int, cabeceras: Headers) -> Optional[str]:
+    """Motivo para NO comprimir esta respuesta (None si se puede)."""
+    if status < 200 or status in (204, 304):
+        return "sin_cuerpo"
+    if "content-encoding" in cabeceras:
+        return "ya_codificada"
+    if "no-transform" in cabeceras.get("cache-control", "").lower():
+        return "no_transform"
+    tipo = cabeceras.get("content-type", "").split(";")[0].strip().lower()
+    if not (tipo.startswith(_TIPOS) or tipo.endswith(_SUFIJOS)):
+        return "tipo"
+    return None
+
+
+def _marcar(cabeceras: MutableHeaders, nombre: str) -> None:
+    cabeceras["Content-Encoding"] = nombre
+    etag = cabeceras.get("etag")
+    if etag and not etag.startswith("W/"):  # otro cuerpo: el ETag fuerte ya no le corresponde
+        cabeceras["ETag"] = "W/" + etag
+
+
+def _vary(cabeceras: MutableHeaders) -> None:
+    if "accept-encoding" not in cabeceras.get("vary", "").lower():
+        cabeceras.add_vary_header("Accept-Encoding")
+
+
+# ------------------ middleware ------------------
+
+class CompresionMiddleware:
+    """ASGI: comprime el cuerpo (de una pieza o por trozos) con la codificación negociada."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ACTIVA or scope["path"].startswith(EXCLUIR) or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        nombre = elegir(Headers(scope=scope).get("accept-encoding", ""))
+        if nombre is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio: Dict[str, Any] = {}
+        estado: Dict[str, Any] = {"modo": None, "c": None, "pendiente": 0}
+
+        async def _pasar(msg) -> None:
+            estado["modo"] = "directo"
+            await send(inicio)
+            await send(msg)
+
+        async def _send(msg):
+            if msg["type"] == "http.response.start":
+                inicio.update(msg)
+                return
+            if msg["type"] != "http.response.body" or estado["modo"] == "directo":
+                await send(msg)
+                return
+
+            cuerpo = msg.get("body", b"")
+            mas = msg.get("more_body", False)
+            if estado["modo"] is None:  # primer trozo: se decide con las cabeceras y el tamaño
+                inicio["headers"] = list(inicio.get("headers") or [])
+                cabeceras = MutableHeaders(raw=inicio["headers"])
+                motivo = _omitir(inicio["status"], cabeceras)
+                if motivo is None:
+                    _vary(cabeceras)  # la respuesta depende de Accept-Encoding aunque esta vaya sin comprimir
+                    largo = cabeceras.get("content-length")
+                    if (not mas and len(cuerpo) < MIN_BYTES) or (mas and largo is not None and int(largo) < MIN_BYTES):
+                        motivo = "umbral"
+                if motivo is not None:
+                    metrics.COMPRESION_OMITIDAS.inc(motivo)
+                    await _pasar(msg)
+                    return
+                _marcar(cabeceras, nombre)
+                estado["modo"] = "comprimido"
+                if not mas:
+                    t0 = time.perf_counter()
+                    if len(cuerpo) >= HILO_BYTES:
+                        import anyio.to_thread
+
+                        salida = await anyio.to_thread.run_sync(comprimir, nombre, cuerpo)
+                    else:
+                        salida = comprimir(nombre, cuerpo)
+                    self._contar(nombre, len(cuerpo), len(salida), time.perf_counter() - t0)
+                    cabeceras["Content-Length"] = str(len(salida))
+                    await send(inicio)
+                    await send({"type": "http.response.body", "body": salida})
+                    return
+                del cabeceras["Content-Length"]
+                estado["c"] = nuevo(nombre)
+                await send(inicio)
+
+            # Streaming: trozo a trozo; flush periódico para no retener la exportación entera
+            t0 = time.perf_counter()
+            c = estado["c"]
+            salida = c.comprimir(cuerpo) if cuerpo else b""
+            estado["pendiente"] += len(cuerpo)
+            if mas and estado["pendiente"] >= FLUSH_BYTES:
+                salida += c.vaciar()
+                estado["pendiente"] = 0
+            if not mas:
+                salida += c.terminar()
+            self._contar(nombre, len(cuerpo), len(salida), time.perf_counter() - t0)
+            if salida or not mas:
+                await send({"type": "http.response.body", "body": salida, "more_body": mas})
+
+        await self.app(scope, receive, _send)
+
+    @staticmethod
+    def _contar(nombre: str, entrada: int, salida: int, segundos: float) -> None:
+        metrics.COMPRESION_BYTES.inc(nombre, "entrada", valor=entrada)
+        metrics.COMPRESION_BYTES.inc(nombre, "salida", valor=salida)
+        metrics.COMPRESION_SEGUNDOS.inc(nombre, valor=segundos)
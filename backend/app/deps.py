@@ -1,9 +1,21 @@
 # backend/app/deps.py
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+import contextvars
+import heapq
+import logging
+import random
 import sqlite3
 import os
+import threading
+import time
+import zlib
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
 from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app import metrics, migraciones, sqltrace
 
 # Resuelve la ruta por defecto SIEMPRE relativa a este archivo:
 # backend/app/deps.py -> backend/  -> backend/data/basedatos.db
@@ -13,12 +25,405 @@ DEFAULT_DB = BASE_DIR / 'data' / 'basedatos.db'
 load_dotenv()
 DB_PATH = os.getenv("DB_PATH", str(DEFAULT_DB))
 
+log = logging.getLogger("deps")
+
+T = TypeVar("T")
+
+# Varios procesos (uvicorn --workers N) escribiendo el mismo archivo:
+# - busy_timeout: SQLite espera el lock en vez de fallar al instante con 'database is locked'
+# - WAL: los lectores no bloquean al escritor ni viceversa (se fija una vez por archivo)
+# - escritura(conn): BEGIN IMMEDIATE con reintentos; agotados -> 503 con Retry-After
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+WAL = (os.getenv("DB_WAL", "on") or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+REINTENTOS = int(os.getenv("DB_REINTENTOS", "4"))
+REINTENTO_BASE_S = float(os.getenv("DB_REINTENTO_BASE_MS", "50")) / 1000.0
+
+# Pool por proceso: la caché de sentencias preparadas de sqlite3 vive en la conexión, así que abrir
+# una por petición la tira cada vez. Las conexiones ociosas (hasta DB_POOL; 0 = una nueva por uso)
+# se reutilizan con sus sentencias ya compiladas (hasta DB_CACHED_STATEMENTS por conexión).
+CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "512"))
+POOL = int(os.getenv("DB_POOL", "8"))
+
+# Modo shards (DB_SHARDS; vacío = una sola base, como siempre). La cartera se reparte en varios
+# archivos SQLite y cada petición trabaja sobre el de su cliente:
+# - DB_SHARDS=4 -> shards '0'..'3'; DB_SHARDS=norte,sur=/data/sur.db -> uno por sucursal. Ruta por
+#   defecto: el primero es DB_PATH y los demás '<base>_<nombre>.db' junto a él.
+# - Ids: el shard k (posición en DB_SHARDS) numera desde k * DB_SHARD_RANGO_IDS + 1 (sqlite_sequence
+#   sembrado al abrir): el id de un cliente, préstamo, cuota o abono dice en qué archivo está.
+#   Los shards solo se agregan al final; reordenar DB_SHARDS cambia a dónde apunta cada id.
+# - El shard de la petición va en un contextvar (app.shards.ShardMiddleware o en_shard()); get_conn()
+#   abre y reutiliza conexiones del archivo de ese shard (un pool por archivo).
+# - Lo que no tiene dueño (listados, recordatorios) recorre todos con dispersar(): en paralelo, en
+#   hasta DB_SHARD_HILOS hilos, y el endpoint une los resultados.
+# - El directorio global de códigos de cliente (asignación y codigo -> shard) está en app.shards.
+SHARDS_CONF = (os.getenv("DB_SHARDS") or "").strip()
+RANGO_IDS = int(os.getenv("DB_SHARD_RANGO_IDS", str(10 ** 10)))
+HILOS_DISPERSION = max(int(os.getenv("DB_SHARD_HILOS", "8")), 1)
+
+_wal_ok: set = set()
+_wal_lock = threading.Lock()
+_sembrado: set = set()
+
+_pools: Dict[str, List[sqlite3.Connection]] = {}  # ruta -> conexiones ociosas de este proceso
+_pool_lock = threading.Lock()
+_pool_pid = 0
+
+_shard_ctx: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("db_shard", default=None)
+_rutas_cache: Tuple[Tuple[str, str], Dict[str, str]] = (("", ""), {})
+_dispersor: Optional[ThreadPoolExecutor] = None
+_dispersor_pid = 0
+_dispersor_lock = threading.Lock()
+
+
+def es_bloqueo(e: BaseException) -> bool:
+    """True si el error es de lock/busy de SQLite (reintentable)."""
+    msg = str(e).lower()
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in msg or "busy" in msg)
+
+
+# ---------- shards ----------
+
+def _parsear_shards(texto: str) -> List[Tuple[str, Optional[str]]]:
+    """'4' -> [('0', None), ..., ('3', None)]; 'norte,sur=/x.db' -> [('norte', None), ('sur', '/x.db')]."""
+    if not texto:
+        return []
+    if texto.isdigit():
+        return [(str(k), None) for k in range(int(texto))]
+    out: List[Tuple[str, Optional[str]]] = []
+    for parte in texto.split(","):
+        nombre, _, ruta_ = parte.partition("=")
+        if nombre.strip():
+            out.append((nombre.strip(), ruta_.strip() or None))
+    return out
+
+
+SHARDS: List[str] = [n for n, _ in _parsear_shards(SHARDS_CONF)]  # [] = modo de una sola base
+
+
+def configurar_shards(texto: str) -> None:
+    """Cambia DB_SHARDS en caliente (benchmarks, pruebas); conviene cerrar_pool() antes."""
+    global SHARDS_CONF, SHARDS
+    SHARDS_CONF = (texto or "").strip()
+    SHARDS = [n for n, _ in _parsear_shards(SHARDS_CONF)]
+
+
+def rutas() -> Dict[str, str]:
+    """nombre -> archivo de cada shard, en el orden de DB_SHARDS ({} sin shards)."""
+    global _rutas_cache
+    clave = (DB_PATH, SHARDS_CONF)
+    if _rutas_cache[0] != clave:  # DB_PATH también cambia en caliente (benchmarks)
+        base, ext = os.path.splitext(DB_PATH)
+        _rutas_cache = (clave, {
+            n: r or (DB_PATH if i == 0 else f"{base}_{n}{ext or '.db'}")
+            for i, (n, r) in enumerate(_parsear_shards(SHARDS_CONF))
+        })
+    return _rutas_cache[1]
+
+
+def shard_actual() -> Optional[str]:
+    """Shard de este contexto: el fijado o, sin fijar, el primero (None sin shards)."""
+    if not SHARDS:
+        return None
+    return _shard_ctx.get() or SHARDS[0]
+
+
+def shard_fijado() -> Optional[str]:
+    """Shard fijado explícitamente para esta petición/tarea (None: sin dueño, o sin shards)."""
+    return _shard_ctx.get() if SHARDS else None
+
+
+def ruta() -> str:
+    """Archivo SQLite del shard actual (DB_PATH sin shards)."""
+    if not SHARDS:
+        return DB_PATH
+    return rutas()[_shard_ctx.get() or SHARDS[0]]
+
+
 @contextmanager
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+def en_shard(nombre: Optional[str]):
+    """Lo que corre dentro usa el shard 'nombre' (None o sin shards: no cambia nada)."""
+    if nombre is None or not SHARDS:
+        yield
+        return
+    if nombre not in rutas():
+        raise HTTPException(status_code=422, detail=f"Shard desconocido: {nombre}")
+    token = _shard_ctx.set(nombre)
+    try:
+        yield
+    finally:
+        _shard_ctx.reset(token)
+
+
+def shard_de_id(id_: Optional[int]) -> Optional[str]:
+    """Shard dueño de un id de cliente/préstamo/cuota/abono por su rango (None sin shards o fuera de rango)."""
+    if not SHARDS or id_ is None:
+        return None
+    k = int(id_) // RANGO_IDS
+    return SHARDS[k] if 0 <= k < len(SHARDS) else None
+
+
+def shard_por_hash(codigo: str) -> Optional[str]:
+    """Shard de un cliente nuevo sin sucursal: crc32 del código (estable entre procesos y reinicios)."""
+    if not SHARDS:
+        return None
+    return SHARDS[zlib.crc32(str(codigo).encode("utf-8")) % len(SHARDS)]
+
+
+def agrupar_ids(ids: Iterable[int]) -> Dict[Optional[str], List[int]]:
+    """ids por shard dueño, para consultar cada grupo en su archivo (sin shards: todo en None)."""
+    grupos: Dict[Optional[str], List[int]] = {}
+    for i in ids:
+        dueno = shard_de_id(i) or (SHARDS[0] if SHARDS else None)
+        grupos.setdefault(dueno, []).append(i)
+    return grupos
+
+
+def _ejecutor() -> ThreadPoolExecutor:
+    global _dispersor, _dispersor_pid
+    with _dispersor_lock:
+        if _dispersor is None or _dispersor_pid != os.getpid():  # tras un fork los hilos no se heredan
+            _dispersor = ThreadPoolExecutor(max_workers=HILOS_DISPERSION, thread_name_prefix="shard")
+            _dispersor_pid = os.getpid()
+        return _dispersor
+
+
+def dispersar(fn: Callable[[Optional[str]], T], nombres: Optional[Iterable[Optional[str]]] = None) -> List[T]:
+    """
+    Scatter-gather: fn(shard) dentro de en_shard(shard) para cada shard de 'nombres' (default: todos),
+    en paralelo; resultados en el mismo orden. Sin shards, o con la petición ya enrutada a uno, es una
+    sola llamada en este hilo. Cada tarea corre con una copia del contexto del llamador (métricas y
+    traza SQL siguen contando en su petición); el primer error se relanza.
+    """
+    if nombres is None:
+        fijo = shard_fijado()
+        if not SHARDS or fijo is not None:
+            return [fn(fijo)]
+        nombres = SHARDS
+    nombres = list(nombres)
+    if len(nombres) <= 1:
+        if not nombres:
+            return []
+        with en_shard(nombres[0]):
+            return [fn(nombres[0])]
+
+    def _tarea(nombre: Optional[str]) -> T:
+        with en_shard(nombre):
+            metrics.DB_SHARD_USOS.inc(nombre or "")
+            return fn(nombre)
+
+    t0 = time.perf_counter()
+    pool = _ejecutor()
+    futuros = [pool.submit(contextvars.copy_context().run, _tarea, n) for n in nombres]
+    try:
+        return [f.result() for f in futuros]
+    finally:
+        metrics.DB_SHARD_DISPERSION.observe(time.perf_counter() - t0)
+
+
+def juntar(partes: List[List[T]], clave: Callable[[T], Any], reverse: bool = False) -> List[T]:
+    """Une los resultados de dispersar() ya ordenados por 'clave' en cada shard (merge, sin reordenar todo)."""
+    if len(partes) == 1:
+        return partes[0]
+    return list(heapq.merge(*partes, key=clave, reverse=reverse))
+
+
+def _sembrar_ids(conn, ruta_: str) -> None:
+    """Shard k > 0: sqlite_sequence de las tablas AUTOINCREMENT arranca en k * RANGO_IDS (una vez por archivo)."""
+    if ruta_ in _sembrado:
+        return
+    k = list(rutas().values()).index(ruta_) if ruta_ in rutas().values() else 0
+    if k > 0:
+        piso = k * RANGO_IDS
+        tablas = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND sql LIKE '%AUTOINCREMENT%';")]
+        with escritura(conn):
+            for t in tablas:
+                conn.execute("UPDATE sqlite_sequence SET seq=? WHERE name=? AND seq<?;", (piso, t, piso))
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? "
+                             "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name=?);", (t, piso, t))
+    _sembrado.add(ruta_)
+
+
+def _activar_wal(conn, ruta_: str) -> None:
+    if not WAL or ruta_ in _wal_ok:
+        return
+    with _wal_lock:
+        if ruta_ in _wal_ok:
+            return
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            _wal_ok.add(ruta_)
+        except sqlite3.Error as e:  # p.ej. otro proceso en medio de una escritura: se intenta en la próxima
+            log.warning("No se pudo activar WAL en %s: %s", ruta_, e)
+
+
+def _cerrar(conn) -> None:
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def _vigentes() -> set:
+    return set(rutas().values()) if SHARDS else {DB_PATH}
+
+
+def _libres() -> int:
+    return sum(len(v) for v in _pools.values())
+
+
+def _tomar(ruta_: str) -> Optional[sqlite3.Connection]:
+    """Conexión ociosa del pool de 'ruta_' en este proceso, o None."""
+    global _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():  # hijo de fork: las del padre no se tocan, solo se olvidan
+            _pools.clear()
+            _pool_pid = os.getpid()
+        libres = _pools.get(ruta_)
+        if libres:
+            conn = libres.pop()
+            metrics.DB_POOL_LIBRES.set(valor=_libres())
+            return conn
+        # Otro archivo (benchmarks, tests cambian DB_PATH o DB_SHARDS): las que sobran se cierran
+        vigentes = _vigentes()
+        viejas = [c for r in list(_pools) if r not in vigentes for c in _pools.pop(r)]
+        metrics.DB_POOL_LIBRES.set(valor=_libres())
+    for c in viejas:
+        _cerrar(c)
+    return None
+
+
+def _abrir(ruta_: str) -> sqlite3.Connection:
+    # La conexión instrumentada cuenta/cronometra sentencias para /metrics
+    conn = sqlite3.connect(ruta_, timeout=BUSY_TIMEOUT_MS / 1000.0, factory=metrics.ConexionInstrumentada,
+                           cached_statements=CACHED_STATEMENTS, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.__dict__["_ruta"] = ruta_
+    _activar_wal(conn, ruta_)
+    migraciones.asegurar(conn)  # una vez por proceso y archivo; luego solo una búsqueda en un set
+    if SHARDS:
+        _sembrar_ids(conn, ruta_)
+    return conn
+
+
+def al_devolver(conn, fn: Callable[[Any], None]) -> None:
+    """Registra fn(conn) para dejar la conexión limpia (vistas TEMP, ATTACH...) antes de volver al pool."""
+    pendientes = conn.__dict__.setdefault("_al_devolver", [])
+    if fn not in pendientes:
+        pendientes.append(fn)
+
+
+def _devolver(conn) -> None:
+    """Confirma, limpia el estado de la petición y la guarda en el pool (o la cierra si sobra o falló)."""
+    try:
+        conn.commit()
+        for fn in conn.__dict__.pop("_al_devolver", []):
+            fn(conn)
+        conn.commit()
+        conn.set_trace_callback(None)
+        conn.set_progress_handler(None, 0)
+    except Exception as e:
+        log.debug("Conexión descartada al devolverla: %s", e)
+        _cerrar(conn)
+        raise
+    ruta_ = conn.__dict__.get("_ruta")
+    with _pool_lock:
+        if _pool_pid == os.getpid() and ruta_ in _vigentes():
+            libres = _pools.setdefault(ruta_, [])
+            if len(libres) < POOL:
+                libres.append(conn)
+                metrics.DB_POOL_LIBRES.set(valor=_libres())
+                return
+    _cerrar(conn)
+
+
+@contextmanager
+def get_conn():
+    t0 = time.perf_counter()
+    ruta_ = ruta()
+    conn = _tomar(ruta_) if POOL > 0 else None
+    metrics.DB_POOL_USOS.inc("reutilizada" if conn is not None else "nueva")
+    if conn is None:
+        conn = _abrir(ruta_)
+    sqltrace.instalar(conn)  # no-op salvo que la petición se esté trazando (SQL_TRACE)
+    metrics.DB_ESPERA_CONEXION.observe(time.perf_counter() - t0)
+    metrics.DB_CONEXIONES_ABIERTAS.inc()
     try:
         yield conn
     finally:
+        try:
+            _devolver(conn)
+        finally:
+            metrics.DB_CONEXIONES_ABIERTAS.dec()
+
+
+def estado_pool() -> Dict[str, Any]:
+    """Conexiones ociosas/en uso y cuántas entregas reutilizaron una conexión ya abierta."""
+    nuevas = metrics.DB_POOL_USOS.valor("nueva")
+    reutilizadas = metrics.DB_POOL_USOS.valor("reutilizada")
+    with _pool_lock:
+        libres = _libres()
+        por_shard = {n: len(_pools.get(r, [])) for n, r in rutas().items()} if SHARDS else None
+    total = nuevas + reutilizadas
+    out = {
+        "tamano": POOL,
+        "libres": libres,
+        "en_uso": int(metrics.DB_CONEXIONES_ABIERTAS.valor()),
+        "nuevas": int(nuevas),
+        "reutilizadas": int(reutilizadas),
+        "tasa_reutilizacion": round(reutilizadas / total, 4) if total else 0.0,
+    }
+    if por_shard is not None:
+        out["libres_por_shard"] = por_shard
+    return out
+
+
+def cerrar_pool() -> None:
+    """Cierra las conexiones ociosas (apagado del proceso)."""
+    with _pool_lock:
+        viejas = [c for v in _pools.values() for c in v]
+        _pools.clear()
+    for c in viejas:
+        _cerrar(c)
+    metrics.DB_POOL_LIBRES.set(valor=0)
+
+
+def begin_immediate(conn) -> None:
+    """
+    Abre la transacción tomando YA el lock de escritura. Con BEGIN diferido, dos procesos que leen y
+    luego escriben chocan al promover el lock y uno falla sin que busy_timeout ayude; así, el segundo
+    espera en el BEGIN. Si tras busy_timeout sigue ocupado, reintenta con backoff + jitter.
+    """
+    if conn.in_transaction:  # trabajo pendiente (p.ej. verificación de esquema): se confirma antes
         conn.commit()
-        conn.close()
+    for intento in range(REINTENTOS + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if not es_bloqueo(e):
+                raise
+            metrics.DB_REINTENTOS_BLOQUEO.inc()
+            if intento >= REINTENTOS:
+                log.warning("Base ocupada tras %s reintentos: %s", REINTENTOS, e)
+                raise HTTPException(status_code=503, detail="Base de datos ocupada; reintente en unos segundos",
+                                    headers={"Retry-After": "1"})
+            time.sleep(REINTENTO_BASE_S * (2 ** intento) * (0.5 + random.random()))
+
+
+@contextmanager
+def escritura(conn):
+    """
+    Transacción de escritura: BEGIN IMMEDIATE (con reintentos), commit al salir y rollback si falla.
+    Con Idempotency-Key la clave queda marcada como aplicada en esta misma transacción.
+    """
+    from app import idempotencia  # importa deps
+
+    begin_immediate(conn)
+    try:
+        yield conn
+        idempotencia.registrar(conn)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
@@ -0,0 +1,99 @@
+# backend/app/detalle.py
+# Detalle compuesto de un préstamo (GET /prestamos/{id}/detalle): lo que la app pedía en cuatro
+# llamadas (/cuotas/prestamo/{id}/resumen, /cuotas?id_prestamo=, /cuotas/estado/prestamo/{id} y
+# /prestamos/{id}/plan) más el historial de abonos, en una sola respuesta.
+# - Una sola transacción de lectura: todas las secciones salen de la misma foto de la base (WAL),
+#   sin un pago colándose entre el resumen y el plan.
+# - Lecturas compartidas: la fila del préstamo y sus cuotas se leen una vez; resumen, cuotas, estado
+#   canónico y plan se derivan de ellas con las mismas reglas que los endpoints sueltos.
+# - ?secciones=resumen,cuotas,... devuelve solo esas (y no lee lo que ninguna necesita).
+from __future__ import annotations
+
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app import archivo, deps, saldos, sentencias, serializacion
+
+SECCIONES = ("resumen", "cuotas", "estado", "plan", "abonos")
+
+
+def secciones(texto: Optional[str]) -> Tuple[str, ...]:
+    """Secciones pedidas (todas si no se indica); 422 si alguna no existe."""
+    if not texto or not texto.strip():
+        return SECCIONES
+    pedidas = [s.strip().lower() for s in texto.split(",") if s.strip()]
+    desconocidas = [s for s in pedidas if s not in SECCIONES]
+    if desconocidas:
+        raise HTTPException(status_code=422, detail=f"Sección desconocida: {', '.join(desconocidas)} "
+                                                    f"(válidas: {', '.join(SECCIONES)})")
+    return tuple(s for s in SECCIONES if s in pedidas)
+
+
+def _abonos(conn, prestamo_id: int) -> List[Dict[str, Any]]:
+    sql = sentencias.sql("detalle.abonos", None, lambda: (
+        "SELECT id, fecha, monto FROM abonos_capital WHERE id_prestamo = ? ORDER BY date(fecha), id;"))
+    return serializacion.como_dicts(conn, sql, (prestamo_id,))
+
+
+def detalle_prestamo(prestamo_id: int, pedidas: Iterable[str] = SECCIONES) -> Dict[str, Any]:
+    from app.routers import cuotas as rc, prestamos as rp  # los routers importan este módulo
+
+    pedidas = set(pedidas)
+    hoy = date.today().isoformat()
+    out: Dict[str, Any] = {"id": prestamo_id, "fecha_referencia": hoy}
+    with deps.get_conn() as conn:
+        archivo.usar_si_archivado(conn, "prestamos", prestamo_id)  # ATTACH no se permite dentro de BEGIN
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN")  # la primera lectura fija la foto para todas las secciones
+        try:
+            p = conn.execute(sentencias.sql("detalle.prestamo", None,
+                                            lambda: "SELECT * FROM prestamos WHERE id = ?;"),
+                             (prestamo_id,)).fetchone()
+            if not p:
+                raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+
+            m = rc._CUOTA_COLS
+            nombres: List[str] = []
+            tuplas: List[tuple] = []
+            if pedidas & {"resumen", "cuotas", "estado", "plan"}:
+                cu_sql = sentencias.sql("cuotas.de_prestamo", None,
+                                        lambda: f"SELECT * FROM cuotas WHERE {m['fk_prestamo']}=? ORDER BY {m['numero']};")
+                nombres, tuplas = serializacion.consultar(conn, cu_sql, (prestamo_id,))
+            filas = [dict(zip(nombres, t)) for t in tuplas]
+
+            if "resumen" in pedidas:
+                cli = conn.execute(sentencias.sql("detalle.cliente", None,
+                                                  lambda: "SELECT nombre FROM clientes WHERE codigo = ?;"),
+                                   (p["cod_cli"],)).fetchone()
+                out["resumen"] = rc._resumen_de(p, cli["nombre"] if cli else None, filas, m, hoy)
+
+            if "cuotas" in pedidas:
+                a_cuota = rc._mapeador_cuota(nombres, m)
+                cuotas = [a_cuota(t) for t in tuplas]
+                for c in cuotas:  # igual que el resumen: sin modalidad propia, la del préstamo
+                    if not c.get("modalidad"):
+                        c["modalidad"] = p["modalidad"]
+                out["cuotas"] = cuotas
+
+            if "estado" in pedidas:
+                estados = [f[m["estado"]] for f in filas]
+                vencimientos = [d for d in (rc._dia(f[m["venc"]]) for f in filas) if d]
+                vencidas = sum(1 for e, f in zip(estados, filas)
+                               if e == "PENDIENTE" and (rc._dia(f[m["venc"]]) or "9999") < hoy)
+                out["estado"] = rc._estado_canonico(
+                    prestamo_id, saldos.de_fila(p), len(filas), estados.count("PAGADO"), vencidas,
+                    max(vencimientos) if vencimientos else None, hoy)
+
+            if "plan" in pedidas:
+                out["plan"] = rp._plan_de(p, filas)
+
+            if "abonos" in pedidas:
+                abonos = _abonos(conn, prestamo_id)
+                out["abonos"] = {"total": round(sum(float(a["monto"] or 0) for a in abonos), 2),
+                                 "items": abonos}
+        finally:
+            conn.commit()  # solo lectura: cierra la transacción
+    return out
@@ -0,0 +1,191 @@
+# backend/app/diagnostico.py
+# Diagnóstico de la base para decidir VACUUM / ANALYZE / cambios de índices con datos
+# (GET /mantenimiento/diagnostico).
+# - Esquema: app.schema_check.snapshot (cacheado hasta el próximo cambio de PRAGMA schema_version).
+# - Por tabla e índice, desde la tabla virtual dbstat: filas, páginas, bytes, bytes sin usar y
+#   fragmentación = fracción de saltos entre páginas consecutivas del b-tree que no son contiguas
+#   en el archivo (0 = recién compactado).
+# - Archivo: tamaño de página, páginas, freelist (páginas libres que solo VACUUM devuelve) y WAL.
+# - Uso de índices: EXPLAIN QUERY PLAN de las consultas del registro (app.sentencias), con NULL en
+#   cada parámetro. Solo cubre las formas que este proceso ya ejecutó: un índice "sin uso" aquí
+#   puede servir a consultas fijas de los routers.
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import deps, schema_check, sentencias
+
+# Umbrales de las sugerencias
+VACUUM_LIBRE = float(os.getenv("DIAG_VACUUM_LIBRE", "0.25"))  # fracción de páginas en la freelist
+VACUUM_FRAGMENTACION = float(os.getenv("DIAG_VACUUM_FRAGMENTACION", "0.5"))
+VACUUM_MIN_PAGINAS = int(os.getenv("DIAG_VACUUM_MIN_PAGINAS", "256"))  # bases chicas: no vale la pena
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_NOMBRADOS = re.compile(r":([A-Za-z_]\w*)")
+_INDICE = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+
+
+# ------------------ tamaños (dbstat) ------------------
+
+def _paginas(conn) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Por b-tree: páginas, bytes, sin usar, celdas y saltos no contiguos. None si no hay dbstat."""
+    try:
+        cur = conn.execute("SELECT name, pageno, pagetype, ncell, unused, pgsize FROM dbstat WHERE schema='main';")
+    except Exception:
+        return None
+    out: Dict[str, Dict[str, Any]] = {}
+    previa: Dict[str, int] = {}
+    # dbstat recorre cada b-tree en orden: una página que no sigue a la anterior es un salto
+    for nombre, pagina, tipo, celdas, libres, tam in cur:
+        d = out.setdefault(nombre, {"paginas": 0, "bytes": 0, "sin_usar": 0, "celdas_hoja": 0,
+                                    "celdas_internas": 0, "saltos": 0})
+        d["paginas"] += 1
+        d["bytes"] += tam
+        d["sin_usar"] += libres or 0
+        if tipo == "leaf":
+            d["celdas_hoja"] += celdas or 0
+        elif tipo == "internal":
+            d["celdas_internas"] += celdas or 0
+        if tipo != "overflow":
+            if nombre in previa and pagina != previa[nombre] + 1:
+                d["saltos"] += 1
+            previa[nombre] = pagina
+    return out
+
+
+def _fragmentacion(saltos: int, paginas: int) -> float:
+    return round(saltos / (paginas - 1), 4) if paginas > 1 else 0.0
+
+
+def _objetos(conn, paginas: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    maestros = conn.execute(
+        "SELECT name, type, tbl_name FROM sqlite_master WHERE type IN ('table', 'index') AND rootpage > 0;"
+    ).fetchall()
+    out = []
+    for nombre, tipo, tabla in maestros:
+        d = paginas.get(nombre) or {"paginas": 0, "bytes": 0, "sin_usar": 0, "celdas_hoja": 0,
+                                     "celdas_internas": 0, "saltos": 0}
+        # Tabla: una fila por celda de hoja. Índice: las celdas internas también son entradas
+        filas = d["celdas_hoja"] if tipo == "table" else d["celdas_hoja"] + d["celdas_internas"]
+        out.append({
+            "nombre": nombre, "tipo": tipo, "tabla": tabla, "filas": filas,
+            "paginas": d["paginas"], "bytes": d["bytes"], "sin_usar_bytes": d["sin_usar"],
+            "fragmentacion": _fragmentacion(d["saltos"], d["paginas"]),
+        })
+    out.sort(key=lambda o: (-o["bytes"], o["nombre"]))
+    return out
+
+
+def _archivo(conn) -> Dict[str, Any]:
+    tam = conn.execute("PRAGMA page_size;").fetchone()[0]
+    paginas = conn.execute("PRAGMA page_count;").fetchone()[0]
+    libres = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    wal = deps.ruta() + "-wal"
+    return {
+        "ruta": deps.ruta(),
+        "bytes": os.path.getsize(deps.ruta()) if os.path.exists(deps.ruta()) else None,
+        "page_size": tam,
+        "paginas": paginas,
+        "freelist_paginas": libres,
+        "freelist_bytes": libres * tam,
+        "proporcion_libre": round(libres / paginas, 4) if paginas else 0.0,
+        "journal_mode": conn.execute("PRAGMA journal_mode;").fetchone()[0],
+        "auto_vacuum": conn.execute("PRAGMA auto_vacuum;").fetchone()[0],
+        "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+    }
+
+
+# ------------------ uso de índices (EXPLAIN QUERY PLAN) ------------------
+
+def _parametros(sql: str):
+    """NULL para cada parámetro: dict si la consulta usa :nombre, tupla si usa '?'."""
+    limpio = _LITERALES.sub("", sql)
+    nombrados = _NOMBRADOS.findall(limpio)
+    if nombrados:
+        return {n: None for n in nombrados}
+    return (None,) * limpio.count("?")
+
+
+def _plan(conn, sql: str) -> Tuple[List[str], Optional[str]]:
+    try:
+        filas = conn.execute("EXPLAIN QUERY PLAN " + sql, _parametros(sql)).fetchall()
+    except Exception as e:  # p.ej. tabla TEMP de un proceso de archivado que ya no existe
+        return [], f"{type(e).__name__}: {e}"
+    return [r[3] for r in filas], None
+
+
+def _consultas(conn) -> List[Dict[str, Any]]:
+    out = []
+    for q in sentencias.registradas():
+        plan, error = _plan(conn, q["sql"])
+        d: Dict[str, Any] = {"nombre": q["nombre"], "forma": q["forma"]}
+        if error:
+            d["error"] = error
+        else:
+            d["indices"] = sorted({m for paso in plan for m in _INDICE.findall(paso)})
+            d["escaneos"] = [p for p in plan if p.startswith("SCAN ") and "INDEX" not in p
+                             and "CONSTANT ROW" not in p]
+            d["ordenamiento_temporal"] = any("TEMP B-TREE" in p for p in plan)
+            d["plan"] = plan
+        out.append(d)
+    return out
+
+
+# ------------------ sugerencias ------------------
+
+def _sugerencias(conn, archivo: Dict[str, Any], objetos: List[Dict[str, Any]]) -> Dict[str, Any]:
+    motivos = []
+    paginas = archivo["paginas"]
+    usadas = sum(o["paginas"] for o in objetos) or 1
+    frag = sum(o["fragmentacion"] * o["paginas"] for o in objetos) / usadas
+    vacuum = False
+    if paginas >= VACUUM_MIN_PAGINAS:
+        if archivo["proporcion_libre"] >= VACUUM_LIBRE:
+            vacuum = True
+            motivos.append(f"{archivo['proporcion_libre']:.0%} de las páginas está en la freelist")
+        if frag >= VACUUM_FRAGMENTACION:
+            vacuum = True
+            motivos.append(f"fragmentación media {frag:.0%}")
+
+    estadisticas = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1';"
+    ).fetchone() is not None
+    con_stat = set()
+    if estadisticas:
+        con_stat = {r[0] for r in conn.execute("SELECT DISTINCT tbl FROM sqlite_stat1;").fetchall()}
+    sin_stat = sorted({o["tabla"] for o in objetos if o["tipo"] == "index"} - con_stat)
+    if sin_stat:
+        motivos.append("tablas con índices sin estadísticas del planificador: " + ", ".join(sin_stat))
+    return {"vacuum": vacuum, "analyze": bool(sin_stat), "fragmentacion_media": round(frag, 4),
+            "motivos": motivos}
+
+
+def _etiqueta(q: Dict[str, Any]) -> str:
+    return q["nombre"] if q["forma"] is None else f"{q['nombre']} {q['forma']!r}"
+
+
+def diagnostico() -> Dict[str, Any]:
+    with deps.get_conn() as conn:
+        esquema = schema_check.snapshot(conn)
+        archivo = _archivo(conn)
+        paginas = _paginas(conn)
+        objetos = _objetos(conn, paginas) if paginas is not None else []
+        consultas = _consultas(conn)
+        sugerencias = _sugerencias(conn, archivo, objetos)
+
+    indices = sorted(o["nombre"] for o in objetos if o["tipo"] == "index")
+    uso = {i: [_etiqueta(q) for q in consultas if i in q.get("indices", ())] for i in indices}
+    return {
+        "archivo": archivo,
+        "objetos": objetos if paginas is not None else None,
+        "dbstat": paginas is not None,
+        "indices": {
+            "uso": uso,
+            "sin_uso_en_registro": [i for i, qs in uso.items() if not qs and not i.startswith("sqlite_autoindex_")],
+        },
+        "consultas": consultas,
+        "sugerencias": sugerencias,
+        "esquema": esquema,
+    }
@@ -0,0 +1,601 @@
+# backend/app/documentos.py
+# PDFs imprimibles: plan de pagos de un préstamo y estado de cuenta de un cliente.
+#
+#   cd backend
+#   python -m app.documentos plan 12 --salida plan-12.pdf
+#   python -m app.documentos estado 7 --corte 2026-09-30 --salida estado-7.pdf
+#   python -m app.documentos lote --mes 2026-09 --procesos 4      # estados de fin de mes de toda la cartera
+#
+# - Se dibujan con reportlab (platypus) en memoria; reportlab se importa en el primer PDF.
+# - Caché en disco (PDF_CACHE_DIR; default: <carpeta de DB_PATH>/pdf_cache) por versión del documento:
+#   la versión es el SHA-256 de los datos que entran al PDF (préstamo, cuotas, abonos, cliente) y de
+#   PLANTILLA. Un pago, abono o replan cambia la versión; al guardar la nueva se borra la anterior.
+#   Los PDFs no llevan fecha de generación (invariant), así que el mismo dato da los mismos bytes.
+#   La carpeta se comparte entre workers (escritura atómica) y se poda a PDF_CACHE_MAX_MB.
+# - Modo lote: reparte los clientes en bloques de PDF_LOTE entre PDF_PROCESOS procesos; cada proceso
+#   abre su propia conexión (réplica de reportes si está al día) y escribe los PDFs en el destino.
+#   Reporta documentos/s, MB/s y el reparto por proceso.
+from __future__ import annotations
+
+import argparse
+import calendar
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app import archivo, deps, metrics, replica
+
+log = logging.getLogger("documentos")
+
+DIRECTORIO_CACHE = (os.getenv("PDF_CACHE_DIR") or "").strip()  # vacío = <carpeta de DB_PATH>/pdf_cache
+CACHE_MAX_BYTES = int(float(os.getenv("PDF_CACHE_MAX_MB", "256")) * 1024 * 1024)
+PROCESOS = int(os.getenv("PDF_PROCESOS", "0"))  # 0 = os.cpu_count()
+LOTE = int(os.getenv("PDF_LOTE", "25"))
+PLANTILLA = "1"  # subir al cambiar el diseño: invalida la caché
+TOL = 0.005
+
+_PODAR_CADA = 100
+_escritos = 0
+_cache_lock = threading.Lock()
+
+
+def directorio_cache() -> str:
+    return DIRECTORIO_CACHE or os.path.join(os.path.dirname(os.path.abspath(deps.DB_PATH)), "pdf_cache")
+
+
+def _num(x) -> float:
+    try:
+        return float(x or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _dia(x) -> str:
+    return str(x or "")[:10]
+
+
+# ------------------ datos ------------------
+
+def datos_plan(prestamo_id: int) -> Dict[str, Any]:
+    """Plan del préstamo tal como lo devuelve GET /prestamos/{id}/plan, más el nombre del cliente."""
+    from app.routers.prestamos import obtener_plan_prestamo  # el router importa este módulo
+
+    plan = obtener_plan_prestamo(prestamo_id)
+    cliente = None
+    with deps.get_conn() as conn:
+        r = conn.execute("SELECT codigo, nombre FROM clientes WHERE codigo=?;", (plan["cod_cli"],)).fetchone()
+        cliente = {"codigo": r["codigo"], "nombre": r["nombre"]} if r else None
+    return {"prestamo": plan, "cliente": cliente}
+
+
+def _movimientos_prestamos(conn, p_rows: List[Any], desde: str, corte: str) -> List[Dict[str, Any]]:
+    """Situación al corte y movimientos del periodo de cada préstamo (en la base que esté leyendo conn)."""
+    p_rows = [p for p in p_rows if _dia(p["fecha_credito"]) <= corte]
+    if not p_rows:
+        return []
+    ids = [int(p["id"]) for p in p_rows]
+    marcas = ",".join("?" * len(ids))
+
+    cuotas: Dict[int, List[Any]] = {i: [] for i in ids}
+    for r in conn.execute(
+        f"SELECT id_prestamo AS pid, cuota_numero AS numero, fecha_vencimiento AS venc, interes_a_pagar AS interes, "
+        f"fecha_pago, estado, interes_pagado AS ipg "
+        f"FROM cuotas WHERE id_prestamo IN ({marcas}) ORDER BY id_prestamo, cuota_numero;", ids):
+        cuotas[int(r["pid"])].append(r)
+
+    abonos: Dict[int, List[Any]] = {i: [] for i in ids}
+    for r in conn.execute(
+        f"SELECT id_prestamo AS pid, fecha, monto FROM abonos_capital WHERE id_prestamo IN ({marcas}) "
+        f"ORDER BY fecha, id;", ids):
+        abonos[int(r["pid"])].append(r)
+
+    out: List[Dict[str, Any]] = []
+    for p in p_rows:
+        pid = int(p["id"])
+        monto = _num(p["importe_credito"])
+        movs: List[Dict[str, Any]] = []
+        abonado = 0.0
+        for a in abonos[pid]:
+            f = _dia(a["fecha"])
+            if f <= corte:
+                abonado += _num(a["monto"])
+                if f >= desde:
+                    movs.append({"fecha": f, "prestamo": pid, "concepto": "Abono a capital", "monto": _num(a["monto"])})
+        vencido = 0.0
+        n_vencidas = 0
+        proxima = None
+        for c in cuotas[pid]:
+            fp = _dia(c["fecha_pago"])
+            pagada = (c["estado"] or "") == "PAGADO" and (not fp or fp <= corte)
+            pagado = _num(c["ipg"]) if fp and fp <= corte else 0.0
+            if fp and desde <= fp <= corte and pagado > 0:
+                movs.append({"fecha": fp, "prestamo": pid, "concepto": f"Pago de interés cuota {c['numero']}",
+                             "monto": pagado})
+            if pagada:
+                continue
+            if _dia(c["venc"]) <= corte:
+                n_vencidas += 1
+                vencido += max(0.0, _num(c["interes"]) - pagado)
+            elif proxima is None:
+                proxima = {"numero": c["numero"], "fecha": _dia(c["venc"]), "interes": _num(c["interes"])}
+        pendiente = max(0.0, monto - abonado)
+        if pendiente <= TOL and vencido <= TOL and not movs:
+            continue
+        out.append({
+            "id": pid,
+            "fecha_credito": _dia(p["fecha_credito"]),
+            "monto": monto,
+            "modalidad": p["modalidad"],
+            "tasa": _num(p["tasa_interes"]),
+            "capital_pendiente": round(pendiente, 2),
+            "interes_vencido": round(vencido, 2),
+            "cuotas_vencidas": n_vencidas,
+            "proxima": proxima,
+            "movimientos": movs,
+        })
+    return out
+
+
+def datos_estado(conn, cliente_id: int, corte: date) -> Optional[Dict[str, Any]]:
+    """Estado de cuenta al corte (movimientos desde el día 1 del mes). None si el cliente no existe."""
+    c = conn.execute("SELECT * FROM clientes WHERE id=?;", (cliente_id,)).fetchone()
+    if not c:
+        return None
+    corte_iso = corte.isoformat()
+    desde = corte.replace(day=1).isoformat()
+    sql = "SELECT * FROM prestamos WHERE cod_cli=? ORDER BY id;"
+    prestamos = _movimientos_prestamos(conn, conn.execute(sql, (c["codigo"],)).fetchall(), desde, corte_iso)
+    # Préstamos cerrados movidos al archivo: solo aparecen si tuvieron movimiento en el periodo
+    with archivo.leyendo_archivo(conn) as hay:
+        if hay:
+            prestamos += _movimientos_prestamos(conn, conn.execute(sql, (c["codigo"],)).fetchall(),
+                                                desde, corte_iso)
+    prestamos.sort(key=lambda p: p["id"])
+    movimientos = sorted((m for p in prestamos for m in p["movimientos"]), key=lambda m: (m["fecha"], m["prestamo"]))
+    return {
+        "cliente": {k: c[k] for k in ("id", "codigo", "nombre", "identificacion", "direccion", "telefono", "email")
+                    if k in c.keys()},
+        "desde": desde,
+        "corte": corte_iso,
+        "prestamos": prestamos,
+        "movimientos": movimientos,
+        "totales": {
+            "capital_pendiente": round(sum(p["capital_pendiente"] for p in prestamos), 2),
+            "interes_vencido": round(sum(p["interes_vencido"] for p in prestamos), 2),
+            "pagado_periodo": round(sum(m["monto"] for m in movimientos), 2),
+        },
+    }
+
+
+# ------------------ dibujo ------------------
+
+def _money(x) -> str:
+    return f"{_num(x):,.2f}"
+
+
+def _pdf(titulo: str, ver: str, elementos: Callable[[Dict[str, Any]], List[Any]]) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate
+
+    def pie(canvas, doc) -> None:
+        canvas.saveState()
+        canvas.setFont("Helvetica", 7)
+        canvas.setFillGray(0.45)
+        canvas.drawString(15 * mm, 10 * mm, f"{titulo} · versión {ver}")
+        canvas.drawRightString(A4[0] - 15 * mm, 10 * mm, f"Página {doc.page}")
+        canvas.restoreState()
+
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, title=titulo, author="Demo Android", invariant=True,
+                            leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=18 * mm)
+    doc.build(elementos(_estilos()), onFirstPage=pie, onLaterPages=pie)
+    return buf.getvalue()
+
+
+def _estilos() -> Dict[str, Any]:
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import TableStyle
+
+    hoja = getSampleStyleSheet()
+    return {
+        "titulo": hoja["Title"],
+        "sub": hoja["Heading3"],
+        "texto": hoja["BodyText"],
+        "ficha": TableStyle([
+            ("FONT", (0, 0), (0, -1), "Helvetica-Bold", 9),
+            ("FONT", (1, 0), (-1, -1), "Helvetica", 9),
+            ("FONT", (2, 0), (2, -1), "Helvetica-Bold", 9),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+        ]),
+        "tabla": TableStyle([
+            ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 8),
+            ("FONT", (0, 1), (-1, -1), "Helvetica", 8),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#e8edf3")),
+            ("LINEBELOW", (0, 0), (-1, 0), 0.6, colors.HexColor("#5b6b7f")),
+            ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f7f9fb")]),
+            ("ALIGN", (2, 0), (-1, -1), "RIGHT"),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+            ("TOPPADDING", (0, 0), (-1, -1), 2),
+        ]),
+        "totales": TableStyle([
+            ("FONT", (0, -1), (-1, -1), "Helvetica-Bold", 8),
+            ("LINEABOVE", (0, -1), (-1, -1), 0.6, colors.HexColor("#5b6b7f")),
+        ]),
+    }
+
+
+def _tabla(filas: List[List[Any]], anchos: List[float], estilo, totales=None):
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Table
+
+    t = Table(filas, colWidths=[a * mm for a in anchos], repeatRows=1)
+    t.setStyle(estilo)
+    if totales is not None:
+        t.setStyle(totales)
+    return t
+
+
+def _ficha(pares: List[Tuple[str, Any]], estilo):
+    """Datos de cabecera en dos columnas de etiqueta/valor."""
+    filas = []
+    for i in range(0, len(pares), 2):
+        fila: List[Any] = []
+        for k, v in pares[i:i + 2]:
+            fila += [k, "" if v is None else str(v)]
+        filas.append(fila + [""] * (4 - len(fila)))
+    return _tabla(filas, [32, 58, 32, 58], estilo)
+
+
+def _dibujar_plan(datos: Dict[str, Any], ver: str) -> bytes:
+    from reportlab.platypus import Paragraph, Spacer
+
+    p = datos["prestamo"]
+    cli = datos.get("cliente") or {}
+    titulo = f"Plan de pagos · Préstamo #{p['id']}"
+
+    def elementos(e: Dict[str, Any]) -> List[Any]:
+        filas: List[List[Any]] = [["N°", "Vencimiento", "Capital", "Interés", "Total", "Int. pagado", "Abono cap.",
+                                   "Estado"]]
+        tot = [0.0, 0.0, 0.0, 0.0]
+        for c in p["plan"]:
+            cap, inte, ipg, ab = _num(c["capital"]), _num(c["interes"]), _num(c["interes_pagado"]), _num(c["abono_capital"])
+            tot = [tot[0] + cap, tot[1] + inte, tot[2] + ipg, tot[3] + ab]
+            filas.append([c["numero"], _dia(c["fecha"]), _money(cap), _money(inte), _money(cap + inte), _money(ipg),
+                          _money(ab), c["estado"]])
+        filas.append(["", "Totales", _money(tot[0]), _money(tot[1]), _money(tot[0] + tot[1]), _money(tot[2]),
+                      _money(tot[3]), ""])
+        return [
+            Paragraph(titulo, e["titulo"]),
+            _ficha([
+                ("Cliente", f"{cli.get('codigo') or p['cod_cli']} · {cli.get('nombre') or ''}".strip(" ·")),
+                ("Estado", p["estado"]),
+                ("Fecha crédito", p["fecha_inicio"]),
+                ("Monto", _money(p["monto"])),
+                ("Modalidad", p["modalidad"]),
+                ("Tasa", f"{_num(p['tasa']):g} %"),
+                ("Cuotas", p["num_cuotas"]),
+                ("Plan", p["plan_mode"]),
+            ], e["ficha"]),
+            Spacer(1, 10),
+            _tabla(filas, [10, 24, 23, 23, 23, 23, 23, 31], e["tabla"], e["totales"]),
+        ]
+
+    return _pdf(titulo, ver, elementos)
+
+
+def _dibujar_estado(datos: Dict[str, Any], ver: str) -> bytes:
+    from reportlab.platypus import Paragraph, Spacer
+
+    cli = datos["cliente"]
+    tot = datos["totales"]
+    titulo = f"Estado de cuenta · {cli.get('codigo') or cli['id']} · al {datos['corte']}"
+
+    def elementos(e: Dict[str, Any]) -> List[Any]:
+        out: List[Any] = [
+            Paragraph(titulo, e["titulo"]),
+            _ficha([
+                ("Cliente", cli.get("nombre")),
+                ("Código", cli.get("codigo")),
+                ("Identificación", cli.get("identificacion")),
+                ("Teléfono", cli.get("telefono")),
+                ("Periodo", f"{datos['desde']} a {datos['corte']}"),
+                ("Correo", cli.get("email")),
+                ("Capital pendiente", _money(tot["capital_pendiente"])),
+                ("Interés vencido", _money(tot["interes_vencido"])),
+            ], e["ficha"]),
+            Spacer(1, 10),
+            Paragraph("Préstamos", e["sub"]),
+        ]
+        if datos["prestamos"]:
+            filas: List[List[Any]] = [["Préstamo", "Fecha", "Monto", "Tasa", "Cap. pendiente", "Int. vencido",
+                                       "Vencidas", "Próxima cuota"]]
+            for p in datos["prestamos"]:
+                prox = p["proxima"]
+                filas.append([f"#{p['id']}", p["fecha_credito"], _money(p["monto"]), f"{p['tasa']:g} %",
+                              _money(p["capital_pendiente"]), _money(p["interes_vencido"]), p["cuotas_vencidas"],
+                              f"{prox['fecha']} · {_money(prox['interes'])}" if prox else "—"])
+            out.append(_tabla(filas, [17, 20, 22, 14, 25, 22, 15, 45], e["tabla"]))
+        else:
+            out.append(Paragraph("Sin préstamos con saldo o movimientos en el periodo.", e["texto"]))
+        out += [Spacer(1, 10), Paragraph("Movimientos del periodo", e["sub"])]
+        if datos["movimientos"]:
+            filas = [["Fecha", "Préstamo", "Concepto", "Monto"]]
+            filas += [[m["fecha"], f"#{m['prestamo']}", m["concepto"], _money(m["monto"])] for m in datos["movimientos"]]
+            filas.append(["", "", "Total pagado", _money(tot["pagado_periodo"])])
+            t = _tabla(filas, [25, 20, 100, 35], e["tabla"], e["totales"])
+            t.setStyle([("ALIGN", (2, 0), (2, -1), "LEFT")])
+            out.append(t)
+        else:
+            out.append(Paragraph("Sin pagos ni abonos en el periodo.", e["texto"]))
+        return out
+
+    return _pdf(titulo, ver, elementos)
+
+
+# ------------------ caché por versión ------------------
+
+def version(datos: Dict[str, Any]) -> str:
+    crudo = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{PLANTILLA}\n{crudo}".encode("utf-8")).hexdigest()[:16]
+
+
+def _podar(directorio: str) -> None:
+    """Borra los PDFs menos usados (mtime) hasta quedar bajo PDF_CACHE_MAX_MB."""
+    try:
+        archivos = [e for e in os.scandir(directorio) if e.name.endswith(".pdf")]
+        info = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in archivos), reverse=True)
+    except OSError:
+        return
+    total = 0
+    for _, tam, ruta in info:
+        total += tam
+        if total > CACHE_MAX_BYTES:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+def _guardar(directorio: str, nombre: str, ver: str, pdf: bytes) -> None:
+    global _escritos
+    os.makedirs(directorio, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".pdf", dir=directorio)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(pdf)
+        os.replace(tmp, os.path.join(directorio, f"{nombre}-{ver}.pdf"))
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    # Versiones anteriores del mismo documento
+    viejo = re.compile(rf"^{re.escape(nombre)}-(?!{ver})[0-9a-f]{{16}}\.pdf$")
+    for e in os.scandir(directorio):
+        if viejo.match(e.name):
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+    with _cache_lock:
+        _escritos += 1
+        podar = _escritos % _PODAR_CADA == 0
+    if podar:
+        _podar(directorio)
+
+
+def documento(nombre: str, datos: Dict[str, Any], dibujar: Callable[[Dict[str, Any], str], bytes],
+              usar_cache: bool = True) -> Tuple[bytes, str, bool]:
+    """(pdf, versión, desde_cache). 'nombre' identifica el documento (p.ej. plan-12); la versión, su contenido."""
+    tipo = nombre.split("-", 1)[0]
+    ver = version(datos)
+    directorio = directorio_cache()
+    ruta = os.path.join(directorio, f"{nombre}-{ver}.pdf")
+    if usar_cache:
+        try:
+            with open(ruta, "rb") as fh:
+                pdf = fh.read()
+            try:
+                os.utime(ruta)  # para la poda por uso
+            except OSError:
+                pass
+            metrics.PDF_CACHE.inc(tipo, "hit")
+            return pdf, ver, True
+        except FileNotFoundError:
+            pass
+    metrics.PDF_CACHE.inc(tipo, "miss")
+    t0 = time.perf_counter()
+    pdf = dibujar(datos, ver)
+    metrics.PDF_RENDER.observe(time.perf_counter() - t0, tipo)
+    if usar_cache:
+        try:
+            _guardar(directorio, nombre, ver, pdf)
+        except OSError as e:
+            log.warning("No se pudo guardar %s en la caché de PDFs: %s", nombre, e)
+    return pdf, ver, False
+
+
+def pdf_plan(prestamo_id: int, usar_cache: bool = True) -> Tuple[bytes, str, bool]:
+    return documento(f"plan-{prestamo_id}", datos_plan(prestamo_id), _dibujar_plan, usar_cache)
+
+
+def pdf_estado(datos: Dict[str, Any], usar_cache: bool = True) -> Tuple[bytes, str, bool]:
+    return documento(f"estado-{datos['cliente']['id']}-{datos['corte']}", datos, _dibujar_estado, usar_cache)
+
+
+def respuesta(request, pdf: bytes, ver: str, desde_cache: bool, archivo_pdf: str):
+    """Response PDF con ETag de la versión (304 si el cliente ya la tiene)."""
+    from starlette.responses import Response
+
+    etag = f'"{ver}"'
+    cabeceras = {"ETag": etag, "Cache-Control": "private, no-cache", "X-Cache": "HIT" if desde_cache else "MISS"}
+    pedidas = [v.strip() for v in (request.headers.get("if-none-match") or "").split(",")]
+    if etag in pedidas or f"W/{etag}" in pedidas:
+        return Response(status_code=304, headers=cabeceras)
+    cabeceras["Content-Disposition"] = f'inline; filename="{archivo_pdf}"'
+    return Response(content=pdf, media_type="application/pdf", headers=cabeceras)
+
+
+# ------------------ lote de fin de mes (pool de procesos) ------------------
+
+def fin_de_mes(mes: Optional[str] = None) -> date:
+    """Último día de 'YYYY-MM'; sin mes, el del mes anterior (el último cerrado)."""
+    if mes:
+        y, m = (int(x) for x in mes.split("-", 1))
+    else:
+        previo = date.today().replace(day=1) - timedelta(days=1)
+        y, m = previo.year, previo.month
+    return date(y, m, calendar.monthrange(y, m)[1])
+
+
+def _clientes_con_prestamos() -> List[int]:
+    sql = ("SELECT c.id FROM clientes c WHERE EXISTS (SELECT 1 FROM prestamos p WHERE p.cod_cli = c.codigo);")
+    with replica.conexion_reportes() as conn:
+        ids = {r[0] for r in conn.execute(sql)}
+        with archivo.leyendo_archivo(conn) as hay:
+            if hay:
+                ids.update(r[0] for r in conn.execute(sql))
+    return sorted(ids)
+
+
+def _iniciar_trabajador(db_path: str) -> None:
+    deps.DB_PATH = db_path
+
+
+def _nombre_archivo(cliente: Dict[str, Any]) -> str:
+    return "estado-" + re.sub(r"[^\w.-]", "_", str(cliente.get("codigo") or cliente["id"])) + ".pdf"
+
+
+def _trabajo_lote(ids: List[int], corte_iso: str, destino: str, usar_cache: bool) -> Dict[str, Any]:
+    """Un bloque de clientes en un proceso del pool: datos, PDF (o caché) y archivo en 'destino'."""
+    corte = date.fromisoformat(corte_iso)
+    res = {"pid": os.getpid(), "documentos": 0, "vacios": 0, "errores": 0, "cache": 0, "bytes": 0,
+           "segundos": 0.0}
+    t0 = time.perf_counter()
+    with replica.conexion_reportes() as conn:
+        for cid in ids:
+            try:
+                datos = datos_estado(conn, cid, corte)
+                if not datos or not datos["prestamos"]:
+                    res["vacios"] += 1
+                    continue
+                pdf, _, hit = pdf_estado(datos, usar_cache)
+                with open(os.path.join(destino, _nombre_archivo(datos["cliente"])), "wb") as fh:
+                    fh.write(pdf)
+                res["documentos"] += 1
+                res["cache"] += int(hit)
+                res["bytes"] += len(pdf)
+            except Exception as e:
+                res["errores"] += 1
+                log.warning("Estado de cuenta del cliente %s: %s", cid, e)
+    res["segundos"] = time.perf_counter() - t0
+    return res
+
+
+def lote(corte: date, procesos: Optional[int] = None, destino: Optional[str] = None,
+         usar_cache: bool = True, tam_lote: Optional[int] = None) -> Dict[str, Any]:
+    """Estados de cuenta al 'corte' de todos los clientes con préstamos, repartidos en un pool de procesos."""
+    procesos = max(1, procesos or PROCESOS or os.cpu_count() or 1)
+    tam_lote = max(1, tam_lote or LOTE)
+    destino = destino or os.path.join(os.path.dirname(os.path.abspath(deps.DB_PATH)), "estados", corte.strftime("%Y-%m"))
+    os.makedirs(destino, exist_ok=True)
+
+    t0 = time.perf_counter()
+    ids = _clientes_con_prestamos()
+    bloques = [ids[i:i + tam_lote] for i in range(0, len(ids), tam_lote)]
+    args = (corte.isoformat(), destino, usar_cache)
+    parciales: List[Dict[str, Any]] = []
+    if procesos == 1:
+        parciales = [_trabajo_lote(b, *args) for b in bloques]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_trabajador,
+                                 initargs=(deps.DB_PATH,)) as pool:
+            futuros = [pool.submit(_trabajo_lote, b, *args) for b in bloques]
+            for n, f in enumerate(as_completed(futuros), 1):
+                parciales.append(f.result())
+                log.info("Estados de cuenta: bloque %d/%d", n, len(futuros))
+    segundos = time.perf_counter() - t0
+
+    total = {k: sum(p[k] for p in parciales) for k in ("documentos", "vacios", "errores", "cache", "bytes")}
+    por_proceso: Dict[str, Dict[str, Any]] = {}
+    for p in parciales:
+        d = por_proceso.setdefault(str(p["pid"]), {"bloques": 0, "documentos": 0, "segundos": 0.0})
+        d["bloques"] += 1
+        d["documentos"] += p["documentos"]
+        d["segundos"] = round(d["segundos"] + p["segundos"], 3)
+    res = {
+        "corte": corte.isoformat(),
+        "destino": destino,
+        "procesos": procesos,
+        "bloques": len(bloques),
+        "clientes": len(ids),
+        **total,
+        "segundos": round(segundos, 3),
+        "documentos_s": round(total["documentos"] / segundos, 2) if segundos > 0 else None,
+        "mb_s": round(total["bytes"] / 1048576.0 / segundos, 3) if segundos > 0 else None,
+        "por_proceso": por_proceso,
+    }
+    log.info("Estados de cuenta: %s documentos en %.2fs (%s doc/s, %d procesos)",
+             total["documentos"], segundos, res["documentos_s"], procesos)
+    return res
+
+
+# ------------------ CLI ------------------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="PDFs de plan de pagos y estados de cuenta")
+    sub = ap.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("plan", help="Plan de pagos de un préstamo")
+    p.add_argument("prestamo_id", type=int)
+    p.add_argument("--salida", required=True)
+    e = sub.add_parser("estado", help="Estado de cuenta de un cliente")
+    e.add_argument("cliente_id", type=int)
+    e.add_argument("--corte", default=None, help="YYYY-MM-DD (default: hoy)")
+    e.add_argument("--salida", required=True)
+    lt = sub.add_parser("lote", help="Estados de fin de mes de toda la cartera en un pool de procesos")
+    lt.add_argument("--mes", default=None, help="YYYY-MM (default: el mes anterior)")
+    lt.add_argument("--procesos", type=int, default=None, help="default: PDF_PROCESOS o núcleos disponibles")
+    lt.add_argument("--lote", type=int, default=None, help=f"Clientes por bloque (default: {LOTE})")
+    lt.add_argument("--destino", default=None, help="Carpeta de salida (default: <carpeta de DB_PATH>/estados/YYYY-MM)")
+    lt.add_argument("--sin-cache", action="store_true", help="Dibujar todo de nuevo sin leer ni escribir la caché")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    try:
+        if args.comando == "lote":
+            res = lote(fin_de_mes(args.mes), args.procesos, args.destino, not args.sin_cache, args.lote)
+        else:
+            if args.comando == "plan":
+                pdf, ver, hit = pdf_plan(args.prestamo_id)
+            else:
+                corte = date.fromisoformat(args.corte) if args.corte else date.today()
+                with replica.conexion_reportes() as conn:
+                    datos = datos_estado(conn, args.cliente_id, corte)
+                if datos is None:
+                    raise LookupError(f"Cliente {args.cliente_id} no encontrado")
+                pdf, ver, hit = pdf_estado(datos)
+            with open(args.salida, "wb") as fh:
+                fh.write(pdf)
+            res = {"salida": args.salida, "bytes": len(pdf), "version": ver, "cache": hit}
+    except Exception as ex:  # HTTPException del router (404), fechas inválidas, errores de SQLite
+        print(f"ERROR: {getattr(ex, 'detail', None) or ex}", file=sys.stderr)
+        return 1
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# backend/app/escritor.py
+# Modo multi-proceso con UN solo proceso escritor (opcional).
+#
+#   # proceso escritor (uno solo)
+#   DB_ESCRITOR_SOCKET=/tmp/demo-escritor.sock python -m app.escritor
+#   # workers HTTP (N); reenvían POST/PUT/PATCH/DELETE al escritor, las lecturas se atienden localmente
+#   DB_ESCRITOR_SOCKET=/tmp/demo-escritor.sock uvicorn app.main:app --workers 4
+#
+# - Protocolo por socket Unix local: marcos con longitud (4 bytes big-endian) + contenido.
+#   Petición: JSON {method, path, query_string, headers, client} + cuerpo. Respuesta: JSON {status, headers} + cuerpo.
+# - El escritor despacha cada petición a la MISMA app ASGI (mismas validaciones, idempotencia, métricas),
+#   de a una por vez (DB_ESCRITOR_SERIALIZAR=on): no hay dos escrituras compitiendo por el lock de SQLite.
+# - Excepción: pagos y abonos con commit agrupado (COMMIT_AGRUPADO=on, app.agrupador) se despachan sin
+#   el cerrojo. El agrupador ya los serializa en su hilo escritor; detrás del cerrojo llegarían de a uno
+#   y nunca se juntarían en un mismo commit.
+# - Si no se puede conectar con el escritor (nada enviado todavía), el worker atiende la escritura
+#   localmente (BEGIN IMMEDIATE + busy_timeout) y lo registra; no se pierde la petición.
+# - Enviada la petición, el escritor pudo haberla aplicado: si no llega respuesta (timeout, corte o
+#   marco inválido) se devuelve 504/502 con Retry-After y NUNCA se repite localmente (sin
+#   Idempotency-Key sería un pago o abono duplicado). El cliente reintenta con su Idempotency-Key.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import agrupador, metrics
+
+log = logging.getLogger("escritor")
+
+SOCKET = (os.getenv("DB_ESCRITOR_SOCKET") or "").strip()
+TIMEOUT_S = float(os.getenv("DB_ESCRITOR_TIMEOUT_S", "30"))
+SERIALIZAR = (os.getenv("DB_ESCRITOR_SERIALIZAR", "on") or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+METODOS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_MARCO = 64 * 1024 * 1024
+# Rutas que aplica app.agrupador (mismas que los grupos pago/abono de app.admision)
+_AGRUPADAS = re.compile(r"^/cuotas/\d+/(pago|abono-capital)/?$")
+
+# True solo dentro del proceso escritor (no reenvía a sí mismo)
+ES_ESCRITOR = False
+
+
+# ------------------ marcos ------------------
+
+async def _leer_marco(reader: asyncio.StreamReader) -> bytes:
+    (n,) = struct.unpack(">I", await reader.readexactly(4))
+    if n > MAX_MARCO:
+        raise ValueError(f"Marco demasiado grande ({n} bytes)")
+    return await reader.readexactly(n)
+
+
+def _escribir_marco(writer: asyncio.StreamWriter, datos: bytes) -> None:
+    writer.write(struct.pack(">I", len(datos)) + datos)
+
+
+# ------------------ lado worker: reenvío ------------------
+
+async def _reenviar(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, scope: Dict[str, Any],
+                    cuerpo: bytes) -> Tuple[int, List[List[str]], bytes]:
+    try:
+        meta = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "query_string": scope.get("query_string", b"").decode("latin-1"),
+            "headers": [[k.decode("latin-1"), v.decode("latin-1")] for k, v in scope.get("headers", [])],
+            "client": list(scope["client"]) if scope.get("client") else None,
+        }
+        _escribir_marco(writer, json.dumps(meta).encode("utf-8"))
+        _escribir_marco(writer, cuerpo)
+        await writer.drain()
+        resp = json.loads(await _leer_marco(reader))
+        return int(resp["status"]), resp["headers"], await _leer_marco(reader)
+    finally:
+        writer.close()
+
+
+class ReenvioEscrituraMiddleware:
+    """ASGI: con DB_ESCRITOR_SOCKET, los métodos que mutan se atienden en el proceso escritor."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or ES_ESCRITOR or not SOCKET or scope["method"] not in METODOS:
+            await self.app(scope, receive, send)
+            return
+
+        partes: List[bytes] = []
+        while True:
+            msg = await receive()
+            if msg["type"] == "http.disconnect":
+                return
+            partes.append(msg.get("body", b""))
+            if not msg.get("more_body"):
+                break
+        cuerpo = b"".join(partes)
+
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(SOCKET), TIMEOUT_S)
+        except (OSError, asyncio.TimeoutError) as e:  # nada enviado: atenderla aquí es seguro
+            metrics.ESCRITOR_REENVIOS.inc("local")
+            log.warning("Escritor no disponible (%s); se atiende localmente %s %s", e, scope["method"], scope["path"])
+
+            entregado = False
+            terminado = asyncio.Event()  # como en el escritor: no avisar desconexión antes de responder
+
+            async def receive_local():
+                nonlocal entregado
+                if entregado:
+                    await terminado.wait()
+                    return {"type": "http.disconnect"}
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+
+            async def send_local(msg):
+                if msg["type"] == "http.response.body" and not msg.get("more_body"):
+                    terminado.set()
+                await send(msg)
+
+            await self.app(scope, receive_local, send_local)
+            return
+
+        try:
+            status, headers, respuesta = await asyncio.wait_for(_reenviar(reader, writer, scope, cuerpo), TIMEOUT_S)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            # Ya enviada: el escritor pudo aplicarla. No se repite aquí; el cliente reintenta con su clave
+            timeout = isinstance(e, asyncio.TimeoutError)
+            metrics.ESCRITOR_REENVIOS.inc("timeout" if timeout else "sin_respuesta")
+            log.warning("Sin respuesta del escritor para %s %s (%s); no se reintenta localmente",
+                        scope["method"], scope["path"], e or type(e).__name__)
+            detalle = ("El escritor no respondió a tiempo" if timeout else "Se perdió la respuesta del escritor")
+            cuerpo_error = json.dumps({"detail": f"{detalle}; la operación pudo haberse aplicado. Reintente con la "
+                                                 f"misma Idempotency-Key"}).encode("utf-8")
+            await send({"type": "http.response.start", "status": 504 if timeout else 502,
+                        "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1"),
+                                    (b"content-length", str(len(cuerpo_error)).encode("latin-1"))]})
+            await send({"type": "http.response.body", "body": cuerpo_error})
+            return
+
+        metrics.ESCRITOR_REENVIOS.inc("ok")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        await send({"type": "http.response.body", "body": respuesta})
+
+
+# ------------------ lado escritor: servidor ------------------
+
+def _serializar(meta: Dict[str, Any]) -> bool:
+    """Pagos y abonos agrupados no toman el cerrojo: el agrupador los serializa y junta en un commit."""
+    if not SERIALIZAR:
+        return False
+    return not (agrupador.ACTIVO and meta.get("method") == "POST" and _AGRUPADAS.match(meta.get("path") or ""))
+
+
+class _Escritor:
+    def __init__(self, app):
+        self.app = app
+        self.cerrojo = asyncio.Lock()
+
+    async def _despachar(self, meta: Dict[str, Any], cuerpo: bytes) -> Tuple[int, List[List[str]], bytes]:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.3"},
+            "http_version": "1.1",
+            "method": meta["method"],
+            "scheme": "http",
+            "path": meta["path"],
+            "raw_path": meta["path"].encode("utf-8"),
+            "query_string": (meta.get("query_string") or "").encode("latin-1"),
+            "root_path": "",
+            "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in meta.get("headers") or []],
+            "client": tuple(meta["client"]) if meta.get("client") else None,
+            "server": ("escritor", 0),
+        }
+        entregado = False
+        terminado = asyncio.Event()  # la app puede seguir corriendo BackgroundTasks (p.ej. correo) después
+        inicio: Dict[str, Any] = {}
+        partes: List[bytes] = []
+
+        async def receive():
+            nonlocal entregado
+            if entregado:
+                await terminado.wait()
+                return {"type": "http.disconnect"}
+            entregado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+
+        async def send(msg):
+            if msg["type"] == "http.response.start":
+                inicio.update(msg)
+            elif msg["type"] == "http.response.body":
+                partes.append(msg.get("body", b""))
+                if not msg.get("more_body"):
+                    terminado.set()
+
+        tarea = asyncio.ensure_future(self.app(scope, receive, send))
+        espera = asyncio.ensure_future(terminado.wait())
+        await asyncio.wait([tarea, espera], return_when=asyncio.FIRST_COMPLETED)
+        if not terminado.is_set():
+            espera.cancel()
+            tarea.result()  # la app terminó sin responder: propaga su excepción
+            raise RuntimeError("La app no produjo respuesta")
+        headers = [[k.decode("latin-1"), v.decode("latin-1")] for k, v in inicio.get("headers", [])]
+        return int(inicio.get("status", 500)), headers, b"".join(partes)
+
+    async def atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            meta = json.loads(await _leer_marco(reader))
+            cuerpo = await _leer_marco(reader)
+            if _serializar(meta):
+                async with self.cerrojo:
+                    status, headers, resp = await self._despachar(meta, cuerpo)
+            else:
+                status, headers, resp = await self._despachar(meta, cuerpo)
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return
+        except Exception as e:
+            log.exception("Error atendiendo escritura reenviada")
+            status, headers = 500, [["content-type", "application/json"]]
+            resp = json.dumps({"detail": f"Error interno en escritor: {type(e).__name__}: {e}"}).encode("utf-8")
+        try:
+            _escribir_marco(writer, json.dumps({"status": status, "headers": headers}).encode("utf-8"))
+            _escribir_marco(writer, resp)
+            await writer.drain()
+        except OSError as e:  # el worker cortó (timeout): la escritura ya quedó aplicada
+            log.warning("No se pudo responder al worker: %s", e)
+        finally:
+            writer.close()
+
+
+async def servir(ruta: str) -> None:
+    global ES_ESCRITOR
+    ES_ESCRITOR = True
+    from app.main import app
+
+    if os.path.exists(ruta):
+        os.remove(ruta)  # socket huérfano de una ejecución anterior
+    escritor = _Escritor(app)
+    await app.router.startup()
+    servidor = await asyncio.start_unix_server(escritor.atender, path=ruta)
+    log.info("Escritor SQLite atendiendo en %s (serializar=%s)", ruta, SERIALIZAR)
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        await app.router.shutdown()
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Proceso escritor único para despliegues multi-worker")
+    ap.add_argument("--socket", default=SOCKET, help="Ruta del socket Unix (default: DB_ESCRITOR_SOCKET)")
+    args = ap.parse_args(argv)
+    if not args.socket:
+        ap.error("Indica --socket o DB_ESCRITOR_SOCKET")
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    # Con 'python -m app.escritor' este archivo corre como __main__; ES_ESCRITOR debe fijarse
+    # en el módulo app.escritor, que es el que consulta el middleware de la app
+    from app import escritor
+    try:
+        asyncio.run(escritor.servir(args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
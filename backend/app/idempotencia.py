@@ -0,0 +1,253 @@
+# backend/app/idempotencia.py
+# Soporte de cabecera 'Idempotency-Key' para TODOS los endpoints que mutan (POST/PUT/PATCH/DELETE).
+# - La primera respuesta se guarda en una tabla compacta con TTL, con status, cuerpo y todas sus cabeceras.
+# - Un reintento con la misma clave devuelve esa respuesta sin re-ejecutar el endpoint
+#   (una búsqueda por PK), evitando p.ej. abonos duplicados en 'abonos_capital'.
+# - La mutación deja su huella en la MISMA transacción que la confirma (registrar): el escritor
+#   agrupado guarda ahí el resultado completo y deps.escritura marca la clave como aplicada. Si el
+#   proceso muere antes de guardar la respuesta final, el reintento ya no re-ejecuta: recibe el
+#   resultado guardado o, sin él, un 409 que dice que la operación ya se aplicó.
+# - Los 5xx liberan la clave (el reintento re-ejecuta) salvo que la mutación ya se haya confirmado:
+#   entonces el error queda guardado como respuesta definitiva y los reintentos lo reciben.
+# - Las claves vencidas se purgan periódicamente (y por endpoint de mantenimiento).
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from app import deps, serializacion
+
+log = logging.getLogger("idempotencia")
+
+HEADER = "Idempotency-Key"
+METODOS = {"POST", "PUT", "PATCH", "DELETE"}
+
+TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+# Reserva mientras el endpoint se ejecuta; si el proceso muere, la clave se libera sola
+RESERVA_S = float(os.getenv("IDEMPOTENCY_RESERVA_S", "60"))
+PURGA_CADA_S = float(os.getenv("IDEMPOTENCY_PURGA_S", "600"))
+MAX_CLAVE = 200
+
+_ultima_purga = 0.0
+_purga_lock = threading.Lock()
+
+
+class _Peticion:
+    """Clave de la petición en curso; los hilos del endpoint la ven por contextvars."""
+    __slots__ = ("clave", "ruta", "pendiente")
+
+    def __init__(self, clave: str):
+        self.clave = clave
+        self.ruta = deps.ruta()  # archivo (shard) donde quedó la reserva
+        self.pendiente = False  # la mutación quedó encolada sin confirmar: no liberar la reserva
+
+
+_peticion: contextvars.ContextVar[Optional[_Peticion]] = contextvars.ContextVar("idempotencia", default=None)
+
+
+# ------------------ almacenamiento ------------------
+# Tabla 'idempotencia': migración 6; 'cabeceras' y 'aplicada', migración 9 (app.migraciones).
+
+def _reservar(clave: str, huella: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Devuelve ('nuevo', None) si la clave quedó reservada para esta petición;
+    ('replay', fila) si ya hay respuesta guardada; ('en_curso', None), ('aplicada', None) o
+    ('conflicto', None) en otro caso. Una reserva vencida se reutiliza solo si nada se confirmó con ella.
+    """
+    ahora = time.time()
+    with deps.get_conn() as conn:
+        cur = conn.execute(
+            """
+            INSERT INTO idempotencia (clave, huella, status, cuerpo, content_type, cabeceras, aplicada, expira)
+            VALUES (?, ?, NULL, NULL, NULL, NULL, 0, ?)
+            ON CONFLICT(clave) DO UPDATE SET
+                huella = excluded.huella, status = NULL, cuerpo = NULL,
+                content_type = NULL, cabeceras = NULL, aplicada = 0, expira = excluded.expira
+            WHERE idempotencia.expira < ? AND (idempotencia.aplicada = 0 OR idempotencia.status IS NOT NULL);
+            """,
+            (clave, huella, ahora + RESERVA_S, ahora),
+        )
+        if cur.rowcount:
+            conn.commit()
+            return "nuevo", None
+        row = conn.execute("SELECT * FROM idempotencia WHERE clave=?;", (clave,)).fetchone()
+    if row is None:
+        return "en_curso", None
+    if row["huella"] != huella:
+        return "conflicto", None
+    if row["status"] is None:
+        return ("aplicada" if row["aplicada"] else "en_curso"), None
+    return "replay", {k: row[k] for k in row.keys()}
+
+
+def registrar(conn, resultado: Any = None, status: int = 200) -> None:
+    """
+    Dentro de la transacción que confirma la mutación de una petición con Idempotency-Key (no-op sin
+    ella): la marca como aplicada y, si se pasa 'resultado', lo guarda ya como su respuesta JSON.
+    No hace commit. La respuesta final del middleware la reemplaza después con status y cabeceras reales.
+    """
+    pet = _peticion.get()
+    if pet is None or getattr(conn, "_ruta", None) != pet.ruta:  # otra base (otro shard, el directorio)
+        return
+    if resultado is None:
+        conn.execute("UPDATE idempotencia SET aplicada=1, expira=? WHERE clave=?;", (time.time() + TTL_S, pet.clave))
+        return
+    conn.execute(
+        "UPDATE idempotencia SET aplicada=1, status=?, cuerpo=?, content_type=?, cabeceras=NULL, expira=? "
+        "WHERE clave=?;",
+        (status, serializacion.dumps(jsonable_encoder(resultado)), "application/json", time.time() + TTL_S, pet.clave),
+    )
+
+
+def marcar_pendiente() -> None:
+    """La mutación de esta petición sigue encolada (p.ej. escritor agrupado sin responder): no liberar la clave."""
+    pet = _peticion.get()
+    if pet is not None:
+        pet.pendiente = True
+
+
+def _guardar(clave: str, status: int, cuerpo: bytes, cabeceras: List[Tuple[str, str]]) -> None:
+    content_type = next((v for k, v in cabeceras if k == "content-type"), None)
+    with deps.get_conn() as conn:
+        conn.execute(
+            "UPDATE idempotencia SET status=?, cuerpo=?, content_type=?, cabeceras=?, expira=? WHERE clave=?;",
+            (status, cuerpo, content_type, json.dumps(cabeceras), time.time() + TTL_S, clave),
+        )
+
+
+_ERROR_APLICADA = serializacion.dumps({
+    "detail": "Error interno después de aplicar la operación; consulte el recurso antes de repetirla con otra clave"
+})
+
+
+def _cerrar_con_error(clave: str, status: int, cuerpo: bytes, cabeceras: List[Tuple[str, str]]) -> None:
+    """
+    Respuesta 5xx (o excepción): si nada se confirmó con la clave, se libera y el reintento re-ejecuta.
+    Si la mutación ya se confirmó (aplicada=1) se guarda el error como respuesta definitiva: los
+    reintentos lo reciben en vez de quedar esperando una respuesta que nunca llegará. Una respuesta
+    guardada dentro de la transacción (registrar con resultado) no se pisa.
+    """
+    with deps.get_conn() as conn:
+        cur = conn.execute("DELETE FROM idempotencia WHERE clave=? AND status IS NULL AND aplicada=0;", (clave,))
+        if cur.rowcount:
+            return
+        content_type = next((v for k, v in cabeceras if k == "content-type"), None)
+        conn.execute(
+            "UPDATE idempotencia SET status=?, cuerpo=?, content_type=?, cabeceras=?, expira=? "
+            "WHERE clave=? AND status IS NULL AND aplicada=1;",
+            (status, cuerpo, content_type, json.dumps(cabeceras), time.time() + TTL_S, clave),
+        )
+
+
+def _respuesta_guardada(fila: Dict[str, Any]) -> Response:
+    if fila.get("cabeceras"):
+        cabeceras = [(k, v) for k, v in json.loads(fila["cabeceras"])]
+    else:  # guardada dentro de la transacción (registrar) o antes de la migración 9
+        cabeceras = [("content-type", fila["content_type"])] if fila["content_type"] else []
+    resp = Response(content=fila["cuerpo"] or b"", status_code=int(fila["status"]))
+    resp.raw_headers = [(b"content-length", str(len(resp.body)).encode("latin-1"))] + [
+        (k.encode("latin-1"), v.encode("latin-1")) for k, v in cabeceras
+    ] + [(b"idempotency-replayed", b"true")]
+    return resp
+
+
+def purgar(conn) -> int:
+    """Elimina claves vencidas. Devuelve cuántas se borraron."""
+    cur = conn.execute("DELETE FROM idempotencia WHERE expira < ?;", (time.time(),))
+    conn.commit()
+    return int(cur.rowcount or 0)
+
+
+def _purgar_si_toca() -> None:
+    global _ultima_purga
+    ahora = time.monotonic()
+    if ahora - _ultima_purga < PURGA_CADA_S or not _purga_lock.acquire(blocking=False):
+        return
+    try:
+        _ultima_purga = ahora
+        with deps.get_conn() as conn:
+            n = purgar(conn)
+        if n:
+            log.info("Idempotencia: %s claves vencidas purgadas.", n)
+    except Exception as e:
+        log.warning("Fallo purgando claves de idempotencia: %s", e)
+    finally:
+        _purga_lock.release()
+
+
+# ------------------ middleware ------------------
+
+class IdempotenciaMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        clave = (request.headers.get(HEADER) or "").strip()
+        if request.method not in METODOS or not clave:
+            return await call_next(request)
+        if len(clave) > MAX_CLAVE:
+            return JSONResponse(status_code=400, content={"detail": f"{HEADER} demasiado larga (máx. {MAX_CLAVE})"})
+
+        cuerpo_req = await request.body()
+        huella = hashlib.sha256(
+            b"\n".join([request.method.encode(), request.url.path.encode(), request.url.query.encode(), cuerpo_req])
+        ).hexdigest()
+
+        estado, fila = await run_in_threadpool(_reservar, clave, huella)
+        if estado == "replay":
+            return _respuesta_guardada(fila)
+        if estado == "aplicada":
+            return JSONResponse(
+                status_code=409,
+                content={"detail": "La petición con este Idempotency-Key ya se aplicó; su respuesta todavía no "
+                                   "está guardada. Reintente en unos segundos"},
+                headers={"Retry-After": "1"},
+            )
+        if estado == "en_curso":
+            return JSONResponse(
+                status_code=409,
+                content={"detail": "Hay una petición en curso con el mismo Idempotency-Key; reintente en unos segundos"},
+                headers={"Retry-After": "1"},
+            )
+        if estado == "conflicto":
+            return JSONResponse(
+                status_code=422,
+                content={"detail": "Idempotency-Key ya fue usado con otra petición (ruta o cuerpo distintos)"},
+            )
+
+        pet = _Peticion(clave)
+        token = _peticion.set(pet)  # call_next copia el contexto: lo ven el endpoint y sus hilos
+        try:
+            response = await call_next(request)
+        except Exception:
+            await run_in_threadpool(_cerrar_con_error, clave, 500, _ERROR_APLICADA,
+                                    [("content-type", "application/json")])
+            raise
+        finally:
+            _peticion.reset(token)
+
+        # Mutación todavía encolada (503 del escritor agrupado): la reserva queda hasta que se confirme
+        if response.status_code >= 500 and pet.pendiente:
+            return response
+
+        cuerpo = b"".join([chunk async for chunk in response.body_iterator])
+        cabeceras = [(k, v) for k, v in response.headers.items() if k != "content-length"]
+        if response.status_code >= 500:  # ver _cerrar_con_error: se libera o queda como respuesta final
+            await run_in_threadpool(_cerrar_con_error, clave, response.status_code, cuerpo, cabeceras)
+        else:
+            await run_in_threadpool(_guardar, clave, response.status_code, cuerpo, cabeceras)
+            await run_in_threadpool(_purgar_si_toca)
+        out = Response(content=cuerpo, status_code=response.status_code, background=response.background)
+        out.raw_headers = [(b"content-length", str(len(cuerpo)).encode("latin-1"))] + [
+            (k.encode("latin-1"), v.encode("latin-1")) for k, v in cabeceras
+        ]
+        return out
@@ -8,7 +8,7 @@ from typing import Any
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 # Importa tus routers existentes
 # (Si alguno no existe en tu árbol actual, comenta la línea correspondiente.)
@@ -16,6 +16,10 @@ from app.routers import health
 from app.routers import clientes
 from app.routers import prestamos
 from app.routers import cuotas
+from app.routers import mantenimiento
+from app.routers import debug_sql
+from app import admision, agrupador, archivo, bitacora, compresion, deps, escritor, metrics, migraciones, mora, replica, respaldo, shards, sqltrace
+from app.idempotencia import IdempotenciaMiddleware
 try:
     from app.routers import debug_mail  # opcional en tu proyecto
 except Exception:
@@ -26,7 +30,37 @@ except Exception:
 # --------------------------------------------------------------------------------------
 app = FastAPI(title="Demo Android API", version="1.0.0")
 
+# Idempotency-Key en endpoints que mutan (reintentos desde el móvil no re-ejecutan)
+app.add_middleware(IdempotenciaMiddleware)
+
+# Modo shards (DB_SHARDS): fija el archivo de la petición por id, cliente o X-Sucursal
+# (por fuera de idempotencia: su registro se guarda en el shard de la petición)
+app.add_middleware(shards.ShardMiddleware)
+
+# Trazador SQL opcional (SQL_TRACE=header|all); detalle en GET /debug/sql
+app.add_middleware(sqltrace.SqlTraceMiddleware)
+
+# Réplica de reportes (DB_REPLICA_PATH): cabeceras X-Data-Source / X-Replica-Age
+app.add_middleware(replica.ReplicaCabecerasMiddleware)
+
+# Multi-worker con proceso escritor único (DB_ESCRITOR_SOCKET): las mutaciones se reenvían a él
+# (por fuera de idempotencia: la aplica el escritor, que corre esta misma app)
+app.add_middleware(escritor.ReenvioEscrituraMiddleware)
+
+# Control de admisión (ADMISION=on): cupos de escritura por endpoint con cola acotada y cupo aparte
+# para lecturas; saturado -> 503 + Retry-After (por dentro de métricas: los rechazos se cuentan)
+app.add_middleware(admision.AdmisionMiddleware)
+
+# Compresión negociada (gzip; br/zstd si están instalados) de respuestas grandes; por dentro de
+# métricas: el tiempo de comprimir cuenta en la latencia
+app.add_middleware(compresion.CompresionMiddleware)
+
+# Métricas Prometheus por ruta (conteo, latencia, en curso, SQL por petición); ver GET /metrics
+# (envuelve al trazador: este reutiliza sus estadísticas SQL por petición)
+app.add_middleware(metrics.MetricsMiddleware, rutas=app.router)
+
 # CORS abierto para desarrollo; ajusta si usas dominios específicos
+# (se agrega al final para que envuelva al resto y también aplique a respuestas repetidas)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],            # en producción especifica dominios
@@ -55,6 +89,29 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
         },
     )
 
+# --------------------------------------------------------------------------------------
+# Tareas en segundo plano del proceso (opcionales por variables de entorno)
+# --------------------------------------------------------------------------------------
+@app.on_event("startup")
+def _startup() -> None:
+    migraciones.migrar()  # esquema al día antes de atender; las peticiones ya no lo verifican
+    admision.ajustar_hilos()
+    mora.iniciar_programador()
+    replica.iniciar_programador()
+    respaldo.iniciar_programador()
+    archivo.iniciar_programador()
+
+
+@app.on_event("shutdown")
+def _shutdown() -> None:
+    agrupador.detener()  # confirma pagos/abonos encolados antes de soltar el pool y la bitácora
+    mora.detener_programador()
+    replica.detener_programador()
+    respaldo.detener_programador()
+    archivo.detener_programador()
+    bitacora.detener_todos()
+    deps.cerrar_pool()
+
 # --------------------------------------------------------------------------------------
 # Rutas/routers
 # --------------------------------------------------------------------------------------
@@ -62,11 +119,17 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
 async def root() -> dict[str, Any]:
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Monta tus routers bajo el prefijo esperado por el front
 app.include_router(health.router, prefix="/health", tags=["health"])
 app.include_router(clientes.router, prefix="/clientes", tags=["clientes"])
 app.include_router(prestamos.router, prefix="/prestamos", tags=["prestamos"])
 app.include_router(cuotas.router, prefix="/cuotas", tags=["cuotas"])
+app.include_router(mantenimiento.router, prefix="/mantenimiento", tags=["mantenimiento"])
+app.include_router(debug_sql.router, prefix="/debug", tags=["debug"])
 if debug_mail:
     app.include_router(debug_mail.router, prefix="/debug", tags=["debug"])
 
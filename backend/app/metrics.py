@@ -0,0 +1,381 @@
+# backend/app/metrics.py
+# Métricas estilo Prometheus (formato de texto 0.0.4) sin dependencias externas.
+# - Middleware ASGI: conteo, latencia (histograma) y en-curso por ruta.
+# - Conexión SQLite instrumentada: sentencias y tiempo SQL por petición, espera de conexión.
+# - Helpers para correo (latencia / fallos) y tamaño de lotes de recordatorios.
+# Los valores son por proceso: con varios workers, Prometheus debe scrapear cada uno.
+from __future__ import annotations
+
+import contextvars
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+LATENCIA_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTEO_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+# ------------------ registro ------------------
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = list(zip(names, values))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    cuerpo = ",".join(
+        f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+        for k, v in pares
+    )
+    return "{" + cuerpo + "}"
+
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, labels: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"] + self._muestras()
+
+    def _muestras(self) -> List[str]:  # pragma: no cover - abstracto
+        return []
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, valor: float = 1.0) -> None:
+        with self._lock:
+            self._valores[labels] = self._valores.get(labels, 0.0) + valor
+
+    def valor(self, *labels: str) -> float:
+        return self._valores.get(labels, 0.0)
+
+    def _muestras(self) -> List[str]:
+        with self._lock:
+            items = list(self._valores.items())
+        return [f"{self.nombre}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    tipo = "gauge"
+
+    def dec(self, *labels: str, valor: float = 1.0) -> None:
+        self.inc(*labels, valor=-valor)
+
+    def set(self, *labels: str, valor: float) -> None:
+        with self._lock:
+            self._valores[labels] = valor
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, labels: Sequence[str] = (), buckets: Iterable[float] = LATENCIA_BUCKETS):
+        super().__init__(nombre, ayuda, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # [c_b1..c_bn, c_inf, suma]
+
+    def observe(self, valor: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                serie = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            serie[i] += 1
+            serie[-1] += valor
+
+    def resumen(self, *labels: str) -> Tuple[int, float]:
+        """(conteo, suma) de una serie; útil para diagnósticos internos."""
+        serie = self._series.get(labels)
+        if not serie:
+            return 0, 0.0
+        return int(sum(serie[:-1])), serie[-1]
+
+    def _muestras(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        out: List[str] = []
+        for k, serie in items:
+            acumulado = 0.0
+            for limite, c in zip(self.buckets + (float("inf"),), serie[:-1]):
+                acumulado += c
+                out.append(f"{self.nombre}_bucket{_fmt_labels(self.labels, k, ('le', _fmt_num(limite)))} {_fmt_num(acumulado)}")
+            out.append(f"{self.nombre}_count{_fmt_labels(self.labels, k)} {_fmt_num(acumulado)}")
+            out.append(f"{self.nombre}_sum{_fmt_labels(self.labels, k)} {_fmt_num(serie[-1])}")
+        return out
+
+
+_REGISTRO: List[_Metrica] = []
+
+
+def _reg(m):
+    _REGISTRO.append(m)
+    return m
+
+
+def render() -> str:
+    lineas: List[str] = []
+    for m in _REGISTRO:
+        lineas.extend(m.render())
+    return "\n".join(lineas) + "\n"
+
+
+# ------------------ métricas de la app ------------------
+
+HTTP_REQUESTS = _reg(Counter("http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status")))
+HTTP_LATENCIA = _reg(Histogram("http_request_duration_seconds", "Latencia de peticiones HTTP", ("method", "route")))
+HTTP_EN_CURSO = _reg(Gauge("http_requests_in_flight", "Peticiones HTTP en curso", ("method", "route")))
+
+SQL_POR_PETICION = _reg(Histogram("db_statements_per_request", "Sentencias SQL por petición", ("route",), CONTEO_BUCKETS))
+SQL_TIEMPO_POR_PETICION = _reg(Histogram("db_time_per_request_seconds", "Tiempo SQL acumulado por petición", ("route",)))
+SQL_SENTENCIAS = _reg(Counter("db_statements_total", "Sentencias SQL ejecutadas", ("route",)))
+SQL_TIEMPO = _reg(Counter("db_statement_seconds_total", "Segundos en ejecución/lectura SQL", ("route",)))
+DB_ESPERA_CONEXION = _reg(Histogram("db_connection_wait_seconds", "Tiempo para obtener una conexión SQLite lista"))
+DB_CONEXIONES_ABIERTAS = _reg(Gauge("db_connections_open", "Conexiones SQLite abiertas"))
+DB_POOL_LIBRES = _reg(Gauge("db_pool_idle_connections", "Conexiones SQLite ociosas en el pool del proceso"))
+DB_POOL_USOS = _reg(Counter("db_pool_checkouts_total", "Conexiones entregadas por get_conn", ("origen",)))
+DB_CACHE_SENTENCIAS = _reg(Counter("db_statement_cache_total",
+                                   "Sentencias ejecutadas según estuvieran ya preparadas en la conexión", ("resultado",)))
+SQL_REGISTRO = _reg(Counter("sql_registry_lookups_total", "Consultas del registro de sentencias", ("consulta", "resultado")))
+DB_REINTENTOS_BLOQUEO = _reg(Counter("db_lock_retries_total", "Reintentos de BEGIN IMMEDIATE por base ocupada (busy_timeout agotado)"))
+DB_SHARD_PETICIONES = _reg(Counter("db_shard_requests_total", "Peticiones HTTP por shard (sin_dueno: recorren todos)", ("shard",)))
+DB_SHARD_USOS = _reg(Counter("db_shard_scatter_tasks_total", "Tareas de consultas dispersas por shard", ("shard",)))
+DB_SHARD_DISPERSION = _reg(Histogram("db_shard_scatter_seconds", "Duración de una consulta dispersa (todos los shards)"))
+ADMISION_EN_CURSO = _reg(Gauge("admission_in_use", "Peticiones admitidas en curso por cupo", ("cupo",)))
+ADMISION_EN_COLA = _reg(Gauge("admission_queued", "Peticiones esperando cupo", ("cupo",)))
+ADMISION_ESPERA = _reg(Histogram("admission_wait_seconds", "Espera en cola hasta ser admitida", ("grupo",)))
+ADMISION_RECHAZOS = _reg(Counter("admission_rejected_total", "Peticiones rechazadas con 503 por saturación",
+                                 ("grupo", "motivo")))
+COMMIT_AGRUPADO_LOTE = _reg(Histogram("db_group_commit_batch_size", "Operaciones confirmadas por commit agrupado",
+                                      buckets=CONTEO_BUCKETS))
+COMMIT_AGRUPADO_ESPERA = _reg(Histogram("db_group_commit_wait_seconds", "Desde que se encola una operación hasta su commit"))
+COMMIT_AGRUPADO_COMMITS = _reg(Counter("db_group_commits_total", "Commits del escritor agrupado", ("resultado",)))
+COMMIT_AGRUPADO_ESPERAS_AGOTADAS = _reg(Counter("db_group_commit_wait_timeouts_total",
+                                                "Llamadores que dejaron de esperar al escritor agrupado (503)"))
+COMMIT_AGRUPADO_COLA = _reg(Gauge("db_group_commit_queue", "Operaciones esperando al escritor agrupado"))
+COMPRESION_BYTES = _reg(Counter("http_compression_bytes_total", "Bytes de cuerpo antes y después de comprimir",
+                                ("codificacion", "lado")))
+COMPRESION_SEGUNDOS = _reg(Counter("http_compression_seconds_total", "Segundos de CPU comprimiendo respuestas",
+                                   ("codificacion",)))
+COMPRESION_OMITIDAS = _reg(Counter("http_compression_skipped_total", "Respuestas enviadas sin comprimir (el cliente aceptaba)",
+                                   ("motivo",)))
+ESCRITOR_REENVIOS = _reg(Counter("db_writer_forwards_total", "Escrituras reenviadas al proceso escritor", ("resultado",)))
+REPLICA_REFRESCO = _reg(Histogram("db_replica_refresh_seconds", "Duración del refresco de la réplica de reportes"))
+REPLICA_LECTURAS = _reg(Counter("db_replica_reads_total", "Conexiones de reportes por origen", ("origen",)))
+RESPALDO_DURACION = _reg(Histogram("db_backup_duration_seconds", "Duración de un respaldo (copia + compresión)",
+                                    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)))
+RESPALDO_LOCK_PASO = _reg(Histogram("db_backup_step_lock_seconds", "Tiempo con lock de lectura por paso de backup",
+                                    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)))
+RESPALDO_LOCK_TOTAL = _reg(Gauge("db_backup_lock_held_seconds", "Tiempo total con lock en el último respaldo"))
+RESPALDO_MBPS = _reg(Gauge("db_backup_throughput_mb_per_second", "MB/s copiados en el último respaldo"))
+RESPALDO_BYTES = _reg(Gauge("db_backup_compressed_bytes", "Tamaño comprimido del último respaldo"))
+RESPALDO_ULTIMO = _reg(Gauge("db_backup_last_success_timestamp_seconds", "Hora (epoch) del último respaldo correcto"))
+ARCHIVO_PRESTAMOS = _reg(Counter("db_archived_loans_total", "Préstamos cerrados movidos al archivo histórico"))
+BITACORA_FALLOS = _reg(Counter("audit_log_write_failures_total", "Lotes de bitácora CSV que no se pudieron escribir",
+                               ("bitacora",)))
+BITACORA_FILAS = _reg(Counter("audit_log_rows_total", "Filas de bitácora CSV por destino (escritas, reintento, respaldo, perdidas)",
+                              ("bitacora", "destino")))
+PDF_RENDER = _reg(Histogram("pdf_render_seconds", "Tiempo de dibujo de un PDF (sin caché)", ("documento",)))
+PDF_CACHE = _reg(Counter("pdf_cache_requests_total", "Consultas a la caché de PDFs por versión", ("documento", "resultado")))
+
+EMAIL_LATENCIA = _reg(Histogram("email_send_duration_seconds", "Latencia de envío de correo", ("canal",)))
+EMAIL_FALLOS = _reg(Counter("email_send_failures_total", "Envíos de correo fallidos", ("canal",)))
+EMAIL_ENVIADOS = _reg(Counter("email_sent_total", "Correos enviados", ("canal",)))
+EMAIL_PENDIENTES = _reg(Gauge("email_queue_pending", "Correos encolados en segundo plano aún sin enviar", ("canal",)))
+
+RECORDATORIOS_LOTE = _reg(Histogram("reminder_batch_size", "Recordatorios detectados por ejecución", ("modo",), CONTEO_BUCKETS))
+RECORDATORIOS_ULTIMO = _reg(Gauge("reminder_last_success_timestamp_seconds", "Hora (epoch) del último envío de recordatorios correcto"))
+
+
+# ------------------ estadísticas SQL por petición ------------------
+
+class EstadisticasSQL:
+    """Acumulador mutable por petición (se comparte por referencia con el threadpool)."""
+    __slots__ = ("sentencias", "segundos", "oyentes")
+
+    def __init__(self):
+        self.sentencias = 0
+        self.segundos = 0.0
+        self.oyentes: List[Any] = []  # callbacks (sql, segundos) p.ej. trazador SQL
+
+
+_stats_ctx: contextvars.ContextVar[Optional[EstadisticasSQL]] = contextvars.ContextVar("sql_stats", default=None)
+
+
+def stats_actuales() -> Optional[EstadisticasSQL]:
+    return _stats_ctx.get()
+
+
+def _registrar_sql(sql: str, segundos: float) -> None:
+    st = _stats_ctx.get()
+    if st is not None:
+        st.sentencias += 1
+        st.segundos += segundos
+        for oyente in st.oyentes:
+            oyente(sql, segundos)
+
+
+def _sumar_tiempo(segundos: float) -> None:
+    st = _stats_ctx.get()
+    if st is not None:
+        st.segundos += segundos
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    # SQLite ejecuta de forma perezosa: el tiempo de fetch también es tiempo SQL
+    def fetchone(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _sumar_tiempo(time.perf_counter() - t0)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _sumar_tiempo(time.perf_counter() - t0)
+
+    def fetchmany(self, *a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchmany(*a, **kw)
+        finally:
+            _sumar_tiempo(time.perf_counter() - t0)
+
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """
+    Connection factory para sqlite3.connect: cuenta y cronometra cada sentencia.
+    Lleva además un espejo LRU de la caché de sentencias preparadas de sqlite3 (misma capacidad,
+    misma clave: el texto) para medir cuántas ejecuciones evitan compilar el SQL.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._capacidad = int(kwargs.get("cached_statements", 128))
+        self._preparadas: "OrderedDict[str, None]" = OrderedDict()
+
+    def _contar_preparada(self, sql: str) -> None:
+        lru = self._preparadas
+        if sql in lru:
+            lru.move_to_end(sql)
+            DB_CACHE_SENTENCIAS.inc("hit")
+            return
+        lru[sql] = None
+        if len(lru) > self._capacidad:
+            lru.popitem(last=False)
+        DB_CACHE_SENTENCIAS.inc("miss")
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        cur = self.cursor()
+        self._contar_preparada(sql)
+        t0 = time.perf_counter()
+        try:
+            return cur.execute(sql, parameters)
+        finally:
+            _registrar_sql(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq_of_parameters):
+        cur = self.cursor()
+        self._contar_preparada(sql)
+        t0 = time.perf_counter()
+        try:
+            return cur.executemany(sql, seq_of_parameters)
+        finally:
+            _registrar_sql(sql, time.perf_counter() - t0)
+
+    def executescript(self, sql_script):
+        cur = self.cursor()
+        t0 = time.perf_counter()
+        try:
+            return cur.executescript(sql_script)
+        finally:
+            _registrar_sql(sql_script, time.perf_counter() - t0)
+
+
+# ------------------ middleware HTTP ------------------
+
+SIN_RUTA = "<sin_ruta>"
+
+
+def _ruta_de(scope, rutas) -> str:
+    for r in rutas:
+        match, _ = r.matches(scope)
+        if match == Match.FULL:
+            return getattr(r, "path", SIN_RUTA)
+    return SIN_RUTA
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro (no bufferiza respuestas; compatible con streaming)."""
+
+    def __init__(self, app, rutas=None):
+        self.app = app
+        self.rutas = rutas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metodo = scope.get("method", "GET")
+        ruta = _ruta_de(scope, self.rutas.routes) if self.rutas is not None else scope.get("path", SIN_RUTA)
+        estado = {"code": 500}
+
+        async def _send(msg):
+            if msg["type"] == "http.response.start":
+                estado["code"] = msg["status"]
+            await send(msg)
+
+        stats = EstadisticasSQL()
+        token = _stats_ctx.set(stats)
+        HTTP_EN_CURSO.inc(metodo, ruta)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            dt = time.perf_counter() - t0
+            _stats_ctx.reset(token)
+            HTTP_EN_CURSO.dec(metodo, ruta)
+            HTTP_REQUESTS.inc(metodo, ruta, str(estado["code"]))
+            HTTP_LATENCIA.observe(dt, metodo, ruta)
+            SQL_POR_PETICION.observe(stats.sentencias, ruta)
+            SQL_TIEMPO_POR_PETICION.observe(stats.segundos, ruta)
+            if stats.sentencias:
+                SQL_SENTENCIAS.inc(ruta, valor=stats.sentencias)
+                SQL_TIEMPO.inc(ruta, valor=stats.segundos)
+
+
+# ------------------ helpers de correo ------------------
+
+def observar_envio(canal: str, segundos: float, ok: bool) -> None:
+    EMAIL_LATENCIA.observe(segundos, canal)
+    if ok:
+        EMAIL_ENVIADOS.inc(canal)
+    else:
+        EMAIL_FALLOS.inc(canal)
@@ -0,0 +1,409 @@
+# backend/app/migraciones.py
+# Migraciones de esquema numeradas, registradas en la tabla 'schema_migrations'.
+#
+#   cd backend
+#   python -m app.migraciones migrar        # aplica las pendientes (también lo hace el arranque de la app)
+#   python -m app.migraciones estado
+#
+# - Cada migración corre una sola vez por base, en su propia transacción BEGIN IMMEDIATE: con varios
+#   workers arrancando a la vez, el segundo espera el lock, ve la versión ya registrada y no repite
+#   el ALTER TABLE (antes: 'duplicate column name' al correr dos sondeos en paralelo).
+# - La 2 normaliza los nombres de columna históricos (prestamo_id, numero, fecha, interes, ...) a los
+#   canónicos; desde ahí el código usa nombres fijos, sin PRAGMA table_info ni alternativas por petición.
+# - Bases creadas antes de este módulo ya tienen parte del esquema (los viejos ensure_schema): cada
+#   migración verifica lo que falta antes de tocarlo, así que adoptarlas no falla.
+# - deps.get_conn() llama a asegurar() al abrir: una búsqueda en un set cuando la base ya está al día.
+# - Agregar una migración: nueva función con @_migracion(N, "nombre") al final; nunca editar una aplicada.
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app import deps
+
+log = logging.getLogger("migraciones")
+
+MIGRACIONES: List[Tuple[int, str, Callable[[Any], None]]] = []
+
+_al_dia: set = set()
+_lock = threading.Lock()
+
+
+def _migracion(version: int, nombre: str):
+    def registrar(fn: Callable[[Any], None]) -> Callable[[Any], None]:
+        assert not MIGRACIONES or MIGRACIONES[-1][0] < version, "versiones en orden creciente"
+        MIGRACIONES.append((version, nombre, fn))
+        return fn
+    return registrar
+
+
+def _table_exists(conn, name: str, schema: str = "main") -> bool:
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type='table' AND name=?;",
+                        (name,)).fetchone() is not None
+
+
+def _cols(conn, table: str, schema: str = "main") -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table});").fetchall()]
+
+
+def _agregar_columnas(conn, tabla: str, columnas: List[Tuple[str, str]], schema: str = "main") -> List[str]:
+    """ALTER TABLE ADD COLUMN de las que falten. Devuelve las agregadas."""
+    if not _table_exists(conn, tabla, schema):
+        return []
+    existentes = set(_cols(conn, tabla, schema))
+    nuevas = [(c, t) for c, t in columnas if c not in existentes]
+    for c, t in nuevas:
+        conn.execute(f"ALTER TABLE {schema}.{tabla} ADD COLUMN {c} {t};")
+    return [c for c, _ in nuevas]
+
+
+# Nombres históricos -> canónico (los que toleraban los routers con _pick)
+RENOMBRAR: Dict[str, List[Tuple[str, List[str]]]] = {
+    "cuotas": [
+        ("id_prestamo", ["prestamo_id"]),
+        ("cod_cli", ["codigo_cliente"]),
+        ("cuota_numero", ["numero"]),
+        ("fecha_vencimiento", ["fecha"]),
+        ("interes_a_pagar", ["interes"]),
+        ("capital_plan", ["capital"]),
+        ("total_plan", ["total"]),
+    ],
+    "prestamos": [("estado", ["estado_capital"])],
+    "clientes": [("email", ["correo", "mail", "e_mail"])],
+    "abonos_capital": [("id_prestamo", ["prestamo_id"])],
+}
+
+
+def normalizar_columnas(conn, schema: str = "main") -> List[str]:
+    """
+    Renombra columnas históricas al nombre canónico (si el canónico no existe ya).
+    También la usa app.archivo sobre la base adjunta. Devuelve 'tabla.viejo->nuevo' aplicados.
+    """
+    hechos: List[str] = []
+    for tabla, reglas in RENOMBRAR.items():
+        if not _table_exists(conn, tabla, schema):
+            continue
+        cols = set(_cols(conn, tabla, schema))
+        for canonico, viejos in reglas:
+            if canonico in cols:
+                continue
+            viejo = next((v for v in viejos if v in cols), None)
+            if viejo:
+                conn.execute(f"ALTER TABLE {schema}.{tabla} RENAME COLUMN {viejo} TO {canonico};")
+                cols = (cols - {viejo}) | {canonico}
+                hechos.append(f"{tabla}.{viejo}->{canonico}")
+    return hechos
+
+
+# ------------------ migraciones ------------------
+
+@_migracion(1, "tablas_base")
+def _m1(conn) -> None:
+    """Tablas del negocio con nombres canónicos (no-op si ya existen)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS clientes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo TEXT UNIQUE, nombre TEXT, identificacion TEXT,
+            direccion TEXT, telefono TEXT, email TEXT
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS prestamos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cod_cli TEXT, fecha_credito TEXT, importe_credito REAL, modalidad TEXT,
+            tasa_interes REAL, num_cuotas INTEGER, estado TEXT DEFAULT 'PENDIENTE'
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cuotas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_prestamo INTEGER, cod_cli TEXT, nombre_cliente TEXT, modalidad TEXT,
+            cuota_numero INTEGER, fecha_vencimiento TEXT, interes_a_pagar REAL,
+            fecha_pago TEXT, estado TEXT DEFAULT 'PENDIENTE', dias_mora INTEGER DEFAULT 0,
+            abono_capital REAL DEFAULT 0, interes_pagado REAL DEFAULT 0
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS abonos_capital (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_prestamo INTEGER, nombre_cliente TEXT, fecha TEXT, monto REAL
+        );
+        """
+    )
+
+
+@_migracion(2, "nombres_de_columnas")
+def _m2(conn) -> None:
+    """Nombres canónicos y columnas base que falten en bases heredadas."""
+    hechos = normalizar_columnas(conn)
+    if hechos:
+        log.info("Columnas renombradas: %s", ", ".join(hechos))
+    _agregar_columnas(conn, "clientes", [(c, "TEXT") for c in
+                                         ("codigo", "nombre", "identificacion", "direccion", "telefono", "email")])
+    _agregar_columnas(conn, "prestamos", [
+        ("cod_cli", "TEXT"), ("fecha_credito", "TEXT"), ("importe_credito", "REAL"), ("modalidad", "TEXT"),
+        ("tasa_interes", "REAL"), ("num_cuotas", "INTEGER"), ("estado", "TEXT DEFAULT 'PENDIENTE'"),
+    ])
+    _agregar_columnas(conn, "cuotas", [
+        ("id_prestamo", "INTEGER"), ("cod_cli", "TEXT"), ("nombre_cliente", "TEXT"), ("modalidad", "TEXT"),
+        ("cuota_numero", "INTEGER"), ("fecha_vencimiento", "TEXT"), ("interes_a_pagar", "REAL"),
+        ("fecha_pago", "TEXT"), ("estado", "TEXT DEFAULT 'PENDIENTE'"), ("dias_mora", "INTEGER DEFAULT 0"),
+        ("abono_capital", "REAL DEFAULT 0"), ("interes_pagado", "REAL DEFAULT 0"),
+    ])
+    _agregar_columnas(conn, "abonos_capital", [
+        ("id_prestamo", "INTEGER"), ("nombre_cliente", "TEXT"), ("fecha", "TEXT"), ("monto", "REAL"),
+    ])
+
+
+@_migracion(3, "columnas_plan")
+def _m3(conn) -> None:
+    """prestamos.plan_mode y el plan por cuota (antes _ensure_plan_columns en cada alta/replan)."""
+    _agregar_columnas(conn, "prestamos", [("plan_mode", "TEXT DEFAULT 'auto'")])
+    nuevas = _agregar_columnas(conn, "cuotas", [
+        ("capital_plan", "REAL NOT NULL DEFAULT 0"),
+        ("interes_plan", "REAL NOT NULL DEFAULT 0"),
+        ("total_plan", "REAL NOT NULL DEFAULT 0"),
+    ])
+    # Cuotas existentes: el interés planificado es el que ya tenían a pagar
+    if "interes_plan" in nuevas:
+        conn.execute("UPDATE cuotas SET interes_plan = COALESCE(interes_a_pagar, 0);")
+    if "total_plan" in nuevas:
+        conn.execute("UPDATE cuotas SET total_plan = ROUND(capital_plan + interes_plan, 2);")
+
+
+@_migracion(4, "mora")
+def _m4(conn) -> None:
+    """cuotas.tramo_mora y la tabla 'mantenimiento' de app.mora."""
+    _agregar_columnas(conn, "cuotas", [("tramo_mora", "TEXT DEFAULT '0'")])
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS mantenimiento (
+            tarea            TEXT PRIMARY KEY,
+            ultima_fecha     TEXT,
+            ultima_ejecucion TEXT,
+            filas            INTEGER
+        );
+        """
+    )
+
+
+@_migracion(5, "saldos")
+def _m5(conn) -> None:
+    """Saldo corriente por préstamo (app.saldos): columnas con backfill desde el libro y triggers."""
+    nuevas = _agregar_columnas(conn, "prestamos", [("capital_abonado", "REAL NOT NULL DEFAULT 0"),
+                                                   ("capital_pendiente", "REAL")])
+    if nuevas:
+        libro = "COALESCE((SELECT SUM(a.monto) FROM abonos_capital a WHERE a.id_prestamo = prestamos.id), 0)"
+        conn.execute(
+            f"UPDATE prestamos SET capital_abonado = {libro}, "
+            f"capital_pendiente = COALESCE(importe_credito, 0) - {libro};"
+        )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_prestamos_saldo_ins AFTER INSERT ON prestamos
+        BEGIN
+            UPDATE prestamos
+               SET capital_pendiente = COALESCE(NEW.importe_credito, 0) - COALESCE(NEW.capital_abonado, 0)
+             WHERE id = NEW.id;
+        END;
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_prestamos_saldo_upd AFTER UPDATE OF importe_credito ON prestamos
+        BEGIN
+            UPDATE prestamos
+               SET capital_pendiente = COALESCE(NEW.importe_credito, 0) - COALESCE(NEW.capital_abonado, 0)
+             WHERE id = NEW.id;
+        END;
+        """
+    )
+
+
+@_migracion(6, "idempotencia")
+def _m6(conn) -> None:
+    """Respuestas guardadas por Idempotency-Key (app.idempotencia)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS idempotencia (
+            clave        TEXT PRIMARY KEY,
+            huella       TEXT NOT NULL,
+            status       INTEGER,
+            cuerpo       BLOB,
+            content_type TEXT,
+            expira       REAL NOT NULL
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+def _indice(conn, nombre: str, tabla: str, columnas: List[str]) -> None:
+    """CREATE INDEX salvo que ya exista otro que empiece por las mismas columnas."""
+    for idx in conn.execute(f"PRAGMA index_list({tabla});").fetchall():
+        cols = [r[2] for r in conn.execute(f"PRAGMA index_info({idx[1]});").fetchall()]
+        if cols[:len(columnas)] == columnas:
+            return
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla}({', '.join(columnas)});")
+
+
+@_migracion(7, "indices")
+def _m7(conn) -> None:
+    """Índices de las búsquedas por préstamo y por cliente."""
+    _indice(conn, "idx_cuotas_prestamo", "cuotas", ["id_prestamo"])
+    _indice(conn, "idx_prestamos_cli", "prestamos", ["cod_cli"])
+    _indice(conn, "idx_abonos_prestamo", "abonos_capital", ["id_prestamo"])
+
+
+@_migracion(8, "latido")
+def _m8(conn) -> None:
+    """Fila de latido que /health/ready lee y reescribe para medir latencia de lectura/escritura."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS latido (
+            id       INTEGER PRIMARY KEY CHECK (id = 1),
+            instante TEXT,
+            pid      INTEGER
+        );
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO latido (id, instante, pid) VALUES (1, NULL, NULL);")
+
+
+@_migracion(9, "idempotencia_aplicada")
+def _m9(conn) -> None:
+    """Cabeceras completas de la respuesta guardada y marca de mutación confirmada (app.idempotencia)."""
+    _agregar_columnas(conn, "idempotencia", [("cabeceras", "TEXT"), ("aplicada", "INTEGER NOT NULL DEFAULT 0")])
+
+
+VERSION = MIGRACIONES[-1][0]
+
+
+# ------------------ motor ------------------
+
+def _tabla_registro(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version  INTEGER PRIMARY KEY,
+            nombre   TEXT NOT NULL,
+            aplicada TEXT NOT NULL,
+            segundos REAL
+        );
+        """
+    )
+    conn.commit()
+
+
+def _version_actual(conn) -> int:
+    return int(conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations;").fetchone()[0])
+
+
+def aplicar(conn) -> List[Dict[str, Any]]:
+    """Aplica las migraciones pendientes sobre 'conn', cada una en su transacción. Devuelve las aplicadas."""
+    if conn.in_transaction:
+        conn.commit()
+    _tabla_registro(conn)
+    if _version_actual(conn) >= VERSION:
+        return []
+    aplicadas: List[Dict[str, Any]] = []
+    for version, nombre, fn in MIGRACIONES:
+        deps.begin_immediate(conn)
+        try:
+            # Releída con el lock tomado: otro proceso pudo aplicarla mientras esperábamos
+            if conn.execute("SELECT 1 FROM schema_migrations WHERE version=?;", (version,)).fetchone():
+                conn.commit()
+                continue
+            t0 = time.perf_counter()
+            fn(conn)
+            seg = round(time.perf_counter() - t0, 4)
+            conn.execute("INSERT INTO schema_migrations (version, nombre, aplicada, segundos) VALUES (?,?,?,?);",
+                         (version, nombre, datetime.now().isoformat(timespec="seconds"), seg))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        log.info("Migración %04d_%s aplicada en %.3fs (%s)", version, nombre, seg, deps.ruta())
+        aplicadas.append({"version": version, "nombre": nombre, "segundos": seg})
+    return aplicadas
+
+
+def asegurar(conn) -> None:
+    """Migraciones pendientes una vez por proceso y archivo; deps.get_conn() la llama al abrir."""
+    ruta = deps.ruta()
+    if ruta in _al_dia:
+        return
+    with _lock:
+        if ruta in _al_dia:
+            return
+        aplicar(conn)
+        _al_dia.add(ruta)
+
+
+def estado(conn) -> Dict[str, Any]:
+    _tabla_registro(conn)
+    hechas = {r["version"]: dict(r) for r in conn.execute(
+        "SELECT version, nombre, aplicada, segundos FROM schema_migrations ORDER BY version;")}
+    return {
+        "version": _version_actual(conn),
+        "ultima": VERSION,
+        "aplicadas": list(hechas.values()),
+        "pendientes": [{"version": v, "nombre": n} for v, n, _ in MIGRACIONES if v not in hechas],
+    }
+
+
+def _migrar_shard(_shard: Optional[str]) -> Dict[str, Any]:
+    with deps.get_conn() as conn:
+        return estado(conn)
+
+
+def migrar() -> Dict[str, Any]:
+    """
+    Paso de arranque: abre la base (get_conn aplica lo pendiente) y devuelve el estado. Con shards
+    (DB_SHARDS) migra todos y devuelve el del primero.
+    """
+    return deps.dispersar(_migrar_shard, deps.SHARDS or [None])[0]
+
+
+# ------------------ CLI ------------------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Migraciones de esquema")
+    sub = ap.add_subparsers(dest="comando", required=True)
+    sub.add_parser("migrar", help="Aplica las migraciones pendientes")
+    sub.add_parser("estado", help="Versión actual, aplicadas y pendientes")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    try:
+        if args.comando == "migrar":
+            res = migrar()
+        else:
+            # Sin aplicar nada: conexión directa, no get_conn()
+            conn = sqlite3.connect(deps.ruta())
+            conn.row_factory = sqlite3.Row
+            try:
+                res = estado(conn)
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
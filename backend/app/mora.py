@@ -0,0 +1,158 @@
+# backend/app/mora.py
+# Mantenimiento de mora: refresca 'dias_mora' y 'tramo_mora' de TODAS las cuotas PENDIENTES
+# con un único UPDATE set-based por día (fecha de corte). Los endpoints de lectura solo leen
+# los valores guardados; ya no parsean fechas en Python por cada cuota.
+# - El refresco lo hace el programador en proceso (MORA_REFRESH_AUTO, on por defecto; revisa cada
+#   MORA_REFRESH_INTERVALO_S si cambió el día) o POST /mantenimiento/mora. Ningún GET escribe.
+# - Siempre dentro de deps.escritura (BEGIN IMMEDIATE con reintentos), como el resto de escrituras.
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+from app import deps, sentencias
+
+log = logging.getLogger("mora")
+
+TAREA = "mora"
+
+# Tramos de antigüedad (aging): (límite superior de días inclusive, etiqueta)
+TRAMOS = [(0, "0"), (30, "1-30"), (60, "31-60"), (90, "61-90")]
+TRAMO_MAX = "90+"
+
+# Cache por proceso: última fecha de corte aplicada por ruta de BD
+# ('cuotas.tramo_mora' y la tabla 'mantenimiento' vienen de la migración 4)
+_ultimo_corte: Dict[str, str] = {}
+
+
+# ------------------ helpers ------------------
+
+def _flag(name: str, default: str = "") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+
+
+def tramo_de(dias: Optional[int]) -> str:
+    """Etiqueta del tramo de mora para 'dias' (misma regla que el UPDATE masivo)."""
+    d = int(dias or 0)
+    for limite, etiqueta in TRAMOS:
+        if d <= limite:
+            return etiqueta
+    return TRAMO_MAX
+
+
+def _tramo_sql(expr: str) -> str:
+    ramas = " ".join(f"WHEN ({expr}) <= {limite} THEN '{etiqueta}'" for limite, etiqueta in TRAMOS)
+    return f"CASE {ramas} ELSE '{TRAMO_MAX}' END"
+
+
+# ------------------ tarea ------------------
+
+def _update_sql(por_prestamo: bool) -> str:
+    dias_expr = "COALESCE(CAST(MAX(julianday(date(:corte)) - julianday(date(fecha_vencimiento)), 0) AS INTEGER), 0)"
+    tramo_expr = _tramo_sql(dias_expr)
+    filtro = " AND id_prestamo = :prestamo_id" if por_prestamo else ""
+    return f"""
+        UPDATE cuotas SET
+            dias_mora = {dias_expr},
+            tramo_mora = {tramo_expr}
+        WHERE UPPER(estado) = 'PENDIENTE'{filtro}
+          AND (dias_mora IS NOT {dias_expr} OR tramo_mora IS NOT {tramo_expr});
+        """
+
+
+def _ejecutar_update(conn, corte: str, prestamo_id: Optional[int] = None) -> int:
+    por_prestamo = prestamo_id is not None
+    cur = conn.execute(
+        sentencias.sql("mora.refrescar", por_prestamo, lambda: _update_sql(por_prestamo)),
+        {"corte": corte, "prestamo_id": prestamo_id},
+    )
+    return int(cur.rowcount or 0)
+
+
+def refrescar_mora(conn, hoy: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Recalcula 'dias_mora' y 'tramo_mora' de todas las cuotas PENDIENTES en un solo UPDATE.
+    Solo reescribe filas cuyo valor cambia. Registra la ejecución en 'mantenimiento'.
+    No hace commit: el llamador la envuelve en deps.escritura(conn).
+    """
+    corte = (hoy or date.today()).isoformat()
+    filas = _ejecutar_update(conn, corte)
+    conn.execute(
+        """
+        INSERT INTO mantenimiento (tarea, ultima_fecha, ultima_ejecucion, filas) VALUES (?, ?, ?, ?)
+        ON CONFLICT(tarea) DO UPDATE SET
+            ultima_fecha = excluded.ultima_fecha,
+            ultima_ejecucion = excluded.ultima_ejecucion,
+            filas = excluded.filas;
+        """,
+        (TAREA, corte, datetime.now().isoformat(timespec="seconds"), filas),
+    )
+    log.info("Mora refrescada al %s (%s cuotas actualizadas).", corte, filas)
+    return {"fecha_corte": corte, "filas_actualizadas": filas}
+
+
+def refrescar_prestamo(conn, prestamo_id: int) -> int:
+    """
+    Mismo cálculo acotado a un préstamo; para cuotas creadas/regeneradas después del corte del día.
+    No hace commit (queda dentro de la transacción del llamador).
+    """
+    return _ejecutar_update(conn, date.today().isoformat(), int(prestamo_id))
+
+
+def asegurar_mora_del_dia(conn) -> None:
+    """
+    Refresca si la fecha de corte guardada no es hoy (lo llama el programador).
+    Tras la primera verificación del día no consulta la BD (cache en memoria).
+    """
+    hoy = date.today().isoformat()
+    ruta = deps.ruta()  # una marca por archivo (shard)
+    if _ultimo_corte.get(ruta) == hoy:
+        return
+    with deps.escritura(conn):  # releída con el lock tomado: otro worker pudo refrescar ya
+        row = conn.execute("SELECT ultima_fecha FROM mantenimiento WHERE tarea=?;", (TAREA,)).fetchone()
+        if not (row and row["ultima_fecha"] == hoy):
+            refrescar_mora(conn)
+    _ultimo_corte[ruta] = hoy
+
+
+def estado_tarea(conn) -> Dict[str, Any]:
+    row = conn.execute("SELECT * FROM mantenimiento WHERE tarea=?;", (TAREA,)).fetchone()
+    return {k: row[k] for k in row.keys()} if row else {"tarea": TAREA, "ultima_fecha": None}
+
+
+# ------------------ programador en proceso ------------------
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _loop(intervalo: float) -> None:
+    while not _stop.is_set():
+        for shard in deps.SHARDS or [None]:
+            try:
+                with deps.en_shard(shard), deps.get_conn() as conn:
+                    asegurar_mora_del_dia(conn)
+            except Exception as e:
+                log.warning("Fallo refrescando mora%s: %s", f" (shard {shard})" if shard else "", e)
+        _stop.wait(intervalo)
+
+
+def iniciar_programador() -> None:
+    """
+    Arranca el hilo que refresca la mora al cambiar el día.
+    Controlado por MORA_REFRESH_AUTO (default on) y MORA_REFRESH_INTERVALO_S (default 900).
+    """
+    global _thread
+    if not _flag("MORA_REFRESH_AUTO", "on") or (_thread and _thread.is_alive()):
+        return
+    intervalo = float(os.getenv("MORA_REFRESH_INTERVALO_S", "900"))
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(intervalo,), name="mora-refresh", daemon=True)
+    _thread.start()
+
+
+def detener_programador() -> None:
+    _stop.set()
@@ -3,14 +3,14 @@ from __future__ import annotations
 
 import logging
 import os
-import smtplib
 import time
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.utils import formataddr
-from typing import Any, Dict, List, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 
-from app.deps import get_conn  # misma conexión/ruta que usa el backend
+from app import metrics
+from app.deps import en_shard, get_conn, shard_de_id  # misma conexión/ruta que usa el backend
+
+if TYPE_CHECKING:  # smtplib/email.* se importan al enviar (no al arrancar la app)
+    import smtplib
 
 log = logging.getLogger("notifications")
 if not log.handlers:
@@ -26,7 +26,8 @@ def _fmt_money(n: float | int | None) -> str:
     return f"$ {s}"
 
 
-def _smtp_client() -> smtplib.SMTP:
+def _smtp_client() -> "smtplib.SMTP":
+    import smtplib
     import ssl
 
     host = os.getenv("SMTP_HOST", "localhost")
@@ -47,6 +48,10 @@ def _smtp_client() -> smtplib.SMTP:
 
 
 def _send_email(to: List[str], subject: str, html: str, text: str | None = None, retries: int = 2) -> None:
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.utils import formataddr
+
     sender_name = os.getenv("FROM_NAME", "Soporte")
     sender_email = os.getenv("FROM_EMAIL", "no-reply@example.local")
     cc = [x.strip() for x in os.getenv("CC_EMAIL", "").split(",") if x.strip()]
@@ -65,6 +70,7 @@ def _send_email(to: List[str], subject: str, html: str, text: str | None = None,
 
     attempt = 0
     while True:
+        t0 = time.perf_counter()
         try:
             cli = _smtp_client()
             cli.sendmail(sender_email, recipients, msg.as_string())
@@ -72,9 +78,11 @@ def _send_email(to: List[str], subject: str, html: str, text: str | None = None,
                 cli.quit()
             except Exception:
                 pass
+            metrics.observar_envio("prestamo", time.perf_counter() - t0, True)
             log.info("Email enviado a %s (asunto: %s)", recipients, subject)
             return
         except Exception as e:
+            metrics.observar_envio("prestamo", time.perf_counter() - t0, False)
             attempt += 1
             log.warning("Fallo enviando email (intento %s/%s): %s", attempt, retries + 1, e)
             if attempt > retries:
@@ -88,8 +96,9 @@ def _send_email(to: List[str], subject: str, html: str, text: str | None = None,
 def _fetch_loan_bundle(prestamo_id: int) -> Tuple[Dict[str, Any] | None, Dict[str, Any] | None, List[Dict[str, Any]]]:
     """
     Obtiene datos del préstamo, cliente y cuotas con tolerancia a diferencias de esquema.
+    Corre en segundo plano tras la respuesta: el shard sale del id, no de la petición.
     """
-    with get_conn() as conn:
+    with en_shard(shard_de_id(prestamo_id)), get_conn() as conn:
         # Cabecera préstamo/cliente
         row = conn.execute(
             """
@@ -128,39 +137,11 @@ def _fetch_loan_bundle(prestamo_id: int) -> Tuple[Dict[str, Any] | None, Dict[st
             "email": row["cliente_email"],
         }
 
-        # Descubrir columnas reales de cuotas
-        cols = [r["name"] for r in conn.execute("PRAGMA table_info(cuotas);").fetchall()]
-
-        fk_q = "id_prestamo" if "id_prestamo" in cols else ("prestamo_id" if "prestamo_id" in cols else "id_prestamo")
-        num_col = "cuota_numero" if "cuota_numero" in cols else ("numero" if "numero" in cols else "cuota_numero")
-        fecha_col = "fecha_vencimiento" if "fecha_vencimiento" in cols else ("fecha" if "fecha" in cols else "fecha_vencimiento")
-
-        # Capital por cuota: capital_plan > capital > 0
-        if "capital_plan" in cols:
-            cap_expr = "capital_plan AS capital"
-        elif "capital" in cols:
-            cap_expr = "capital AS capital"
-        else:
-            cap_expr = "0 AS capital"
-
-        # Interés por cuota: interes_plan > interes_a_pagar > interes > 0
-        if "interes_plan" in cols:
-            int_expr = "interes_plan AS interes"
-        elif "interes_a_pagar" in cols:
-            int_expr = "interes_a_pagar AS interes"
-        elif "interes" in cols:
-            int_expr = "interes AS interes"
-        else:
-            int_expr = "0 AS interes"
-
-        # Total por cuota: si existe 'total', úsalo; si no, lo calcularemos en Python (capital+interes).
-        total_exists = "total" in cols  # en tus dumps suele estar 'total_plan', así que calcularemos a mano
-        total_select = "total" if total_exists else "NULL AS total"
-
+        # Plan por cuota (nombres canónicos: app.migraciones); el total se calcula luego (capital + interes)
         sql = (
-            f"SELECT {num_col} AS numero, {fecha_col} AS fecha_venc, "
-            f"{cap_expr}, {int_expr}, {total_select} "
-            f"FROM cuotas WHERE {fk_q}=? ORDER BY {num_col} ASC;"
+            "SELECT cuota_numero AS numero, fecha_vencimiento AS fecha_venc, "
+            "capital_plan AS capital, interes_plan AS interes "
+            "FROM cuotas WHERE id_prestamo=? ORDER BY cuota_numero ASC;"
         )
         rows_q = conn.execute(sql, (prestamo_id,)).fetchall()
 
@@ -0,0 +1,254 @@
+# backend/app/replica.py
+# Réplica de solo lectura para reportes (resumen de cartera, previews de recordatorios, estados por lote).
+# - Un hilo refresca periódicamente una copia de DB_PATH con la API de backup en línea de SQLite
+#   (Connection.backup) en pasos de N páginas, con pausa entre pasos para no acaparar el archivo.
+# - La copia se escribe en '<réplica>.tmp' y se publica con os.replace (atómico): los lectores
+#   nunca ven una copia a medias. La mtime de la réplica = inicio de la copia (edad conservadora).
+# - Multi-worker: un lock de archivo elige un solo proceso refrescando; los demás usan la copia.
+# - conexion_reportes(): réplica si existe y su edad <= REPLICA_MAX_ATRASO_S (o la cabecera
+#   X-Replica-Max-Age de la petición, si es menor); si no, la base principal.
+#   Las respuestas llevan X-Data-Source (replica|primary) y X-Replica-Age (segundos).
+#   Con shards (DB_SHARDS) la réplica es solo del primero (DB_PATH); los demás leen su principal.
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from app import deps, metrics, sqltrace
+
+log = logging.getLogger("replica")
+
+
+def _flag(name: str, default: str = "") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+
+
+RUTA = (os.getenv("DB_REPLICA_PATH") or "").strip()  # vacío = sin réplica (todo a la base principal)
+INTERVALO_S = float(os.getenv("REPLICA_INTERVALO_S", "60"))
+PAGINAS = int(os.getenv("REPLICA_PAGINAS", "256"))          # páginas por paso de backup
+PAUSA_S = float(os.getenv("REPLICA_PAUSA_MS", "5")) / 1000.0  # entre pasos (cede el archivo a escritores)
+MAX_REINICIOS = int(os.getenv("REPLICA_MAX_REINICIOS", "3"))
+MAX_ATRASO_S = float(os.getenv("REPLICA_MAX_ATRASO_S", "300"))
+
+HEADER_MAX = "X-Replica-Max-Age"
+
+_estado: Dict[str, Any] = {"ultimo": None, "error": None, "refrescos": 0}
+
+
+class _Reinicio(Exception):
+    pass
+
+
+def activa() -> bool:
+    return bool(RUTA)
+
+
+def edad_s() -> Optional[float]:
+    """Segundos desde el inicio de la copia publicada (None si no hay réplica)."""
+    if not RUTA:
+        return None
+    try:
+        return max(0.0, time.time() - os.path.getmtime(RUTA))
+    except OSError:
+        return None
+
+
+# ------------------ refresco ------------------
+
+try:  # POSIX
+    import fcntl
+
+    def _tomar_lock(fh, esperar: bool) -> bool:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | (0 if esperar else fcntl.LOCK_NB))
+            return True
+        except OSError:
+            return False
+except ImportError:  # pragma: no cover - Windows: un solo proceso
+    def _tomar_lock(fh, esperar: bool) -> bool:
+        return True
+
+
+def refrescar(forzar: bool = False) -> Dict[str, Any]:
+    """
+    Copia DB_PATH a la réplica. Sin 'forzar', no hace nada si ya hay una copia en curso (este u otro
+    proceso) o si la réplica es más nueva que el intervalo; con 'forzar' espera a la copia en curso
+    y copia de nuevo. Devuelve un resumen del refresco.
+    """
+    if not RUTA:
+        return {"estado": "desactivada"}
+    with open(RUTA + ".lock", "a+") as fh:
+        if not _tomar_lock(fh, esperar=forzar):
+            return {"estado": "en_curso"}
+        edad = edad_s()
+        if not forzar and edad is not None and edad < INTERVALO_S * 0.9:
+            return {"estado": "vigente", "edad_s": round(edad, 1)}
+
+        tmp = RUTA + ".tmp"
+        t0 = time.time()
+        reinicios = 0
+        pasos = 0
+        previo = [None]
+
+        def progreso(status, restantes, total):
+            nonlocal reinicios, pasos
+            pasos += 1
+            # Si otra conexión escribe la base durante la copia, SQLite la reinicia desde el principio
+            # (lo restante no baja)
+            if previo[0] is not None and restantes >= previo[0]:
+                reinicios += 1
+                if reinicios > MAX_REINICIOS:
+                    raise _Reinicio()
+            previo[0] = restantes
+            if PAUSA_S > 0:
+                time.sleep(PAUSA_S)
+
+        src = sqlite3.connect(deps.DB_PATH, timeout=deps.BUSY_TIMEOUT_MS / 1000.0)
+        dst = sqlite3.connect(tmp)
+        try:
+            try:
+                src.backup(dst, pages=PAGINAS, progress=progreso)
+            except _Reinicio:
+                # Demasiadas escrituras concurrentes: copia en un solo paso (en WAL no bloquea escritores)
+                log.info("Réplica: %s reinicios, copiando en un solo paso", reinicios)
+                t0 = time.time()
+                src.backup(dst)
+            # La réplica se abre 'immutable': sin WAL ni -shm
+            dst.execute("PRAGMA journal_mode=DELETE;")
+            dst.commit()
+        except Exception as e:
+            _estado["error"] = f"{type(e).__name__}: {e}"
+            log.warning("Fallo refrescando réplica: %s", e)
+            raise
+        finally:
+            dst.close()
+            src.close()
+        os.utime(tmp, (t0, t0))
+        os.replace(tmp, RUTA)
+
+        dur = time.time() - t0
+        metrics.REPLICA_REFRESCO.observe(dur)
+        _estado.update({"ultimo": t0, "error": None, "refrescos": _estado["refrescos"] + 1})
+        res = {"estado": "ok", "segundos": round(dur, 3), "pasos": pasos, "reinicios": reinicios,
+               "bytes": os.path.getsize(RUTA)}
+        log.info("Réplica refrescada: %s", res)
+        return res
+
+
+def estado() -> Dict[str, Any]:
+    edad = edad_s()
+    return {
+        "activa": activa(),
+        "ruta": RUTA or None,
+        "edad_s": round(edad, 1) if edad is not None else None,
+        "max_atraso_s": MAX_ATRASO_S,
+        "intervalo_s": INTERVALO_S,
+        "refrescos_en_este_proceso": _estado["refrescos"],
+        "ultimo_error": _estado["error"],
+    }
+
+
+# ------------------ programador en proceso ------------------
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _loop() -> None:
+    while not _stop.is_set():
+        try:
+            refrescar()
+        except Exception:
+            pass  # ya registrado; se reintenta en el próximo ciclo
+        _stop.wait(INTERVALO_S)
+
+
+def iniciar_programador() -> None:
+    """Arranca el hilo de refresco si DB_REPLICA_PATH está definido (REPLICA_AUTO=off lo desactiva)."""
+    global _thread
+    if not RUTA or not _flag("REPLICA_AUTO", "on") or (_thread and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="replica-refresh", daemon=True)
+    _thread.start()
+
+
+def detener_programador() -> None:
+    _stop.set()
+
+
+# ------------------ conexiones para reportes ------------------
+
+# Por petición: dict mutable que el endpoint (en el threadpool) completa y el middleware lee
+_origen_ctx: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("replica_origen", default=None)
+
+
+@contextmanager
+def conexion_reportes(max_atraso_s: Optional[float] = None):
+    """Conexión de solo lectura a la réplica si está dentro del atraso permitido; si no, la principal."""
+    info = _origen_ctx.get()
+    limite = MAX_ATRASO_S
+    if info is not None and info.get("max_pedido") is not None:
+        limite = min(limite, info["max_pedido"])
+    if max_atraso_s is not None:
+        limite = min(limite, max_atraso_s)
+    edad = edad_s() if deps.ruta() == deps.DB_PATH else None  # la réplica copia DB_PATH, no otros shards
+
+    if edad is not None and edad <= limite:
+        conn = sqlite3.connect(f"file:{RUTA}?mode=ro&immutable=1", uri=True, factory=metrics.ConexionInstrumentada)
+        conn.row_factory = sqlite3.Row
+        sqltrace.instalar(conn)
+        metrics.REPLICA_LECTURAS.inc("replica")
+        if info is not None:
+            info.update(origen="replica", edad=edad)
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    metrics.REPLICA_LECTURAS.inc("primary")
+    if info is not None:
+        info.update(origen="primary", edad=edad)
+    with deps.get_conn() as conn:
+        yield conn
+
+
+class ReplicaCabecerasMiddleware:
+    """ASGI: agrega X-Data-Source / X-Replica-Age en las respuestas que usaron conexion_reportes()."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        info: Dict[str, Any] = {}
+        for k, v in scope.get("headers", []):
+            if k.decode("latin-1").lower() == HEADER_MAX.lower():
+                try:
+                    info["max_pedido"] = max(0.0, float(v.decode("latin-1")))
+                except ValueError:
+                    pass
+        token = _origen_ctx.set(info)
+
+        async def send_con_cabeceras(msg):
+            if msg["type"] == "http.response.start" and info.get("origen"):
+                headers = list(msg.get("headers", []))
+                headers.append((b"x-data-source", info["origen"].encode()))
+                if info.get("edad") is not None:
+                    headers.append((b"x-replica-age", f"{info['edad']:.1f}".encode()))
+                msg = {**msg, "headers": headers}
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, send_con_cabeceras)
+        finally:
+            _origen_ctx.reset(token)
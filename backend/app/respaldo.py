@@ -0,0 +1,393 @@
+# backend/app/respaldo.py
+# Respaldos en caliente de la base (sin copiar el archivo vivo).
+#
+#   cd backend
+#   python -m app.respaldo crear                   # snapshot ahora (omite si el contenido no cambió)
+#   python -m app.respaldo listar
+#   python -m app.respaldo restaurar basedatos-20260101T020000-1a2b3c4d5e6f.db.gz [--destino otra.db]
+#
+# - Copia con la API de backup de SQLite (Connection.backup) en pasos de BACKUP_PAGINAS páginas,
+#   con pausa entre pasos: cada paso toma el lock de lectura solo mientras copia sus páginas.
+#   Si las escrituras reinician la copia más de BACKUP_MAX_REINICIOS veces, termina en un paso.
+# - El snapshot se comprime (gzip) y se nombra con el SHA-256 del contenido sin comprimir;
+#   al lado queda un manifiesto .json (hash, tamaños, duración, MB/s, tiempo con lock).
+#   Si el último snapshot tiene el mismo hash no se guarda otro.
+# - Retención: se conservan los BACKUP_RETENER más recientes y, además, el último de cada día
+#   de los últimos BACKUP_RETENER_DIAS días.
+# - Restaurar verifica hash e integrity_check y copia sobre la base con la misma API de backup
+#   (las conexiones abiertas ven el cambio). Antes se toma un snapshot de seguridad.
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app import deps, metrics
+
+log = logging.getLogger("respaldo")
+
+
+def _flag(name: str, default: str = "") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+
+
+DIRECTORIO = (os.getenv("BACKUP_DIR") or "").strip()  # vacío = <carpeta de DB_PATH>/respaldos
+PAGINAS = int(os.getenv("BACKUP_PAGINAS", "128"))
+PAUSA_S = float(os.getenv("BACKUP_PAUSA_MS", "10")) / 1000.0
+RETENER = int(os.getenv("BACKUP_RETENER", "7"))
+RETENER_DIAS = int(os.getenv("BACKUP_RETENER_DIAS", "30"))
+INTERVALO_S = float(os.getenv("BACKUP_INTERVALO_H", "24")) * 3600.0
+NIVEL_GZIP = int(os.getenv("BACKUP_GZIP_NIVEL", "6"))
+MAX_REINICIOS = int(os.getenv("BACKUP_MAX_REINICIOS", "3"))
+
+_PATRON = re.compile(r"^(?P<base>.+)-(?P<ts>\d{8}T\d{6})-(?P<hash>[0-9a-f]{12})\.db\.gz$")
+_lock = threading.Lock()  # un respaldo a la vez por proceso
+_BLOQUE = 1024 * 1024
+
+
+class _Reinicio(Exception):
+    pass
+
+
+def directorio() -> str:
+    return DIRECTORIO or os.path.join(os.path.dirname(os.path.abspath(deps.ruta())), "respaldos")
+
+
+def _base() -> str:
+    return os.path.splitext(os.path.basename(deps.ruta()))[0] or "base"
+
+
+# ------------------ snapshots ------------------
+
+def _copiar_por_pasos(origen: str, destino: str) -> Dict[str, Any]:
+    """Backup en línea por pasos; mide cuánto tiempo se sostuvo el lock de lectura en la base."""
+    pasos = 0
+    reinicios = 0
+    lock_total = 0.0
+    lock_max = 0.0
+    previo = [None]
+    marca = [time.perf_counter()]
+
+    def progreso(status, restantes, total):
+        nonlocal pasos, reinicios, lock_total, lock_max
+        paso_s = time.perf_counter() - marca[0]  # solo el paso, sin la pausa anterior
+        pasos += 1
+        lock_total += paso_s
+        lock_max = max(lock_max, paso_s)
+        metrics.RESPALDO_LOCK_PASO.observe(paso_s)
+        # Una escritura concurrente reinicia la copia (SQLite vuelve a empezar desde la página 1):
+        # si lo restante no bajó, hubo reinicio
+        if previo[0] is not None and restantes >= previo[0]:
+            reinicios += 1
+            if reinicios > MAX_REINICIOS:
+                raise _Reinicio()
+        previo[0] = restantes
+        if PAUSA_S > 0:
+            time.sleep(PAUSA_S)
+        marca[0] = time.perf_counter()
+
+    src = sqlite3.connect(origen, timeout=deps.BUSY_TIMEOUT_MS / 1000.0)
+    dst = sqlite3.connect(destino)
+    try:
+        marca[0] = time.perf_counter()
+        try:
+            src.backup(dst, pages=PAGINAS, progress=progreso)
+        except _Reinicio:
+            # Con escrituras continuas la copia por pasos no termina nunca: se copia en un solo paso.
+            # En WAL eso es una transacción de lectura y no frena a los escritores.
+            log.info("Respaldo: %s reinicios, copiando en un solo paso", reinicios)
+            t = time.perf_counter()
+            src.backup(dst)
+            paso_s = time.perf_counter() - t
+            pasos += 1
+            lock_total += paso_s
+            lock_max = max(lock_max, paso_s)
+            metrics.RESPALDO_LOCK_PASO.observe(paso_s)
+        # El snapshot debe abrirse solo, sin -wal/-shm al lado
+        dst.execute("PRAGMA journal_mode=DELETE;")
+        dst.commit()
+    finally:
+        dst.close()
+        src.close()
+    return {"pasos": pasos, "reinicios": reinicios, "lock_total_s": lock_total, "lock_max_s": lock_max}
+
+
+def _comprimir(origen: str, destino: str) -> str:
+    """gzip de 'origen' en 'destino'; devuelve el SHA-256 del contenido sin comprimir."""
+    h = hashlib.sha256()
+    # mtime=0: el mismo contenido produce el mismo .gz
+    with open(origen, "rb") as fi, open(destino, "wb") as crudo, \
+            gzip.GzipFile(fileobj=crudo, mode="wb", compresslevel=NIVEL_GZIP, mtime=0) as fo:
+        while True:
+            bloque = fi.read(_BLOQUE)
+            if not bloque:
+                break
+            h.update(bloque)
+            fo.write(bloque)
+    return h.hexdigest()
+
+
+def _manifiesto(ruta_gz: str) -> Dict[str, Any]:
+    try:
+        with open(ruta_gz[: -len(".db.gz")] + ".json", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def listar() -> List[Dict[str, Any]]:
+    """Snapshots de la base actual, del más reciente al más antiguo."""
+    d = directorio()
+    if not os.path.isdir(d):
+        return []
+    base = _base()
+    out = []
+    for nombre in os.listdir(d):
+        m = _PATRON.match(nombre)
+        if not m or m.group("base") != base:
+            continue
+        ruta = os.path.join(d, nombre)
+        man = _manifiesto(ruta)
+        out.append({
+            "nombre": nombre,
+            "fecha": datetime.strptime(m.group("ts"), "%Y%m%dT%H%M%S").isoformat(),
+            "sha256": man.get("sha256") or m.group("hash"),
+            "bytes_comprimido": os.path.getsize(ruta),
+            "bytes": man.get("bytes"),
+        })
+    out.sort(key=lambda x: x["nombre"], reverse=True)
+    return out
+
+
+def _aplicar_retencion() -> List[str]:
+    """Conserva los RETENER más recientes + el último de cada día dentro de RETENER_DIAS."""
+    snaps = listar()
+    conservar = {s["nombre"] for s in snaps[:max(RETENER, 1)]}
+    limite = time.time() - RETENER_DIAS * 86400
+    dias_vistos = set()
+    for s in snaps:  # de más nuevo a más viejo: el primero de cada día es el último de ese día
+        fecha = datetime.fromisoformat(s["fecha"])
+        if fecha.timestamp() < limite:
+            continue
+        if fecha.date() not in dias_vistos:
+            dias_vistos.add(fecha.date())
+            conservar.add(s["nombre"])
+    borrados = []
+    for s in snaps:
+        if s["nombre"] in conservar:
+            continue
+        ruta = os.path.join(directorio(), s["nombre"])
+        for p in (ruta, ruta[: -len(".db.gz")] + ".json"):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        borrados.append(s["nombre"])
+    if borrados:
+        log.info("Retención: %s snapshot(s) eliminados", len(borrados))
+    return borrados
+
+
+def crear(forzar: bool = False) -> Dict[str, Any]:
+    """
+    Toma un snapshot consistente de la base (con shards, la del shard actual) sin bloquear a los escritores más de un paso a la vez.
+    Sin 'forzar', si el contenido es idéntico al último snapshot no guarda otro.
+    """
+    if not os.path.exists(deps.ruta()):
+        raise FileNotFoundError(f"No existe la base {deps.ruta()}")
+    d = directorio()
+    os.makedirs(d, exist_ok=True)
+    with _lock:
+        ts = datetime.now().strftime("%Y%m%dT%H%M%S")
+        fd, tmp_db = tempfile.mkstemp(prefix=".respaldo-", suffix=".db", dir=d)
+        os.close(fd)
+        tmp_gz = tmp_db + ".gz"
+        t0 = time.perf_counter()
+        try:
+            copia = _copiar_por_pasos(deps.ruta(), tmp_db)
+            t_copia = time.perf_counter() - t0
+            tam = os.path.getsize(tmp_db)
+            sha = _comprimir(tmp_db, tmp_gz)
+            dur = time.perf_counter() - t0
+
+            ultimo = next(iter(listar()), None)
+            if not forzar and ultimo and ultimo["sha256"] == sha:
+                log.info("Respaldo omitido: sin cambios desde %s", ultimo["nombre"])
+                return {"estado": "sin_cambios", "nombre": ultimo["nombre"], "sha256": sha}
+
+            nombre = f"{_base()}-{ts}-{sha[:12]}.db.gz"
+            ruta = os.path.join(d, nombre)
+            mbps = (tam / 1e6) / t_copia if t_copia > 0 else 0.0
+            man = {
+                "nombre": nombre,
+                "origen": os.path.abspath(deps.ruta()),
+                "fecha": datetime.strptime(ts, "%Y%m%dT%H%M%S").isoformat(),
+                "sha256": sha,
+                "bytes": tam,
+                "bytes_comprimido": os.path.getsize(tmp_gz),
+                "segundos_copia": round(t_copia, 3),
+                "segundos_total": round(dur, 3),
+                "mb_s": round(mbps, 2),
+                "pasos": copia["pasos"],
+                "paginas_por_paso": PAGINAS,
+                "reinicios": copia["reinicios"],
+                "lock_total_s": round(copia["lock_total_s"], 4),
+                "lock_max_paso_s": round(copia["lock_max_s"], 4),
+            }
+            os.replace(tmp_gz, ruta)
+            with open(ruta[: -len(".db.gz")] + ".json", "w", encoding="utf-8") as fh:
+                json.dump(man, fh, ensure_ascii=False, indent=2)
+        finally:
+            for p in (tmp_db, tmp_gz):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+        metrics.RESPALDO_DURACION.observe(dur)
+        metrics.RESPALDO_MBPS.set(valor=mbps)
+        metrics.RESPALDO_LOCK_TOTAL.set(valor=copia["lock_total_s"])
+        metrics.RESPALDO_BYTES.set(valor=float(man["bytes_comprimido"]))
+        metrics.RESPALDO_ULTIMO.set(valor=time.time())
+        man["eliminados_por_retencion"] = _aplicar_retencion()
+        log.info("Respaldo %s: %.1f MB a %.1f MB/s, lock %.3fs (máx. paso %.4fs)",
+                 nombre, tam / 1e6, mbps, copia["lock_total_s"], copia["lock_max_s"])
+        return {"estado": "ok", **man}
+
+
+def _ruta_snapshot(nombre: str) -> str:
+    if os.path.basename(nombre) != nombre or not _PATRON.match(nombre):
+        raise ValueError(f"Nombre de snapshot inválido: {nombre}")
+    ruta = os.path.join(directorio(), nombre)
+    if not os.path.exists(ruta):
+        raise FileNotFoundError(f"No existe el snapshot {nombre}")
+    return ruta
+
+
+def restaurar(nombre: str, destino: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Restaura un snapshot sobre 'destino' (default: la base en uso). Verifica SHA-256 e integrity_check antes
+    de tocar la base; si el destino es la base en uso, toma antes un snapshot de seguridad.
+    """
+    ruta = _ruta_snapshot(nombre)
+    destino = destino or deps.ruta()
+    esperado = _manifiesto(ruta).get("sha256")
+    fd, tmp = tempfile.mkstemp(prefix=".restaurar-", suffix=".db", dir=os.path.dirname(ruta))
+    os.close(fd)
+    try:
+        h = hashlib.sha256()
+        with gzip.open(ruta, "rb") as fi, open(tmp, "wb") as fo:
+            while True:
+                bloque = fi.read(_BLOQUE)
+                if not bloque:
+                    break
+                h.update(bloque)
+                fo.write(bloque)
+        sha = h.hexdigest()
+        if (esperado and sha != esperado) or not sha.startswith(_PATRON.match(nombre).group("hash")):
+            raise ValueError(f"Hash del snapshot no coincide ({sha[:12]}); archivo dañado")
+        chk = sqlite3.connect(tmp)
+        try:
+            ok = chk.execute("PRAGMA integrity_check;").fetchone()[0]
+        finally:
+            chk.close()
+        if ok != "ok":
+            raise ValueError(f"integrity_check del snapshot falló: {ok}")
+
+        seguridad = None
+        if os.path.exists(destino) and os.path.abspath(destino) == os.path.abspath(deps.ruta()):
+            seguridad = crear().get("nombre")
+
+        t0 = time.perf_counter()
+        src = sqlite3.connect(tmp)
+        dst = sqlite3.connect(destino, timeout=deps.BUSY_TIMEOUT_MS / 1000.0)
+        try:
+            modo = dst.execute("PRAGMA journal_mode;").fetchone()[0]
+            src.backup(dst)  # un solo paso: escribe la base entera bajo su lock de escritura
+            if modo.lower() == "wal":  # el snapshot viene en modo DELETE; la base en uso sigue en WAL
+                dst.execute("PRAGMA journal_mode=WAL;")
+        finally:
+            dst.close()
+            src.close()
+        dur = time.perf_counter() - t0
+    finally:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    log.info("Restaurado %s en %s (%.2fs)", nombre, destino, dur)
+    return {"estado": "ok", "nombre": nombre, "destino": os.path.abspath(destino), "sha256": sha,
+            "segundos": round(dur, 3), "snapshot_previo": seguridad}
+
+
+# ------------------ programador en proceso ------------------
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _loop() -> None:
+    while not _stop.wait(INTERVALO_S):
+        for shard in deps.SHARDS or [None]:  # con shards, un snapshot por archivo (nombre = base del shard)
+            try:
+                with deps.en_shard(shard):
+                    crear()
+            except Exception as e:
+                log.warning("Fallo en respaldo programado%s: %s", f" (shard {shard})" if shard else "", e)
+
+
+def iniciar_programador() -> None:
+    """Respaldo cada BACKUP_INTERVALO_H horas si BACKUP_AUTO=on (con varios workers, usar cron + CLI)."""
+    global _thread
+    if not _flag("BACKUP_AUTO") or (_thread and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="respaldo", daemon=True)
+    _thread.start()
+
+
+def detener_programador() -> None:
+    _stop.set()
+
+
+# ------------------ CLI ------------------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Respaldos en caliente de la base SQLite")
+    sub = ap.add_subparsers(dest="comando", required=True)
+    c = sub.add_parser("crear", help="Toma un snapshot ahora")
+    c.add_argument("--forzar", action="store_true", help="Guarda aunque no haya cambios")
+    sub.add_parser("listar", help="Lista los snapshots")
+    r = sub.add_parser("restaurar", help="Restaura un snapshot")
+    r.add_argument("nombre")
+    r.add_argument("--destino", help="Archivo destino (default: DB_PATH)")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    try:
+        if args.comando == "crear":
+            res: Any = crear(forzar=args.forzar)
+        elif args.comando == "listar":
+            res = listar()
+        else:
+            res = restaurar(args.nombre, args.destino)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
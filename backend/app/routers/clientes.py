@@ -1,8 +1,10 @@
-﻿from fastapi import APIRouter, HTTPException, Path
+﻿from fastapi import APIRouter, HTTPException, Path, Query, Request
 from pydantic import BaseModel, EmailStr, field_validator
 from pydantic.types import StringConstraints
+from datetime import date
 from typing import Optional, List, Any, Annotated
-from app.deps import get_conn
+from app import deps, documentos, replica, serializacion, shards
+from app.deps import escritura, get_conn
 
 router = APIRouter()
 
@@ -49,18 +51,6 @@ class ClienteUpdate(BaseModel):
 
 # ---------- util ----------
 
-def _table_exists(conn, name: str) -> bool:
-    r = conn.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name=?;",
-        (name,),
-    ).fetchone()
-    return r is not None
-
-
-def _cols(conn, table: str) -> List[str]:
-    return [r["name"] for r in conn.execute(f"PRAGMA table_info({table});").fetchall()]
-
-
 def _generar_siguiente_codigo(conn) -> str:
     """Calcula el siguiente 'codigo' consecutivo con padding de ceros.
     Usa el ancho máximo existente (mínimo 3). Ej.: 001, 002, ..., 010.
@@ -85,18 +75,17 @@ def _generar_siguiente_codigo(conn) -> str:
 @router.get("")
 @router.get("/", include_in_schema=False)
 def listar_clientes():
-    with get_conn() as conn:
-        if not _table_exists(conn, "clientes"):
-            return []
-        rows = conn.execute("SELECT * FROM clientes ORDER BY id ASC;").fetchall()
-        return [{k: r[k] for k in r.keys()} for r in rows]
+    def _shard(_: Optional[str]) -> List[Any]:
+        with get_conn() as conn:
+            return serializacion.como_dicts(conn, "SELECT * FROM clientes ORDER BY id ASC;")
+
+    # Con shards (DB_SHARDS) sin X-Sucursal: todos los archivos en paralelo, intercalados por id
+    return serializacion.RespuestaJSON(deps.juntar(deps.dispersar(_shard), lambda c: c["id"]))
 
 
 @router.get("/{id:int}")
 def obtener_cliente(id: int = Path(..., ge=1)):
     with get_conn() as conn:
-        if not _table_exists(conn, "clientes"):
-            raise HTTPException(status_code=404, detail="No existe tabla 'clientes'")
         r = conn.execute("SELECT * FROM clientes WHERE id=?;", (id,)).fetchone()
         if not r:
             raise HTTPException(status_code=404, detail="Cliente no encontrado")
@@ -108,71 +97,73 @@ def detalle_cliente(id: int = Path(..., ge=1)):
     return obtener_cliente(id)
 
 
+@router.get("/{id:int}/estado-cuenta.pdf")
+def estado_cuenta_pdf(request: Request, id: int = Path(..., ge=1),
+                      corte: Optional[str] = Query(default=None, description="YYYY-MM-DD; default: hoy")):
+    """Estado de cuenta al corte: préstamos con saldo y pagos/abonos del mes (caché por versión)."""
+    try:
+        fecha = date.fromisoformat(corte) if corte else date.today()
+    except ValueError:
+        raise HTTPException(status_code=422, detail="corte debe tener formato YYYY-MM-DD")
+    with replica.conexion_reportes() as conn:
+        datos = documentos.datos_estado(conn, id, fecha)
+    if datos is None:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    pdf, ver, hit = documentos.pdf_estado(datos)
+    nombre = f"estado-{datos['cliente'].get('codigo') or id}-{datos['corte']}.pdf"
+    return documentos.respuesta(request, pdf, ver, hit, nombre)
+
+
 @router.get("/siguiente-codigo")
 def siguiente_codigo():
     """Devuelve el próximo consecutivo para prefijarlo en el formulario."""
+    if deps.SHARDS:  # consecutivo global: el directorio de app.shards
+        return {"codigo": shards.siguiente_codigo(_generar_siguiente_codigo)}
     with get_conn() as conn:
-        if not _table_exists(conn, "clientes"):
-            raise HTTPException(status_code=404, detail="No existe tabla 'clientes'")
         return {"codigo": _generar_siguiente_codigo(conn)}
 
 
 @router.post("")
 def crear_cliente(payload: ClienteIn):
-    with get_conn() as conn:
-        if not _table_exists(conn, "clientes"):
-            raise HTTPException(status_code=404, detail="No existe tabla 'clientes'")
-        cols = _cols(conn, "clientes")
-
-        # === Generar 'codigo' consecutivo automáticamente si la columna existe ===
-        codigo_gen: Optional[str] = None
-        if "codigo" in cols:
-            codigo_gen = _generar_siguiente_codigo(conn)
-
-        # Campos tolerantes: solo insertamos columnas que existan
-        fields: List[str] = []
-        values: List[Any] = []
-        for k in ("codigo", "nombre", "identificacion", "direccion", "telefono", "email"):
-            if k in cols:
-                fields.append(k)
-                if k == "codigo" and codigo_gen is not None:
-                    values.append(codigo_gen)  # ignorar 'codigo' del payload
-                else:
-                    values.append(getattr(payload, k))
-
-        if not fields:
-            raise HTTPException(status_code=400, detail="No hay columnas válidas para insertar")
-
-        placeholders = ",".join(["?"] * len(fields))
-        sql = f"INSERT INTO clientes ({','.join(fields)}) VALUES ({placeholders});"
-        conn.execute(sql, tuple(values))
-        conn.commit()
-        new_id = conn.execute("SELECT last_insert_rowid() AS id;").fetchone()["id"]
-        r = conn.execute("SELECT * FROM clientes WHERE id=?;", (new_id,)).fetchone()
+    # Con shards el código sale del directorio global (único entre archivos) junto con el shard del
+    # cliente: el de X-Sucursal o, sin ella, el que toca por hash del código
+    codigo, shard = (shards.asignar_codigo(deps.shard_fijado(), _generar_siguiente_codigo)
+                     if deps.SHARDS else (None, None))
+    with deps.en_shard(shard), get_conn() as conn:
+        # El código consecutivo se calcula y usa dentro de la misma transacción de escritura
+        # (BEGIN IMMEDIATE): con varios workers dos altas no pueden tomar el mismo código.
+        with escritura(conn):
+            # 'codigo' del payload se ignora: siempre el siguiente consecutivo
+            values = [codigo or _generar_siguiente_codigo(conn)] + [
+                getattr(payload, k) for k in ("nombre", "identificacion", "direccion", "telefono", "email")
+            ]
+            conn.execute(
+                "INSERT INTO clientes (codigo,nombre,identificacion,direccion,telefono,email) VALUES (?,?,?,?,?,?);",
+                tuple(values),
+            )
+            new_id = conn.execute("SELECT last_insert_rowid() AS id;").fetchone()["id"]
+            r = conn.execute("SELECT * FROM clientes WHERE id=?;", (new_id,)).fetchone()
         return {k: r[k] for k in r.keys()}
 
 
 @router.put("/{id:int}")
 def actualizar_cliente(id: int, payload: ClienteUpdate):
     with get_conn() as conn:
-        if not _table_exists(conn, "clientes"):
-            raise HTTPException(status_code=404, detail="No existe tabla 'clientes'")
         r0 = conn.execute("SELECT * FROM clientes WHERE id=?;", (id,)).fetchone()
         if not r0:
             raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
-        cols = _cols(conn, "clientes")
         sets: List[str] = []
         vals: List[Any] = []
         for k in ("nombre", "identificacion", "direccion", "telefono", "email"):
-            if getattr(payload, k) is not None and k in cols:
+            if getattr(payload, k) is not None:
                 sets.append(f"{k}=?")
                 vals.append(getattr(payload, k))
         if not sets:
             return {k: r0[k] for k in r0.keys()}
 
         vals.append(id)
-        conn.execute(f"UPDATE clientes SET {', '.join(sets)} WHERE id=?;", tuple(vals))
-        conn.commit()
+        with escritura(conn):
+            conn.execute(f"UPDATE clientes SET {', '.join(sets)} WHERE id=?;", tuple(vals))
         r = conn.execute("SELECT * FROM clientes WHERE id=?;", (id,)).fetchone()
         return {k: r[k] for k in r.keys()}
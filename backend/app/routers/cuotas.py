@@ -1,98 +1,76 @@
 ﻿# app/routers/cuotas.py
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Path, Query
 from pydantic import BaseModel, Field
-from typing import Optional, List, Any, Dict
-from datetime import date, datetime
-import csv
-from pathlib import Path
-from app.deps import get_conn
+from typing import Optional, List, Any, Dict, Literal
+from datetime import date, datetime, timedelta
+import os
+import time
+from app.deps import (agrupar_ids, begin_immediate, dispersar, en_shard, escritura, get_conn, juntar,
+                      shard_actual)
+from app import agrupador, archivo, bitacora, idempotencia, metrics, mora, replica, saldos, sentencias, serializacion
 
 router = APIRouter()  # prefix se agrega en app.main
 
-# ---------- utilidades ----------
-
-def _table_exists(conn, name: str) -> bool:
-    r = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,)).fetchone()
-    return r is not None
-
-
-def _cols(conn, table: str) -> List[str]:
-    return [r["name"] for r in conn.execute(f"PRAGMA table_info({table});").fetchall()]
-
-
-def _pick(cols: List[str], candidates: List[str]) -> Optional[str]:
-    s = set(cols)
-    for c in candidates:
-        if c in s:
-            return c
-    return None
-
-
-def _db_dir(conn) -> Path:
-    row = conn.execute("PRAGMA database_list;").fetchone()
-    fpath = row["file"] if row and "file" in row.keys() else None
-    return Path(fpath).resolve().parent if fpath else Path.cwd()
-
 # ---------- mapping columnas (cuotas) ----------
 
-def _cuota_mapping(conn) -> Dict[str, str]:
-    cols = _cols(conn, "cuotas")
-    return {
-        "id": "id",
-        "fk_prestamo": _pick(cols, ["id_prestamo", "prestamo_id"]) or "id_prestamo",
-        "cod_cli": _pick(cols, ["cod_cli", "codigo_cliente"]) or "cod_cli",
-        "nombre_cliente": _pick(cols, ["nombre_cliente"]) or "nombre_cliente",
-        "modalidad": _pick(cols, ["modalidad"]) or "modalidad",
-        "numero": _pick(cols, ["cuota_numero", "numero"]) or "cuota_numero",
-        "venc": _pick(cols, ["fecha_vencimiento", "fecha"]) or "fecha_vencimiento",
-        "interes_a_pagar": _pick(cols, ["interes_a_pagar", "interes"]) or "interes_a_pagar",
-        "fecha_pago": _pick(cols, ["fecha_pago"]) or "fecha_pago",
-        "estado": _pick(cols, ["estado"]) or "estado",
-        "dias_mora": _pick(cols, ["dias_mora"]) or "dias_mora",
-        "abono_capital": _pick(cols, ["abono_capital"]) or "abono_capital",
-        "interes_pagado": _pick(cols, ["interes_pagado"]) or "interes_pagado",
-    }
+# Nombres canónicos: la migración 2 (app.migraciones) renombra los históricos al arrancar
+_CUOTA_COLS: Dict[str, str] = {
+    "id": "id",
+    "fk_prestamo": "id_prestamo",
+    "cod_cli": "cod_cli",
+    "nombre_cliente": "nombre_cliente",
+    "modalidad": "modalidad",
+    "numero": "cuota_numero",
+    "venc": "fecha_vencimiento",
+    "interes_a_pagar": "interes_a_pagar",
+    "fecha_pago": "fecha_pago",
+    "estado": "estado",
+    "dias_mora": "dias_mora",
+    "tramo_mora": "tramo_mora",
+    "abono_capital": "abono_capital",
+    "interes_pagado": "interes_pagado",
+}
 
 # ---------- helper: row -> cuota dict ----------
 
-def _row_to_cuota(row, m) -> Dict[str, Any]:
-    def has(col: str) -> bool:
-        try:
-            return col in row.keys()
-        except Exception:
-            return False
+def _fnum(x):
+    try:
+        return float(x)
+    except Exception:
+        return None
 
-    def fnum(x):
-        try:
-            return float(x) if x is not None else None
-        except Exception:
-            return None
 
-    def fint(x):
-        try:
-            return int(x) if x is not None else None
-        except Exception:
-            return None
+def _fint(x):
+    try:
+        return int(x)
+    except Exception:
+        return None
+
+
+def _mapeador_cuota(nombres, m):
+    """Convierte filas de 'cuotas' (tuplas o sqlite3.Row) con índices precalculados para la consulta."""
+    return serializacion.mapeador(nombres, [
+        ("id", "id", None),
+        ("id_prestamo", m["fk_prestamo"], None),
+        ("cod_cli", m["cod_cli"], None),
+        ("nombre_cliente", m["nombre_cliente"], None),
+        ("modalidad", m["modalidad"], None),
+        # número de cuota (exponer ambos para compatibilidad: 'numero' y 'cuota_numero')
+        ("numero", m["numero"], _fint),
+        ("cuota_numero", m["numero"], _fint),  # <-- clave legacy para la UI
+        ("fecha_vencimiento", m["venc"], None),
+        ("interes_a_pagar", m["interes_a_pagar"], _fnum),
+        ("fecha_pago", m["fecha_pago"], None),
+        ("estado", m["estado"], None),
+        ("dias_mora", m["dias_mora"], _fint),
+        ("tramo_mora", m["tramo_mora"], None),
+        ("abono_capital", m["abono_capital"], _fnum),
+        ("interes_pagado", m["interes_pagado"], _fnum),
+    ])
 
-    # número de cuota (exponer ambos para compatibilidad: 'numero' y 'cuota_numero')
-    num_val = fint(row[m["numero"]] if has(m["numero"]) else None)
 
-    return {
-        "id": row["id"],
-        "id_prestamo": row[m["fk_prestamo"]] if has(m["fk_prestamo"]) else None,
-        "cod_cli": row[m["cod_cli"]] if has(m["cod_cli"]) else None,
-        "nombre_cliente": row[m["nombre_cliente"]] if has(m["nombre_cliente"]) else None,
-        "modalidad": row[m["modalidad"]] if has(m["modalidad"]) else None,
-        "numero": num_val,
-        "cuota_numero": num_val,  # <-- clave legacy para la UI
-        "fecha_vencimiento": row[m["venc"]] if has(m["venc"]) else None,
-        "interes_a_pagar": fnum(row[m["interes_a_pagar"]] if has(m["interes_a_pagar"]) else None),
-        "fecha_pago": row[m["fecha_pago"]] if has(m["fecha_pago"]) else None,
-        "estado": row[m["estado"]] if has(m["estado"]) else None,
-        "dias_mora": fint(row[m["dias_mora"]] if has(m["dias_mora"]) else None),
-        "abono_capital": fnum(row[m["abono_capital"]] if has(m["abono_capital"]) else None),
-        "interes_pagado": fnum(row[m["interes_pagado"]] if has(m["interes_pagado"]) else None),
-    }
+def _row_to_cuota(row, m) -> Dict[str, Any]:
+    return _mapeador_cuota(row.keys(), m)(row)
 
 # ---------- modelos ----------
 
@@ -108,34 +86,20 @@ class AbonoCapitalInput(BaseModel):
 
 # ---------- NUEVO: Resumen de préstamos (definido ANTES de rutas con {id}) ----------
 
-@router.get("/resumen-prestamos")
-def resumen_prestamos():
-    """Resumen por préstamo (dinámico y tolerante a 'abonos_capital' ausente)."""
-    hoy = date.today().isoformat()
-    with get_conn() as conn:
-        if not (_table_exists(conn, "prestamos") and _table_exists(conn, "cuotas")):
-            return []
-
-        m = _cuota_mapping(conn)
-        cols_cuotas = _cols(conn, "cuotas")
-
-        fk = m["fk_prestamo"]
-        venc = m["venc"]
-        interes_col = m["interes_a_pagar"]
-        nombre_cli_col = m["nombre_cliente"] if m["nombre_cliente"] in cols_cuotas else None
+def _resumen_sql(m: Dict[str, str], uno: bool) -> str:
+    """
+    Resumen por préstamo (listado y detalle comparten la regla de 'estado').
+    uno=True filtra por p.id (parámetros: hoy, id); si no, toda la cartera (parámetros: hoy).
+    """
+    fk = m["fk_prestamo"]
+    venc = m["venc"]
 
-        abonos_existe = _table_exists(conn, "abonos_capital")
-        ab_sum_expr = (
-            "COALESCE((SELECT SUM(a.monto) FROM abonos_capital a WHERE a.id_prestamo=p.id), 0)"
-            if abonos_existe else "0"
-        )
-        total_interes_expr = f"COALESCE((SELECT SUM(c2.{interes_col}) FROM cuotas c2 WHERE c2.{fk}=p.id), 0)"
-        nombre_expr = (
-            f"COALESCE(MAX(cl.nombre), MAX(cu.{nombre_cli_col}))"
-            if nombre_cli_col else "MAX(cl.nombre)"
-        )
+    # Saldos corrientes mantenidos por cada abono (app.saldos): sin re-sumar abonos_capital
+    ab_sum_expr = "p.capital_abonado"
+    total_interes_expr = f"COALESCE((SELECT SUM(c1.{m['interes_a_pagar']}) FROM cuotas c1 WHERE c1.{fk}=p.id), 0)"
+    nombre_expr = f"COALESCE(MAX(cl.nombre), MAX(cu.{m['nombre_cliente']}))"
 
-        sql = f"""
+    return f"""
         SELECT
             p.id AS id,
             {nombre_expr} AS nombre_cliente,
@@ -157,25 +121,90 @@ def resumen_prestamos():
                 ) = (
                     SELECT COUNT(*) FROM cuotas c4 WHERE c4.{fk}=p.id
                 ) AND (
-                    (p.importe_credito - {ab_sum_expr}) > 0 ) THEN 'PENDIENTE'
+                    p.capital_pendiente > 0 ) THEN 'PENDIENTE'
                 WHEN (
                     SELECT COUNT(*) FROM cuotas c5 WHERE c5.{fk}=p.id AND c5.estado='PAGADO'
                 ) = (
                     SELECT COUNT(*) FROM cuotas c6 WHERE c6.{fk}=p.id
                 ) AND (
-                    (p.importe_credito - {ab_sum_expr}) <= 0
+                    p.capital_pendiente <= 0
                 ) THEN 'PAGADO'
                 ELSE 'PENDIENTE'
             END AS estado,
-            (p.importe_credito - {ab_sum_expr}) AS capital_pendiente
+            p.capital_pendiente AS capital_pendiente
         FROM prestamos p
         LEFT JOIN cuotas cu ON cu.{fk}=p.id
         LEFT JOIN clientes cl ON cl.codigo = p.cod_cli
+        {"WHERE p.id = ?" if uno else ""}
         GROUP BY p.id
-        ORDER BY p.id DESC
+        {"" if uno else "ORDER BY p.id DESC"}
         """
-        rows = conn.execute(sql, (hoy,)).fetchall()
-        return [{k: r[k] for k in r.keys()} for r in rows]
+
+
+def _dia(valor) -> Optional[str]:
+    """date() de SQLite en Python: 'YYYY-MM-DD' (descarta la hora) o None si no es una fecha."""
+    try:
+        return date.fromisoformat(str(valor)[:10]).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _resumen_de(p, nombre_cliente: Optional[str], cuotas: List[Dict[str, Any]], m: Dict[str, str],
+                hoy: str) -> Dict[str, Any]:
+    """
+    Lo mismo que _resumen_sql(m, True) a partir de la fila del préstamo y sus cuotas ya leídas
+    (GET /prestamos/{id}/detalle las comparte con las demás secciones). Misma regla de 'estado'.
+    """
+    estados = [c[m["estado"]] for c in cuotas]
+    vencimientos = [d for d in (_dia(c[m["venc"]]) for c in cuotas) if d]
+    nombres = [c[m["nombre_cliente"]] for c in cuotas if c[m["nombre_cliente"]] is not None]
+    cap = p["capital_pendiente"]
+    todas_pagadas = estados.count("PAGADO") == len(estados)
+    if any(e == "PENDIENTE" and (_dia(c[m["venc"]]) or "9999") < hoy for e, c in zip(estados, cuotas)):
+        estado = "VENCIDO"
+    elif todas_pagadas and cap is not None and cap > 0:
+        estado = "PENDIENTE"
+    elif todas_pagadas and cap is not None and cap <= 0:
+        estado = "PAGADO"
+    else:
+        estado = "PENDIENTE"
+    return {
+        "id": p["id"],
+        "nombre_cliente": nombre_cliente if nombre_cliente is not None else (max(nombres) if nombres else None),
+        "vence_ultima_cuota": max(vencimientos) if vencimientos else None,
+        "modalidad": p["modalidad"],
+        "importe_credito": p["importe_credito"],
+        "tasa_interes": p["tasa_interes"],
+        "total_interes_a_pagar": sum(c[m["interes_a_pagar"]] or 0 for c in cuotas),
+        "total_abonos_capital": p["capital_abonado"],
+        "estado": estado,
+        "capital_pendiente": cap,
+    }
+
+
+@router.get("/resumen-prestamos")
+def resumen_prestamos(historial: bool = Query(default=False, description="Incluir préstamos archivados (app.archivo)")):
+    """
+    Resumen por préstamo. Se lee de la réplica si está al día.
+    Por defecto solo la cartera en la base caliente; historial=true agrega los préstamos archivados.
+    Con shards (DB_SHARDS) se consulta cada uno en paralelo y se intercalan por id.
+    """
+    hoy = date.today().isoformat()
+
+    def _shard(_: Optional[str]) -> List[Dict[str, Any]]:
+        with replica.conexion_reportes() as conn:
+            m = _CUOTA_COLS
+            sql = sentencias.sql("cuotas.resumen", False, lambda: _resumen_sql(m, False))
+            filas = serializacion.como_dicts(conn, sql, (hoy,))
+            if historial:
+                # Cada préstamo está entero en una base: misma consulta sobre el archivo y se intercalan por id
+                with archivo.leyendo_archivo(conn) as hay:
+                    if hay:
+                        filas += serializacion.como_dicts(conn, sql, (hoy,))
+                        filas.sort(key=lambda f: f["id"], reverse=True)
+            return filas
+
+    return serializacion.RespuestaJSON(juntar(dispersar(_shard), lambda f: f["id"], reverse=True))
 
 
 @router.get("/prestamo/{prestamo_id:int}/resumen")
@@ -183,92 +212,27 @@ def resumen_de_prestamo(prestamo_id: int):
     """
     Resumen + lista de cuotas de un préstamo.
     - Calcula 'estado' con la misma regla del listado.
-    - Calcula 'dias_mora' por cuota si está 'PENDIENTE'.
-    - Tolera que 'abonos_capital' no exista.
+    - 'dias_mora' / 'tramo_mora' se leen de la BD (refresco diario en app.mora).
     """
     with get_conn() as conn:
-        if not (_table_exists(conn, "prestamos") and _table_exists(conn, "cuotas")):
-            raise HTTPException(status_code=404, detail="Faltan tablas requeridas")
-
-        m = _cuota_mapping(conn)
-        cols_cuotas = _cols(conn, "cuotas")
-
-        fk = m["fk_prestamo"]
-        venc = m["venc"]
-        interes_col = m["interes_a_pagar"]
-        nombre_cli_col = m["nombre_cliente"] if m["nombre_cliente"] in cols_cuotas else None
-
-        abonos_existe = _table_exists(conn, "abonos_capital")
-        ab_sum_expr = (
-            "COALESCE((SELECT SUM(monto) FROM abonos_capital a WHERE a.id_prestamo=p.id),0)"
-            if abonos_existe else "0"
-        )
-        total_interes_expr = f"COALESCE((SELECT SUM(cu2.{interes_col}) FROM cuotas cu2 WHERE cu2.{fk}=p.id), 0)"
-        nombre_expr = (
-            f"COALESCE(MAX(cl.nombre), MAX(cu.{nombre_cli_col}))" if nombre_cli_col else "MAX(cl.nombre)"
-        )
+        archivo.usar_si_archivado(conn, "prestamos", prestamo_id)  # préstamo archivado: se lee del archivo
+        m = _CUOTA_COLS
 
         hoy = date.today().isoformat()
-        res_sql = f"""
-        SELECT
-            p.id AS id,
-            {nombre_expr} AS nombre_cliente,
-            MAX(date(cu.{venc})) AS vence_ultima_cuota,
-            p.modalidad AS modalidad,
-            p.importe_credito AS importe_credito,
-            p.tasa_interes AS tasa_interes,
-            {total_interes_expr} AS total_interes_a_pagar,
-            {ab_sum_expr} AS total_abonos_capital,
-            CASE
-                WHEN EXISTS (
-                    SELECT 1 FROM cuotas c2
-                    WHERE c2.{fk} = p.id
-                      AND c2.estado = 'PENDIENTE'
-                      AND date(c2.{venc}) < date(?)
-                ) THEN 'VENCIDO'
-                WHEN (
-                    SELECT COUNT(*) FROM cuotas c3 WHERE c3.{fk}=p.id AND c3.estado='PAGADO'
-                ) = (
-                    SELECT COUNT(*) FROM cuotas c4 WHERE c4.{fk}=p.id
-                ) AND (
-                    (p.importe_credito - {ab_sum_expr}) > 0 ) THEN 'PENDIENTE'
-                WHEN (
-                    SELECT COUNT(*) FROM cuotas c5 WHERE c5.{fk}=p.id AND c5.estado='PAGADO'
-                ) = (
-                    SELECT COUNT(*) FROM cuotas c6 WHERE c6.{fk}=p.id
-                ) AND (
-                    (p.importe_credito - {ab_sum_expr}) <= 0
-                ) THEN 'PAGADO'
-                ELSE 'PENDIENTE'
-            END AS estado,
-            (p.importe_credito - {ab_sum_expr}) AS capital_pendiente
-        FROM prestamos p
-        LEFT JOIN cuotas cu ON cu.{fk}=p.id
-        LEFT JOIN clientes cl ON cl.codigo = p.cod_cli
-        WHERE p.id = ?
-        GROUP BY p.id
-        """
+        res_sql = sentencias.sql("cuotas.resumen", True, lambda: _resumen_sql(m, True))
         rr = conn.execute(res_sql, (hoy, prestamo_id)).fetchone()
         if not rr:
             raise HTTPException(status_code=404, detail="Préstamo no encontrado")
 
         resumen = {k: rr[k] for k in rr.keys()}
 
-        cu_sql = f"SELECT * FROM cuotas WHERE {fk}=? ORDER BY {m['numero']};"
-        cuotas = conn.execute(cu_sql, (prestamo_id,)).fetchall()
+        cu_sql = sentencias.sql("cuotas.de_prestamo", None,
+                                lambda: f"SELECT * FROM cuotas WHERE {m['fk_prestamo']}=? ORDER BY {m['numero']};")
+        nombres, cuotas = serializacion.consultar(conn, cu_sql, (prestamo_id,))
+        a_cuota = _mapeador_cuota(nombres, m)
         cu_out: List[Dict[str, Any]] = []
         for c in cuotas:
-            d = _row_to_cuota(c, m)
-            try:
-                fv_raw = d.get("fecha_vencimiento")
-                if fv_raw and d.get("estado") == "PENDIENTE":
-                    try:
-                        fv = datetime.strptime(fv_raw, "%Y-%m-%d").date()
-                    except ValueError:
-                        fv = datetime.fromisoformat(fv_raw).date()
-                    d["dias_mora"] = max((date.today() - fv).days, 0)
-            except Exception:
-                pass
+            d = a_cuota(c)
             # Fallback: si la cuota no trae modalidad, usa la del préstamo (resumen)
             if not d.get("modalidad"):
                 try:
@@ -277,53 +241,243 @@ def resumen_de_prestamo(prestamo_id: int):
                     pass
             cu_out.append(d)
 
-        return {"resumen": resumen, "cuotas": cu_out}
+        return serializacion.RespuestaJSON({"resumen": resumen, "cuotas": cu_out})
 
 # ---------- Endpoints estándar (listar, obtener, pagar, abono) ----------
 
+def _listar_sql(m: Dict[str, str], cod_cli: bool, estado: bool, id_prestamo: bool, vencidas: bool) -> str:
+    """Listado de cuotas con los filtros presentes (los parámetros van en ese mismo orden)."""
+    sql = "SELECT * FROM cuotas WHERE 1=1"
+    if cod_cli:
+        sql += f" AND {m['cod_cli']} = ?"
+    if estado:
+        sql += f" AND {m['estado']} = ?"
+    if id_prestamo:
+        sql += f" AND {m['fk_prestamo']} = ?"
+    if vencidas:
+        sql += f" AND {m['estado']} = 'PENDIENTE' AND date({m['venc']}) < date(?)"
+    return sql + f" ORDER BY {m['fk_prestamo']} DESC, {m['numero']} ASC"
+
+
 @router.get("")
 @router.get("/", include_in_schema=False)
 def listar_cuotas(cod_cli: Optional[str] = Query(default=None),
                   estado: Optional[str] = Query(default=None, regex=r"^(PENDIENTE|PAGADO)$"),
                   vencidas: bool = Query(default=False),
-                  id_prestamo: Optional[int] = Query(default=None)):
-
-    with get_conn() as conn:
-        if not _table_exists(conn, "cuotas"):
-            return []
-        m = _cuota_mapping(conn)
-        sql = "SELECT * FROM cuotas WHERE 1=1"
-        params: List[Any] = []
-        if cod_cli:
-            sql += f" AND {m['cod_cli']} = ?"
-            params.append(cod_cli)
-        if estado:
-            sql += f" AND {m['estado']} = ?"
-            params.append(estado)
-        if id_prestamo is not None:
-            sql += f" AND {m['fk_prestamo']} = ?"
-            params.append(id_prestamo)
-        if vencidas:
-            hoy = date.today().isoformat()
-            sql += f" AND {m['estado']} = 'PENDIENTE' AND date({m['venc']}) < date(?)"
-            params.append(hoy)
-        sql += f" ORDER BY {m['fk_prestamo']} DESC, {m['numero']} ASC"
-        rows = conn.execute(sql, tuple(params)).fetchall()
-        return [_row_to_cuota(r, m) for r in rows]
+                  id_prestamo: Optional[int] = Query(default=None),
+                  historial: bool = Query(default=False, description="Incluir cuotas de préstamos archivados")):
+
+    # Con shards: cod_cli o id_prestamo enrutan a un solo archivo (app.shards); sin filtro, todos
+    def _shard(_: Optional[str]) -> List[Dict[str, Any]]:
+        with get_conn() as conn:
+            if id_prestamo is not None and not historial:
+                archivo.usar_si_archivado(conn, "prestamos", id_prestamo)
+            m = _CUOTA_COLS
+            params: List[Any] = []
+            if cod_cli:
+                params.append(cod_cli)
+            if estado:
+                params.append(estado)
+            if id_prestamo is not None:
+                params.append(id_prestamo)
+            if vencidas:
+                params.append(date.today().isoformat())
+            forma = (bool(cod_cli), bool(estado), id_prestamo is not None, vencidas)
+            sql = sentencias.sql("cuotas.listar", forma, lambda: _listar_sql(m, *forma))
+            nombres, rows = serializacion.consultar(conn, sql, tuple(params))
+            a_cuota = _mapeador_cuota(nombres, m)
+            out = [a_cuota(r) for r in rows]
+            if historial:
+                with archivo.leyendo_archivo(conn) as hay:
+                    if hay:
+                        nombres, rows = serializacion.consultar(conn, sql, tuple(params))
+                        a_cuota = _mapeador_cuota(nombres, m)
+                        out += [a_cuota(r) for r in rows]
+                        out.sort(key=lambda c: (-(c["id_prestamo"] or 0), c["numero"] or 0))
+            return out
+
+    return serializacion.RespuestaJSON(
+        juntar(dispersar(_shard), lambda c: (-(c["id_prestamo"] or 0), c["numero"] or 0)))
 
 
 @router.get("/{cuota_id:int}")
 def obtener_cuota(cuota_id: int):
     with get_conn() as conn:
-        if not _table_exists(conn, "cuotas"):
-            raise HTTPException(status_code=404, detail="No existe tabla 'cuotas'")
-        m = _cuota_mapping(conn)
+        archivo.usar_si_archivado(conn, "cuotas", cuota_id)
+        m = _CUOTA_COLS
         row = conn.execute("SELECT * FROM cuotas WHERE id = ?", (cuota_id,)).fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Cuota no encontrada")
         return _row_to_cuota(row, m)
 
 
+# ---------- núcleo de pagos / abonos (reutilizado por los endpoints individuales y por /lote) ----------
+
+def _cerrar_prestamo_si_corresponde(conn, m, prestamo_id) -> None:
+    """Marca el préstamo PAGADO si todas sus cuotas están pagadas y no queda capital pendiente."""
+    try:
+        r = conn.execute(sentencias.sql("cuotas.pagadas", None, lambda: (
+            f"SELECT COUNT(*) AS total, "
+            f"COALESCE(SUM(CASE WHEN UPPER({m['estado']}) = 'PAGADO' THEN 1 ELSE 0 END), 0) AS pagadas "
+            f"FROM cuotas WHERE {m['fk_prestamo']} = ?"
+        )), (prestamo_id,)).fetchone()
+        todas_pagadas = bool(r["total"] and r["pagadas"] == r["total"])
+
+        sp = saldos.saldo(conn, prestamo_id)
+        capital_cubierto = sp is not None and sp[2] <= 1e-6
+
+        if todas_pagadas and capital_cubierto:
+            conn.execute("UPDATE prestamos SET estado = 'PAGADO' WHERE id = ?", (prestamo_id,))
+    except Exception:
+        pass
+
+
+def _aplicar_pago(conn, m, cuota_id: int, payload: PagoInput, cerrar: bool = True) -> Dict[str, Any]:
+    """
+    Aplica el pago sobre la conexión recibida, SIN commit.
+    Con cerrar=False no evalúa el cierre del préstamo (lo hace el llamador una vez por préstamo).
+    """
+    fp = payload.fecha_pago or date.today().isoformat()
+    row = conn.execute("SELECT * FROM cuotas WHERE id=?;", (cuota_id,)).fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Cuota no encontrada")
+    dias_mora = 0
+    try:
+        fv = datetime.strptime(row[m["venc"]], "%Y-%m-%d").date() if row[m["venc"]] else None
+        f_pago = datetime.strptime(fp, "%Y-%m-%d").date()
+        if fv:
+            dias_mora = max((f_pago - fv).days, 0)
+    except Exception:
+        dias_mora = 0
+    conn.execute(
+        sentencias.sql("cuotas.pagar", None, lambda: f"""
+        UPDATE cuotas SET
+            {m['estado']} = 'PAGADO',
+            {m['fecha_pago']} = ?,
+            {m['interes_pagado']} = ?,
+            {m['dias_mora']} = ?,
+            {m['tramo_mora']} = ?
+        WHERE id = ?
+        """),
+        (fp, float(payload.interes_pagado), int(dias_mora), mora.tramo_de(dias_mora), cuota_id)
+    )
+    prestamo_id = row[m["fk_prestamo"]]
+    if cerrar:
+        _cerrar_prestamo_si_corresponde(conn, m, prestamo_id)
+    row = conn.execute("SELECT * FROM cuotas WHERE id=?;", (cuota_id,)).fetchone()
+    return _row_to_cuota(row, m)
+
+
+def _fecha_abono(payload: AbonoCapitalInput) -> str:
+    # Normalizar fecha: aceptar string ISO o date; default hoy
+    if isinstance(payload.fecha, str):
+        try:
+            return date.fromisoformat(payload.fecha).isoformat()
+        except Exception:
+            raise HTTPException(status_code=422, detail="fecha debe tener formato YYYY-MM-DD")
+    return (payload.fecha or date.today()).isoformat()
+
+
+_ABONOS_INSERT_SQL = "INSERT INTO abonos_capital (id_prestamo,nombre_cliente,fecha,monto) VALUES (?,?,?,?);"
+
+
+def _aplicar_abono(conn, m, cuota_id: int, payload: AbonoCapitalInput) -> Dict[str, Any]:
+    """
+    Aplica el abono sobre la conexión recibida, SIN commit (ver reglas en registrar_abono_capital).
+    Devuelve la respuesta del endpoint; la fila de la bitácora queda en '_log'.
+    """
+    f = _fecha_abono(payload)
+    monto = float(payload.monto)
+    if monto <= 0:
+        raise HTTPException(status_code=422, detail="monto debe ser > 0")
+
+    # Traer cuota objetivo con numero, interés plan y pagado
+    sel = sentencias.sql("cuotas.abono_objetivo", None, lambda: (
+        f"SELECT id, {m['fk_prestamo']} AS id_prestamo, {m['numero']} AS numero, "
+        f"{m['nombre_cliente']} AS nombre_cliente, {m['estado']} AS estado, "
+        f"{m['interes_a_pagar']} AS interes_plan, "
+        f"{m['interes_pagado']} AS interes_pagado "
+        f"FROM cuotas WHERE id=?;"
+    ))
+    row = conn.execute(sel, (cuota_id,)).fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Cuota no encontrada")
+
+    estado_actual = (row["estado"] or "PENDIENTE").upper()
+    interes_plan = float(row["interes_plan"] or 0.0)
+    interes_pagado = float(row["interes_pagado"] or 0.0)
+
+    # --- NUEVA REGLA: no permitir abonos si el interés ya está cubierto ---
+    tol = 0.005
+    if estado_actual == "PAGADO" or (interes_pagado + tol >= interes_plan and interes_plan > 0):
+        raise HTTPException(
+            status_code=409,
+            detail="No se puede abonar capital a una cuota con interés ya pagado (PAGADO)."
+        )
+
+    id_prestamo = row["id_prestamo"]
+    numero_actual = int(row["numero"] or 0)
+    nombre_cliente = row["nombre_cliente"]
+
+    # Datos del préstamo (saldo corriente en la misma fila: sin sumar abonos_capital)
+    imp_row = conn.execute(
+        "SELECT importe_credito, tasa_interes, plan_mode, capital_pendiente FROM prestamos WHERE id=?;",
+        (id_prestamo,),
+    ).fetchone()
+    if not imp_row:
+        raise HTTPException(status_code=404, detail="Préstamo no encontrado para la cuota")
+    tasa = float(imp_row["tasa_interes"] or 0)
+    plan_mode = imp_row["plan_mode"] or "auto"
+
+    # Capital pendiente previo (ANTES de este abono)
+    capital_pendiente_pre = max(float(imp_row["capital_pendiente"] or 0.0), 0.0)
+    if monto > capital_pendiente_pre + 1e-6:
+        raise HTTPException(status_code=422, detail=f"Abono excede capital pendiente ({capital_pendiente_pre:.2f})")
+
+    # Insertar en abonos_capital
+    conn.execute(_ABONOS_INSERT_SQL, (id_prestamo, nombre_cliente, f, monto))
+    saldos.aplicar_abono(conn, id_prestamo, monto)
+
+    # Acumular en el campo de la cuota
+    conn.execute(
+        f"UPDATE cuotas SET {m['abono_capital']} = COALESCE({m['abono_capital']}, 0) + ? WHERE id = ?;",
+        (monto, cuota_id)
+    )
+
+    # -------- PERSISTENCIA de INTERÉS para TODAS las siguientes (bajo flag) --------
+    try:
+        persist_on = (os.getenv("AUTO_INTERES_ABONOS_PERSIST", "") or "").strip().lower() in {"1","true","on","yes","y"}
+        if persist_on and plan_mode == "auto":
+            # Base tras incluir ESTE abono
+            cap_pend = max(capital_pendiente_pre - monto, 0.0)
+            interes_por_cuota_nuevo = round(cap_pend * tasa / 100.0, 2)
+
+            num_col = m["numero"]
+            int_col = m["interes_a_pagar"]
+            estado_col = m["estado"]
+            fk_col = m["fk_prestamo"]
+
+            conn.execute(
+                f"""
+                UPDATE cuotas
+                SET {int_col} = ?
+                WHERE {fk_col} = ?
+                  AND {num_col} > ?
+                  AND UPPER({estado_col}) <> 'PAGADO';
+                """,
+                (interes_por_cuota_nuevo, id_prestamo, numero_actual)
+            )
+    except Exception:
+        # Si el recalculo persistente falla, el abono NO se bloquea
+        pass
+    # -------------------------------------------------------------------------------
+
+    return {
+        "status": "ok", "id_prestamo": id_prestamo, "fecha": f, "monto": monto,
+        "_log": [f, id_prestamo, nombre_cliente or "", monto, cuota_id],
+    }
+
+
 @router.post(
     "/{cuota_id:int}/pago",
     summary="Registrar pago de interés",
@@ -335,69 +489,8 @@ def obtener_cuota(cuota_id: int):
     ),
 )
 def registrar_pago(cuota_id: int, payload: PagoInput):
-    fp = payload.fecha_pago or date.today().isoformat()
-    with get_conn() as conn:
-        if not _table_exists(conn, "cuotas"):
-            raise HTTPException(status_code=404, detail="No existe tabla 'cuotas'")
-        m = _cuota_mapping(conn)
-        row = conn.execute("SELECT * FROM cuotas WHERE id=?;", (cuota_id,)).fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Cuota no encontrada")
-        dias_mora = 0
-        try:
-            fv = datetime.strptime(row[m["venc"]], "%Y-%m-%d").date() if row[m["venc"]] else None
-            f_pago = datetime.strptime(fp, "%Y-%m-%d").date()
-            if fv:
-                dias_mora = max((f_pago - fv).days, 0)
-        except Exception:
-            dias_mora = 0
-        conn.execute(
-            f"""
-            UPDATE cuotas SET
-                {m['estado']} = 'PAGADO',
-                {m['fecha_pago']} = ?,
-                {m['interes_pagado']} = ?,
-                {m['dias_mora']} = ?
-            WHERE id = ?
-            """,
-            (fp, float(payload.interes_pagado), int(dias_mora), cuota_id)
-        )
-        try:
-            prestamo_id = row[m["fk_prestamo"]]
-            total = conn.execute(
-                f"SELECT COUNT(*) AS c FROM cuotas WHERE {m['fk_prestamo']} = ?",
-                (prestamo_id,)
-            ).fetchone()[0]
-            pagadas = conn.execute(
-                f"SELECT COUNT(*) AS c FROM cuotas WHERE {m['fk_prestamo']} = ? AND UPPER({m['estado']}) = 'PAGADO'",
-                (prestamo_id,)
-            ).fetchone()[0]
-            todas_pagadas = bool(total and pagadas == total)
-
-            importe_credito_row = conn.execute("SELECT importe_credito FROM prestamos WHERE id = ?", (prestamo_id,)).fetchone()
-            importe_credito = float(importe_credito_row["importe_credito"]) if importe_credito_row and "importe_credito" in importe_credito_row.keys() else 0.0
-
-            capital_pagado = 0.0
-            if _table_exists(conn, "abonos_capital"):
-                r = conn.execute("SELECT COALESCE(SUM(monto),0) AS s FROM abonos_capital WHERE id_prestamo = ?", (prestamo_id,)).fetchone()
-                capital_pagado = float(r["s"]) if r and "s" in r.keys() else 0.0
-            else:
-                if m.get("abono_capital") in _cols(conn, "cuotas"):
-                    r = conn.execute(
-                        f"SELECT COALESCE(SUM({m['abono_capital']}),0) AS s FROM cuotas WHERE {m['fk_prestamo']} = ?",
-                        (prestamo_id,)
-                    ).fetchone()
-                    capital_pagado = float(r["s"]) if r and "s" in r.keys() else 0.0
-
-            capital_cubierto = (importe_credito - capital_pagado) <= 1e-6
-
-            if todas_pagadas and capital_cubierto:
-                conn.execute("UPDATE prestamos SET estado = 'PAGADO' WHERE id = ?", (prestamo_id,))
-        except Exception:
-            pass
-        conn.commit()
-        row = conn.execute("SELECT * FROM cuotas WHERE id=?;", (cuota_id,)).fetchone()
-        return _row_to_cuota(row, m)
+    # Commit agrupado con otros pagos/abonos concurrentes (app.agrupador); vuelve tras el commit
+    return agrupador.ejecutar(lambda conn: _aplicar_pago(conn, _CUOTA_COLS, cuota_id, payload))
 
 @router.post(
     "/{cuota_id:int}/abono-capital",
@@ -430,137 +523,151 @@ def registrar_abono_capital(cuota_id: int, payload: AbonoCapitalInput):
       recalcula y PERSISTE el interés de TODAS las cuotas siguientes (N+1..fin),
       excluyendo cuotas ya PAGADAS.
     """
-    from datetime import date as _date
-    import os
+    _fecha_abono(payload)  # valida formato antes de abrir conexión
 
-    # Normalizar fecha: aceptar string ISO o date; default hoy
-    if isinstance(payload.fecha, str):
-        try:
-            f = _date.fromisoformat(payload.fecha).isoformat()
-        except Exception:
-            raise HTTPException(status_code=422, detail="fecha debe tener formato YYYY-MM-DD")
-    else:
-        f = (payload.fecha or _date.today()).isoformat()
+    out = agrupador.ejecutar(lambda conn: _aplicar_abono(conn, _CUOTA_COLS, cuota_id, payload),
+                             respuesta=lambda r: {k: v for k, v in r.items() if k != "_log"})
 
-    monto = float(payload.monto)
-    if monto <= 0:
-        raise HTTPException(status_code=422, detail="monto debe ser > 0")
+    # Bitácora CSV: se encola; la escribe app.bitacora en segundo plano
+    bitacora.registrar_abonos([out.pop("_log")])
+    return out
 
-    with get_conn() as conn:
-        # Tablas mínimas
-        if not (_table_exists(conn, "cuotas") and _table_exists(conn, "abonos_capital")):
-            raise HTTPException(status_code=404, detail="Falta tabla 'cuotas' o 'abonos_capital'")
-
-        m = _cuota_mapping(conn)
-        nom_col = m.get("nombre_cliente") or "''"
-
-        # Traer cuota objetivo con numero, interés plan y pagado
-        sel = (
-            f"SELECT id, {m['fk_prestamo']} AS id_prestamo, {m['numero']} AS numero, "
-            f"{nom_col} AS nombre_cliente, {m['estado']} AS estado, "
-            f"{m['interes_a_pagar']} AS interes_plan, "
-            f"{m['interes_pagado']} AS interes_pagado "
-            f"FROM cuotas WHERE id=?;"
-        )
-        row = conn.execute(sel, (cuota_id,)).fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Cuota no encontrada")
+# ---------- Lote de pagos/abonos (cobradores de campo) ----------
 
-        estado_actual = (row["estado"] or "PENDIENTE").upper()
-        interes_plan = float(row["interes_plan"] or 0.0)
-        interes_pagado = float(row["interes_pagado"] or 0.0)
+class OperacionLoteIn(BaseModel):
+  tipo: Literal["pago", "abono"]
+  cuota_id: int = Field(ge=1)
+  # pago
+  interes_pagado: Optional[float] = Field(default=None, ge=0)
+  fecha_pago: Optional[str] = Field(default=None, description="YYYY-MM-DD; default: hoy")
+  # abono
+  monto: Optional[float] = Field(default=None, gt=0)
+  fecha: Optional[str] = Field(default=None, description="YYYY-MM-DD; default: hoy")
 
-        # --- NUEVA REGLA: no permitir abonos si el interés ya está cubierto ---
-        tol = 0.005
-        if estado_actual == "PAGADO" or (interes_pagado + tol >= interes_plan and interes_plan > 0):
-            raise HTTPException(
-                status_code=409,
-                detail="No se puede abonar capital a una cuota con interés ya pagado (PAGADO)."
-            )
 
-        id_prestamo = row["id_prestamo"]
-        numero_actual = int(row["numero"] or 0)
-        nombre_cliente = row["nombre_cliente"]
-
-        # Datos del préstamo
-        imp_row = conn.execute("SELECT importe_credito, tasa_interes, plan_mode FROM prestamos WHERE id=?;", (id_prestamo,)).fetchone()
-        if not imp_row:
-            raise HTTPException(status_code=404, detail="Préstamo no encontrado para la cuota")
-        importe_credito = float(imp_row["importe_credito"] or 0)
-        tasa = float(imp_row["tasa_interes"] or 0)
-        plan_mode = (imp_row["plan_mode"] or "auto") if "plan_mode" in imp_row.keys() else "auto"
-
-        # Capital pagado previo (ANTES de este abono)
-        r = conn.execute("SELECT COALESCE(SUM(monto),0) AS s FROM abonos_capital WHERE id_prestamo = ?", (id_prestamo,)).fetchone()
-        capital_pagado_pre = float(r["s"] if r and "s" in r.keys() else 0.0)
-        capital_pendiente_pre = max(importe_credito - capital_pagado_pre, 0.0)
-        if monto > capital_pendiente_pre + 1e-6:
-            raise HTTPException(status_code=422, detail=f"Abono excede capital pendiente ({capital_pendiente_pre:.2f})")
-
-        # Insertar en abonos_capital
-        ab_cols = _cols(conn, "abonos_capital")
-        ab_fk    = _pick(["id_prestamo"],   ab_cols) or "id_prestamo"
-        ab_nom   = _pick(["nombre_cliente"],ab_cols) or "nombre_cliente"
-        ab_fecha = _pick(["fecha"],         ab_cols) or "fecha"
-        ab_monto = _pick(["monto"],         ab_cols) or "monto"
-        conn.execute(
-            f"INSERT INTO abonos_capital ({ab_fk},{ab_nom},{ab_fecha},{ab_monto}) VALUES (?,?,?,?);",
-            (id_prestamo, nombre_cliente, f, monto)
-        )
+class LoteIn(BaseModel):
+  operaciones: List[OperacionLoteIn] = Field(min_length=1, max_length=10000)
+  atomico: bool = Field(default=False, description="Si es true, cualquier error revierte todo el lote")
 
-        # Acumular en campo de la cuota si existe
-        if m.get("abono_capital"):
-            conn.execute(
-                f"UPDATE cuotas SET {m['abono_capital']} = COALESCE({m['abono_capital']}, 0) + ? WHERE id = ?;",
-                (monto, cuota_id)
-            )
 
-        # -------- PERSISTENCIA de INTERÉS para TODAS las siguientes (bajo flag) --------
+def _aplicar_operaciones(conn, operaciones: List[Any], atomico: bool):
+    """
+    Aplica (índice, operación) en la transacción abierta de 'conn', cada una en su SAVEPOINT, y evalúa el
+    cierre de los préstamos afectados. Devuelve (resultados, préstamos afectados, filas de bitácora).
+    """
+    m = _CUOTA_COLS
+    resultados: List[Dict[str, Any]] = []
+    prestamos_afectados: Dict[Any, None] = {}
+    log_filas: List[List[Any]] = []
+
+    for idx, op in operaciones:
+        conn.execute("SAVEPOINT op")
         try:
-            persist_on = (os.getenv("AUTO_INTERES_ABONOS_PERSIST", "") or "").strip().lower() in {"1","true","on","yes","y"}
-            if persist_on and plan_mode == "auto":
-                # Recalcular base tras incluir ESTE abono
-                r2 = conn.execute("SELECT COALESCE(SUM(monto),0) AS s FROM abonos_capital WHERE id_prestamo = ?", (id_prestamo,)).fetchone()
-                capital_pagado_total = float(r2["s"] if r2 and "s" in r2.keys() else 0.0)
-                cap_pend = max(importe_credito - capital_pagado_total, 0.0)
-                interes_por_cuota_nuevo = round(cap_pend * tasa / 100.0, 2)
-
-                num_col = m["numero"]
-                int_col = m["interes_a_pagar"]
-                estado_col = m["estado"]
-                fk_col = m["fk_prestamo"]
-
-                conn.execute(
-                    f"""
-                    UPDATE cuotas
-                    SET {int_col} = ?
-                    WHERE {fk_col} = ?
-                      AND {num_col} > ?
-                      AND UPPER({estado_col}) <> 'PAGADO';
-                    """,
-                    (interes_por_cuota_nuevo, id_prestamo, numero_actual)
+            if op.tipo == "pago":
+                if op.interes_pagado is None:
+                    raise HTTPException(status_code=422, detail="interes_pagado es obligatorio para 'pago'")
+                res = _aplicar_pago(
+                    conn, m, op.cuota_id,
+                    PagoInput(interes_pagado=op.interes_pagado, fecha_pago=op.fecha_pago),
+                    cerrar=False,
                 )
-        except Exception:
-            # Si el recalculo persistente falla, el abono NO se bloquea
-            pass
-        # -------------------------------------------------------------------------------
-
-        conn.commit()
+                prestamos_afectados[res.get("id_prestamo")] = None
+            else:
+                if op.monto is None:
+                    raise HTTPException(status_code=422, detail="monto es obligatorio para 'abono'")
+                res = _aplicar_abono(
+                    conn, m, op.cuota_id,
+                    AbonoCapitalInput(monto=op.monto, fecha=op.fecha),
+                )
+                log_filas.append(res.pop("_log"))
+                prestamos_afectados[res.get("id_prestamo")] = None
+            conn.execute("RELEASE SAVEPOINT op")
+            resultados.append({"indice": idx, "tipo": op.tipo, "cuota_id": op.cuota_id, "ok": True, "resultado": res})
+        except HTTPException as e:
+            conn.execute("ROLLBACK TO SAVEPOINT op")
+            conn.execute("RELEASE SAVEPOINT op")
+            if atomico:
+                raise HTTPException(status_code=e.status_code, detail=f"Operación {idx} (cuota {op.cuota_id}): {e.detail}")
+            resultados.append({"indice": idx, "tipo": op.tipo, "cuota_id": op.cuota_id, "ok": False,
+                               "status_code": e.status_code, "error": e.detail})
+
+    # Cierre de préstamos: una vez por préstamo afectado
+    for prestamo_id in prestamos_afectados:
+        if prestamo_id is not None:
+            _cerrar_prestamo_si_corresponde(conn, m, prestamo_id)
+
+    return resultados, [p for p in prestamos_afectados if p is not None], log_filas
+
+
+def _resumen_lote(total: int, resultados: List[Dict[str, Any]], prestamos_afectados: List[Any]) -> Dict[str, Any]:
+    aplicadas = sum(1 for r in resultados if r["ok"])
+    return {
+        "total": total,
+        "aplicadas": aplicadas,
+        "fallidas": total - aplicadas,
+        "prestamos_afectados": prestamos_afectados,
+        "resultados": resultados,
+    }
 
-        # Log CSV (best-effort)
-        try:
-            csv_path = _db_dir(conn) / "abonos_capital_log.csv"
-            write_header = not csv_path.exists()
-            with open(csv_path, "a", newline="", encoding="utf-8") as fh:
-                import csv as _csv
-                w = _csv.writer(fh)
-                if write_header:
-                    w.writerow(["fecha", "id_prestamo", "nombre_cliente", "monto", "cuota_id"])
-                w.writerow([f, id_prestamo, nombre_cliente or "", monto, cuota_id])
-        except Exception:
-            pass
 
-        return {"status": "ok", "id_prestamo": id_prestamo, "fecha": f, "monto": monto}
+@router.post(
+    "/lote",
+    summary="Registrar lote de pagos y abonos",
+    description=(
+        "Aplica en orden una lista de pagos y abonos a capital en **una sola transacción** y con **un solo commit**. "
+        "Cada operación corre en su propio SAVEPOINT: si falla se revierte solo esa operación y se informa su error "
+        "(salvo `atomico=true`, que revierte el lote completo). "
+        "El cierre de préstamos se evalúa una vez por préstamo afectado, al final. "
+        "Las filas de la bitácora de abonos se encolan tras el commit. "
+        "Con shards, el lote se parte por shard (una transacción y un commit en cada uno); "
+        "un lote `atomico=true` con cuotas de más de un shard se rechaza con 422."
+    ),
+)
+def registrar_lote(payload: LoteIn):
+    # Con shards (DB_SHARDS) cada cuota vive en el archivo que numeró su id: el lote se parte por shard,
+    # en el orden en que llegaron las operaciones, como los lotes de app.agrupador
+    dueno = {i: shard for shard, ids in agrupar_ids(op.cuota_id for op in payload.operaciones).items() for i in ids}
+    grupos: Dict[Optional[str], List[Any]] = {}
+    for idx, op in enumerate(payload.operaciones):
+        grupos.setdefault(dueno[op.cuota_id], []).append((idx, op))
+
+    if len(grupos) > 1 and payload.atomico:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Un lote atómico no puede abarcar varios shards ({', '.join(map(str, grupos))}); "
+                   "envíe un lote por shard",
+        )
+    propio = shard_actual()
+    if list(grupos) != [propio]:
+        # La reserva de Idempotency-Key vive en el shard de la petición: su commit va primero (aunque no
+        # tenga operaciones) y la deja aplicada, así un fallo en otro shard no libera la clave
+        grupos = {propio: grupos.pop(propio, []), **grupos}
+
+    resultados: List[Dict[str, Any]] = []
+    prestamos_afectados: List[Any] = []
+    out: Dict[str, Any] = {}
+    for shard, operaciones in grupos.items():
+        with en_shard(shard), get_conn() as conn:
+            begin_immediate(conn)
+            try:
+                res, prestamos, log_filas = _aplicar_operaciones(conn, operaciones, payload.atomico)
+                resultados.extend(res)
+                prestamos_afectados.extend(prestamos)
+                if len(grupos) == 1:
+                    out = _resumen_lote(len(payload.operaciones), resultados, prestamos_afectados)
+                    idempotencia.registrar(conn, out)  # con Idempotency-Key: respuesta en la misma transacción
+                else:
+                    idempotencia.registrar(conn)  # solo escribe en el shard de la reserva
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        bitacora.registrar_abonos(log_filas)
+
+    if len(grupos) > 1:
+        out = _resumen_lote(len(payload.operaciones), sorted(resultados, key=lambda r: r["indice"]),
+                            prestamos_afectados)
+    return out
 
 # ======================== RECORDATORIOS POR EMAIL =========================
 # Endpoints NUEVOS y no invasivos:
@@ -568,10 +675,6 @@ def registrar_abono_capital(cuota_id: int, payload: AbonoCapitalInput):
 #   - POST /cuotas/recordatorios/enviar?dias=1     (envío real)
 # Usa SMTP_* por variables de entorno (ya probaste el SMTP).
 
-import os, smtplib
-from email.message import EmailMessage
-from datetime import timedelta
-
 def _fmt_money(x) -> str:
     try:
         return f"${float(x):,.0f}"
@@ -588,6 +691,9 @@ def _smtp_cfg():
     }
 
 def _send_email(to_addr: str, subject: str, body: str) -> (bool, str):
+    import smtplib  # carga diferida: solo cuando hay algo que enviar
+    from email.message import EmailMessage
+
     cfg = _smtp_cfg()
     if not (cfg["host"] and cfg["from"] and to_addr):
         return False, "SMTP config incompleta o destinatario vacío"
@@ -596,6 +702,7 @@ def _send_email(to_addr: str, subject: str, body: str) -> (bool, str):
     msg["To"] = to_addr
     msg["Subject"] = subject
     msg.set_content(body)
+    t0 = time.perf_counter()
     try:
         with smtplib.SMTP(cfg["host"], cfg["port"], timeout=20) as s:
             try:
@@ -605,8 +712,10 @@ def _send_email(to_addr: str, subject: str, body: str) -> (bool, str):
             if cfg["user"]:
                 s.login(cfg["user"], cfg["pass"])
             s.send_message(msg)
+        metrics.observar_envio("recordatorio", time.perf_counter() - t0, True)
         return True, "enviado"
     except Exception as e:
+        metrics.observar_envio("recordatorio", time.perf_counter() - t0, False)
         return False, str(e)
 
 def _build_recordatorios(conn, dias: int) -> List[Dict[str, Any]]:
@@ -614,19 +723,17 @@ def _build_recordatorios(conn, dias: int) -> List[Dict[str, Any]]:
     Arma recordatorios para cuotas PENDIENTES cuyo vencimiento = hoy + dias.
     Incluye: email, asunto, cuerpo, y datos de apoyo.
     """
-    m = _cuota_mapping(conn)
+    m = _CUOTA_COLS
     target = (date.today() + timedelta(days=int(dias))).isoformat()
 
-    # ¿existe abonos_capital para calcular capital pendiente?
-    abonos_existe = _table_exists(conn, "abonos_capital")
-
-    sql = f"""
+    sql = sentencias.sql("cuotas.recordatorios", None, lambda: f"""
     SELECT
         c.*,
         p.id               AS p_id,
         p.importe_credito  AS p_importe,
         p.modalidad        AS p_modalidad,
         p.cod_cli          AS p_cod_cli,
+        p.capital_pendiente AS p_capital_pendiente,
         cl.id              AS cli_id,
         cl.nombre          AS cli_nombre,
         cl.email           AS cli_email
@@ -636,26 +743,21 @@ def _build_recordatorios(conn, dias: int) -> List[Dict[str, Any]]:
     WHERE UPPER(c.{m['estado']}) = 'PENDIENTE'
       AND date(c.{m['venc']}) = date(?)
     ORDER BY p.id, c.{m['numero']}
-    """
+    """)
 
     rows = conn.execute(sql, (target,)).fetchall()
     out: List[Dict[str, Any]] = []
 
     for r in rows:
         # Valor de la cuota (usamos el campo de interés/importe registrado en cuotas)
-        valor = r[m["interes_a_pagar"]] if m["interes_a_pagar"] in r.keys() else None
+        valor = r[m["interes_a_pagar"]]
 
-        # Capital pendiente del préstamo
+        # Capital pendiente del préstamo (saldo corriente, ya viene en la fila)
         p_id = r["p_id"]
-        importe = float(r["p_importe"] or 0)
-        capital_pagado = 0.0
-        if abonos_existe:
-            rr = conn.execute("SELECT COALESCE(SUM(monto),0) AS s FROM abonos_capital WHERE id_prestamo = ?", (p_id,)).fetchone()
-            capital_pagado = float(rr["s"] if rr and "s" in rr.keys() else 0.0)
-        cap_pend = max(importe - capital_pagado, 0)
-
-        numero = r[m["numero"]] if m["numero"] in r.keys() else None
-        fv = r[m["venc"]] if m["venc"] in r.keys() else target
+        cap_pend = max(float(r["p_capital_pendiente"] or 0), 0)
+
+        numero = r[m["numero"]]
+        fv = r[m["venc"]]
         modalidad = r["p_modalidad"]
 
         nombre = r["cli_nombre"] or "(sin nombre)"
@@ -691,20 +793,51 @@ def _build_recordatorios(conn, dias: int) -> List[Dict[str, Any]]:
 
     return out
 
+def _recordatorios_de_todos(dias: int, reportes: bool) -> List[Dict[str, Any]]:
+    """_build_recordatorios en cada shard (DB_SHARDS) en paralelo, intercalados por préstamo."""
+    def _shard(_: Optional[str]) -> List[Dict[str, Any]]:
+        with (replica.conexion_reportes() if reportes else get_conn()) as conn:
+            return _build_recordatorios(conn, dias)
+
+    return juntar(dispersar(_shard), lambda x: x["prestamo_id"])
+
+
+TAREA_RECORDATORIOS = "recordatorios"
+
+
+def _registrar_corrida_recordatorios(enviados: int) -> None:
+    """Última corrida correcta en 'mantenimiento' (la lee /health/ready). Best-effort."""
+    ahora = datetime.now()
+    try:
+        with get_conn() as conn, escritura(conn):
+            conn.execute(
+                """
+                INSERT INTO mantenimiento (tarea, ultima_fecha, ultima_ejecucion, filas) VALUES (?, ?, ?, ?)
+                ON CONFLICT(tarea) DO UPDATE SET
+                    ultima_fecha = excluded.ultima_fecha,
+                    ultima_ejecucion = excluded.ultima_ejecucion,
+                    filas = excluded.filas;
+                """,
+                (TAREA_RECORDATORIOS, ahora.date().isoformat(), ahora.isoformat(timespec="seconds"), enviados),
+            )
+        metrics.RECORDATORIOS_ULTIMO.set(valor=ahora.timestamp())
+    except Exception:
+        pass
+
+
 @router.get("/recordatorios/preview")
 def preview_recordatorios(dias: int = Query(1, ge=0, le=30), incluir_sin_email: bool = Query(False)):
     """
     Vista previa (no envía). Útil para revisar antes de notificar.
     - dias: 1 => mañana; 0 => hoy; N => en N días.
     - incluir_sin_email: si True, incluye clientes sin email para depurar.
+    Se lee de la réplica de reportes si está al día (ver cabeceras X-Data-Source / X-Replica-Age).
     """
-    with get_conn() as conn:
-        if not (_table_exists(conn, "cuotas") and _table_exists(conn, "prestamos") and _table_exists(conn, "clientes")):
-            return []
-        items = _build_recordatorios(conn, dias)
-        if not incluir_sin_email:
-            items = [x for x in items if x["email_to"]]
-        return items
+    items = _recordatorios_de_todos(dias, reportes=True)
+    metrics.RECORDATORIOS_LOTE.observe(len(items), "preview")
+    if not incluir_sin_email:
+        items = [x for x in items if x["email_to"]]
+    return items
 
 @router.post("/recordatorios/enviar")
 def enviar_recordatorios(dias: int = Query(1, ge=0, le=30), dry_run: bool = Query(False)):
@@ -713,13 +846,11 @@ def enviar_recordatorios(dias: int = Query(1, ge=0, le=30), dry_run: bool = Quer
     - dry_run=True: no envía, solo retorna lo que enviaría.
     Respuesta: conteos, errores y items procesados.
     """
-    with get_conn() as conn:
-        if not (_table_exists(conn, "cuotas") and _table_exists(conn, "prestamos") and _table_exists(conn, "clientes")):
-            raise HTTPException(status_code=404, detail="Faltan tablas requeridas")
-        items = _build_recordatorios(conn, dias)
+    items = _recordatorios_de_todos(dias, reportes=False)
 
     # Filtra solo los que tienen email
     to_send = [x for x in items if x["email_to"]]
+    metrics.RECORDATORIOS_LOTE.observe(len(to_send), "dry_run" if dry_run else "envio")
     sent, errors = 0, []
 
     if not dry_run:
@@ -729,6 +860,8 @@ def enviar_recordatorios(dias: int = Query(1, ge=0, le=30), dry_run: bool = Quer
                 sent += 1
             else:
                 errors.append({"cuota_id": it["cuota_id"], "email_to": it["email_to"], "error": msg})
+        if sent or not errors:
+            _registrar_corrida_recordatorios(sent)
 
     return {
         "total_detectados": len(items),
@@ -750,32 +883,20 @@ def enviar_recordatorios(dias: int = Query(1, ge=0, le=30), dry_run: bool = Quer
 # - En otros casos, "PENDIENTE".
 # No se eliminan ni alteran endpoints existentes; esto permite a la app consumir un estado canónico.
 
-from fastapi import Path
-
 def _estado_prestamo_canonico(conn, prestamo_id: int) -> Dict[str, Any]:
     """
     Calcula el estado de un préstamo con las reglas anteriores sin tocar lógica existente.
     Devuelve además métricas útiles para depurar diferencias entre pantallas.
     """
-    if not (_table_exists(conn, "prestamos") and _table_exists(conn, "cuotas")):
-        raise HTTPException(status_code=500, detail="Tablas requeridas no existen")
-
-    m = _cuota_mapping(conn)
+    m = _CUOTA_COLS
     fk = m["fk_prestamo"]
     venc = m["venc"]
 
-    # ¿existe tabla de abonos?
-    abonos_existe = _table_exists(conn, "abonos_capital")
-    ab_sum_expr = (
-        "COALESCE((SELECT SUM(a.monto) FROM abonos_capital a WHERE a.id_prestamo=p.id), 0)"
-        if abonos_existe else "0"
-    )
-
-    # Traer datos base del préstamo
-    row_p = conn.execute("SELECT id, importe_credito FROM prestamos WHERE id=?;", (prestamo_id,)).fetchone()
-    if not row_p:
+    # Traer datos base del préstamo (con saldo corriente)
+    sp = saldos.saldo(conn, prestamo_id)
+    if sp is None:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
-    importe_credito = float(row_p["importe_credito"] or 0)
+    importe_credito, _, capital_pendiente = sp
 
     # Conteos de cuotas
     total = conn.execute(f"SELECT COUNT(*) AS c FROM cuotas WHERE {fk}=?;", (prestamo_id,)).fetchone()["c"]
@@ -787,17 +908,18 @@ def _estado_prestamo_canonico(conn, prestamo_id: int) -> Dict[str, Any]:
         (prestamo_id, hoy)
     ).fetchone()["c"]
 
-    # Capital pendiente por abonos de capital
-    cap_row = conn.execute(
-        f"SELECT (p.importe_credito - {ab_sum_expr}) AS capital_pendiente FROM prestamos p WHERE p.id=?;",
-        (prestamo_id,)
-    ).fetchone()
-    capital_pendiente = float(cap_row["capital_pendiente"] or 0)
-
     # Última fecha de vencimiento
     vence_row = conn.execute(f"SELECT MAX(date({venc})) AS vence_ultima_cuota FROM cuotas WHERE {fk}=?;", (prestamo_id,)).fetchone()
     vence_ultima_cuota = vence_row["vence_ultima_cuota"]
 
+    return _estado_canonico(prestamo_id, sp, total, pagadas, vencidas_pendientes, vence_ultima_cuota, hoy)
+
+
+def _estado_canonico(prestamo_id: int, sp, total: int, pagadas: int, vencidas_pendientes: int,
+                     vence_ultima_cuota: Optional[str], hoy: str) -> Dict[str, Any]:
+    """Regla del estado canónico sobre conteos ya calculados (sp = saldos.saldo / saldos.de_fila)."""
+    importe_credito, _, capital_pendiente = sp
+
     # Lógica de estado canónico
     if total == 0:
         estado = "PENDIENTE"
@@ -830,6 +952,7 @@ def obtener_estado_prestamo(prestamo_id: int = Path(..., ge=1)):
     No modifica datos; solo consulta, para que el frontend lo consuma y evite divergencias entre pantallas.
     """
     with get_conn() as conn:
+        archivo.usar_si_archivado(conn, "prestamos", prestamo_id)
         return _estado_prestamo_canonico(conn, prestamo_id)
 
 
@@ -847,12 +970,22 @@ def listar_estado_resumen_prestamos(ids: Optional[str] = Query(default=None)):
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de 'ids' inválido")
 
-    out: List[Dict[str, Any]] = []
-    with get_conn() as conn:
-        for pid in id_list:
-            try:
-                out.append(_estado_prestamo_canonico(conn, pid))
-            except HTTPException as e:
-                # Si algún id no existe, devolvemos un objeto con error contextual pero seguimos con los demás
-                out.append({"id": pid, "error": e.detail})
-    return out
+    grupos = agrupar_ids(id_list)
+
+    def _shard(shard: Optional[str]) -> Dict[int, Dict[str, Any]]:
+        with replica.conexion_reportes() as conn:
+            def _uno(pid: int) -> Dict[str, Any]:
+                try:
+                    return _estado_prestamo_canonico(conn, pid)
+                except HTTPException as e:
+                    # Si algún id no existe, devolvemos un objeto con error contextual pero seguimos con los demás
+                    return {"id": pid, "error": e.detail}
+
+            # Los préstamos archivados se calculan contra el archivo (app.archivo)
+            return archivo.por_base(conn, "prestamos", grupos[shard], _uno)
+
+    # Con shards, cada grupo de ids en el archivo que lo numeró, en paralelo
+    por_id: Dict[int, Dict[str, Any]] = {}
+    for parte in dispersar(_shard, list(grupos)):
+        por_id.update(parte)
+    return [por_id[pid] for pid in id_list]
@@ -1,7 +1,6 @@
 # backend/app/routers/debug_mail.py
 from fastapi import APIRouter, HTTPException
 import os
-from app.notifications import send_loan_created_email
 from app.deps import get_conn
 
 router = APIRouter(prefix="/debug/mail", tags=["debug"])
@@ -43,5 +42,6 @@ def send(prestamo_id: int | None = None, cod_cli: str | None = None):
     if prestamo_id is None:
         raise HTTPException(status_code=400, detail="Provee prestamo_id o cod_cli")
 
+    from app.notifications import send_loan_created_email  # carga diferida (smtplib, email.*)
     send_loan_created_email(int(prestamo_id))
     return {"status": "sent", "prestamo_id": prestamo_id}
@@ -0,0 +1,22 @@
+# backend/app/routers/debug_sql.py
+# Consulta de las últimas trazas SQL por petición (ver app/sqltrace.py, SQL_TRACE).
+from fastapi import APIRouter, HTTPException
+
+from app import sqltrace
+
+router = APIRouter()
+
+
+@router.get("/sql")
+def trazas_recientes():
+    """Resumen de las últimas peticiones trazadas (más reciente primero)."""
+    return {"modo": sqltrace.MODO, "umbral_n_mas_1": sqltrace.N1_UMBRAL, "trazas": sqltrace.recientes()}
+
+
+@router.get("/sql/{traza_id}")
+def detalle_traza(traza_id: int):
+    """Sentencias agrupadas por SQL normalizado, con tiempos, pasos de VM y marcas N+1."""
+    res = sqltrace.obtener(traza_id)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Traza no encontrada (o ya expulsada del buffer)")
+    return res
@@ -1,5 +1,7 @@
 ﻿# backend/app/routers/health.py
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app import salud
 from app.deps import get_conn
 
 router = APIRouter()
@@ -9,3 +11,12 @@ def ping():
     with get_conn() as conn:
         conn.execute("SELECT 1")
     return {"status": "ok"}
+
+@router.get("/ready")
+def ready():
+    """
+    Preparación para recibir tráfico: latencia de lectura/escritura, pool, colas, recordatorios,
+    WAL y disco (app.salud). 200 ok, 429 degradado (READY_CODIGO_DEGRADADO), 503 no listo.
+    """
+    res = salud.preparacion()
+    return JSONResponse(res, status_code=salud.CODIGOS[res["estado"]])
@@ -0,0 +1,143 @@
+# backend/app/routers/mantenimiento.py
+# Tareas de mantenimiento disparables por endpoint (además del programador en proceso).
+# Con shards (DB_SHARDS) cada tarea corre sobre el shard de X-Sucursal (default: el primero).
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app import admision, archivo, diagnostico, idempotencia, migraciones, mora, replica, respaldo, saldos, sentencias, shards
+from app.deps import escritura, get_conn
+
+router = APIRouter()
+
+
+@router.get("/migraciones")
+def estado_migraciones():
+    """Versión de esquema de la base, migraciones aplicadas (con su duración) y pendientes."""
+    with get_conn() as conn:
+        return migraciones.estado(conn)
+
+
+@router.get("/sentencias")
+def estado_sentencias():
+    """Consultas del registro de sentencias, aciertos de la caché de sqlite3 y uso del pool de conexiones."""
+    return sentencias.estado()
+
+
+@router.get("/admision")
+def estado_admision():
+    """Cupos del control de admisión: límite, en uso y en cola (lecturas, escrituras y por grupo)."""
+    return admision.estado()
+
+
+@router.get("/shards")
+def estado_shards():
+    """Modo shards: archivo, tamaño, rango de ids y clientes (según el directorio) de cada shard."""
+    return shards.estado()
+
+
+@router.get("/diagnostico")
+def diagnostico_base():
+    """
+    Tamaños y fragmentación por tabla/índice (dbstat), freelist y WAL, uso de índices en las consultas
+    registradas (EXPLAIN QUERY PLAN) y sugerencias de VACUUM/ANALYZE. Incluye la foto del esquema.
+    """
+    return diagnostico.diagnostico()
+
+
+@router.get("/mora")
+def estado_mora():
+    """Última ejecución del refresco de mora (fecha de corte y filas actualizadas)."""
+    with get_conn() as conn:
+        return mora.estado_tarea(conn)
+
+
+@router.post("/mora")
+def refrescar_mora(fecha_corte: Optional[str] = Query(default=None, description="YYYY-MM-DD; default: hoy")):
+    """
+    Refresca 'dias_mora' y 'tramo_mora' de todas las cuotas PENDIENTES en un solo UPDATE.
+    Útil para cron externo; el programador interno (MORA_REFRESH_AUTO, on por defecto) hace lo mismo.
+    """
+    try:
+        corte = date.fromisoformat(fecha_corte) if fecha_corte else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="fecha_corte debe tener formato YYYY-MM-DD")
+    with get_conn() as conn, escritura(conn):
+        return mora.refrescar_mora(conn, corte)
+
+
+@router.get("/saldos/conciliacion")
+def conciliar_saldos():
+    """Verifica 'prestamos.capital_abonado' / 'capital_pendiente' contra la suma de 'abonos_capital'."""
+    with get_conn() as conn:
+        return saldos.conciliar(conn)
+
+
+@router.post("/saldos/conciliacion")
+def corregir_saldos():
+    """Igual que el GET, pero reescribe los préstamos descuadrados con el valor del libro."""
+    with get_conn() as conn:
+        return saldos.conciliar(conn, corregir=True)
+
+
+@router.post("/idempotencia/purgar")
+def purgar_idempotencia():
+    """Elimina las claves Idempotency-Key vencidas (también se purgan solas periódicamente)."""
+    with get_conn() as conn:
+        return {"purgadas": idempotencia.purgar(conn)}
+
+
+@router.get("/replica")
+def estado_replica():
+    """Estado de la réplica de reportes (DB_REPLICA_PATH): edad, atraso máximo y último error."""
+    return replica.estado()
+
+
+@router.post("/replica")
+def refrescar_replica():
+    """Refresca la réplica ahora (backup en línea por pasos), sin esperar al programador."""
+    if not replica.activa():
+        raise HTTPException(status_code=404, detail="Réplica no configurada (DB_REPLICA_PATH)")
+    try:
+        return replica.refrescar(forzar=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fallo refrescando réplica: {type(e).__name__}: {e}")
+
+
+@router.get("/respaldos")
+def listar_respaldos():
+    """Snapshots disponibles (más reciente primero). Restaurar: python -m app.respaldo restaurar <nombre>."""
+    return {"directorio": respaldo.directorio(), "snapshots": respaldo.listar()}
+
+
+@router.post("/respaldos")
+def crear_respaldo(forzar: bool = Query(default=False, description="Guardar aunque el contenido no haya cambiado")):
+    """
+    Snapshot en caliente: backup en línea por pasos, comprimido y con hash de contenido.
+    Devuelve MB/s y el tiempo total / máximo por paso con lock sobre la base.
+    """
+    try:
+        return respaldo.crear(forzar=forzar)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fallo creando respaldo: {type(e).__name__}: {e}")
+
+
+@router.get("/archivo")
+def estado_archivo():
+    """Conteos de préstamos/cuotas/abonos en la base caliente y en el archivo histórico."""
+    return archivo.estado()
+
+
+@router.post("/archivo")
+def archivar_prestamos(
+    dias: Optional[int] = Query(default=None, ge=0, description="Días sin movimiento (default: ARCHIVO_DIAS)"),
+    limite: Optional[int] = Query(default=None, ge=1, description="Máximo de préstamos en esta corrida"),
+):
+    """Mueve al archivo los préstamos PAGADOS sin movimiento reciente (lotes cortos de escritura)."""
+    try:
+        return archivo.archivar(dias=dias, limite=limite)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
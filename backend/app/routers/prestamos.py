@@ -6,41 +6,32 @@ import sqlite3
 from datetime import date, datetime, timedelta
 from typing import Any, Dict, List, Literal, Optional
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request
 from pydantic import AliasChoices, BaseModel, Field, ValidationInfo, field_validator
 
-from app.deps import get_conn
+from app.deps import agrupar_ids, dispersar, en_shard, escritura, get_conn
+from app import archivo, detalle, documentos, metrics, mora, replica, saldos, serializacion, shards
 
-# Envío de correo (si no existe el módulo, se hace no-op para no romper)
-try:
-    from app.notifications import send_loan_created_email
-except Exception:  # pragma: no cover
-    def send_loan_created_email(*args, **kwargs):  # type: ignore
-        return None
 
-router = APIRouter()
+def send_loan_created_email(*args, **kwargs):
+    """Envío de correo: app.notifications se importa en el primer envío (si no existe, no-op)."""
+    try:
+        try:
+            from app.notifications import send_loan_created_email as _enviar
+        except Exception:  # pragma: no cover
+            return None
+        return _enviar(*args, **kwargs)
+    finally:
+        metrics.EMAIL_PENDIENTES.dec("prestamo_creado")  # tras el envío: uno lento sigue contando en la cola
 
-# -------------------------------------------------------------
-# Utilidades de esquema
-# -------------------------------------------------------------
-def _table_exists(conn, name: str) -> bool:
-    row = conn.execute(
-        "SELECT COUNT(*) AS c FROM sqlite_master WHERE type='table' AND name=?;",
-        (name,),
-    ).fetchone()
-    return bool(row and int(row["c"] or 0))
 
-def _cols(conn, table: str) -> List[str]:
-    try:
-        return [r["name"] for r in conn.execute(f"PRAGMA table_info({table});").fetchall()]
-    except Exception:
-        return []
+def _encolar_correo(bg: BackgroundTasks, prestamo_id: int) -> None:
+    """Encola el correo de préstamo creado; /health/ready mide la cola con email_queue_pending."""
+    bg.add_task(send_loan_created_email, prestamo_id)  # se envía solo con id
+    metrics.EMAIL_PENDIENTES.inc("prestamo_creado")
 
-def _pick(options: List[str], cols: List[str]) -> Optional[str]:
-    for o in options:
-        if o in cols:
-            return o
-    return None
+
+router = APIRouter()
 
 # -------------------------------------------------------------
 # Guardrail de correo (helper)
@@ -51,9 +42,6 @@ def _mail_can_send_on_create(conn, prestamo_id: int):
     Devuelve (ok: bool, motivo: str, email: Optional[str]).
     """
     try:
-        if not (_table_exists(conn, "prestamos") and _table_exists(conn, "clientes")):
-            return (False, "Falta tabla 'prestamos' o 'clientes'", None)
-
         p = conn.execute(
             "SELECT id, cod_cli FROM prestamos WHERE id=?;",
             (prestamo_id,),
@@ -65,20 +53,8 @@ def _mail_can_send_on_create(conn, prestamo_id: int):
         if not cod_cli:
             return (False, f"Prestamo {prestamo_id} sin cod_cli", None)
 
-        cols_cli = _cols(conn, "clientes")
-        email_col = _pick(["email", "correo", "mail", "e_mail"], cols_cli)
-        if not email_col:
-            return (False, "No existe columna de email en 'clientes'", None)
-
-        id_cli_col = _pick(
-            ["cod_cli", "codigo", "cod_cliente", "codcliente", "id", "id_cliente", "cliente_id"],
-            cols_cli,
-        )
-        if not id_cli_col:
-            return (False, "No existe columna identificadora del cliente en 'clientes'", None)
-
         row_cli = conn.execute(
-            f"SELECT {email_col} AS email FROM clientes WHERE {id_cli_col}=?;",
+            "SELECT email FROM clientes WHERE codigo=?;",
             (cod_cli,),
         ).fetchone()
         email = (row_cli["email"] or "").strip() if row_cli and "email" in row_cli.keys() else ""
@@ -193,38 +169,6 @@ def _calc_due_guarded(fecha_inicio: date, modalidad: str, n: int) -> date:
         due = _calc_due(fecha_inicio, modalidad, n + 1)
     return due
 
-def _ensure_plan_columns(conn):
-    # prestamos.plan_mode
-    if _table_exists(conn, "prestamos"):
-        cols = _cols(conn, "prestamos")
-        if "plan_mode" not in cols:
-            try:
-                conn.execute("ALTER TABLE prestamos ADD COLUMN plan_mode TEXT DEFAULT 'auto';")
-                conn.commit()
-            except Exception:
-                pass
-
-    # cuotas columnas plan
-    if _table_exists(conn, "cuotas"):
-        cols_q = _cols(conn, "cuotas")
-        changed = False
-        for colname, coltype in [
-            ("capital_plan", "REAL NOT NULL DEFAULT 0"),
-            ("interes_plan", "REAL NOT NULL DEFAULT 0"),
-            ("total_plan", "REAL NOT NULL DEFAULT 0"),
-        ]:
-            if colname not in cols_q:
-                try:
-                    conn.execute(f"ALTER TABLE cuotas ADD COLUMN {colname} {coltype};")
-                    changed = True
-                except Exception:
-                    pass
-        if changed:
-            try:
-                conn.commit()
-            except Exception:
-                pass
-
 def _prestamo_to_front(conn, p_row) -> Dict[str, Any]:
     out = {
         "id": p_row["id"],
@@ -233,8 +177,7 @@ def _prestamo_to_front(conn, p_row) -> Dict[str, Any]:
         "importe_credito": p_row["importe_credito"],
         "modalidad": p_row["modalidad"],
         "tasa_interes": p_row["tasa_interes"],
-        "estado": p_row["estado"] if "estado" in p_row.keys()
-        else (p_row["estado_capital"] if "estado_capital" in p_row.keys() else "PENDIENTE"),
+        "estado": p_row["estado"],
     }
     c = conn.execute(
         "SELECT id, codigo, nombre FROM clientes WHERE codigo=?;",
@@ -245,16 +188,15 @@ def _prestamo_to_front(conn, p_row) -> Dict[str, Any]:
     return out
 
 def _estado_prestamo_dinamico(conn, prestamo_id: int) -> str:
-    if not _table_exists(conn, "cuotas"):
-        return "PENDIENTE"
-    cols = set(_cols(conn, "cuotas"))
-    fk = _pick(["id_prestamo", "prestamo_id"], list(cols)) or "id_prestamo"
-    fecha_col = _pick(["fecha_vencimiento", "fecha"], list(cols))
-    has_ipg = "interes_pagado" in cols
-    has_abcap = "abono_capital" in cols
-    has_estado = "estado" in cols
-
-    cuotas = conn.execute(f"SELECT * FROM cuotas WHERE {fk}=?;", (prestamo_id,)).fetchall()
+    cuotas = conn.execute(
+        "SELECT estado, interes_pagado, abono_capital, fecha_vencimiento FROM cuotas WHERE id_prestamo=?;",
+        (prestamo_id,),
+    ).fetchall()
+    return _estado_dinamico(cuotas)
+
+
+def _estado_dinamico(cuotas) -> str:
+    """Regla de _estado_prestamo_dinamico sobre filas de cuotas ya leídas (Row o dict)."""
     if not cuotas:
         return "PENDIENTE"
 
@@ -264,15 +206,15 @@ def _estado_prestamo_dinamico(conn, prestamo_id: int) -> str:
     vencida_pendiente = False
 
     for r in cuotas:
-        estado_c = (r["estado"] if has_estado else "PENDIENTE") or "PENDIENTE"
-        ipg = float(r["interes_pagado"]) if has_ipg and r["interes_pagado"] is not None else 0.0
-        abcap = float(r["abono_capital"]) if has_abcap and r["abono_capital"] is not None else 0.0
+        estado_c = r["estado"] or "PENDIENTE"
+        ipg = float(r["interes_pagado"]) if r["interes_pagado"] is not None else 0.0
+        abcap = float(r["abono_capital"]) if r["abono_capital"] is not None else 0.0
         if estado_c == "PAGADO" or ipg > 0 or abcap > 0:
             pagadas += 1
         else:
-            if fecha_col and r[fecha_col]:
+            if r["fecha_vencimiento"]:
                 try:
-                    f = date.fromisoformat(str(r[fecha_col]))
+                    f = date.fromisoformat(str(r["fecha_vencimiento"]))
                     if f < hoy:
                         vencida_pendiente = True
                 except Exception:
@@ -322,58 +264,17 @@ def _validar_plan_manual_o_400(monto: float, tasa: float, plan: List[Dict[str, A
     if abs(saldo) > tol:
         raise HTTPException(status_code=400, detail=f"Saldo de capital final distinto de 0 ({saldo:.2f})")
 
+_INSERT_CUOTA_SQL = (
+    "INSERT INTO cuotas (id_prestamo, cuota_numero, fecha_vencimiento, estado, interes_pagado, abono_capital, "
+    "capital_plan, interes_plan, total_plan, interes_a_pagar) VALUES (?, ?, ?, 'PENDIENTE', 0, 0, ?, ?, ?, ?);"
+)
+
 def _insert_cuota_flexible(conn, prestamo_id: int, i: int, fv_iso: str, c_capital: float, c_interes: float):
-    if not _table_exists(conn, "cuotas"):
-        raise HTTPException(status_code=500, detail="No existe tabla 'cuotas'")
-
-    cols = _cols(conn, "cuotas")
-    fk = _pick(["id_prestamo", "prestamo_id"], cols) or "id_prestamo"
-    num_col = _pick(["cuota_numero", "numero"], cols)
-    fecha_col = _pick(["fecha_vencimiento", "fecha"], cols)
-
-    fields: List[str] = [fk]
-    values: List[Any] = [prestamo_id]
-    if num_col:
-        fields.append(num_col); values.append(i)
-    if fecha_col:
-        fields.append(fecha_col); values.append(fv_iso)
-
-    has_estado = "estado" in cols
-    has_ipg = "interes_pagado" in cols
-    has_abcap = "abono_capital" in cols
-    has_iap = "interes_a_pagar" in cols or "interes" in cols
-    iap_col = _pick(["interes_a_pagar", "interes"], cols)
-    has_capital = "capital" in cols
-    has_total = "total" in cols
-    has_cap_plan = "capital_plan" in cols
-    has_int_plan = "interes_plan" in cols
-    has_tot_plan = "total_plan" in cols
-
-    if has_estado:
-        fields.append("estado"); values.append("PENDIENTE")
-    if has_ipg:
-        fields.append("interes_pagado"); values.append(0.0)
-    if has_abcap:
-        fields.append("abono_capital"); values.append(0.0)
-
-    if has_cap_plan:
-        fields.append("capital_plan"); values.append(float(c_capital))
-    if has_int_plan:
-        fields.append("interes_plan"); values.append(float(c_interes))
-    if has_tot_plan:
-        fields.append("total_plan"); values.append(round(float(c_capital) + float(c_interes), 2))
-
-    if has_capital:
-        fields.append("capital"); values.append(float(c_capital))
-    if has_total:
-        fields.append("total"); values.append(round(float(c_capital) + float(c_interes), 2))
-    if has_iap and iap_col:
-        fields.append(iap_col); values.append(float(c_interes))
-
-    placeholders = ", ".join(["?"] * len(values))
-    sql = f"INSERT INTO cuotas ({', '.join(fields)}) VALUES ({placeholders});"
+    # Columnas canónicas garantizadas por app.migraciones: una sola sentencia preparada para todo el plan
+    values = (prestamo_id, i, fv_iso, float(c_capital), float(c_interes),
+              round(float(c_capital) + float(c_interes), 2), float(c_interes))
     try:
-        conn.execute(sql, values)
+        conn.execute(_INSERT_CUOTA_SQL, values)
     except sqlite3.Error as e:
         raise HTTPException(status_code=400, detail=f"Error al insertar cuota {i}: {e}")
 
@@ -384,35 +285,30 @@ def _insert_cuota_flexible(conn, prestamo_id: int, i: int, fv_iso: str, c_capita
 # POST CREAR PRESTAMO AUTO
 @router.post("")
 def crear_prestamo_auto(data: PrestamoAutoIn, bg: BackgroundTasks):
-    with get_conn() as conn:
-        if not _table_exists(conn, "prestamos"):
-            raise HTTPException(status_code=500, detail="No existe tabla 'prestamos'")
-        _ensure_plan_columns(conn)
-
+    # Con shards (DB_SHARDS) el préstamo va al archivo de su cliente (el cliente viene en el cuerpo)
+    with en_shard(shards.de_codigo(data.cod_cli)), get_conn() as conn:
         try:
-            cur = conn.execute(
-                "INSERT INTO prestamos (cod_cli, fecha_credito, importe_credito, modalidad, tasa_interes, num_cuotas, plan_mode)"
-                " VALUES (?, ?, ?, ?, ?, ?, 'auto');",
-                (
-                    data.cod_cli,
-                    data.fecha_inicio.isoformat(),
-                    float(data.monto),
-                    data.modalidad,
-                    float(data.tasa_interes),
-                    int(data.num_cuotas),
-                ),
-            )
-            prestamo_id = int(cur.lastrowid)
-
-            if not _table_exists(conn, "cuotas"):
-                raise HTTPException(status_code=500, detail="No existe tabla 'cuotas'")
+            with escritura(conn):
+                cur = conn.execute(
+                    "INSERT INTO prestamos (cod_cli, fecha_credito, importe_credito, modalidad, tasa_interes, num_cuotas, plan_mode)"
+                    " VALUES (?, ?, ?, ?, ?, ?, 'auto');",
+                    (
+                        data.cod_cli,
+                        data.fecha_inicio.isoformat(),
+                        float(data.monto),
+                        data.modalidad,
+                        float(data.tasa_interes),
+                        int(data.num_cuotas),
+                    ),
+                )
+                prestamo_id = int(cur.lastrowid)
 
-            for i in range(1, data.num_cuotas + 1):
-                fv = _calc_due_guarded(data.fecha_inicio, data.modalidad, i).isoformat()
-                interes = round(float(data.monto) * float(data.tasa_interes) / 100.0, 2)
-                _insert_cuota_flexible(conn, prestamo_id, i, fv, 0.0, interes)
+                for i in range(1, data.num_cuotas + 1):
+                    fv = _calc_due_guarded(data.fecha_inicio, data.modalidad, i).isoformat()
+                    interes = round(float(data.monto) * float(data.tasa_interes) / 100.0, 2)
+                    _insert_cuota_flexible(conn, prestamo_id, i, fv, 0.0, interes)
 
-            conn.commit()
+                mora.refrescar_prestamo(conn, prestamo_id)
         except sqlite3.Error as e:
             raise HTTPException(status_code=400, detail=f"Error SQL al crear préstamo: {e}")
         except HTTPException:
@@ -424,12 +320,6 @@ def crear_prestamo_auto(data: PrestamoAutoIn, bg: BackgroundTasks):
         res = _prestamo_to_front(conn, conn.execute("SELECT * FROM prestamos WHERE id=?", (prestamo_id,)).fetchone())
 
          # MAIL GUARDRAIL (INLINE)
-        def _pick_first(candidates: List[str], cols: List[str]) -> Optional[str]:
-            for c in candidates:
-                if c in cols:
-                    return c
-            return None
-
         send_on = (os.getenv("MAIL_SEND_ON_CREATE", "on") or "").strip().lower() in {"1", "true", "on", "yes", "y"}
         ok_send, motivo_send, email_to = False, "", None
 
@@ -437,35 +327,18 @@ def crear_prestamo_auto(data: PrestamoAutoIn, bg: BackgroundTasks):
             cod_cli = (res.get("cod_cli") or "").strip()
             if not cod_cli:
                 motivo_send = "Prestamo sin cod_cli"
-            elif not _table_exists(conn, "clientes"):
-                motivo_send = "Falta tabla clientes"
             else:
-                cols_cli = _cols(conn, "clientes")
-                email_col = _pick_first(["email", "correo", "mail", "e_mail"], cols_cli)
-                if not email_col:
-                    motivo_send = "No existe columna de email en 'clientes'"
+                row_cli = conn.execute("SELECT email FROM clientes WHERE codigo=?;", (cod_cli,)).fetchone()
+                email = (row_cli["email"] or "").strip() if row_cli else ""
+                if email and "@" in email and "." in email.split("@")[-1]:
+                    ok_send, email_to = True, email
                 else:
-                    id_cli_col = _pick_first(
-                        ["cod_cli", "codigo", "cod_cliente", "codcliente", "id", "id_cliente", "cliente_id"],
-                        cols_cli,
-                    )
-                    if not id_cli_col:
-                        motivo_send = "No existe columna identificadora del cliente en 'clientes'"
-                    else:
-                        row_cli = conn.execute(
-                            f"SELECT {email_col} AS email FROM clientes WHERE {id_cli_col}=?;",
-                            (cod_cli,),
-                        ).fetchone()
-                        email = (row_cli["email"] or "").strip() if row_cli and "email" in row_cli.keys() else ""
-                        if email and "@" in email and "." in email.split("@")[-1]:
-                            ok_send, email_to = True, email
-                        else:
-                            motivo_send = f"Email inválido o vacío para cod_cli={cod_cli}"
+                    motivo_send = f"Email inválido o vacío para cod_cli={cod_cli}"
 
         # Envío (simple: notifications.py decide el contenido del email)
         if send_on and ok_send:
             try:
-                bg.add_task(send_loan_created_email, res["id"])  # se envía solo con id
+                _encolar_correo(bg, res["id"])
             except Exception as e:
                 print(f"WARNING: Envío de correo fallido (prestamo_id={res.get('id')}): {e}")
         else:
@@ -476,37 +349,31 @@ def crear_prestamo_auto(data: PrestamoAutoIn, bg: BackgroundTasks):
 # POST CREAR PRESTAMO MANUAL
 @router.post("/manual")
 def crear_prestamo_manual(data: PrestamoManualIn, bg: BackgroundTasks):
-    with get_conn() as conn:
-        if not _table_exists(conn, "prestamos"):
-            raise HTTPException(status_code=500, detail="No existe tabla 'prestamos'")
-
+    with en_shard(shards.de_codigo(data.cod_cli)), get_conn() as conn:
         plan_payload = [{"capital": p.capital, "interes": p.interes} for p in data.plan]
         _validar_plan_manual_o_400(float(data.monto), float(data.tasa), plan_payload)
-        _ensure_plan_columns(conn)
 
         try:
-            cur = conn.execute(
-                "INSERT INTO prestamos (cod_cli, fecha_credito, importe_credito, modalidad, tasa_interes, num_cuotas, plan_mode)"
-                " VALUES (?, ?, ?, ?, ?, ?, 'manual');",
-                (
-                    data.cod_cli,
-                    data.fecha_inicio.isoformat(),
-                    float(data.monto),
-                    data.modalidad,
-                    float(data.tasa),
-                    int(data.num_cuotas),
-                ),
-            )
-            prestamo_id = int(cur.lastrowid)
-
-            if not _table_exists(conn, "cuotas"):
-                raise HTTPException(status_code=500, detail="No existe tabla 'cuotas'")
+            with escritura(conn):
+                cur = conn.execute(
+                    "INSERT INTO prestamos (cod_cli, fecha_credito, importe_credito, modalidad, tasa_interes, num_cuotas, plan_mode)"
+                    " VALUES (?, ?, ?, ?, ?, ?, 'manual');",
+                    (
+                        data.cod_cli,
+                        data.fecha_inicio.isoformat(),
+                        float(data.monto),
+                        data.modalidad,
+                        float(data.tasa),
+                        int(data.num_cuotas),
+                    ),
+                )
+                prestamo_id = int(cur.lastrowid)
 
-            for i, c in enumerate(data.plan, start=1):
-                fv = _calc_due_guarded(data.fecha_inicio, data.modalidad, i).isoformat()
-                _insert_cuota_flexible(conn, prestamo_id, i, fv, float(c.capital), float(c.interes))
+                for i, c in enumerate(data.plan, start=1):
+                    fv = _calc_due_guarded(data.fecha_inicio, data.modalidad, i).isoformat()
+                    _insert_cuota_flexible(conn, prestamo_id, i, fv, float(c.capital), float(c.interes))
 
-            conn.commit()
+                mora.refrescar_prestamo(conn, prestamo_id)
         except sqlite3.Error as e:
             raise HTTPException(status_code=400, detail=f"Error SQL al crear préstamo manual: {e}")
         except HTTPException:
@@ -517,7 +384,7 @@ def crear_prestamo_manual(data: PrestamoManualIn, bg: BackgroundTasks):
         row = conn.execute("SELECT * FROM prestamos WHERE id=?", (prestamo_id,)).fetchone()
         res = _prestamo_to_front(conn, row)
         try:
-            bg.add_task(send_loan_created_email, res["id"])  # type: ignore[arg-type]
+            _encolar_correo(bg, res["id"])  # type: ignore[arg-type]
         except Exception:
             pass
         return res
@@ -532,112 +399,127 @@ def listar_estado_prestamos(ids: Optional[str] = Query(default=None)):
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de 'ids' inválido")
 
-    out: List[Dict[str, Any]] = []
-    with get_conn() as conn:
-        for pid in id_list:
-            try:
-                out.append(_estado_prestamo_canonico(conn, pid))
-            except HTTPException as e:
-                out.append({"id": pid, "error": e.detail})
-    return out
+    grupos = agrupar_ids(id_list)
+
+    def _shard(shard: Optional[str]) -> Dict[int, Dict[str, Any]]:
+        with replica.conexion_reportes() as conn:
+            def _uno(pid: int) -> Dict[str, Any]:
+                try:
+                    return _estado_prestamo_canonico(conn, pid)
+                except HTTPException as e:
+                    return {"id": pid, "error": e.detail}
+
+            # Los préstamos archivados se calculan contra el archivo (app.archivo)
+            return archivo.por_base(conn, "prestamos", grupos[shard], _uno)
+
+    # Con shards, cada grupo de ids en el archivo que lo numeró, en paralelo
+    por_id: Dict[int, Dict[str, Any]] = {}
+    for parte in dispersar(_shard, list(grupos)):
+        por_id.update(parte)
+    return [por_id[pid] for pid in id_list]
 
 # GET PLAN (solo lectura, con ajuste dinámico opcional)
 @router.get("/{prestamo_id:int}/plan", summary="Obtener plan de cuotas del préstamo")
 def obtener_plan_prestamo(prestamo_id: int):
-    import os as _os
     with get_conn() as conn:
-        if not _table_exists(conn, "prestamos"):
-            raise HTTPException(status_code=500, detail="No existe tabla 'prestamos'")
+        archivo.usar_si_archivado(conn, "prestamos", prestamo_id)  # plan de un préstamo archivado
         p = conn.execute("SELECT * FROM prestamos WHERE id=?", (prestamo_id,)).fetchone()
         if not p:
             raise HTTPException(status_code=404, detail="Préstamo no encontrado")
 
-        out = {
-            "id": p["id"],
-            "cod_cli": p["cod_cli"],
-            "monto": float(p["importe_credito"]),
-            "modalidad": p["modalidad"],
-            "fecha_inicio": p["fecha_credito"],
-            "num_cuotas": int(p["num_cuotas"]),
-            "tasa": float(p["tasa_interes"]),
-            "plan_mode": p["plan_mode"] if "plan_mode" in p.keys() else "auto",
-            "estado": p["estado"] if "estado" in p.keys()
-                      else (p["estado_capital"] if "estado_capital" in p.keys() else "PENDIENTE"),
-            "plan": [],
-            "last_paid_num": 0,
-        }
+        rows = conn.execute(
+            "SELECT cuota_numero, fecha_vencimiento, capital_plan, interes_plan, estado, interes_pagado, abono_capital "
+            "FROM cuotas WHERE id_prestamo=? ORDER BY cuota_numero ASC;",
+            (prestamo_id,),
+        ).fetchall()
+        return _plan_de(p, rows)
 
-        try:
-            out["estado"] = _estado_prestamo_dinamico(conn, int(prestamo_id))
-        except Exception:
-            pass
 
-        if not _table_exists(conn, "cuotas"):
-            return out
-
-        cols = _cols(conn, "cuotas")
-        fk = _pick(["id_prestamo", "prestamo_id"], cols) or "id_prestamo"
-        num_col = _pick(["cuota_numero", "numero"], cols) or "cuota_numero"
-        fecha_col = _pick(["fecha_vencimiento", "fecha"], cols) or "fecha_vencimiento"
-        cap_src = _pick(["capital_plan", "capital"], cols)
-        int_src = _pick(["interes_plan", "interes_a_pagar", "interes"], cols)
-        has_ipg = "interes_pagado" in cols
-        has_abcap = "abono_capital" in cols
-        has_estado = "estado" in cols
-
-        rows = conn.execute(f"SELECT * FROM cuotas WHERE {fk}=? ORDER BY {num_col} ASC;", (prestamo_id,)).fetchall()
-
-        last_paid = 0
-        for r in rows:
-            numero = int(r[num_col])
-            estado_c = (r["estado"] if has_estado else "PENDIENTE") or "PENDIENTE"
-            ipg = float(r["interes_pagado"]) if has_ipg and r["interes_pagado"] is not None else 0.0
-            abcap = float(r["abono_capital"]) if has_abcap and r["abono_capital"] is not None else 0.0
-            if estado_c == "PAGADO" or ipg > 0 or abcap > 0:
-                if numero > last_paid:
-                    last_paid = numero
-            c = float(r[cap_src]) if cap_src else 0.0
-            i = float(r[int_src]) if int_src else 0.0
-            out["plan"].append(
-                {
-                    "numero": numero,
-                    "fecha": r[fecha_col],
-                    "capital": c,
-                    "interes": i,
-                    "estado": estado_c,
-                    "interes_pagado": ipg,
-                    "abono_capital": abcap,
-                    "editable": numero > last_paid,
-                }
-            )
+def _plan_de(p, rows) -> Dict[str, Any]:
+    """
+    Plan del préstamo a partir de su fila y de sus cuotas ordenadas por número (Row o dict).
+    Lo comparten GET /prestamos/{id}/plan y GET /prestamos/{id}/detalle.
+    """
+    import os as _os
+    out = {
+        "id": p["id"],
+        "cod_cli": p["cod_cli"],
+        "monto": float(p["importe_credito"]),
+        "modalidad": p["modalidad"],
+        "fecha_inicio": p["fecha_credito"],
+        "num_cuotas": int(p["num_cuotas"]),
+        "tasa": float(p["tasa_interes"]),
+        "plan_mode": p["plan_mode"] or "auto",
+        "estado": p["estado"],
+        "plan": [],
+        "last_paid_num": 0,
+    }
 
-        # Ajuste dinámico de interés para la próxima cuota (SOLO LECTURA)
-        try:
-            flag = (_os.getenv("AUTO_INTERES_ABONOS", "") or "").strip().lower() in {"1", "true", "on", "yes", "y"}
-            if flag and (out.get("plan_mode") == "auto") and (last_paid < int(out.get("num_cuotas", 0))):
-                next_num = last_paid + 1
-                abonos_sum = 0.0
-                if has_abcap:
-                    row_ab = conn.execute(
-                        f"SELECT COALESCE(SUM(COALESCE(abono_capital,0)),0) AS s "
-                        f"FROM cuotas WHERE {fk}=? AND {num_col}<=?;",
-                        (prestamo_id, next_num),
-                    ).fetchone()
-                    abonos_sum = float(row_ab["s"] or 0.0) if row_ab and "s" in row_ab.keys() else 0.0
-
-                cap_pend = max(0.0, float(out.get("monto", 0)) - abonos_sum)
-                tasa = float(out.get("tasa", 0))
-                interes_next = round(cap_pend * tasa / 100.0, 2)
-
-                for it in out["plan"]:
-                    if int(it.get("numero", 0)) == next_num:
-                        it["interes"] = interes_next
-                        break
-        except Exception:
-            pass
+    try:
+        out["estado"] = _estado_dinamico(rows)
+    except Exception:
+        pass
+
+    last_paid = 0
+    for r in rows:
+        numero = int(r["cuota_numero"])
+        estado_c = r["estado"] or "PENDIENTE"
+        ipg = float(r["interes_pagado"]) if r["interes_pagado"] is not None else 0.0
+        abcap = float(r["abono_capital"]) if r["abono_capital"] is not None else 0.0
+        if estado_c == "PAGADO" or ipg > 0 or abcap > 0:
+            if numero > last_paid:
+                last_paid = numero
+        c = float(r["capital_plan"] or 0)
+        i = float(r["interes_plan"] or 0)
+        out["plan"].append(
+            {
+                "numero": numero,
+                "fecha": r["fecha_vencimiento"],
+                "capital": c,
+                "interes": i,
+                "estado": estado_c,
+                "interes_pagado": ipg,
+                "abono_capital": abcap,
+                "editable": numero > last_paid,
+            }
+        )
 
-        out["last_paid_num"] = last_paid
-        return out
+    # Ajuste dinámico de interés para la próxima cuota (SOLO LECTURA)
+    try:
+        flag = (_os.getenv("AUTO_INTERES_ABONOS", "") or "").strip().lower() in {"1", "true", "on", "yes", "y"}
+        if flag and (out.get("plan_mode") == "auto") and (last_paid < int(out.get("num_cuotas", 0))):
+            next_num = last_paid + 1
+            # Saldo corriente del préstamo (ya cargado en la fila 'p'; sin re-sumar abonos)
+            cap_pend = max(0.0, float(p["capital_pendiente"] if p["capital_pendiente"] is not None else out.get("monto", 0)))
+            tasa = float(out.get("tasa", 0))
+            interes_next = round(cap_pend * tasa / 100.0, 2)
+
+            for it in out["plan"]:
+                if int(it.get("numero", 0)) == next_num:
+                    it["interes"] = interes_next
+                    break
+    except Exception:
+        pass
+
+    out["last_paid_num"] = last_paid
+    return out
+
+# GET DETALLE COMPUESTO (una llamada en lugar de cuatro; ver app.detalle)
+@router.get("/{prestamo_id:int}/detalle", summary="Detalle compuesto del préstamo")
+def obtener_detalle_prestamo(
+    prestamo_id: int,
+    secciones: Optional[str] = Query(
+        default=None,
+        description="Secciones separadas por comas: resumen, cuotas, estado, plan, abonos (default: todas)",
+    ),
+):
+    return serializacion.RespuestaJSON(detalle.detalle_prestamo(prestamo_id, detalle.secciones(secciones)))
+
+# GET PLAN EN PDF (caché por versión del préstamo; ver app.documentos)
+@router.get("/{prestamo_id:int}/plan.pdf", summary="Plan de cuotas del préstamo en PDF")
+def obtener_plan_prestamo_pdf(prestamo_id: int, request: Request):
+    pdf, ver, hit = documentos.pdf_plan(prestamo_id)
+    return documentos.respuesta(request, pdf, ver, hit, f"plan-{prestamo_id}.pdf")
 
 # PUT PRESTAMO AUTO (quirúrgico)
 @router.put("/{prestamo_id:int}")
@@ -650,86 +532,83 @@ def actualizar_prestamo_auto(prestamo_id: int, data: PrestamoAutoUpdateIn):
         return date(y, m, day)
 
     with get_conn() as conn:
-        p = conn.execute("SELECT * FROM prestamos WHERE id=?", (prestamo_id,)).fetchone()
-        if not p:
-            raise HTTPException(status_code=404, detail="Préstamo no encontrado")
-
-        plan_mode = p["plan_mode"] if "plan_mode" in p.keys() else "auto"
-        if plan_mode == "manual":
-            raise HTTPException(status_code=400, detail="Este préstamo es manual; usa PUT /prestamos/{id}/replan")
+        with escritura(conn):
+            p = conn.execute("SELECT * FROM prestamos WHERE id=?", (prestamo_id,)).fetchone()
+            if not p:
+                raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+
+            plan_mode = p["plan_mode"] or "auto"
+            if plan_mode == "manual":
+                raise HTTPException(status_code=400, detail="Este préstamo es manual; usa PUT /prestamos/{id}/replan")
+
+            monto = float(p["importe_credito"])
+            tasa = float(p["tasa_interes"])
+            modalidad = p["modalidad"] or "Mensual"
+            fecha_inicio = p["fecha_credito"]
+            if isinstance(fecha_inicio, str):
+                try:
+                    yyyy, mm, dd = map(int, fecha_inicio.split("-"))
+                    fecha_inicio = date(yyyy, mm, dd)
+                except Exception:
+                    raise HTTPException(status_code=400, detail="fecha_credito inválida en préstamo")
 
-        monto = float(p["importe_credito"])
-        tasa = float(p["tasa_interes"])
-        modalidad = p["modalidad"] or "Mensual"
-        fecha_inicio = p["fecha_credito"]
-        if isinstance(fecha_inicio, str):
-            try:
-                yyyy, mm, dd = map(int, fecha_inicio.split("-"))
-                fecha_inicio = date(yyyy, mm, dd)
-            except Exception:
-                raise HTTPException(status_code=400, detail="fecha_credito inválida en préstamo")
-
-        num_actual = int(p["num_cuotas"])
-        num_nuevo = int(data.num_cuotas) if getattr(data, "num_cuotas", None) is not None else num_actual
-
-        cols = _cols(conn, "cuotas")
-        fk = _pick(["id_prestamo", "prestamo_id"], cols) or "id_prestamo"
-        num_col = _pick(["cuota_numero", "numero"], cols) or "cuota_numero"
-        has_estado = "estado" in cols
-        has_ipg = "interes_pagado" in cols
-        has_abcap = "abono_capital" in cols
-
-        rows = conn.execute(f"SELECT * FROM cuotas WHERE {fk}=? ORDER BY {num_col} ASC;", (prestamo_id,)).fetchall()
-        last_paid = 0
-        for r in rows:
-            estado_c = (r["estado"] if has_estado else "PENDIENTE") or "PENDIENTE"
-            ipg = float(r["interes_pagado"]) if has_ipg and r["interes_pagado"] is not None else 0.0
-            abcap = float(r["abono_capital"]) if has_abcap and r["abono_capital"] is not None else 0.0
-            if estado_c == "PAGADO" or ipg > 0 or abcap > 0:
-                n = int(r[num_col])
-                if n > last_paid:
-                    last_paid = n
-
-        if num_nuevo < last_paid:
-            raise HTTPException(
-                status_code=422,
-                detail=f"No se puede reducir num_cuotas por debajo de las cuotas ya pagadas (última pagada: {last_paid}).",
-            )
+            num_actual = int(p["num_cuotas"])
+            num_nuevo = int(data.num_cuotas) if getattr(data, "num_cuotas", None) is not None else num_actual
 
-        to_set: Dict[str, Any] = {}
-        if getattr(data, "tasa_interes", None) is not None:
-            to_set["tasa_interes"] = float(data.tasa_interes)
-            tasa = float(data.tasa_interes)
-        if getattr(data, "modalidad", None) is not None:
-            to_set["modalidad"] = str(data.modalidad)
-            modalidad = str(data.modalidad)
-        if getattr(data, "fecha_inicio", None) is not None:
-            try:
-                yyyy, mm, dd = map(int, str(data.fecha_inicio).split("-"))
-                fecha_inicio = date(yyyy, mm, dd)
-                to_set["fecha_credito"] = str(data.fecha_inicio)
-            except Exception:
-                raise HTTPException(status_code=422, detail="fecha_inicio inválida")
-        if getattr(data, "num_cuotas", None) is not None:
-            to_set["num_cuotas"] = int(data.num_cuotas)
-
-        if to_set:
-            set_clause = ", ".join([f"{k}=?" for k in to_set.keys()])
-            params = list(to_set.values()) + [prestamo_id]
-            conn.execute(f"UPDATE prestamos SET {set_clause} WHERE id=?", params)
-
-        next_num = last_paid + 1
-        if num_nuevo >= next_num:
-            conn.execute(f"DELETE FROM cuotas WHERE {fk}=? AND {num_col}>=?;", (prestamo_id, next_num))
-            interes_por_cuota = round(monto * tasa / 100.0, 2)
-            for n in range(next_num, num_nuevo + 1):
-                if modalidad.lower().startswith("mens"):
-                    fv = _add_months(fecha_inicio, n)
-                else:
-                    fv = fecha_inicio + timedelta(days=15 * n)
-                _insert_cuota_flexible(conn, prestamo_id, n, fv.isoformat(), 0.0, interes_por_cuota)
+            rows = conn.execute(
+                "SELECT cuota_numero, estado, interes_pagado, abono_capital FROM cuotas "
+                "WHERE id_prestamo=? ORDER BY cuota_numero ASC;",
+                (prestamo_id,),
+            ).fetchall()
+            last_paid = 0
+            for r in rows:
+                estado_c = r["estado"] or "PENDIENTE"
+                ipg = float(r["interes_pagado"]) if r["interes_pagado"] is not None else 0.0
+                abcap = float(r["abono_capital"]) if r["abono_capital"] is not None else 0.0
+                if estado_c == "PAGADO" or ipg > 0 or abcap > 0:
+                    n = int(r["cuota_numero"])
+                    if n > last_paid:
+                        last_paid = n
+
+            if num_nuevo < last_paid:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"No se puede reducir num_cuotas por debajo de las cuotas ya pagadas (última pagada: {last_paid}).",
+                )
 
-        conn.commit()
+            to_set: Dict[str, Any] = {}
+            if getattr(data, "tasa_interes", None) is not None:
+                to_set["tasa_interes"] = float(data.tasa_interes)
+                tasa = float(data.tasa_interes)
+            if getattr(data, "modalidad", None) is not None:
+                to_set["modalidad"] = str(data.modalidad)
+                modalidad = str(data.modalidad)
+            if getattr(data, "fecha_inicio", None) is not None:
+                try:
+                    yyyy, mm, dd = map(int, str(data.fecha_inicio).split("-"))
+                    fecha_inicio = date(yyyy, mm, dd)
+                    to_set["fecha_credito"] = str(data.fecha_inicio)
+                except Exception:
+                    raise HTTPException(status_code=422, detail="fecha_inicio inválida")
+            if getattr(data, "num_cuotas", None) is not None:
+                to_set["num_cuotas"] = int(data.num_cuotas)
+
+            if to_set:
+                set_clause = ", ".join([f"{k}=?" for k in to_set.keys()])
+                params = list(to_set.values()) + [prestamo_id]
+                conn.execute(f"UPDATE prestamos SET {set_clause} WHERE id=?", params)
+
+            next_num = last_paid + 1
+            if num_nuevo >= next_num:
+                conn.execute("DELETE FROM cuotas WHERE id_prestamo=? AND cuota_numero>=?;", (prestamo_id, next_num))
+                interes_por_cuota = round(monto * tasa / 100.0, 2)
+                for n in range(next_num, num_nuevo + 1):
+                    if modalidad.lower().startswith("mens"):
+                        fv = _add_months(fecha_inicio, n)
+                    else:
+                        fv = fecha_inicio + timedelta(days=15 * n)
+                    _insert_cuota_flexible(conn, prestamo_id, n, fv.isoformat(), 0.0, interes_por_cuota)
+                mora.refrescar_prestamo(conn, prestamo_id)
 
         row = conn.execute("SELECT * FROM prestamos WHERE id=?", (prestamo_id,)).fetchone()
         out = _prestamo_to_front(conn, row)
@@ -745,106 +624,84 @@ def actualizar_prestamo_auto(prestamo_id: int, data: PrestamoAutoUpdateIn):
 def replan_prestamo(prestamo_id: int, data: PrestamoReplanIn):
     tol = 0.01
     with get_conn() as conn:
-        if not _table_exists(conn, "prestamos"):
-            raise HTTPException(status_code=500, detail="No existe tabla 'prestamos'")
-        p = conn.execute("SELECT * FROM prestamos WHERE id=?", (prestamo_id,)).fetchone()
-        if not p:
-            raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+        with escritura(conn):
+            p = conn.execute("SELECT * FROM prestamos WHERE id=?", (prestamo_id,)).fetchone()
+            if not p:
+                raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+
+            plan_mode = p["plan_mode"] or "auto"
+            estado = p["estado"]
+            if plan_mode != "manual":
+                raise HTTPException(status_code=400, detail="Este préstamo no es de modo manual")
+            if estado == "PAGADO":
+                raise HTTPException(status_code=400, detail="No se puede editar un préstamo ya pagado")
 
-        plan_mode = p["plan_mode"] if "plan_mode" in p.keys() else "auto"
-        estado = p["estado"] if "estado" in p.keys() else (p["estado_capital"] if "estado_capital" in p.keys() else "PENDIENTE")
-        if plan_mode != "manual":
-            raise HTTPException(status_code=400, detail="Este préstamo no es de modo manual")
-        if estado == "PAGADO":
-            raise HTTPException(status_code=400, detail="No se puede editar un préstamo ya pagado")
-
-        if _table_exists(conn, "cuotas"):
-            cols0 = _cols(conn, "cuotas")
-            fk0 = _pick(["id_prestamo", "prestamo_id"], cols0) or "id_prestamo"
             q = conn.execute(
-                f"SELECT COUNT(*) AS c FROM cuotas WHERE {fk0}=? AND "
-                f"(COALESCE(interes_pagado,0)>0 OR COALESCE(abono_capital,0)>0);",
+                "SELECT COUNT(*) AS c FROM cuotas WHERE id_prestamo=? AND "
+                "(COALESCE(interes_pagado,0)>0 OR COALESCE(abono_capital,0)>0);",
                 (prestamo_id,),
             ).fetchone()
             if int(q["c"] or 0) > 0:
                 raise HTTPException(status_code=400, detail="No se puede editar: hay cuotas con pagos registrados")
 
-        monto_total = float(p["importe_credito"])
-        abonos_registrados = 0.0
-        if _table_exists(conn, "cuotas"):
-            cols1 = _cols(conn, "cuotas")
-            fk1 = _pick(["id_prestamo", "prestamo_id"], cols1) or "id_prestamo"
-            abonos_registrados = float(
-                conn.execute(
-                    f"SELECT COALESCE(SUM(COALESCE(abono_capital,0)),0) AS s FROM cuotas WHERE {fk1}=?;",
-                    (prestamo_id,),
-                ).fetchone()["s"]
-            ) or 0.0
-
-        plan_capital = round(sum(float(x.capital) for x in data.plan), 2)
-        pendiente = round(monto_total - abonos_registrados, 2)
-        if abs(plan_capital - pendiente) > tol:
-            raise HTTPException(
-                status_code=400,
-                detail=f"La suma de capital del nuevo plan ({plan_capital:.2f}) debe igualar el capital pendiente ({pendiente:.2f})",
-            )
-
-        _ensure_plan_columns(conn)
-
-        try:
-            if not _table_exists(conn, "cuotas"):
-                raise HTTPException(status_code=500, detail="No existe tabla 'cuotas'")
+            sp = saldos.saldo(conn, prestamo_id)
+            pendiente = round(sp[2] if sp else float(p["importe_credito"]), 2)
 
-            cols = _cols(conn, "cuotas")
-            fk = _pick(["id_prestamo", "prestamo_id"], cols) or "id_prestamo"
-            num_col = _pick(["cuota_numero", "numero"], cols) or "cuota_numero"
-            fecha_col = _pick(["fecha_vencimiento", "fecha"], cols) or "fecha_vencimiento"
+            plan_capital = round(sum(float(x.capital) for x in data.plan), 2)
+            if abs(plan_capital - pendiente) > tol:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"La suma de capital del nuevo plan ({plan_capital:.2f}) debe igualar el capital pendiente ({pendiente:.2f})",
+                )
 
-            rows = conn.execute(f"SELECT * FROM cuotas WHERE {fk}=? ORDER BY {num_col} ASC;", (prestamo_id,)).fetchall()
-            last_paid = 0
-            last_paid_fecha = date.fromisoformat(p["fecha_credito"])
-            has_ipg = "interes_pagado" in cols
-            has_abcap = "abono_capital" in cols
-            has_estado = "estado" in cols
+            try:
+                rows = conn.execute(
+                    "SELECT cuota_numero, fecha_vencimiento, estado, interes_pagado, abono_capital FROM cuotas "
+                    "WHERE id_prestamo=? ORDER BY cuota_numero ASC;",
+                    (prestamo_id,),
+                ).fetchall()
+                last_paid = 0
+                last_paid_fecha = date.fromisoformat(p["fecha_credito"])
+
+                for r in rows:
+                    numero = int(r["cuota_numero"])
+                    estado_c = r["estado"] or "PENDIENTE"
+                    ipg = float(r["interes_pagado"])
+                    abcap = float(r["abono_capital"])
+                    if estado_c == "PAGADO" or ipg > 0 or abcap > 0:
+                        if numero > last_paid:
+                            last_paid = numero
+                        try:
+                            venc = r["fecha_vencimiento"]
+                            last_paid_fecha = date.fromisoformat(venc) if venc else last_paid_fecha
+                        except Exception:
+                            pass
+
+                conn.execute("DELETE FROM cuotas WHERE id_prestamo=? AND cuota_numero>?;", (prestamo_id, last_paid))
+
+                modalidad = data.modalidad or p["modalidad"]
+                for i, c in enumerate(data.plan, start=1):
+                    nro = last_paid + i
+                    base_date = last_paid_fecha
+                    next_date = (
+                        _calc_due_guarded(base_date, modalidad, 1)
+                        if last_paid > 0
+                        else _calc_due_guarded(date.fromisoformat(p["fecha_credito"]), modalidad, i)
+                    )
+                    _insert_cuota_flexible(conn, prestamo_id, nro, next_date.isoformat(), float(c.capital), float(c.interes))
 
-            for r in rows:
-                numero = int(r[num_col])
-                estado_c = (r["estado"] if has_estado else "PENDIENTE") or "PENDIENTE"
-                ipg = float(r["interes_pagado"]) if has_ipg else 0.0
-                abcap = float(r["abono_capital"]) if has_abcap else 0.0
-                if estado_c == "PAGADO" or ipg > 0 or abcap > 0:
-                    if numero > last_paid:
-                        last_paid = numero
-                    try:
-                        last_paid_fecha = date.fromisoformat(r[fecha_col]) if r[fecha_col] else last_paid_fecha
-                    except Exception:
-                        pass
-
-            conn.execute(f"DELETE FROM cuotas WHERE {fk}=? AND {num_col}>?;", (prestamo_id, last_paid))
-
-            modalidad = data.modalidad or p["modalidad"]
-            for i, c in enumerate(data.plan, start=1):
-                nro = last_paid + i
-                base_date = last_paid_fecha
-                next_date = (
-                    _calc_due_guarded(base_date, modalidad, 1)
-                    if last_paid > 0
-                    else _calc_due_guarded(date.fromisoformat(p["fecha_credito"]), modalidad, i)
+                new_count = last_paid + len(data.plan)
+                conn.execute(
+                    "UPDATE prestamos SET num_cuotas=?, modalidad=? WHERE id=?;",
+                    (new_count, modalidad, prestamo_id),
                 )
-                _insert_cuota_flexible(conn, prestamo_id, nro, next_date.isoformat(), float(c.capital), float(c.interes))
-
-            new_count = last_paid + len(data.plan)
-            conn.execute(
-                "UPDATE prestamos SET num_cuotas=?, modalidad=? WHERE id=?;",
-                (new_count, modalidad, prestamo_id),
-            )
-            conn.commit()
-        except sqlite3.Error as e:
-            raise HTTPException(status_code=400, detail=f"Error SQL en replan: {e}")
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error inesperado en replan: {type(e).__name__}: {e}")
+                mora.refrescar_prestamo(conn, prestamo_id)
+            except sqlite3.Error as e:
+                raise HTTPException(status_code=400, detail=f"Error SQL en replan: {e}")
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Error inesperado en replan: {type(e).__name__}: {e}")
 
         return {
             "id": prestamo_id,
@@ -857,24 +714,13 @@ def replan_prestamo(prestamo_id: int, data: PrestamoReplanIn):
 
 # ESTADO CANÓNICO (no modifica datos)
 def _estado_prestamo_canonico(conn, prestamo_id: int) -> Dict[str, Any]:
-    if not (_table_exists(conn, "prestamos") and _table_exists(conn, "cuotas")):
-        raise HTTPException(status_code=500, detail="Tablas requeridas no existen")
-
-    cols = _cols(conn, "cuotas")
-    fk = _pick(["id_prestamo", "prestamo_id"], cols) or "id_prestamo"
-    venc = _pick(["fecha_vencimiento", "fecha"], cols) or "fecha_vencimiento"
-
-    abonos_existe = _table_exists(conn, "abonos_capital")
-    ab_sum_expr = (
-        "COALESCE((SELECT SUM(a.monto) FROM abonos_capital a WHERE a.id_prestamo=p.id), 0)"
-        if abonos_existe
-        else "0"
-    )
+    fk = "id_prestamo"
+    venc = "fecha_vencimiento"
 
-    row_p = conn.execute("SELECT id, importe_credito FROM prestamos p WHERE id=?;", (prestamo_id,)).fetchone()
-    if not row_p:
+    sp = saldos.saldo(conn, prestamo_id)
+    if sp is None:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
-    importe_credito = float(row_p["importe_credito"] or 0)
+    importe_credito, _, capital_pendiente = sp
 
     total = conn.execute(f"SELECT COUNT(*) AS c FROM cuotas WHERE {fk}=?;", (prestamo_id,)).fetchone()["c"]
     pagadas = conn.execute(
@@ -887,12 +733,6 @@ def _estado_prestamo_canonico(conn, prestamo_id: int) -> Dict[str, Any]:
         (prestamo_id, hoy),
     ).fetchone()["c"]
 
-    cap_row = conn.execute(
-        f"SELECT (p.importe_credito - {ab_sum_expr}) AS capital_pendiente FROM prestamos p WHERE p.id=?;",
-        (prestamo_id,),
-    ).fetchone()
-    capital_pendiente = float(cap_row["capital_pendiente"] or 0)
-
     vence_row = conn.execute(
         f"SELECT MAX(date({venc})) AS vence_ultima_cuota FROM cuotas WHERE {fk}=?;",
         (prestamo_id,),
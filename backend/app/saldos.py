@@ -0,0 +1,106 @@
+# backend/app/saldos.py
+# Saldos corrientes por préstamo: 'capital_abonado' y 'capital_pendiente' en 'prestamos',
+# mantenidos incrementalmente en la MISMA transacción de cada abono. Las lecturas y
+# validaciones consultan una fila (O(1)) en vez de sumar 'abonos_capital' cada vez.
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import deps
+
+log = logging.getLogger("saldos")
+
+TOL = 0.005
+
+# Suma del libro de abonos por préstamo (fuente de verdad para conciliación).
+# Columnas, backfill y triggers: migración 5 (app.migraciones).
+LIBRO = "COALESCE((SELECT SUM(a.monto) FROM abonos_capital a WHERE a.id_prestamo = prestamos.id), 0)"
+
+
+# ------------------ lecturas / escrituras ------------------
+
+def saldo(conn, prestamo_id: int) -> Optional[Tuple[float, float, float]]:
+    """(importe_credito, capital_abonado, capital_pendiente) o None si el préstamo no existe."""
+    row = conn.execute(
+        "SELECT importe_credito, capital_abonado, capital_pendiente FROM prestamos WHERE id=?;",
+        (prestamo_id,),
+    ).fetchone()
+    return de_fila(row) if row else None
+
+
+def de_fila(row) -> Tuple[float, float, float]:
+    """Igual que saldo() sobre una fila de 'prestamos' ya leída (p.ej. SELECT * del detalle)."""
+    importe = float(row["importe_credito"] or 0)
+    abonado = float(row["capital_abonado"] or 0)
+    pendiente = float(row["capital_pendiente"]) if row["capital_pendiente"] is not None else importe - abonado
+    return importe, abonado, pendiente
+
+
+def aplicar_abono(conn, prestamo_id: int, monto: float) -> None:
+    """Suma 'monto' al saldo del préstamo. No hace commit: va en la transacción del abono."""
+    conn.execute(
+        """
+        UPDATE prestamos SET
+            capital_abonado = capital_abonado + :monto,
+            capital_pendiente = COALESCE(importe_credito, 0) - (capital_abonado + :monto)
+        WHERE id = :id;
+        """,
+        {"monto": float(monto), "id": prestamo_id},
+    )
+
+
+# ------------------ conciliación ------------------
+
+def _descuadres(conn) -> List[Dict[str, Any]]:
+    rows = conn.execute(
+        f"""
+        SELECT id, importe_credito, capital_abonado, capital_pendiente, ledger
+        FROM (SELECT id, importe_credito, capital_abonado, capital_pendiente, {LIBRO} AS ledger FROM prestamos)
+        WHERE ABS(capital_abonado - ledger) > :tol
+           OR capital_pendiente IS NULL
+           OR ABS(capital_pendiente - (COALESCE(importe_credito, 0) - ledger)) > :tol
+        ORDER BY id;
+        """,
+        {"tol": TOL},
+    ).fetchall()
+    return [
+        {
+            "id": r["id"],
+            "capital_abonado": r["capital_abonado"],
+            "capital_pendiente": r["capital_pendiente"],
+            "libro_abonos": r["ledger"],
+            "diferencia": round(float(r["capital_abonado"] or 0) - float(r["ledger"] or 0), 2),
+        }
+        for r in rows
+    ]
+
+
+def conciliar(conn, corregir: bool = False) -> Dict[str, Any]:
+    """
+    Compara los saldos guardados contra la suma del libro 'abonos_capital'.
+    Con corregir=True reescribe los préstamos descuadrados con el valor del libro, en una
+    transacción deps.escritura: la revisión y la corrección ven el mismo estado.
+    """
+    if not corregir:
+        descuadres = _descuadres(conn)
+    else:
+        with deps.escritura(conn):
+            descuadres = _descuadres(conn)
+            if descuadres:
+                ids = [d["id"] for d in descuadres]
+                conn.execute(
+                    f"UPDATE prestamos SET capital_abonado = {LIBRO}, "
+                    f"capital_pendiente = COALESCE(importe_credito, 0) - {LIBRO} "
+                    f"WHERE id IN ({','.join('?' * len(ids))});",
+                    ids,
+                )
+        if descuadres:
+            log.warning("Saldos corregidos para %s préstamo(s): %s", len(descuadres), [d["id"] for d in descuadres])
+    total = conn.execute("SELECT COUNT(*) AS c FROM prestamos;").fetchone()["c"]
+    return {
+        "prestamos_revisados": int(total or 0),
+        "descuadrados": len(descuadres),
+        "corregidos": len(descuadres) if corregir else 0,
+        "detalle": descuadres,
+    }
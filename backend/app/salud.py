@@ -0,0 +1,139 @@
+# backend/app/salud.py
+# Chequeo de preparación (GET /health/ready) para el balanceador: deja de mandar tráfico ANTES de
+# que la contención de locks de SQLite se dispare.
+# - Latencia de lectura y de escritura sobre la fila de latido (tabla 'latido', migración 8). La
+#   escritura es BEGIN IMMEDIATE + UPDATE + COMMIT con busy_timeout acotado al umbral de no-listo:
+#   mide la espera real por el lock de escritura que verían las peticiones.
+# - Saturación del pool de conexiones (en uso / DB_POOL), colas en segundo plano (correos encolados,
+#   bitácora de abonos), última corrida correcta de recordatorios, tamaño del WAL y disco libre.
+# - Cada chequeo tiene umbral de degradado y de no-listo (READY_<CHEQUEO>_DEGRADADO / _NO_LISTO;
+#   0 = no se evalúa). Peor estado: ok -> 200, degradado -> READY_CODIGO_DEGRADADO (429), no_listo -> 503.
+from __future__ import annotations
+
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from app import bitacora, deps, metrics
+
+CODIGO_DEGRADADO = int(os.getenv("READY_CODIGO_DEGRADADO", "429"))
+CODIGOS = {"ok": 200, "degradado": CODIGO_DEGRADADO, "no_listo": 503}
+_ORDEN = {"ok": 0, "degradado": 1, "no_listo": 2}
+
+
+def _umbrales(nombre: str, degradado: str, no_listo: str) -> Tuple[float, float]:
+    return (float(os.getenv(f"READY_{nombre}_DEGRADADO", degradado)),
+            float(os.getenv(f"READY_{nombre}_NO_LISTO", no_listo)))
+
+
+# (degradado, no_listo); en disco_libre_mb lo peor es el valor BAJO
+UMBRALES: Dict[str, Tuple[float, float]] = {
+    "lectura_ms": _umbrales("LECTURA_MS", "50", "500"),
+    "escritura_ms": _umbrales("ESCRITURA_MS", "250", "2000"),
+    "pool_saturacion": _umbrales("POOL_SATURACION", "1", "0"),
+    "cola_correo": _umbrales("COLA_CORREO", "50", "0"),
+    "cola_bitacora": _umbrales("COLA_BITACORA", "5000", "0"),
+    "recordatorios_edad_h": _umbrales("RECORDATORIOS_EDAD_H", "0", "0"),
+    "wal_mb": _umbrales("WAL_MB", "64", "512"),
+    "disco_libre_mb": _umbrales("DISCO_LIBRE_MB", "1024", "100"),
+}
+_MENOR_ES_PEOR = {"disco_libre_mb"}
+
+
+def _nivel(nombre: str, valor: Optional[float]) -> str:
+    if valor is None:
+        return "ok"
+    menor_es_peor = nombre in _MENOR_ES_PEOR
+    degradado, no_listo = UMBRALES[nombre]
+    for umbral, estado in ((no_listo, "no_listo"), (degradado, "degradado")):
+        if umbral > 0 and (valor < umbral if menor_es_peor else valor >= umbral):
+            return estado
+    return "ok"
+
+
+# ------------------ mediciones ------------------
+
+def _latencias(conn) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    t0 = time.perf_counter()
+    conn.execute("SELECT instante FROM latido WHERE id = 1;").fetchone()
+    out["lectura_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+
+    # Sin los reintentos de deps.begin_immediate: el chequeo no debe esperar más que su umbral
+    espera_ms = int(UMBRALES["escritura_ms"][1] or deps.BUSY_TIMEOUT_MS)
+    conn.execute(f"PRAGMA busy_timeout = {espera_ms};")
+    t0 = time.perf_counter()
+    try:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE latido SET instante = ?, pid = ? WHERE id = 1;",
+                     (datetime.now().isoformat(timespec="milliseconds"), os.getpid()))
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        if conn.in_transaction:
+            conn.rollback()
+        out["error_escritura"] = str(e)
+    finally:
+        out["escritura_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+        conn.execute(f"PRAGMA busy_timeout = {deps.BUSY_TIMEOUT_MS};")
+    return out
+
+
+def _edad_recordatorios_h(conn) -> Optional[float]:
+    row = conn.execute("SELECT ultima_ejecucion FROM mantenimiento WHERE tarea = 'recordatorios';").fetchone()
+    if not row or not row[0]:
+        return None
+    try:
+        return round((datetime.now() - datetime.fromisoformat(row[0])).total_seconds() / 3600.0, 2)
+    except ValueError:
+        return None
+
+
+def _wal_mb() -> float:
+    wal = deps.ruta() + "-wal"
+    return round(os.path.getsize(wal) / 1e6, 3) if os.path.exists(wal) else 0.0
+
+
+def _disco_libre_mb() -> Optional[float]:
+    try:
+        return round(shutil.disk_usage(os.path.dirname(os.path.abspath(deps.ruta()))).free / 1e6, 1)
+    except OSError:
+        return None
+
+
+def preparacion() -> Dict[str, Any]:
+    """Estado global (peor de los chequeos) y, por chequeo, valor, estado y umbrales."""
+    pool = deps.estado_pool()  # antes de tomar la conexión del propio chequeo
+    valores: Dict[str, Optional[float]] = {
+        "pool_saturacion": round(pool["en_uso"] / pool["tamano"], 3) if pool["tamano"] > 0 else None,
+        "cola_correo": metrics.EMAIL_PENDIENTES.valor("prestamo_creado"),
+        "cola_bitacora": bitacora.pendientes(),
+        "wal_mb": _wal_mb(),
+        "disco_libre_mb": _disco_libre_mb(),
+    }
+    errores: Dict[str, str] = {}
+    try:
+        with deps.get_conn() as conn:
+            lat = _latencias(conn)
+            valores["recordatorios_edad_h"] = _edad_recordatorios_h(conn)
+        valores["lectura_ms"] = lat["lectura_ms"]
+        valores["escritura_ms"] = lat["escritura_ms"]
+        if "error_escritura" in lat:
+            errores["escritura_ms"] = lat["error_escritura"]
+    except Exception as e:  # sin base no hay nada que atender
+        errores["lectura_ms"] = errores["escritura_ms"] = f"{type(e).__name__}: {e}"
+
+    chequeos: Dict[str, Dict[str, Any]] = {}
+    for nombre, (degradado, no_listo) in UMBRALES.items():
+        valor = valores.get(nombre)
+        estado = "no_listo" if nombre in errores else _nivel(nombre, valor)
+        chequeos[nombre] = {"valor": valor, "estado": estado, "degradado": degradado or None,
+                            "no_listo": no_listo or None}
+        if nombre in errores:
+            chequeos[nombre]["error"] = errores[nombre]
+    global_ = max((c["estado"] for c in chequeos.values()), key=_ORDEN.__getitem__)
+    return {"estado": global_, "pid": os.getpid(), "chequeos": chequeos}
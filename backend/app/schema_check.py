@@ -1,16 +1,46 @@
-from typing import Dict, Any
+# backend/app/schema_check.py
+# Foto del esquema (tablas, columnas, FKs, índices). snapshot() la cachea por archivo y PRAGMA
+# schema_version: cualquier DDL (migración, índice nuevo) la invalida; mientras tanto no se vuelve
+# a leer sqlite_master ni los PRAGMA de cada tabla.
+from typing import Any, Dict, List, Tuple
 import sqlite3
+import threading
+
+_cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+_lock = threading.Lock()
+
+
+def _filas(conn: sqlite3.Connection, sql: str) -> List[Dict[str, Any]]:
+    # Los nombres salen del cursor de ESTA consulta (cada PRAGMA tiene sus propias columnas)
+    cur = conn.execute(sql)
+    nombres = [d[0] for d in cur.description]
+    return [dict(zip(nombres, row)) for row in cur.fetchall()]
+
 
 def get_schema_snapshot(conn: sqlite3.Connection) -> Dict[str, Any]:
-    cur = conn.cursor()
-    tables = [r[0] for r in cur.execute(
+    tables = [r[0] for r in conn.execute(
         "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name;"
     ).fetchall()]
     schema = {}
     for t in tables:
-        cols = [dict(zip([d[0] for d in cur.description], row))
-                for row in conn.execute(f"PRAGMA table_info({t});").fetchall()]
-        fks = [dict(zip([d[0] for d in cur.description], row))
-               for row in conn.execute(f"PRAGMA foreign_key_list({t});").fetchall()]
-        schema[t] = {"columns": cols, "foreign_keys": fks}
+        cols = _filas(conn, f"PRAGMA table_info({t});")
+        fks = _filas(conn, f"PRAGMA foreign_key_list({t});")
+        indexes = []
+        for ix in _filas(conn, f"PRAGMA index_list({t});"):
+            ix["columns"] = [c["name"] for c in _filas(conn, f"PRAGMA index_info({ix['name']});")]
+            indexes.append(ix)
+        schema[t] = {"columns": cols, "foreign_keys": fks, "indexes": indexes}
     return {"tables": schema}
+
+
+def snapshot(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """get_schema_snapshot cacheado; 'schema_version' indica de qué versión del esquema es la foto."""
+    archivo = next((r[2] for r in conn.execute("PRAGMA database_list;").fetchall() if r[1] == "main"), "")
+    version = conn.execute("PRAGMA schema_version;").fetchone()[0]
+    previo = _cache.get(archivo)
+    if previo is not None and previo[0] == version:
+        return previo[1]
+    with _lock:
+        foto = dict(get_schema_snapshot(conn), schema_version=version)
+        _cache[archivo] = (version, foto)
+    return foto
@@ -0,0 +1,72 @@
+# backend/app/sentencias.py
+# Registro de sentencias SQL armadas dinámicamente (por mapeo de columnas o filtros opcionales).
+# - Cada forma de consulta se arma UNA vez por versión de esquema (app.migraciones.VERSION) y después
+#   se devuelve el mismo texto: el handler no vuelve a concatenar y la caché de sentencias preparadas
+#   de sqlite3 (por conexión, indexada por el texto; ver deps.CACHED_STATEMENTS y el pool de deps)
+#   la encuentra en vez de compilarla de nuevo.
+# - 'forma' distingue variantes de una misma consulta (p.ej. qué filtros vienen): cada combinación es
+#   una entrada y el total está acotado por el código, no por los datos.
+# - Aciertos/armados: sql_registry_lookups_total; aciertos de la caché de sqlite3: db_statement_cache_total;
+#   resumen en GET /mantenimiento/sentencias. app.diagnostico usa registradas() para EXPLAIN QUERY PLAN.
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from app import deps, metrics, migraciones
+
+_registro: Dict[Tuple[int, str, Hashable], str] = {}
+_lock = threading.Lock()
+
+
+def sql(nombre: str, forma: Hashable, construir: Callable[[], str]) -> str:
+    """Texto de la consulta 'nombre' para 'forma'; construir() solo corre la primera vez."""
+    clave = (migraciones.VERSION, nombre, forma)
+    texto = _registro.get(clave)
+    if texto is not None:
+        metrics.SQL_REGISTRO.inc(nombre, "reutilizada")
+        return texto
+    with _lock:
+        texto = _registro.get(clave)
+        if texto is None:
+            texto = _registro[clave] = construir()
+            metrics.SQL_REGISTRO.inc(nombre, "armada")
+            return texto
+    metrics.SQL_REGISTRO.inc(nombre, "reutilizada")
+    return texto
+
+
+def registradas() -> List[Dict[str, Any]]:
+    """Formas registradas en este proceso: [{nombre, forma, sql}] (para diagnóstico)."""
+    items = sorted(_registro.items(), key=lambda kv: (kv[0][1], repr(kv[0][2])))
+    return [{"nombre": n, "forma": f, "sql": s} for (_, n, f), s in items]
+
+
+def _tasa(aciertos: float, fallos: float) -> float:
+    total = aciertos + fallos
+    return round(aciertos / total, 4) if total else 0.0
+
+
+def estado() -> Dict[str, Any]:
+    """Formas por consulta y tasas de acierto del registro y de la caché de sentencias de sqlite3."""
+    por_nombre: Dict[str, Dict[str, Any]] = {}
+    for (_, nombre, _forma) in list(_registro):
+        d = por_nombre.setdefault(nombre, {"formas": 0})
+        d["formas"] += 1
+    for nombre, d in por_nombre.items():
+        armadas = metrics.SQL_REGISTRO.valor(nombre, "armada")
+        reutilizadas = metrics.SQL_REGISTRO.valor(nombre, "reutilizada")
+        d.update(armadas=int(armadas), reutilizadas=int(reutilizadas), tasa_acierto=_tasa(reutilizadas, armadas))
+    aciertos = metrics.DB_CACHE_SENTENCIAS.valor("hit")
+    fallos = metrics.DB_CACHE_SENTENCIAS.valor("miss")
+    return {
+        "version_esquema": migraciones.VERSION,
+        "registro": dict(sorted(por_nombre.items())),
+        "cache_sqlite": {
+            "capacidad_por_conexion": deps.CACHED_STATEMENTS,
+            "aciertos": int(aciertos),
+            "fallos": int(fallos),
+            "tasa_acierto": _tasa(aciertos, fallos),
+        },
+        "pool": deps.estado_pool(),
+    }
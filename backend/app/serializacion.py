@@ -0,0 +1,79 @@
+# backend/app/serializacion.py
+# Ruta rápida de serialización para listados grandes.
+# - Filas como tuplas (sin sqlite3.Row) y mapeo por índice de columna, calculado una vez por consulta.
+# - RespuestaJSON: orjson si está instalado; si no, json de la stdlib con el mismo formato compacto.
+#   Los endpoints que devuelven RespuestaJSON directamente se saltan el jsonable_encoder de FastAPI.
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.responses import JSONResponse
+
+try:  # opcional
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None  # type: ignore
+
+
+def _default(o: Any) -> Any:
+    if isinstance(o, (date, datetime)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, bytes):
+        return o.decode("utf-8", "replace")
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f"Tipo no serializable a JSON: {type(o).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                      default=_default).encode("utf-8")
+
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse con orjson (o stdlib como respaldo)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# ------------------ filas por índice ------------------
+
+def consultar(conn, sql: str, params: Sequence[Any] = ()) -> Tuple[List[str], List[tuple]]:
+    """Ejecuta y devuelve (nombres de columna, filas como tuplas) sin construir sqlite3.Row."""
+    cur = conn.execute(sql, params)
+    cur.row_factory = None  # se aplica al leer: las filas llegan como tuplas
+    filas = cur.fetchall()
+    return [d[0] for d in (cur.description or ())], filas
+
+
+def como_dicts(conn, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+    """Equivalente a [{k: r[k] for k in r.keys()} ...] pero armado en C con zip()."""
+    nombres, filas = consultar(conn, sql, params)
+    return [dict(zip(nombres, f)) for f in filas]
+
+
+def mapeador(nombres: Sequence[str], campos: Sequence[Tuple[str, Optional[str], Optional[Callable[[Any], Any]]]]):
+    """
+    Precalcula, para una consulta, el índice de cada campo de salida:
+    campos = [(clave_salida, columna_origen | None, conversor | None), ...].
+    Devuelve f(fila) -> dict; columnas ausentes salen como None.
+    """
+    idx = {n: i for i, n in enumerate(nombres)}
+    plan = [(clave, idx.get(col) if col else None, conv) for clave, col, conv in campos]
+
+    def convertir(fila) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for clave, i, conv in plan:
+            v = None if i is None else fila[i]
+            out[clave] = conv(v) if (conv is not None and v is not None) else v
+        return out
+
+    return convertir
@@ -0,0 +1,185 @@
+# backend/app/shards.py
+# Directorio global de clientes y enrutamiento de peticiones del modo shards (DB_SHARDS, ver app.deps).
+# - Directorio (DB_DIRECTORIO_PATH; default '<base>_directorio.db' junto a DB_PATH): tabla 'clientes'
+#   (codigo, shard). El código de cada cliente nuevo se asigna aquí con BEGIN IMMEDIATE sobre este único
+#   archivo: el consecutivo es global aunque el cliente viva en cualquier shard.
+# - Shard de un cliente nuevo: la sucursal de la petición (cabecera X-Sucursal = nombre de un shard) o,
+#   sin ella, crc32 del código. Desde ahí manda el directorio: agregar shards no mueve a nadie.
+# - Adopción: la primera vez que se abre el directorio se registran los códigos que ya existen en cada
+#   shard (p.ej. toda la base de antes, que queda como primer shard).
+# - ShardMiddleware fija el shard de la petición por X-Sucursal, por el primer id numérico de la ruta
+#   (rango de ids, deps.shard_de_id) o por id_prestamo / id_cliente / cod_cli en la query. Sin ninguno la
+#   petición no tiene dueño: lo de un solo archivo va al primer shard y los listados recorren todos.
+# - Altas con el cliente en el cuerpo (POST /prestamos) eligen su shard en el endpoint con de_codigo().
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app import deps, metrics
+
+RUTA = (os.getenv("DB_DIRECTORIO_PATH") or "").strip()
+HEADER = "X-Sucursal"
+
+_QUERY_ID = ("id_prestamo", "prestamo_id", "id_cliente", "cliente_id")
+_QUERY_CODIGO = ("cod_cli", "codigo")
+
+_cache: Dict[Tuple[str, str], str] = {}  # (directorio, codigo) -> shard; un cliente no cambia de shard
+_adoptado: set = set()
+_lock = threading.Lock()
+
+
+def ruta() -> str:
+    if RUTA:
+        return RUTA
+    base, _ = os.path.splitext(os.path.abspath(deps.DB_PATH))
+    return f"{base}_directorio.db"
+
+
+# ------------------ directorio ------------------
+
+def _adoptar(d) -> None:
+    """Registra (una vez por directorio) los clientes que ya existen en cada shard."""
+    clave = ruta()
+    if clave in _adoptado:
+        return
+    with _lock:
+        if clave in _adoptado:
+            return
+        with deps.escritura(d):
+            if d.execute("SELECT 1 FROM adopcion LIMIT 1;").fetchone() is None:
+                ahora = datetime.now().isoformat(timespec="seconds")
+                for nombre in deps.SHARDS:
+                    with deps.en_shard(nombre), deps.get_conn() as conn:
+                        codigos = [r[0] for r in conn.execute("SELECT codigo FROM clientes WHERE codigo IS NOT NULL;")]
+                    d.executemany("INSERT OR IGNORE INTO clientes (codigo, shard, creado) VALUES (?, ?, ?);",
+                                  [(c, nombre, ahora) for c in codigos])
+                d.execute("INSERT INTO adopcion (fecha, shards) VALUES (?, ?);", (ahora, ",".join(deps.SHARDS)))
+        _adoptado.add(clave)
+
+
+@contextmanager
+def _directorio():
+    d = sqlite3.connect(ruta(), timeout=deps.BUSY_TIMEOUT_MS / 1000.0)
+    d.row_factory = sqlite3.Row
+    try:
+        d.execute("CREATE TABLE IF NOT EXISTS clientes (codigo TEXT PRIMARY KEY, shard TEXT NOT NULL, creado TEXT);")
+        d.execute("CREATE TABLE IF NOT EXISTS adopcion (fecha TEXT NOT NULL, shards TEXT NOT NULL);")
+        d.commit()
+        _adoptar(d)
+        yield d
+    finally:
+        d.close()
+
+
+def de_codigo(codigo: Optional[str]) -> Optional[str]:
+    """Shard del cliente 'codigo' (None sin shards o si el código no está en el directorio)."""
+    if not deps.SHARDS or not codigo or not str(codigo).strip():
+        return None
+    clave = (ruta(), str(codigo).strip())
+    shard = _cache.get(clave)
+    if shard is None:
+        with _directorio() as d:
+            row = d.execute("SELECT shard FROM clientes WHERE codigo=?;", (clave[1],)).fetchone()
+        if row is None:  # los códigos desconocidos no se cachean: pueden darse de alta después
+            return None
+        shard = _cache[clave] = row["shard"]
+    return shard
+
+
+def asignar_codigo(sucursal: Optional[str], generar: Callable[[Any], str]) -> Tuple[str, str]:
+    """
+    Siguiente código global (generar(conn) sobre la tabla 'clientes' del directorio, la misma regla de
+    consecutivo que una base sola) y shard del cliente nuevo. Queda registrado aunque el alta en el
+    shard falle después: ese código se salta, no se repite.
+    """
+    if sucursal is not None and sucursal not in deps.rutas():
+        raise HTTPException(status_code=422, detail=f"Sucursal desconocida: {sucursal}")
+    with _directorio() as d:
+        with deps.escritura(d):
+            codigo = generar(d)
+            shard = sucursal or deps.shard_por_hash(codigo)
+            d.execute("INSERT INTO clientes (codigo, shard, creado) VALUES (?, ?, ?);",
+                      (codigo, shard, datetime.now().isoformat(timespec="seconds")))
+    _cache[(ruta(), codigo)] = shard
+    return codigo, shard
+
+
+def siguiente_codigo(generar: Callable[[Any], str]) -> str:
+    """Vista previa del próximo código global (no lo reserva)."""
+    with _directorio() as d:
+        return generar(d)
+
+
+def estado() -> Dict[str, Any]:
+    if not deps.SHARDS:
+        return {"activo": False}
+    shards = []
+    for k, (nombre, archivo) in enumerate(deps.rutas().items()):
+        shards.append({"nombre": nombre, "ruta": archivo, "existe": os.path.exists(archivo),
+                       "bytes": os.path.getsize(archivo) if os.path.exists(archivo) else None,
+                       "ids_desde": k * deps.RANGO_IDS + 1})
+    with _directorio() as d:
+        por_shard = {r["shard"]: r["n"] for r in d.execute(
+            "SELECT shard, COUNT(*) AS n FROM clientes GROUP BY shard;")}
+    for s in shards:
+        s["clientes"] = por_shard.get(s["nombre"], 0)
+    return {"activo": True, "rango_ids": deps.RANGO_IDS, "hilos_dispersion": deps.HILOS_DISPERSION,
+            "directorio": ruta(), "shards": shards}
+
+
+# ------------------ enrutamiento ------------------
+
+async def _resolver(scope) -> Optional[str]:
+    sucursal = Headers(scope=scope).get(HEADER.lower())
+    if sucursal:
+        if sucursal not in deps.rutas():
+            raise HTTPException(status_code=422, detail=f"Sucursal desconocida: {sucursal}")
+        return sucursal
+    for parte in scope["path"].split("/"):
+        if parte.isdigit():
+            return deps.shard_de_id(int(parte))
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    for k in _QUERY_ID:
+        valor = (query.get(k) or [""])[0].strip()
+        if valor.isdigit():
+            return deps.shard_de_id(int(valor))
+    for k in _QUERY_CODIGO:
+        valor = (query.get(k) or [""])[0].strip()
+        if valor:
+            shard = _cache.get((ruta(), valor))
+            if shard is None:  # el directorio es un archivo: fuera del event loop
+                import anyio.to_thread
+
+                shard = await anyio.to_thread.run_sync(de_codigo, valor)
+            return shard
+    return None
+
+
+class ShardMiddleware:
+    """ASGI: fija el shard de la petición (deps.en_shard) antes de que nadie abra una conexión."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not deps.SHARDS:
+            await self.app(scope, receive, send)
+            return
+        try:
+            nombre = await _resolver(scope)
+        except HTTPException as e:
+            await JSONResponse(status_code=e.status_code, content={"detail": e.detail})(scope, receive, send)
+            return
+        metrics.DB_SHARD_PETICIONES.inc(nombre or "sin_dueno")
+        with deps.en_shard(nombre):
+            await self.app(scope, receive, send)
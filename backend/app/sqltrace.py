@@ -0,0 +1,295 @@
+# backend/app/sqltrace.py
+# Trazador SQL por petición (opcional) con detección de N+1.
+# - SQL_TRACE=off (default) | header (solo peticiones con 'X-SQL-Trace: 1') | all.
+# - Usa set_trace_callback (texto de cada sentencia, incluidas las de triggers) y
+#   set_progress_handler (pasos de la VM de SQLite como medida de trabajo) en las
+#   conexiones de get_conn; los tiempos salen de la conexión instrumentada de metrics.
+# - Agrupa por SQL normalizado (literales -> ?) y marca como N+1 las formas repetidas
+#   >= SQL_TRACE_N1_UMBRAL veces.
+# - Salida: cabeceras X-SQL-* en la respuesta y el detalle en GET /debug/sql/{id}.
+# - assert_query_budget / presupuesto_sql: helpers para pytest (presupuesto de sentencias).
+from __future__ import annotations
+
+import contextvars
+import itertools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+from app import metrics
+
+HEADER = "X-SQL-Trace"
+MODO = (os.getenv("SQL_TRACE", "off") or "off").strip().lower()
+N1_UMBRAL = int(os.getenv("SQL_TRACE_N1_UMBRAL", "5"))
+PASOS_VM = int(os.getenv("SQL_TRACE_PASOS_VM", "1000"))  # granularidad del progress handler
+BUFFER = int(os.getenv("SQL_TRACE_BUFFER", "50"))
+
+# Control de transacción: se repite por diseño en los lotes, no es N+1
+_CONTROL = ("BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+_RE_COMENTARIO = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_RE_CADENA = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_RE_PARAM = re.compile(r":\w+|\?\d*")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar(sql: str) -> str:
+    """Forma del SQL sin literales ni espacios redundantes (clave de agrupación)."""
+    s = sql.strip()
+    trigger = s.startswith("-- TRIGGER")
+    s = _RE_COMENTARIO.sub(" ", s) if not trigger else s
+    s = _RE_CADENA.sub("?", s)
+    s = _RE_NUMERO.sub("?", s)
+    s = _RE_PARAM.sub("?", s)
+    s = _RE_LISTA.sub("(?+)", s)
+    return _RE_ESPACIOS.sub(" ", s).strip().rstrip(";").strip()
+
+
+# ------------------ traza por petición ------------------
+
+class Traza:
+    _ids = itertools.count(1)
+
+    def __init__(self, etiqueta: str = ""):
+        self.id = next(Traza._ids)
+        self.etiqueta = etiqueta
+        self.inicio = time.time()
+        self.sentencias: List[Dict[str, Any]] = []
+        self._abierta: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    # --- callbacks de sqlite3 ---
+    def _on_trace(self, sql: str) -> None:
+        ahora = time.perf_counter()
+        with self._lock:
+            self._cerrar(ahora)
+            self._abierta = {"sql": sql, "t0": ahora, "ms": 0.0, "pasos_vm": 0}
+            self.sentencias.append(self._abierta)
+
+    def _on_progress(self) -> int:
+        e = self._abierta
+        if e is not None:
+            e["pasos_vm"] += PASOS_VM
+        return 0  # 0 = continuar
+
+    def _on_fin(self, sql: str, segundos: float) -> None:
+        with self._lock:
+            self._cerrar(time.perf_counter())
+
+    def _cerrar(self, ahora: float) -> None:
+        e = self._abierta
+        if e is not None:
+            e["ms"] = round((ahora - e.pop("t0")) * 1000, 3)
+            self._abierta = None
+
+    def instalar(self, conn) -> None:
+        conn.set_trace_callback(self._on_trace)
+        if PASOS_VM > 0:
+            conn.set_progress_handler(self._on_progress, PASOS_VM)
+
+    # --- resultados ---
+    def grupos(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._cerrar(time.perf_counter())
+            sentencias = list(self.sentencias)
+        g: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for e in sentencias:
+            forma = normalizar(e["sql"])
+            d = g.get(forma)
+            if d is None:
+                d = g[forma] = {"sql": forma, "veces": 0, "ms": 0.0, "pasos_vm": 0, "ejemplo": e["sql"][:500]}
+            d["veces"] += 1
+            d["ms"] += e["ms"]
+            d["pasos_vm"] += e["pasos_vm"]
+        for d in g.values():
+            d["ms"] = round(d["ms"], 3)
+            d["n_mas_1"] = d["veces"] >= N1_UMBRAL and not d["sql"].upper().startswith(_CONTROL)
+        return sorted(g.values(), key=lambda d: (-d["veces"], -d["ms"]))
+
+    def resumen(self) -> Dict[str, Any]:
+        grupos = self.grupos()
+        return {
+            "id": self.id,
+            "etiqueta": self.etiqueta,
+            "inicio": self.inicio,
+            "sentencias": len(self.sentencias),
+            "formas": len(grupos),
+            "ms": round(sum(d["ms"] for d in grupos), 3),
+            "n_mas_1": [d["sql"] for d in grupos if d["n_mas_1"]],
+            "grupos": grupos,
+        }
+
+
+_traza_ctx: contextvars.ContextVar[Optional[Traza]] = contextvars.ContextVar("sql_traza", default=None)
+_recientes: Deque[Dict[str, Any]] = deque(maxlen=max(BUFFER, 1))
+_recientes_lock = threading.Lock()
+
+
+def traza_actual() -> Optional[Traza]:
+    return _traza_ctx.get()
+
+
+def instalar(conn) -> None:
+    """Llamado por get_conn: engancha la conexión a la traza activa (si la hay)."""
+    t = _traza_ctx.get()
+    if t is not None:
+        t.instalar(conn)
+
+
+def _iniciar(etiqueta: str):
+    traza = Traza(etiqueta)
+    tokens = [_traza_ctx.set(traza)]
+    stats = metrics.stats_actuales()
+    if stats is None:  # fuera del middleware de métricas (p.ej. llamada directa en un test)
+        stats = metrics.EstadisticasSQL()
+        tokens.append(metrics._stats_ctx.set(stats))
+    stats.oyentes.append(traza._on_fin)
+    return traza, tokens, stats
+
+
+def _restaurar(tokens) -> None:
+    # Debe llamarse en el mismo contexto que _iniciar (no desde el callback 'send')
+    _traza_ctx.reset(tokens[0])
+    if len(tokens) > 1:
+        metrics._stats_ctx.reset(tokens[1])
+
+
+def _terminar(traza: Traza, stats) -> Dict[str, Any]:
+    try:
+        stats.oyentes.remove(traza._on_fin)
+    except ValueError:
+        pass
+    res = traza.resumen()
+    with _recientes_lock:
+        _recientes.append(res)
+    return res
+
+
+def recientes() -> List[Dict[str, Any]]:
+    with _recientes_lock:
+        return [{k: v for k, v in r.items() if k != "grupos"} for r in reversed(_recientes)]
+
+
+def obtener(traza_id: int) -> Optional[Dict[str, Any]]:
+    with _recientes_lock:
+        for r in _recientes:
+            if r["id"] == traza_id:
+                return r
+    return None
+
+
+# ------------------ middleware ------------------
+
+def _activo(scope) -> bool:
+    if MODO == "all":
+        return True
+    if MODO != "header":
+        return False
+    for k, v in scope.get("headers") or []:
+        if k.decode("latin-1").lower() == HEADER.lower():
+            return v.decode("latin-1").strip().lower() in {"1", "true", "on", "yes", "y"}
+    return False
+
+
+class SqlTraceMiddleware:
+    """Middleware ASGI: traza la petición si corresponde y agrega cabeceras X-SQL-*."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _activo(scope):
+            return await self.app(scope, receive, send)
+
+        traza, tokens, stats = _iniciar(f"{scope.get('method')} {scope.get('path')}")
+        terminado: Dict[str, Any] = {}
+
+        async def _send(msg):
+            if msg["type"] == "http.response.start" and not terminado:
+                terminado.update(_terminar(traza, stats))
+                headers = list(msg.get("headers") or [])
+                headers += [
+                    (b"x-sql-trace-id", str(terminado["id"]).encode()),
+                    (b"x-sql-count", str(terminado["sentencias"]).encode()),
+                    (b"x-sql-time-ms", str(terminado["ms"]).encode()),
+                    (b"x-sql-n1", str(len(terminado["n_mas_1"])).encode()),
+                ]
+                msg = {**msg, "headers": headers}
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            if not terminado:
+                _terminar(traza, stats)
+            _restaurar(tokens)
+
+
+# ------------------ helpers para pytest ------------------
+
+def _fallo(res: Dict[str, Any], motivo: str) -> AssertionError:
+    lineas = [f"{motivo} ({res['etiqueta'] or 'bloque'})"]
+    for d in res["grupos"][:15]:
+        marca = " [N+1]" if d["n_mas_1"] else ""
+        lineas.append(f"  {d['veces']:>4}x {d['ms']:>8.2f} ms  {d['sql'][:160]}{marca}")
+    return AssertionError("\n".join(lineas))
+
+
+def _verificar(res: Dict[str, Any], max_sentencias: Optional[int], permitir_n1: bool) -> None:
+    if max_sentencias is not None and res["sentencias"] > max_sentencias:
+        raise _fallo(res, f"Presupuesto SQL excedido: {res['sentencias']} > {max_sentencias} sentencias")
+    if not permitir_n1 and res["n_mas_1"]:
+        raise _fallo(res, f"Patrón N+1 detectado ({len(res['n_mas_1'])} forma(s) repetidas >= {N1_UMBRAL})")
+
+
+@contextmanager
+def presupuesto_sql(max_sentencias: Optional[int] = None, permitir_n1: bool = False, etiqueta: str = "", conn=None):
+    """
+    Traza las sentencias ejecutadas en el bloque (mismo hilo) y falla si excede el presupuesto.
+    Las conexiones abiertas con get_conn dentro del bloque se trazan solas; una conexión ya
+    abierta se pasa en 'conn':
+
+        with get_conn() as conn, presupuesto_sql(5, conn=conn):
+            _build_recordatorios(conn, 1)
+    """
+    traza, tokens, stats = _iniciar(etiqueta)
+    if conn is not None:
+        traza.instalar(conn)
+    try:
+        yield traza
+    finally:
+        if conn is not None:
+            conn.set_trace_callback(None)
+            conn.set_progress_handler(None, 0)
+        res = _terminar(traza, stats)
+        _restaurar(tokens)
+    _verificar(res, max_sentencias, permitir_n1)
+
+
+def assert_query_budget(client, method: str, url: str, max_sentencias: int, permitir_n1: bool = False, **kwargs):
+    """
+    Hace la petición con un TestClient trazándola y verifica el presupuesto de sentencias:
+
+        assert_query_budget(client, "GET", "/cuotas/resumen-prestamos", 15)
+    """
+    global MODO
+    previo = MODO
+    if MODO == "off":
+        MODO = "header"
+    try:
+        headers = {**(kwargs.pop("headers", None) or {}), HEADER: "1"}
+        resp = client.request(method, url, headers=headers, **kwargs)
+    finally:
+        MODO = previo
+    res = obtener(int(resp.headers["x-sql-trace-id"]))
+    if res is None:  # expulsado del buffer: solo se valida el conteo
+        res = {"etiqueta": f"{method} {url}", "sentencias": int(resp.headers["x-sql-count"]),
+               "n_mas_1": [], "grupos": []}
+    _verificar(res, max_sentencias, permitir_n1)
+    return resp
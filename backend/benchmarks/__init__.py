@@ -0,0 +1,2 @@
+# backend/benchmarks/__init__.py
+# Suite de benchmarks reproducibles (ver benchmarks/ejecutar.py).
@@ -0,0 +1,156 @@
+# backend/benchmarks/admision.py
+# Control de admisión (app.admision) más allá de la saturación: mezcla cargada de escrituras contra
+# uvicorn (proceso aparte; sus hilos compiten por el escritor de SQLite), con el control apagado
+# (ADMISION=off) y encendido.
+#
+#   cd backend
+#   python -m benchmarks.admision                                  # niveles 4,16,64,128
+#   python -m benchmarks.admision --niveles 8,32,128 --duracion 10 --espera-ms 500 --salida admision.json
+#
+# - Por modo y nivel (servidor y base frescos en cada uno): p50/p99 de lecturas y escrituras admitidas
+#   vistas por el cliente, p99 del lado del servidor (histograma http_request_duration_seconds de
+#   /metrics, cota superior del bucket), rechazos 503 (con Retry-After) y errores de lock de SQLite.
+# - Esperado: sin control, el p99 del servidor crece con la concurrencia (hilos esperando el lock de
+#   escritura, lecturas sin hilo libre); con control queda acotado por ADMISION_ESPERA_MS + el tiempo
+#   de servicio y el exceso sale rápido como 503.
+# - El generador de carga corre en este proceso: con pocos núcleos compite por CPU con el servidor y
+#   la latencia del lado del cliente incluye esa espera; la del servidor es la que mide el control.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from benchmarks import carga, generador
+from benchmarks.ejecutar import _meta, _percentil
+from benchmarks.escalado import _detener, _esperar_listo, _levantar
+from benchmarks.escenarios import cargar_contexto
+
+MEZCLA = {"listar": 10, "detalle": 20, "pago": 30, "abono": 25, "crear": 15}
+_CUBETA = re.compile(r'^http_request_duration_seconds_bucket\{method="(\w+)",route="[^"]*",le="([^"]+)"\} (\S+)$')
+
+
+def _resumen(reg: "carga.Registro", clase: str) -> Dict[str, Any]:
+    """p50/p99 de las llamadas de una clase ('GET' lecturas, 'POST' escrituras) y conteos por status."""
+    todas = sorted(x for k, v in reg.latencias.items() if k.startswith(clase) for x in v)
+    ok = sorted(x for k, v in reg.exitosas.items() if k.startswith(clase) for x in v)
+    status: Dict[str, int] = {}
+    for k, st in reg.status.items():
+        if k.startswith(clase):
+            for s, n in st.items():
+                status[s] = status.get(s, 0) + n
+    total = len(todas)
+    return {
+        "n": total,
+        "admitidas_p50": round(_percentil(ok, 50), 2) if ok else None,
+        "admitidas_p99": round(_percentil(ok, 99), 2) if ok else None,
+        "todas_p99": round(_percentil(todas, 99), 2) if todas else None,
+        "rechazos_503": status.get("503", 0),
+        "tasa_503": round(status.get("503", 0) / total, 4) if total else 0.0,
+        "status": status,
+    }
+
+
+def _p99_servidor(url: str) -> Dict[str, Optional[float]]:
+    """p99 (ms, cota superior del bucket) por método desde el histograma de latencia HTTP del servidor."""
+    import httpx
+
+    texto = httpx.get(f"{url}/metrics", timeout=30.0).text
+    cubetas: Dict[str, Dict[float, float]] = {}
+    for linea in texto.splitlines():
+        m = _CUBETA.match(linea)
+        if m:
+            por_le = cubetas.setdefault(m.group(1), {})
+            le = float("inf") if m.group(2) == "+Inf" else float(m.group(2))
+            por_le[le] = por_le.get(le, 0.0) + float(m.group(3))
+    out: Dict[str, Optional[float]] = {}
+    for metodo, por_le in cubetas.items():
+        total = por_le.get(float("inf"), 0.0)
+        cota = next((le for le in sorted(por_le) if total and por_le[le] >= 0.99 * total), None)
+        out[metodo] = None if cota is None else (cota * 1000.0 if cota != float("inf") else float("inf"))
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark del control de admisión de escrituras")
+    ap.add_argument("--niveles", default="4,16,64,128", help="Concurrencias a probar")
+    ap.add_argument("--espera-ms", type=int, help="ADMISION_ESPERA_MS del servidor (default: el de la app)")
+    ap.add_argument("--escrituras-max", type=int, help="ADMISION_ESCRITURAS_MAX del servidor")
+    ap.add_argument("--duracion", type=float, default=8.0, help="Segundos por nivel")
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    generador.agregar_argumentos(ap)
+    args = ap.parse_args(argv)
+    niveles = [int(x) for x in args.niveles.split(",") if x.strip()]
+    args.iteraciones, args.calentamiento = None, None
+
+    from app import admision
+
+    trabajo = tempfile.mkdtemp(prefix="admision_")
+    params = generador._args_a_parametros(args)
+    base = os.path.join(trabajo, "base.db")
+    resultado: Dict[str, Any] = {
+        "meta": {**_meta(args), "mezcla": MEZCLA, "duracion_s": args.duracion,
+                 "admision": {"espera_max_ms": round(admision.ESPERA_S * 1000.0),
+                              "escrituras_max": admision.ESCRITURAS_MAX, "lecturas_max": admision.LECTURAS_MAX}},
+        "cartera": generador.generar(base, params),
+        "modos": {},
+    }
+    previo = {k: os.environ.get(k) for k in ("ADMISION", "ADMISION_ESPERA_MS", "ADMISION_ESCRITURAS_MAX")}
+    if args.espera_ms is not None:
+        os.environ["ADMISION_ESPERA_MS"] = str(args.espera_ms)
+        resultado["meta"]["admision"]["espera_max_ms"] = args.espera_ms
+    if args.escrituras_max is not None:
+        os.environ["ADMISION_ESCRITURAS_MAX"] = str(args.escrituras_max)
+        resultado["meta"]["admision"]["escrituras_max"] = args.escrituras_max
+    try:
+        for modo, valor in (("sin_control", "off"), ("con_control", "on")):
+            os.environ["ADMISION"] = valor
+            filas = resultado["modos"][modo] = []
+            for n in niveles:
+                destino = os.path.join(trabajo, f"{modo}_{n}.db")
+                shutil.copyfile(base, destino)
+                pools = carga.Pools(cargar_contexto(None, destino, params.variante))
+                puerto = carga._puerto_libre()
+                url = f"http://127.0.0.1:{puerto}"
+                procs = _levantar(destino, 1, puerto, None)  # un worker: /metrics es de todo el servidor
+                try:
+                    _esperar_listo("127.0.0.1", puerto)
+                    reg = carga.Registro()
+                    r = asyncio.run(carga._nivel(url, n, args.duracion, MEZCLA, pools, n, reg))
+                    servidor = _p99_servidor(url)
+                finally:
+                    _detener(procs)
+                fila = {"concurrencia": n, "req_s": r["req_s"], "sqlite_busy": r["sqlite_busy"],
+                        "lecturas": _resumen(reg, "GET"), "escrituras": _resumen(reg, "POST")}
+                fila["lecturas"]["servidor_p99"] = servidor.get("GET")
+                fila["escrituras"]["servidor_p99"] = servidor.get("POST")
+                filas.append(fila)
+                le, es = fila["lecturas"], fila["escrituras"]
+                print(f"[{modo:<11}] c={n:>4}  {r['req_s']:>7} req/s  p99 servidor: lect={le['servidor_p99']} "
+                      f"esc={es['servidor_p99']} ms  cliente: lect={le['admitidas_p99']} esc={es['admitidas_p99']} ms  "
+                      f"503={es['tasa_503']:.1%}  busy={r['sqlite_busy']}", file=sys.stderr)
+    finally:
+        for k, v in previo.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# backend/benchmarks/archivo.py
+# Efecto del archivo histórico (app.archivo) sobre las lecturas de la cartera activa.
+#
+#   cd backend
+#   python -m benchmarks.archivo                                    # 90% de la cartera archivada
+#   python -m benchmarks.archivo --clientes 5000 --proporcion 0.9 --salida archivo.json
+#
+# - Genera una cartera sintética y cierra la fracción --proporcion de los préstamos (todas las cuotas
+#   PAGADAS, sin capital pendiente), como una cartera con muchos años de historia.
+# - Mide los endpoints con todo en la base caliente, archiva los préstamos cerrados y vuelve a medir:
+#   cartera activa (solo base caliente) y con historial=true (base caliente + archivo, fusionados).
+# - Reporta p50/p95 por fase, aceleración, filas y tamaño de cada base y la duración del archivado.
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks import generador
+from benchmarks.ejecutar import _meta, _percentil
+
+# Igual que benchmarks.ejecutar: sin correo ni tareas en segundo plano
+for _k, _v in {"MAIL_SEND_ON_CREATE": "off", "EMAIL_ON_LOAN_CREATED": "off", "MORA_REFRESH_AUTO": "off",
+               "SMTP_HOST": "", "SQL_TRACE": "off", "REPLICA_AUTO": "off"}.items():
+    os.environ[_k] = _v
+
+
+def _cerrar_prestamos(db: str, proporcion: float, semilla: int) -> Dict[str, Any]:
+    """
+    Marca como pagados (cuotas y capital) la fracción pedida de préstamos. Devuelve la fecha de corte.
+    Corre después de que la app abrió la base: las migraciones ya dejaron los nombres canónicos.
+    """
+    conn = sqlite3.connect(db)
+    try:
+        ids = [r[0] for r in conn.execute("SELECT id FROM prestamos ORDER BY id;")]
+        elegidos = random.Random(semilla).sample(ids, int(len(ids) * proporcion))
+        conn.executemany(
+            "UPDATE cuotas SET estado='PAGADO', fecha_pago=COALESCE(fecha_pago, fecha_vencimiento), dias_mora=0 "
+            "WHERE id_prestamo=?;", [(i,) for i in elegidos])
+        conn.executemany(
+            "UPDATE prestamos SET estado='PAGADO', capital_abonado=COALESCE(importe_credito, 0), "
+            "capital_pendiente=0 WHERE id=?;", [(i,) for i in elegidos])
+        ultima = conn.execute(
+            "SELECT MAX(MAX(date(fecha_vencimiento)), MAX(COALESCE(date(fecha_pago), ''))) FROM cuotas;").fetchone()[0]
+        conn.commit()
+    finally:
+        conn.close()
+    # Corte posterior a todo movimiento: se archivan exactamente los préstamos cerrados
+    return {"cerrados": len(elegidos), "total": len(ids),
+            "corte": date.fromisoformat(ultima) + timedelta(days=1)}
+
+
+def _medir(fn: Callable[[], Any], iteraciones: int, calentamiento: int) -> Dict[str, Any]:
+    for _ in range(calentamiento):
+        fn()
+    tiempos: List[float] = []
+    filas = None
+    for _ in range(iteraciones):
+        t0 = time.perf_counter()
+        r = fn()
+        tiempos.append((time.perf_counter() - t0) * 1000.0)
+        if r.status_code >= 400:
+            raise RuntimeError(f"{r.status_code}: {r.text[:200]}")
+        filas = len(r.json())
+    ordenados = sorted(tiempos)
+    return {"p50": round(_percentil(ordenados, 50), 2), "p95": round(_percentil(ordenados, 95), 2),
+            "min": round(ordenados[0], 2), "filas": filas}
+
+
+def _tamanos(db: str) -> Dict[str, Any]:
+    conn = sqlite3.connect(db)
+    try:
+        filas = {t: conn.execute(f"SELECT COUNT(*) FROM {t};").fetchone()[0]
+                 for t in ("prestamos", "cuotas", "abonos_capital")}
+    finally:
+        conn.close()
+    return {"bytes": os.path.getsize(db), "filas": filas}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de lecturas con cartera archivada")
+    ap.add_argument("--proporcion", type=float, default=0.9, help="Fracción de préstamos cerrados y archivados")
+    ap.add_argument("--iteraciones", type=int, default=15)
+    ap.add_argument("--calentamiento", type=int, default=2)
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    ap.add_argument("--conservar", action="store_true", help="No borrar las bases generadas")
+    generador.agregar_argumentos(ap)
+    args = ap.parse_args(argv)
+
+    from fastapi.testclient import TestClient
+    from app import archivo, deps
+    from app.main import app
+
+    trabajo = tempfile.mkdtemp(prefix="archivo_")
+    params = generador._args_a_parametros(args)
+    db = os.path.join(trabajo, "base.db")
+    previo = deps.DB_PATH
+    resultado: Dict[str, Any] = {"meta": _meta(args), "cartera": generador.generar(db, params), "fases": {}}
+    try:
+        deps.DB_PATH = db
+        cliente = TestClient(app, raise_server_exceptions=False)
+        cliente.get("/cuotas/resumen-prestamos")  # migraciones y conexiones fuera de la medición
+        cierre = _cerrar_prestamos(db, args.proporcion, params.semilla)
+        resultado["cerrados"] = {"prestamos": cierre["cerrados"], "de": cierre["total"]}
+
+        rutas = {
+            "resumen_prestamos": lambda: cliente.get("/cuotas/resumen-prestamos"),
+            "resumen_prestamos_historial": lambda: cliente.get("/cuotas/resumen-prestamos",
+                                                               params={"historial": "true"}),
+            "cuotas_vencidas": lambda: cliente.get("/cuotas", params={"vencidas": "true"}),
+        }
+
+        def fase(nombre: str) -> None:
+            res = {k: _medir(fn, args.iteraciones, args.calentamiento) for k, fn in rutas.items()}
+            resultado["fases"][nombre] = res
+            for k, r in res.items():
+                print(f"[{nombre:<9}] {k:<30} p50={r['p50']:>9} ms  p95={r['p95']:>9} ms  filas={r['filas']}",
+                      file=sys.stderr)
+
+        resultado["antes"] = _tamanos(db)
+        fase("sin_archivo")
+
+        t0 = time.perf_counter()
+        job = archivo.archivar(corte=cierre["corte"])
+        job["segundos"] = round(time.perf_counter() - t0, 3)
+        resultado["archivado"] = job
+        conn = sqlite3.connect(db)
+        conn.execute("VACUUM;")  # el espacio liberado vuelve al sistema; sin esto la base no se achica
+        conn.close()
+        resultado["despues"] = {"caliente": _tamanos(db), "archivo": _tamanos(archivo.ruta())}
+        print(f"archivados {job['prestamos']} préstamos / {job['cuotas']} cuotas en {job['segundos']}s",
+              file=sys.stderr)
+        fase("archivado")
+
+        resultado["aceleracion_p50"] = {
+            k: round(resultado["fases"]["sin_archivo"][k]["p50"] / max(resultado["fases"]["archivado"][k]["p50"], 1e-6), 2)
+            for k in rutas
+        }
+    finally:
+        deps.DB_PATH = previo
+        if not args.conservar:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2, default=str)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
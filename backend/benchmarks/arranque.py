@@ -0,0 +1,252 @@
+# backend/benchmarks/arranque.py
+# Tiempo de arranque de la app (reinicios de workers / arranques en frío).
+#
+#   cd backend
+#   python -m benchmarks.arranque                                  # tabla -X importtime + arranque
+#   python -m benchmarks.arranque --repeticiones 15 --salida arranque.json
+#   python -m benchmarks.arranque --comparar arranque.json --umbral 0.2 --fallar
+#
+# - Perfil de importación: 'python -X importtime -c "import app.main"' parseado a tabla
+#   (top por tiempo acumulado o propio, y resumen por paquete de primer nivel).
+#   Con varias repeticiones se toma el mínimo por módulo (menos ruido de disco/caché).
+# - Arranque: N procesos nuevos; cada uno mide import de app.main, eventos startup/shutdown
+#   y el tiempo total del proceso. Se reportan p50/p95/min.
+# - Subsistemas diferidos: correo (smtplib, email.mime, app.notifications) y PDF (reportlab)
+#   NO deben quedar cargados tras el arranque; si aparecen cuenta como regresión.
+# - La app corre sobre una cartera temporal (benchmarks.generador) ya migrada, como un reinicio de
+#   worker: el startup migra y arranca los planificadores, y no debe tocar backend/data ni la base real.
+# - --comparar marca regresión si el p50 de import o de proceso crece más que --umbral
+#   (y más de --min-ms); --presupuesto-ms fija además un techo absoluto para el import.
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks import generador
+from benchmarks.ejecutar import _meta, _percentil
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+
+# Módulos que la app carga en el primer uso y no al arrancar
+DIFERIDOS = ("smtplib", "email.mime", "app.notifications", "reportlab")
+
+# Igual que benchmarks.ejecutar: sin correo ni tareas en segundo plano (DB_PATH lo fija main)
+ENTORNO = {"MAIL_SEND_ON_CREATE": "off", "EMAIL_ON_LOAN_CREATED": "off", "MORA_REFRESH_AUTO": "off",
+           "SMTP_HOST": "", "SQL_TRACE": "off", "REPLICA_AUTO": "off", "BACKUP_AUTO": "off",
+           "ARCHIVO_AUTO": "off", "DB_SHARDS": "", "DB_ESCRITOR_SOCKET": ""}
+
+_LINEA = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+_SONDA = """
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+from {objetivo} import app
+t1 = time.perf_counter()
+asyncio.run(app.router.startup())
+t2 = time.perf_counter()
+asyncio.run(app.router.shutdown())
+diferidos = {diferidos!r}
+print(json.dumps({{
+    "import_ms": (t1 - t0) * 1000.0,
+    "startup_ms": (t2 - t1) * 1000.0,
+    "modulos": len(sys.modules),
+    "cargados": [m for m in diferidos if m in sys.modules],
+}}))
+"""
+
+
+def _entorno() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(ENTORNO)
+    env["PYTHONPATH"] = RAIZ + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    return env
+
+
+def preparar_base(directorio: str, clientes: int = 50) -> str:
+    """Cartera sintética chica y ya migrada: cada sonda arranca como un reinicio, sin migrar."""
+    from app import deps, migraciones
+
+    ruta = os.path.join(directorio, "arranque.db")
+    generador.generar(ruta, generador.Parametros(clientes=clientes))
+    previo, shards = deps.DB_PATH, deps.SHARDS_CONF
+    deps.cerrar_pool()
+    deps.DB_PATH = ruta
+    deps.configurar_shards("")
+    try:
+        migraciones.migrar()
+    finally:
+        deps.cerrar_pool()
+        deps.DB_PATH = previo
+        deps.configurar_shards(shards)
+    return ruta
+
+
+# ------------------ perfil de importación ------------------
+
+def parsear_importtime(texto: str) -> List[Dict[str, Any]]:
+    """Líneas 'import time: propio | acumulado | módulo' (µs) -> dicts con profundidad y paquete."""
+    filas = []
+    for linea in texto.splitlines():
+        m = _LINEA.match(linea)
+        if not m:
+            continue
+        propio, acumulado, sangria, modulo = m.groups()
+        filas.append({
+            "modulo": modulo,
+            "paquete": modulo.split(".")[0],
+            "profundidad": len(sangria) // 2,
+            "propio_ms": int(propio) / 1000.0,
+            "acumulado_ms": int(acumulado) / 1000.0,
+        })
+    return filas
+
+
+def perfil_importacion(objetivo: str = "app.main", repeticiones: int = 1) -> List[Dict[str, Any]]:
+    """Corre -X importtime en procesos nuevos; mínimo por módulo entre repeticiones."""
+    mejor: Dict[str, Dict[str, Any]] = {}
+    for _ in range(max(1, repeticiones)):
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {objetivo}"],
+                             capture_output=True, text=True, cwd=RAIZ, env=_entorno(), timeout=120)
+        if res.returncode != 0:
+            raise RuntimeError(f"import de {objetivo} falló:\n{res.stderr[-2000:]}")
+        for f in parsear_importtime(res.stderr):
+            previo = mejor.get(f["modulo"])
+            if previo is None or f["acumulado_ms"] < previo["acumulado_ms"]:
+                mejor[f["modulo"]] = f
+    return list(mejor.values())
+
+
+def por_paquete(filas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Suma del tiempo propio por paquete de primer nivel (quién paga el arranque)."""
+    acum: Dict[str, Dict[str, Any]] = {}
+    for f in filas:
+        a = acum.setdefault(f["paquete"], {"paquete": f["paquete"], "propio_ms": 0.0, "modulos": 0})
+        a["propio_ms"] += f["propio_ms"]
+        a["modulos"] += 1
+    return sorted(acum.values(), key=lambda a: a["propio_ms"], reverse=True)
+
+
+def tabla(filas: List[Dict[str, Any]], top: int = 25, orden: str = "acumulado") -> str:
+    clave = "acumulado_ms" if orden == "acumulado" else "propio_ms"
+    ordenadas = sorted(filas, key=lambda f: f[clave], reverse=True)[:top]
+    ancho = max([len(f["modulo"]) for f in ordenadas] + [6])
+    lineas = [f"{'módulo':<{ancho}}  {'propio ms':>10}  {'acum. ms':>10}",
+              f"{'-' * ancho}  {'-' * 10}  {'-' * 10}"]
+    for f in ordenadas:
+        lineas.append(f"{f['modulo']:<{ancho}}  {f['propio_ms']:>10.2f}  {f['acumulado_ms']:>10.2f}")
+    paquetes = por_paquete(filas)[:top]
+    ancho_p = max([len(p["paquete"]) for p in paquetes] + [7])
+    lineas += ["", f"{'paquete':<{ancho_p}}  {'propio ms':>10}  {'módulos':>8}",
+               f"{'-' * ancho_p}  {'-' * 10}  {'-' * 8}"]
+    for p in paquetes:
+        lineas.append(f"{p['paquete']:<{ancho_p}}  {p['propio_ms']:>10.2f}  {p['modulos']:>8}")
+    return "\n".join(lineas)
+
+
+# ------------------ arranque ------------------
+
+def medir_arranque(objetivo: str = "app.main", repeticiones: int = 10) -> Dict[str, Any]:
+    sonda = _SONDA.format(objetivo=objetivo, diferidos=DIFERIDOS)
+    muestras: List[Dict[str, Any]] = []
+    for _ in range(max(1, repeticiones)):
+        t0 = time.perf_counter()
+        res = subprocess.run([sys.executable, "-c", sonda], capture_output=True, text=True,
+                             cwd=RAIZ, env=_entorno(), timeout=120)
+        total = (time.perf_counter() - t0) * 1000.0
+        if res.returncode != 0:
+            raise RuntimeError(f"arranque de {objetivo} falló:\n{res.stderr[-2000:]}")
+        m = json.loads(res.stdout.strip().splitlines()[-1])
+        m["proceso_ms"] = total
+        muestras.append(m)
+
+    def resumen(clave: str) -> Dict[str, float]:
+        v = sorted(m[clave] for m in muestras)
+        return {"p50": round(_percentil(v, 50), 2), "p95": round(_percentil(v, 95), 2), "min": round(v[0], 2)}
+
+    return {
+        "repeticiones": len(muestras),
+        "import_ms": resumen("import_ms"),
+        "startup_ms": resumen("startup_ms"),
+        "proceso_ms": resumen("proceso_ms"),
+        "modulos": muestras[-1]["modulos"],
+        "diferidos_cargados": sorted({x for m in muestras for x in m["cargados"]}),
+    }
+
+
+def comparar(nuevo: Dict[str, Any], base: Optional[Dict[str, Any]], umbral: float, min_ms: float,
+             presupuesto_ms: Optional[float] = None) -> List[str]:
+    motivos = []
+    a = nuevo["arranque"]
+    if a["diferidos_cargados"]:
+        motivos.append(f"subsistemas diferidos cargados al arrancar: {', '.join(a['diferidos_cargados'])}")
+    if presupuesto_ms is not None and a["import_ms"]["p50"] > presupuesto_ms:
+        motivos.append(f"import p50 {a['import_ms']['p50']:.1f} ms > presupuesto {presupuesto_ms:.1f} ms")
+    if base:
+        b = base.get("arranque", {})
+        for clave in ("import_ms", "proceso_ms"):
+            p_new, p_old = a[clave]["p50"], (b.get(clave) or {}).get("p50")
+            if p_old and p_new / p_old > 1 + umbral and (p_new - p_old) > min_ms:
+                motivos.append(f"{clave} p50 {p_old:.1f} -> {p_new:.1f} ms (x{p_new / p_old:.2f})")
+    return motivos
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Perfil de importación y tiempo de arranque de la app")
+    ap.add_argument("--objetivo", default="app.main", help="Módulo que expone 'app'")
+    ap.add_argument("--repeticiones", type=int, default=10, help="Procesos nuevos para medir el arranque")
+    ap.add_argument("--repeticiones-perfil", dest="repeticiones_perfil", type=int, default=3)
+    ap.add_argument("--top", type=int, default=25)
+    ap.add_argument("--orden", choices=("acumulado", "propio"), default="acumulado")
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    ap.add_argument("--comparar", help="JSON de una corrida anterior")
+    ap.add_argument("--umbral", type=float, default=0.2, help="Regresión si el p50 crece más que esto (0.2 = 20%%)")
+    ap.add_argument("--min-ms", dest="min_ms", type=float, default=15.0, help="Ignora diferencias de p50 menores")
+    ap.add_argument("--presupuesto-ms", dest="presupuesto_ms", type=float, help="Techo absoluto para import p50")
+    ap.add_argument("--fallar", action="store_true", help="Código de salida 1 si hay regresiones")
+    args = ap.parse_args(argv)
+
+    trabajo = tempfile.mkdtemp(prefix="arranque_")
+    try:
+        ENTORNO["DB_PATH"] = preparar_base(trabajo)
+        filas = perfil_importacion(args.objetivo, args.repeticiones_perfil)
+        print(tabla(filas, args.top, args.orden), file=sys.stderr)
+        arranque = medir_arranque(args.objetivo, args.repeticiones)
+    finally:
+        shutil.rmtree(trabajo, ignore_errors=True)
+    print(f"\nimport p50={arranque['import_ms']['p50']} ms  startup p50={arranque['startup_ms']['p50']} ms  "
+          f"proceso p50={arranque['proceso_ms']['p50']} ms  módulos={arranque['modulos']}", file=sys.stderr)
+
+    meta = _meta(argparse.Namespace(iteraciones=args.repeticiones, calentamiento=0))
+    res: Dict[str, Any] = {
+        "meta": meta,
+        "arranque": arranque,
+        "paquetes": [{**p, "propio_ms": round(p["propio_ms"], 2)} for p in por_paquete(filas)],
+        "modulos": sorted(filas, key=lambda f: f["acumulado_ms"], reverse=True)[:args.top],
+    }
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            base = json.load(fh)
+    regresiones = comparar(res, base, args.umbral, args.min_ms, args.presupuesto_ms)
+    res["regresiones"] = regresiones
+    for r in regresiones:
+        print(f"REGRESIÓN arranque: {r}", file=sys.stderr)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(json.dumps(res, ensure_ascii=False, indent=2) + "\n")
+    if args.fallar and regresiones:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
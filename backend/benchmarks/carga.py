@@ -0,0 +1,275 @@
+# backend/benchmarks/carga.py
+# Prueba de carga: clientes asyncio (httpx) contra la app servida por uvicorn en este proceso,
+# reproduciendo la mezcla de llamadas de las pantallas de la app Flutter.
+#
+#   cd backend
+#   python -m benchmarks.carga --clientes 500 --niveles 1,4,16,64,256 --duracion 10 --salida carga.json
+#   python -m benchmarks.carga --url http://127.0.0.1:8000 --db /ruta/basedatos.db   # servidor externo
+#
+# Flujos (peso relativo configurable con --mezcla listar=40,detalle=30,...):
+#   listar  : GET /cuotas/resumen-prestamos + GET /cuotas/estado/resumen-prestamos?ids=<50>
+#   detalle : GET /cuotas/prestamo/{id}/resumen + GET /cuotas?id_prestamo={id} + GET /cuotas/estado/prestamo/{id}
+#   pago    : GET /cuotas?id_prestamo={id} y POST /cuotas/{primera PENDIENTE}/pago
+#   abono   : POST /cuotas/{id}/abono-capital
+#   crear   : POST /prestamos
+# Por nivel de concurrencia: throughput (req/s y flujos/s), p50/p95/p99 por llamada,
+# tasa de errores y errores "database is locked/busy" de SQLite.
+# Nota: cliente y servidor comparten el GIL en modo en-proceso; para cifras absolutas use --url.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks import generador
+from benchmarks.ejecutar import _meta, _percentil
+from benchmarks.escenarios import cargar_contexto
+
+for _k, _v in {"MAIL_SEND_ON_CREATE": "off", "EMAIL_ON_LOAN_CREATED": "off", "MORA_REFRESH_AUTO": "off",
+               "SMTP_HOST": "", "SQL_TRACE": "off"}.items():
+    os.environ[_k] = _v
+
+MEZCLA_DEFAULT = {"listar": 40, "detalle": 30, "pago": 12, "abono": 10, "crear": 8}
+MARCAS_BUSY = ("database is locked", "database is busy", "database table is locked")
+
+
+class Registro:
+    """Resultados de un nivel (lo comparten todos los clientes virtuales del mismo loop)."""
+
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = {}
+        self.exitosas: Dict[str, List[float]] = {}  # solo status < 400 (p.ej. sin los 503 de admisión)
+        self.status: Dict[str, Dict[str, int]] = {}
+        self.busy = 0
+        self.excepciones = 0
+        self.flujos = 0
+
+    def anotar(self, llamada: str, ms: float, status: int, cuerpo: bytes) -> None:
+        self.latencias.setdefault(llamada, []).append(ms)
+        if status < 400:
+            self.exitosas.setdefault(llamada, []).append(ms)
+        st = self.status.setdefault(llamada, {})
+        st[str(status)] = st.get(str(status), 0) + 1
+        if status >= 400 and any(m.encode() in cuerpo for m in MARCAS_BUSY):
+            self.busy += 1
+
+
+class Pools:
+    """Objetivos para los flujos; se toman rotando (compartidos entre clientes)."""
+
+    def __init__(self, ctx):
+        self.prestamos = ctx.prestamos or [1]
+        self.codigos = ctx.codigos or ["00001"]
+        self.abonables = ctx.cuotas_abonables or [1]
+        self._n = 0
+
+    def siguiente(self, pool: List[Any]) -> Any:
+        self._n += 1
+        return pool[self._n % len(pool)]
+
+
+async def _llamar(http, reg: Registro, llamada: str, metodo: str, url: str, **kw):
+    t0 = time.perf_counter()
+    try:
+        r = await http.request(metodo, url, **kw)
+    except Exception:
+        reg.excepciones += 1
+        reg.anotar(llamada, (time.perf_counter() - t0) * 1000.0, 599, b"")
+        return None
+    reg.anotar(llamada, (time.perf_counter() - t0) * 1000.0, r.status_code, r.content if r.status_code >= 400 else b"")
+    return r
+
+
+async def _flujo(nombre: str, http, reg: Registro, pools: Pools, rnd: random.Random) -> None:
+    if nombre == "listar":
+        await _llamar(http, reg, "GET /cuotas/resumen-prestamos", "GET", "/cuotas/resumen-prestamos")
+        base = rnd.randrange(len(pools.prestamos))
+        ids = ",".join(str(pools.prestamos[(base + k) % len(pools.prestamos)]) for k in range(50))
+        await _llamar(http, reg, "GET /cuotas/estado/resumen-prestamos", "GET", f"/cuotas/estado/resumen-prestamos?ids={ids}")
+    elif nombre == "detalle":
+        pid = rnd.choice(pools.prestamos)
+        await _llamar(http, reg, "GET /cuotas/prestamo/{id}/resumen", "GET", f"/cuotas/prestamo/{pid}/resumen")
+        await _llamar(http, reg, "GET /cuotas?id_prestamo", "GET", f"/cuotas?id_prestamo={pid}")
+        await _llamar(http, reg, "GET /cuotas/estado/prestamo/{id}", "GET", f"/cuotas/estado/prestamo/{pid}")
+    elif nombre == "pago":
+        pid = pools.siguiente(pools.prestamos)
+        r = await _llamar(http, reg, "GET /cuotas?id_prestamo", "GET", f"/cuotas?id_prestamo={pid}")
+        if r is not None and r.status_code == 200:
+            pend = sorted((c for c in r.json() if c.get("estado") == "PENDIENTE"), key=lambda c: c.get("numero") or 0)
+            if pend:
+                c = pend[0]
+                await _llamar(http, reg, "POST /cuotas/{id}/pago", "POST", f"/cuotas/{c['id']}/pago",
+                              json={"interes_pagado": float(c.get("interes_a_pagar") or 0)})
+    elif nombre == "abono":
+        await _llamar(http, reg, "POST /cuotas/{id}/abono-capital", "POST",
+                      f"/cuotas/{pools.siguiente(pools.abonables)}/abono-capital", json={"monto": 1.0})
+    elif nombre == "crear":
+        await _llamar(http, reg, "POST /prestamos", "POST", "/prestamos", json={
+            "cod_cli": pools.siguiente(pools.codigos), "monto": 1000, "tasa_interes": 5,
+            "modalidad": "Mensual", "num_cuotas": 12, "fecha_inicio": time.strftime("%Y-%m-%d"),
+        })
+    reg.flujos += 1
+
+
+async def _nivel(url: str, concurrencia: int, duracion: float, mezcla: Dict[str, int], pools: Pools,
+                 semilla: int, reg: Optional[Registro] = None) -> Dict[str, Any]:
+    import httpx
+
+    reg = reg if reg is not None else Registro()
+    nombres = list(mezcla)
+    pesos = [mezcla[n] for n in nombres]
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    fin = 0.0
+
+    async def cliente_virtual(k: int, http) -> None:
+        rnd = random.Random(semilla * 1000 + k)
+        while time.perf_counter() < fin:
+            await _flujo(rnd.choices(nombres, pesos)[0], http, reg, pools, rnd)
+
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60.0) as http:
+        t0 = time.perf_counter()
+        fin = t0 + duracion
+        await asyncio.gather(*(cliente_virtual(k, http) for k in range(concurrencia)))
+        transcurrido = time.perf_counter() - t0
+
+    todas = sorted(x for v in reg.latencias.values() for x in v)
+    total = len(todas)
+    errores = sum(n for st in reg.status.values() for s, n in st.items() if int(s) >= 400)
+    por_llamada = {}
+    for llamada, lat in sorted(reg.latencias.items()):
+        o = sorted(lat)
+        por_llamada[llamada] = {
+            "n": len(o),
+            "p50": round(_percentil(o, 50), 2), "p95": round(_percentil(o, 95), 2), "p99": round(_percentil(o, 99), 2),
+            "status": reg.status.get(llamada, {}),
+        }
+    return {
+        "concurrencia": concurrencia,
+        "segundos": round(transcurrido, 2),
+        "peticiones": total,
+        "flujos": reg.flujos,
+        "req_s": round(total / transcurrido, 1) if transcurrido else 0.0,
+        "flujos_s": round(reg.flujos / transcurrido, 1) if transcurrido else 0.0,
+        "ms": {"p50": round(_percentil(todas, 50), 2), "p95": round(_percentil(todas, 95), 2),
+               "p99": round(_percentil(todas, 99), 2)},
+        "errores": errores,
+        "tasa_error": round(errores / total, 4) if total else 0.0,
+        "sqlite_busy": reg.busy,
+        "excepciones_cliente": reg.excepciones,
+        "por_llamada": por_llamada,
+    }
+
+
+# ------------------ servidor en proceso ------------------
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServidorLocal:
+    def __init__(self, puerto: int):
+        import uvicorn
+        from app.main import app
+
+        cfg = uvicorn.Config(app, host="127.0.0.1", port=puerto, log_level="warning", access_log=False,
+                             lifespan="on", backlog=4096, limit_concurrency=None)
+        self.server = uvicorn.Server(cfg)
+        self.hilo = threading.Thread(target=self.server.run, name="uvicorn-carga", daemon=True)
+        self.url = f"http://127.0.0.1:{puerto}"
+
+    def __enter__(self):
+        self.hilo.start()
+        limite = time.time() + 15
+        while not self.server.started:
+            if time.time() > limite or not self.hilo.is_alive():
+                raise RuntimeError("uvicorn no arrancó")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.hilo.join(timeout=10)
+
+
+def _mezcla(texto: Optional[str]) -> Dict[str, int]:
+    if not texto:
+        return dict(MEZCLA_DEFAULT)
+    out = {}
+    for parte in texto.split(","):
+        k, _, v = parte.partition("=")
+        if k.strip() not in MEZCLA_DEFAULT:
+            raise SystemExit(f"flujo desconocido en --mezcla: {k!r} (válidos: {', '.join(MEZCLA_DEFAULT)})")
+        out[k.strip()] = int(v)
+    return {k: v for k, v in out.items() if v > 0}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Prueba de carga con mezcla de tráfico móvil")
+    ap.add_argument("--niveles", default="1,2,4,8,16,32,64,128,256", help="Concurrencias a probar")
+    ap.add_argument("--duracion", type=float, default=10.0, help="Segundos por nivel")
+    ap.add_argument("--mezcla", help="Pesos por flujo, p.ej. listar=40,detalle=30,pago=12,abono=10,crear=8")
+    ap.add_argument("--url", help="Servidor externo (no levanta uvicorn en proceso)")
+    ap.add_argument("--db", help="Con --url: base que usa ese servidor (para leer ids objetivo)")
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    generador.agregar_argumentos(ap)
+    args = ap.parse_args(argv)
+    niveles = [int(x) for x in args.niveles.split(",") if x.strip()]
+    mezcla = _mezcla(args.mezcla)
+    args.iteraciones, args.calentamiento = None, None
+
+    resultado: Dict[str, Any] = {"meta": {**_meta(args), "mezcla": mezcla, "duracion_s": args.duracion}, "niveles": []}
+    trabajo = tempfile.mkdtemp(prefix="carga_")
+    try:
+        if args.url:
+            if not args.db:
+                ap.error("--url requiere --db para elegir préstamos/cuotas objetivo")
+            pools = Pools(cargar_contexto(None, args.db, args.variante or "a"))
+            for n in niveles:
+                resultado["niveles"].append(asyncio.run(_nivel(args.url, n, args.duracion, mezcla, pools, n)))
+                _imprimir(resultado["niveles"][-1])
+        else:
+            from app import deps
+
+            params = generador._args_a_parametros(args)
+            base = os.path.join(trabajo, "base.db")
+            resultado["cartera"] = generador.generar(base, params)
+            with ServidorLocal(_puerto_libre()) as srv:
+                for n in niveles:
+                    # base fresca por nivel: los niveles son comparables entre sí
+                    destino = os.path.join(trabajo, f"nivel_{n}.db")
+                    shutil.copyfile(base, destino)
+                    deps.DB_PATH = destino
+                    pools = Pools(cargar_contexto(None, destino, params.variante))
+                    resultado["niveles"].append(asyncio.run(_nivel(srv.url, n, args.duracion, mezcla, pools, n)))
+                    _imprimir(resultado["niveles"][-1])
+    finally:
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+def _imprimir(r: Dict[str, Any]) -> None:
+    print(f"c={r['concurrencia']:>4}  {r['req_s']:>8} req/s  {r['flujos_s']:>7} flujos/s  "
+          f"p50={r['ms']['p50']:>8}  p95={r['ms']['p95']:>8}  p99={r['ms']['p99']:>8} ms  "
+          f"err={r['tasa_error']:.2%}  busy={r['sqlite_busy']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# backend/benchmarks/commit_agrupado.py
+# Posteos por segundo de pagos y abonos con y sin commit agrupado (app.agrupador).
+#
+#   cd backend
+#   python -m benchmarks.commit_agrupado                            # hilos 1,8,32; 2000 posteos por nivel
+#   python -m benchmarks.commit_agrupado --hilos 4,64 --posteos 5000 --ventana-ms 5 --salida agrupado.json
+#
+# - Llama a los endpoints (registrar_pago / registrar_abono_capital) desde N hilos, sin capa HTTP: se
+#   mide la escritura. Mezcla: 1 de cada 3 es el pago de la próxima cuota de un préstamo, el resto
+#   abonos de 1.0 a cuotas abonables.
+# - Por modo y nivel (base fresca en cada uno): posteos/s, commits y posteos por commit, p50/p99 por
+#   llamada y status de los rechazos de negocio (409/422, iguales en ambos modos).
+# - Cada commit es un fsync del WAL (synchronous=FULL por defecto): en disco local rápido o tmpfs la
+#   ganancia es menor que en discos giratorios o de red, donde el fsync domina; ahí la cifra que
+#   importa es posteos por commit.
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks import generador
+from benchmarks.ejecutar import _meta, _percentil
+from benchmarks.escenarios import cargar_contexto
+
+# Igual que benchmarks.ejecutar: sin correo ni tareas en segundo plano
+for _k, _v in {"MAIL_SEND_ON_CREATE": "off", "EMAIL_ON_LOAN_CREATED": "off", "MORA_REFRESH_AUTO": "off",
+               "SMTP_HOST": "", "SQL_TRACE": "off", "REPLICA_AUTO": "off"}.items():
+    os.environ[_k] = _v
+
+
+def _nivel(db: str, variante: str, hilos: int, posteos: int) -> Dict[str, Any]:
+    from fastapi import HTTPException
+    from app import agrupador, metrics
+    from app.routers import cuotas
+
+    ctx = cargar_contexto(None, db, variante)
+    proximas = list(ctx.proximas_cuotas)
+    abonables = ctx.cuotas_abonables or [1]
+    tiempos: List[float] = []
+    status: Dict[str, int] = {}
+    lock = threading.Lock()
+    siguiente = iter(range(posteos))
+
+    def posteo(i: int) -> None:
+        if i % 3 == 0 and i // 3 < len(proximas):  # cada préstamo paga su próxima cuota una sola vez
+            c = proximas[i // 3]
+            cuotas.registrar_pago(c["id"], cuotas.PagoInput(interes_pagado=float(c.get("interes_a_pagar") or 0)))
+        else:
+            cuotas.registrar_abono_capital(abonables[i % len(abonables)], cuotas.AbonoCapitalInput(monto=1.0))
+
+    def trabajador() -> None:
+        while True:
+            with lock:
+                i = next(siguiente, None)
+            if i is None:
+                return
+            t0 = time.perf_counter()
+            try:
+                posteo(i)
+                clave = "200"
+            except HTTPException as e:
+                clave = str(e.status_code)
+            except Exception as e:
+                clave = type(e).__name__
+            ms = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                tiempos.append(ms)
+                status[clave] = status.get(clave, 0) + 1
+
+    commits_previos = metrics.COMMIT_AGRUPADO_COMMITS.valor("ok")
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=trabajador) for _ in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    segundos = time.perf_counter() - t0
+    agrupador.detener()
+
+    # Sin agrupar, cada posteo (aceptado o rechazado) es su propia transacción
+    commits = (metrics.COMMIT_AGRUPADO_COMMITS.valor("ok") - commits_previos) if agrupador.ACTIVO else posteos
+    ordenados = sorted(tiempos)
+    return {
+        "hilos": hilos,
+        "posteos": posteos,
+        "segundos": round(segundos, 3),
+        "posteos_s": round(posteos / segundos, 1) if segundos else None,
+        "commits": int(commits),
+        "posteos_por_commit": round(posteos / commits, 2) if commits else None,
+        "p50_ms": round(_percentil(ordenados, 50), 2),
+        "p99_ms": round(_percentil(ordenados, 99), 2),
+        "status": status,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de commit agrupado de pagos y abonos")
+    ap.add_argument("--hilos", default="1,8,32", help="Concurrencias a probar")
+    ap.add_argument("--posteos", type=int, default=2000, help="Pagos + abonos por nivel")
+    ap.add_argument("--ventana-ms", type=float, help="COMMIT_AGRUPADO_VENTANA_MS (default: el de la app)")
+    ap.add_argument("--max-ops", type=int, help="COMMIT_AGRUPADO_MAX_OPS (default: el de la app)")
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    generador.agregar_argumentos(ap)
+    args = ap.parse_args(argv)
+    niveles = [int(x) for x in args.hilos.split(",") if x.strip()]
+    args.iteraciones, args.calentamiento = None, None
+
+    from app import agrupador, deps
+
+    if args.ventana_ms is not None:
+        agrupador.VENTANA_S = args.ventana_ms / 1000.0
+    if args.max_ops is not None:
+        agrupador.MAX_OPS = max(args.max_ops, 1)
+
+    trabajo = tempfile.mkdtemp(prefix="agrupado_")
+    params = generador._args_a_parametros(args)
+    base = os.path.join(trabajo, "base.db")
+    resultado: Dict[str, Any] = {
+        "meta": {**_meta(args), "posteos": args.posteos,
+                 "agrupador": {"ventana_ms": agrupador.VENTANA_S * 1000.0, "max_ops": agrupador.MAX_OPS}},
+        "cartera": generador.generar(base, params),
+        "modos": {},
+    }
+    previo = (deps.DB_PATH, agrupador.ACTIVO)
+    try:
+        for modo, activo in (("por_llamada", False), ("agrupado", True)):
+            agrupador.ACTIVO = activo
+            filas = resultado["modos"][modo] = []
+            for n in niveles:
+                destino = os.path.join(trabajo, f"{modo}_{n}.db")
+                shutil.copyfile(base, destino)
+                deps.cerrar_pool()
+                deps.DB_PATH = destino
+                fila = _nivel(destino, params.variante, n, args.posteos)
+                filas.append(fila)
+                print(f"[{modo:<11}] hilos={n:>3}  {fila['posteos_s']:>8} posteos/s  commits={fila['commits']:>5} "
+                      f"({fila['posteos_por_commit']}/commit)  p50={fila['p50_ms']} p99={fila['p99_ms']} ms  "
+                      f"{fila['status']}", file=sys.stderr)
+        resultado["aceleracion"] = {
+            str(a["hilos"]): round(b["posteos_s"] / a["posteos_s"], 2)
+            for a, b in zip(resultado["modos"]["por_llamada"], resultado["modos"]["agrupado"])
+            if a["posteos_s"] and b["posteos_s"]
+        }
+    finally:
+        deps.cerrar_pool()
+        deps.DB_PATH, agrupador.ACTIVO = previo
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# backend/benchmarks/compresion.py
+# Costo de CPU vs bytes ahorrados de la compresión de respuestas (app.compresion).
+#
+#   cd backend
+#   python -m benchmarks.compresion                                 # cartera de 1000 clientes
+#   python -m benchmarks.compresion --clientes 5000 --repeticiones 20 --salida compresion.json
+#
+# - Payloads reales: el JSON de /cuotas/resumen-prestamos, /cuotas, /clientes y
+#   /prestamos/{id}/detalle, y recortes del listado de cuotas a 512 B, 1, 4, 16, 64, 256 KB y 1 MB
+#   (el umbral COMPRESION_MIN_BYTES se decide con estos).
+# - Por payload, codificación disponible (gzip; br y zstd si están instalados) y nivel: tamaño
+#   comprimido, proporción, ms de CPU (mediana), MB/s y KB ahorrados por ms de CPU.
+# - Para datos móviles: a ~1 MB/s de bajada, cada KB ahorrado son ~1 ms; comprimir conviene mientras
+#   los KB ahorrados por ms de CPU superen de sobra 1.
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks import generador
+from benchmarks.ejecutar import _meta
+
+# Igual que benchmarks.ejecutar: sin correo ni tareas en segundo plano
+for _k, _v in {"MAIL_SEND_ON_CREATE": "off", "EMAIL_ON_LOAN_CREATED": "off", "MORA_REFRESH_AUTO": "off",
+               "SMTP_HOST": "", "SQL_TRACE": "off", "REPLICA_AUTO": "off"}.items():
+    os.environ[_k] = _v
+
+TAMANOS = (512, 1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024)
+NIVELES = {"gzip": (1, 6, 9), "br": (1, 4, 11), "zstd": (1, 3, 10)}
+
+
+def _recorte(items: List[Any], objetivo: int) -> Optional[bytes]:
+    """JSON de los primeros elementos de la lista que llega a ~objetivo bytes (None si no alcanza)."""
+    from app import serializacion
+
+    total = serializacion.dumps(items)
+    if len(total) < objetivo:
+        return None
+    n = max(1, int(len(items) * objetivo / len(total)))
+    return serializacion.dumps(items[:n])
+
+
+def _medir(nombre: str, nivel: int, datos: bytes, repeticiones: int) -> Dict[str, Any]:
+    from app import compresion
+
+    tiempos = []
+    salida = b""
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        salida = compresion.comprimir(nombre, datos, nivel)
+        tiempos.append(time.perf_counter() - t0)
+    ms = statistics.median(tiempos) * 1000.0
+    ahorro_kb = (len(datos) - len(salida)) / 1024.0
+    return {
+        "nivel": nivel,
+        "bytes": len(salida),
+        "proporcion": round(len(salida) / len(datos), 4),
+        "ms": round(ms, 4),
+        "mb_s": round(len(datos) / 1e6 / (ms / 1000.0), 1) if ms else None,
+        "kb_ahorrados_por_ms": round(ahorro_kb / ms, 1) if ms else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de compresión de respuestas")
+    ap.add_argument("--repeticiones", type=int, default=9, help="Compresiones por medición (se toma la mediana)")
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    generador.agregar_argumentos(ap)
+    ap.set_defaults(clientes=1000)
+    args = ap.parse_args(argv)
+    args.iteraciones, args.calentamiento = args.repeticiones, 0
+
+    from fastapi.testclient import TestClient
+    from app import compresion, deps
+    from app.main import app
+
+    trabajo = tempfile.mkdtemp(prefix="compresion_")
+    params = generador._args_a_parametros(args)
+    db = os.path.join(trabajo, "base.db")
+    previo = deps.DB_PATH
+    resultado: Dict[str, Any] = {
+        "meta": {**_meta(args), "codificaciones": sorted(compresion.CODIFICADORES),
+                 "min_bytes": compresion.MIN_BYTES},
+        "cartera": generador.generar(db, params),
+        "payloads": {},
+    }
+    try:
+        deps.DB_PATH = db
+        cliente = TestClient(app, raise_server_exceptions=False)
+        sin = {"Accept-Encoding": "identity"}
+        pid = cliente.get("/cuotas/resumen-prestamos", headers=sin).json()[0]["id"]
+        payloads: Dict[str, bytes] = {
+            ruta: cliente.get(ruta, headers=sin).content
+            for ruta in ("/cuotas/resumen-prestamos", "/cuotas", "/clientes", f"/prestamos/{pid}/detalle")
+        }
+        cuotas = json.loads(payloads["/cuotas"])
+        for objetivo in TAMANOS:
+            datos = _recorte(cuotas, objetivo)
+            if datos is not None:
+                payloads[f"cuotas[{objetivo // 1024 or objetivo}{'KB' if objetivo >= 1024 else 'B'}]"] = datos
+
+        for etiqueta, datos in payloads.items():
+            filas: Dict[str, List[Dict[str, Any]]] = {}
+            for nombre in compresion.CODIFICADORES:
+                filas[nombre] = [_medir(nombre, nivel, datos, args.repeticiones) for nivel in NIVELES[nombre]]
+            resultado["payloads"][etiqueta] = {"bytes": len(datos), "codificaciones": filas}
+            for nombre, medidas in filas.items():
+                texto = "  ".join(f"n{m['nivel']}: {m['proporcion']:.0%} {m['ms']}ms {m['kb_ahorrados_por_ms']}KB/ms"
+                                  for m in medidas)
+                print(f"{etiqueta:<28} {len(datos):>9} B  {nombre:<4} {texto}", file=sys.stderr)
+    finally:
+        deps.DB_PATH = previo
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
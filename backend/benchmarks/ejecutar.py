@@ -0,0 +1,245 @@
+# backend/benchmarks/ejecutar.py
+# Corre los escenarios de benchmarks/escenarios.py sobre carteras sintéticas y guarda JSON
+# comparable entre commits.
+#
+#   cd backend
+#   python -m benchmarks.ejecutar --salida bench.json                      # variantes a y b
+#   python -m benchmarks.ejecutar --clientes 5000 --solo cuotas. --salida grande.json
+#   python -m benchmarks.ejecutar --salida nuevo.json --comparar bench.json --umbral 0.25 --fallar
+#
+# - Lecturas: una copia de la base por variante. Escenarios que mutan: copia fresca cada uno.
+# - Por escenario: calentamiento, una corrida trazada (conteo de sentencias SQL, determinista)
+#   y N iteraciones cronometradas (p50/p95/p99/media/min/max en ms, errores por status).
+# - --comparar marca regresiones de p50 por encima del umbral (y con diferencia > --min-ms)
+#   y cualquier aumento en sentencias SQL por llamada.
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from benchmarks import generador
+from benchmarks.escenarios import ESCENARIOS, Contexto, Escenario, cargar_contexto
+
+# La app NO debe enviar correos ni arrancar tareas durante el benchmark
+for _k, _v in {"MAIL_SEND_ON_CREATE": "off", "EMAIL_ON_LOAN_CREATED": "off", "MORA_REFRESH_AUTO": "off",
+               "SMTP_HOST": "", "SQL_TRACE": "off"}.items():
+    os.environ[_k] = _v
+
+
+def _percentil(ordenados: List[float], p: float) -> float:
+    if not ordenados:
+        return 0.0
+    k = max(0, min(len(ordenados) - 1, int(round(p / 100.0 * len(ordenados) + 0.5)) - 1))
+    return ordenados[k]
+
+
+def _status(res: Any) -> Optional[int]:
+    return getattr(res, "status_code", None)
+
+
+def _contar_sql(esc: Escenario, ctx: Contexto, i: int) -> Optional[int]:
+    """Una llamada trazada (no cronometrada) para contar sentencias SQL."""
+    from app import sqltrace
+    if esc.grupo == "interno":
+        with sqltrace.presupuesto_sql(permitir_n1=True) as traza:
+            esc.correr(ctx, i)
+        return len(traza.sentencias)
+    previo = sqltrace.MODO
+    sqltrace.MODO = "header"
+    try:
+        ctx.cliente.headers[sqltrace.HEADER] = "1"
+        res = esc.correr(ctx, i)
+    finally:
+        ctx.cliente.headers.pop(sqltrace.HEADER, None)
+        sqltrace.MODO = previo
+    n = res.headers.get("x-sql-count") if hasattr(res, "headers") else None
+    return int(n) if n is not None else None
+
+
+def correr_escenario(esc: Escenario, ctx: Contexto, iteraciones: int, calentamiento: int) -> Dict[str, Any]:
+    if esc.requiere and not getattr(ctx, esc.requiere):
+        return {"grupo": esc.grupo, "omitido": f"sin datos para '{esc.requiere}'"}
+    i = 0
+    for _ in range(calentamiento):
+        esc.correr(ctx, i)
+        i += 1
+    sentencias = _contar_sql(esc, ctx, i)
+    i += 1
+
+    tiempos: List[float] = []
+    errores: Dict[str, int] = {}
+    ejemplo_error: Optional[str] = None
+    for _ in range(iteraciones):
+        t0 = time.perf_counter()
+        try:
+            res = esc.correr(ctx, i)
+            err = _status(res) if (_status(res) or 0) >= 400 else None
+        except Exception as e:  # internos
+            res, err = None, type(e).__name__
+        tiempos.append((time.perf_counter() - t0) * 1000.0)
+        if err is not None:
+            errores[str(err)] = errores.get(str(err), 0) + 1
+            if ejemplo_error is None:
+                ejemplo_error = (getattr(res, "text", "") or str(err))[:300]
+        i += 1
+
+    ordenados = sorted(tiempos)
+    out = {
+        "grupo": esc.grupo,
+        "muta": esc.muta,
+        "iteraciones": iteraciones,
+        "sentencias_sql": sentencias,
+        "ms": {
+            "p50": round(_percentil(ordenados, 50), 3),
+            "p95": round(_percentil(ordenados, 95), 3),
+            "p99": round(_percentil(ordenados, 99), 3),
+            "media": round(sum(tiempos) / len(tiempos), 3) if tiempos else 0.0,
+            "min": round(ordenados[0], 3) if ordenados else 0.0,
+            "max": round(ordenados[-1], 3) if ordenados else 0.0,
+        },
+        "errores": errores,
+    }
+    if ejemplo_error:
+        out["ejemplo_error"] = ejemplo_error
+    return out
+
+
+def _meta(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "plataforma": platform.platform(),
+        "iteraciones": args.iteraciones,
+        "calentamiento": args.calentamiento,
+    }
+
+
+def ejecutar(args: argparse.Namespace) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+    from app import deps
+    from app.main import app
+
+    cliente = TestClient(app, raise_server_exceptions=False)
+    seleccion = [e for e in ESCENARIOS if not args.solo or re.search(args.solo, e.nombre)]
+    variantes = ["a", "b"] if args.variante == "ambas" else [args.variante]
+    trabajo = tempfile.mkdtemp(prefix="bench_")
+    resultado: Dict[str, Any] = {"meta": _meta(args), "carteras": {}, "escenarios": {}}
+    previo = deps.DB_PATH
+    try:
+        for var in variantes:
+            params = generador._args_a_parametros(args)
+            params.variante = var
+            base = os.path.join(trabajo, f"base_{var}.db")
+            resultado["carteras"][var] = generador.generar(base, params)
+
+            lectura = os.path.join(trabajo, f"lectura_{var}.db")
+            shutil.copyfile(base, lectura)
+            deps.DB_PATH = lectura
+            ctx_lectura = cargar_contexto(cliente, lectura, var)
+
+            for n, esc in enumerate(seleccion):
+                if esc.muta:
+                    destino = os.path.join(trabajo, f"mut_{var}_{n}.db")
+                    shutil.copyfile(base, destino)
+                    deps.DB_PATH = destino
+                    ctx = cargar_contexto(cliente, destino, var)
+                else:
+                    deps.DB_PATH = lectura
+                    ctx = ctx_lectura
+                r = correr_escenario(esc, ctx, args.iteraciones, args.calentamiento)
+                resultado["escenarios"][f"{var}/{esc.nombre}"] = r
+                if not args.silencioso:
+                    ms = r.get("ms", {})
+                    print(f"[{var}] {esc.nombre:<40} p50={ms.get('p50', '-'):>9} p95={ms.get('p95', '-'):>9} "
+                          f"sql={r.get('sentencias_sql', '-')!s:>5} err={r.get('errores') or r.get('omitido') or '-'}",
+                          file=sys.stderr)
+    finally:
+        deps.DB_PATH = previo
+        if not args.conservar:
+            shutil.rmtree(trabajo, ignore_errors=True)
+    return resultado
+
+
+def comparar(nuevo: Dict[str, Any], base: Dict[str, Any], umbral: float, min_ms: float) -> List[Dict[str, Any]]:
+    """Regresiones de 'nuevo' respecto de 'base' (mismas claves variante/escenario)."""
+    regresiones = []
+    for clave, r in nuevo.get("escenarios", {}).items():
+        b = base.get("escenarios", {}).get(clave)
+        if not b or "ms" not in r or "ms" not in b:
+            continue
+        p_new, p_old = r["ms"]["p50"], b["ms"]["p50"]
+        ratio = (p_new / p_old) if p_old else None
+        motivos = []
+        if ratio is not None and ratio > 1 + umbral and (p_new - p_old) > min_ms:
+            motivos.append(f"p50 {p_old:.3f} -> {p_new:.3f} ms (x{ratio:.2f})")
+        s_new, s_old = r.get("sentencias_sql"), b.get("sentencias_sql")
+        if s_new is not None and s_old is not None and s_new > s_old:
+            motivos.append(f"sentencias SQL {s_old} -> {s_new}")
+        if len(r.get("errores") or {}) > len(b.get("errores") or {}):
+            motivos.append(f"errores nuevos: {r['errores']}")
+        if motivos:
+            regresiones.append({"escenario": clave, "motivos": motivos})
+    return regresiones
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmarks de la API (carteras sintéticas)")
+    ap.add_argument("--salida", help="Archivo JSON de resultados (default: stdout)")
+    ap.add_argument("--iteraciones", type=int, default=30)
+    ap.add_argument("--calentamiento", type=int, default=3)
+    ap.add_argument("--solo", help="Regex sobre el nombre del escenario (p.ej. 'cuotas\\.')")
+    ap.add_argument("--comparar", help="JSON de una corrida anterior para detectar regresiones")
+    ap.add_argument("--umbral", type=float, default=0.25, help="Regresión si p50 crece más que esto (0.25 = 25%%)")
+    ap.add_argument("--min-ms", dest="min_ms", type=float, default=0.2, help="Ignora diferencias de p50 menores")
+    ap.add_argument("--fallar", action="store_true", help="Código de salida 1 si hay regresiones")
+    ap.add_argument("--conservar", action="store_true", help="No borra las bases temporales")
+    ap.add_argument("--silencioso", action="store_true")
+    generador.agregar_argumentos(ap)
+    ap.set_defaults(variante="ambas")
+    args = ap.parse_args(argv)
+    if args.variante not in ("a", "b", "ambas"):
+        ap.error("--variante debe ser a, b o ambas")
+
+    res = ejecutar(args)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            base = json.load(fh)
+        res["comparacion"] = {
+            "contra": base.get("meta", {}).get("commit"),
+            "umbral": args.umbral,
+            "regresiones": comparar(res, base, args.umbral, args.min_ms),
+        }
+        for reg in res["comparacion"]["regresiones"]:
+            print(f"REGRESIÓN {reg['escenario']}: {'; '.join(reg['motivos'])}", file=sys.stderr)
+
+    texto = json.dumps(res, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    if args.fallar and res.get("comparacion", {}).get("regresiones"):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# backend/benchmarks/escalado.py
+# Escalado de LECTURAS con uvicorn --workers N sobre la misma base SQLite (WAL).
+#
+#   cd backend
+#   python -m benchmarks.escalado                                   # workers 1,2,4.. hasta nproc
+#   python -m benchmarks.escalado --workers 1,2,4,8 --duracion 10 --clientes 5000 --salida escalado.json
+#   python -m benchmarks.escalado --escritor                        # con proceso escritor único
+#
+# - Por nivel: levanta uvicorn con N workers (proceso aparte), calienta y mide req/s con P procesos
+#   de carga (http.client keep-alive, sin dependencias) sobre una mezcla de GETs de la app móvil.
+# - Reporta req/s, p50/p95, aceleración contra 1 worker y eficiencia (aceleración / N).
+#   Escalado lineal = eficiencia ~1.0 mientras N <= núcleos. Los niveles con N > núcleos se marcan.
+# - Los procesos de carga corren en la misma máquina y compiten por CPU: para medir el techo real
+#   usa --url desde otra máquina, o reserva núcleos con --procesos-carga.
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks import generador
+from benchmarks.arranque import ENTORNO, RAIZ
+from benchmarks.ejecutar import _meta, _percentil
+
+
+def _rutas(db: str, variante: str, limite: int = 500) -> List[str]:
+    conn = sqlite3.connect(db)
+    try:
+        v = generador.columnas(conn, variante)
+        prestamos = [r[0] for r in conn.execute("SELECT id FROM prestamos ORDER BY id LIMIT ?;", (limite,))]
+        clientes = [r[0] for r in conn.execute("SELECT id FROM clientes ORDER BY id LIMIT ?;", (limite,))]
+        cuotas = [r[0] for r in conn.execute(f"SELECT id FROM cuotas ORDER BY {v['fk']}, id LIMIT ?;", (limite,))]
+    finally:
+        conn.close()
+    rutas = []
+    for i in range(max(len(prestamos), 1)):
+        p = prestamos[i % len(prestamos)]
+        rutas += [
+            f"/cuotas?id_prestamo={p}",
+            f"/cuotas/prestamo/{p}/resumen",
+            f"/cuotas/estado/prestamo/{p}",
+            f"/clientes/{clientes[i % len(clientes)]}",
+            f"/cuotas/{cuotas[i % len(cuotas)]}",
+        ]
+    return rutas
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar_listo(host: str, port: int, timeout: float = 60.0) -> None:
+    fin = time.monotonic() + timeout
+    while time.monotonic() < fin:
+        try:
+            c = http.client.HTTPConnection(host, port, timeout=2)
+            c.request("GET", "/health/ping")
+            if c.getresponse().status == 200:
+                c.close()
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"El servidor en {host}:{port} no respondió en {timeout:.0f}s")
+
+
+def _carga(args: Tuple[str, int, List[str], int, float, float]) -> Dict[str, Any]:
+    """Proceso de carga: GETs secuenciales keep-alive hasta 'fin'; latencias solo tras 'desde'."""
+    host, port, rutas, desfase, desde, fin = args
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    n, errores, lat = 0, 0, []
+    i = desfase
+    while True:
+        ahora = time.time()
+        if ahora >= fin:
+            break
+        ruta = rutas[i % len(rutas)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", ruta)
+            r = conn.getresponse()
+            r.read()
+            ok = r.status < 400
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            ok = False
+        if ahora >= desde:
+            lat.append((time.perf_counter() - t0) * 1000.0)
+            n += 1
+            errores += 0 if ok else 1
+    conn.close()
+    return {"n": n, "errores": errores, "lat": lat}
+
+
+def medir(host: str, port: int, rutas: List[str], procesos: int, duracion: float, calentamiento: float) -> Dict[str, Any]:
+    desde = time.time() + calentamiento
+    fin = desde + duracion
+    paso = max(1, len(rutas) // max(procesos, 1))
+    with multiprocessing.get_context("spawn").Pool(procesos) as pool:
+        res = pool.map(_carga, [(host, port, rutas, k * paso, desde, fin) for k in range(procesos)])
+    lat = sorted(x for r in res for x in r["lat"])
+    total = sum(r["n"] for r in res)
+    return {
+        "peticiones": total,
+        "req_s": round(total / duracion, 1),
+        "errores": sum(r["errores"] for r in res),
+        "ms": {"p50": round(_percentil(lat, 50), 2), "p95": round(_percentil(lat, 95), 2),
+               "p99": round(_percentil(lat, 99), 2)},
+    }
+
+
+def _levantar(db: str, workers: int, port: int, escritor: Optional[str]) -> List[subprocess.Popen]:
+    env = dict(os.environ)
+    env.update(ENTORNO)
+    env["DB_PATH"] = db
+    procs = []
+    if escritor:
+        env["DB_ESCRITOR_SOCKET"] = escritor
+        procs.append(subprocess.Popen([sys.executable, "-m", "app.escritor"], cwd=RAIZ, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    ))
+    return procs
+
+
+def _detener(procs: List[subprocess.Popen]) -> None:
+    for p in reversed(procs):
+        if p.poll() is None:
+            p.send_signal(signal.SIGINT)
+    for p in reversed(procs):
+        try:
+            p.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    nucleos = os.cpu_count() or 1
+    por_defecto = ",".join(str(2 ** k) for k in range(0, 8) if 2 ** k <= max(nucleos, 1))
+    ap = argparse.ArgumentParser(description="Escalado de lecturas con uvicorn --workers N")
+    ap.add_argument("--workers", default=por_defecto, help=f"Niveles de workers (default: {por_defecto})")
+    ap.add_argument("--duracion", type=float, default=8.0, help="Segundos medidos por nivel")
+    ap.add_argument("--calentamiento", type=float, default=2.0)
+    ap.add_argument("--procesos-carga", dest="procesos_carga", type=int, default=0,
+                    help="Procesos de carga (default: 2 por worker, máx. núcleos*2)")
+    ap.add_argument("--escritor", action="store_true", help="Levanta también el proceso escritor único")
+    ap.add_argument("--eficiencia-min", dest="eficiencia_min", type=float, default=0.7,
+                    help="Con --fallar: eficiencia mínima aceptable mientras N <= núcleos")
+    ap.add_argument("--fallar", action="store_true")
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    generador.agregar_argumentos(ap)
+    args = ap.parse_args(argv)
+
+    niveles = [int(x) for x in args.workers.split(",") if x.strip()]
+    trabajo = tempfile.mkdtemp(prefix="escalado_")
+    params = generador._args_a_parametros(args)
+    db = os.path.join(trabajo, "base.db")
+    resultado: Dict[str, Any] = {
+        "meta": {**_meta(argparse.Namespace(iteraciones=None, calentamiento=args.calentamiento)),
+                 "nucleos": nucleos, "escritor": args.escritor},
+        "cartera": generador.generar(db, params),
+        "niveles": [],
+    }
+    conn = sqlite3.connect(db)
+    conn.execute("PRAGMA journal_mode=WAL;")  # como en producción (deps.DB_WAL)
+    conn.close()
+    rutas = _rutas(db, params.variante)
+
+    base_rps = None
+    fallas = []
+    try:
+        for n in niveles:
+            port = _puerto_libre()
+            sock = os.path.join(trabajo, "escritor.sock") if args.escritor else None
+            procs = _levantar(db, n, port, sock)
+            try:
+                _esperar_listo("127.0.0.1", port)
+                procesos = args.procesos_carga or min(2 * n, 2 * nucleos)
+                r = medir("127.0.0.1", port, rutas, procesos, args.duracion, args.calentamiento)
+            finally:
+                _detener(procs)
+            base_rps = base_rps or r["req_s"] or None
+            acel = (r["req_s"] / base_rps) if base_rps else 0.0
+            r.update({"workers": n, "procesos_carga": procesos, "aceleracion": round(acel, 2),
+                      "eficiencia": round(acel / n, 2), "sobre_suscrito": n > nucleos})
+            resultado["niveles"].append(r)
+            print(f"workers={n:>3}  {r['req_s']:>9} req/s  p50={r['ms']['p50']:>8} ms  p95={r['ms']['p95']:>8} ms  "
+                  f"x{r['aceleracion']:<5} eficiencia={r['eficiencia']:<5} err={r['errores']}"
+                  f"{'  (N > núcleos)' if r['sobre_suscrito'] else ''}", file=sys.stderr)
+            if not r["sobre_suscrito"] and n > 1 and r["eficiencia"] < args.eficiencia_min:
+                fallas.append(f"workers={n}: eficiencia {r['eficiencia']} < {args.eficiencia_min}")
+    finally:
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    resultado["fallas"] = fallas
+    for f in fallas:
+        print(f"ESCALADO INSUFICIENTE {f}", file=sys.stderr)
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    return 1 if (args.fallar and fallas) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
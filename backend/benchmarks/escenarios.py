@@ -0,0 +1,251 @@
+# backend/benchmarks/escenarios.py
+# Escenarios cronometrados: todos los endpoints de clientes, préstamos y cuotas, más
+# funciones internas calientes (_build_recordatorios, _render_loan_created).
+# Cada escenario recibe el índice de iteración para rotar objetivos (ids distintos por
+# iteración), así los escenarios que mutan no repiten la misma operación sobre la misma fila.
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.generador import columnas
+
+
+@dataclass
+class Contexto:
+    """Pools de ids leídos de la base generada (antes de medir)."""
+    cliente: Any                      # TestClient
+    db_path: str
+    variante: str
+    clientes: List[int] = field(default_factory=list)
+    codigos: List[str] = field(default_factory=list)
+    prestamos: List[int] = field(default_factory=list)
+    prestamos_auto: List[Dict[str, Any]] = field(default_factory=list)
+    manuales_sin_pagos: List[Dict[str, Any]] = field(default_factory=list)
+    proximas_cuotas: List[Dict[str, Any]] = field(default_factory=list)   # primera PENDIENTE por préstamo
+    cuotas_abonables: List[int] = field(default_factory=list)
+    cuotas: List[int] = field(default_factory=list)
+    dias_recordatorio: int = 1
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def rot(self, pool: List[Any], i: int) -> Any:
+        return pool[i % len(pool)]
+
+
+def cargar_contexto(cliente, db_path: str, variante: str, limite: int = 2000) -> Contexto:
+    ctx = Contexto(cliente=cliente, db_path=db_path, variante=variante)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        v = columnas(conn, variante)
+        ctx.clientes = [r[0] for r in conn.execute("SELECT id FROM clientes ORDER BY id LIMIT ?;", (limite,))]
+        ctx.codigos = [r[0] for r in conn.execute("SELECT codigo FROM clientes ORDER BY id LIMIT ?;", (limite,))]
+        ctx.prestamos = [r[0] for r in conn.execute("SELECT id FROM prestamos ORDER BY id LIMIT ?;", (limite,))]
+        ctx.prestamos_auto = [
+            dict(r) for r in conn.execute(
+                "SELECT id, cod_cli, importe_credito, tasa_interes, modalidad, num_cuotas, fecha_credito "
+                "FROM prestamos WHERE plan_mode='auto' AND estado='PENDIENTE' ORDER BY id LIMIT ?;", (limite,))
+        ]
+        ctx.manuales_sin_pagos = [
+            dict(r) for r in conn.execute(
+                f"""
+                SELECT p.id, p.importe_credito, p.tasa_interes FROM prestamos p
+                WHERE p.plan_mode='manual' AND p.estado='PENDIENTE'
+                  AND NOT EXISTS (SELECT 1 FROM cuotas c WHERE c.{v['fk']}=p.id
+                                  AND (COALESCE(c.interes_pagado,0)>0 OR COALESCE(c.abono_capital,0)>0))
+                  AND NOT EXISTS (SELECT 1 FROM abonos_capital a WHERE a.id_prestamo=p.id)
+                ORDER BY p.id LIMIT ?;
+                """, (limite,))
+        ]
+        ctx.proximas_cuotas = [
+            dict(r) for r in conn.execute(
+                f"""
+                SELECT c.id, c.{v['interes']} AS interes FROM cuotas c
+                JOIN (SELECT {v['fk']} AS pid, MIN({v['numero']}) AS n FROM cuotas
+                      WHERE estado='PENDIENTE' GROUP BY {v['fk']}) t
+                  ON t.pid = c.{v['fk']} AND t.n = c.{v['numero']}
+                ORDER BY c.id LIMIT ?;
+                """, (limite,))
+        ]
+        ctx.cuotas_abonables = [
+            r[0] for r in conn.execute(
+                f"""
+                SELECT c.id FROM cuotas c JOIN prestamos p ON p.id = c.{v['fk']}
+                WHERE c.estado='PENDIENTE' AND COALESCE(c.interes_pagado,0)=0 AND p.plan_mode='auto'
+                ORDER BY c.id LIMIT ?;
+                """, (limite * 10,))
+        ]
+        ctx.cuotas = [r[0] for r in conn.execute("SELECT id FROM cuotas ORDER BY id LIMIT ?;", (limite,))]
+        # 'dias' (0..30) con más cuotas por vencer: recordatorios con carga real
+        hoy = date.today()
+        fila = conn.execute(
+            f"""
+            SELECT CAST(julianday(date({v['venc']})) - julianday(date(?)) AS INTEGER) AS d, COUNT(*) AS n
+            FROM cuotas WHERE estado='PENDIENTE' AND date({v['venc']}) BETWEEN date(?) AND date(?)
+            GROUP BY d ORDER BY n DESC LIMIT 1;
+            """, (hoy.isoformat(), hoy.isoformat(), (hoy + timedelta(days=30)).isoformat()),
+        ).fetchone()
+        ctx.dias_recordatorio = int(fila["d"]) if fila else 1
+    finally:
+        conn.close()
+    return ctx
+
+
+@dataclass
+class Escenario:
+    nombre: str
+    grupo: str
+    correr: Callable[[Contexto, int], Any]   # devuelve Response (HTTP) o cualquier valor (interno)
+    muta: bool = False
+    requiere: Optional[str] = None           # pool del contexto que no puede estar vacío
+
+
+def _get(url_fn):
+    return lambda ctx, i: ctx.cliente.get(url_fn(ctx, i))
+
+
+def _manual_plan(monto: float, tasa: float, n: int) -> List[Dict[str, float]]:
+    cap = round(monto / n, 2)
+    out, saldo = [], monto
+    for k in range(1, n + 1):
+        c = round(saldo, 2) if k == n else cap
+        out.append({"capital": c, "interes": round(saldo * tasa / 100.0, 2)})
+        saldo = round(saldo - c, 2)
+    return out
+
+
+def _crear_cliente(ctx: Contexto, i: int):
+    return ctx.cliente.post("/clientes", json={"nombre": f"Bench Cliente {i}", "email": f"bench{i}@example.com",
+                                               "telefono": f"301{i:07d}"})
+
+
+def _actualizar_cliente(ctx: Contexto, i: int):
+    cid = ctx.rot(ctx.clientes, i)
+    return ctx.cliente.put(f"/clientes/{cid}", json={"telefono": f"302{i:07d}"})
+
+
+def _crear_prestamo(ctx: Contexto, i: int):
+    return ctx.cliente.post("/prestamos", json={
+        "cod_cli": ctx.rot(ctx.codigos, i), "monto": 1000, "tasa_interes": 5, "modalidad": "Mensual",
+        "num_cuotas": 12, "fecha_inicio": date.today().isoformat(),
+    })
+
+
+def _crear_prestamo_manual(ctx: Contexto, i: int):
+    return ctx.cliente.post("/prestamos/manual", json={
+        "cod_cli": ctx.rot(ctx.codigos, i), "monto": 1200, "tasa": 5, "tasa_interes": 5, "modalidad": "Quincenal",
+        "num_cuotas": 6, "fecha_inicio": date.today().isoformat(), "plan": _manual_plan(1200.0, 5.0, 6),
+    })
+
+
+def _actualizar_prestamo(ctx: Contexto, i: int):
+    p = ctx.rot(ctx.prestamos_auto, i)
+    return ctx.cliente.put(f"/prestamos/{p['id']}", json={
+        "cod_cli": p["cod_cli"], "monto": p["importe_credito"], "tasa_interes": p["tasa_interes"],
+        "modalidad": p["modalidad"], "num_cuotas": p["num_cuotas"], "fecha_inicio": p["fecha_credito"],
+    })
+
+
+def _replan(ctx: Contexto, i: int):
+    p = ctx.rot(ctx.manuales_sin_pagos, i)
+    return ctx.cliente.put(f"/prestamos/{p['id']}/replan", json={
+        "plan": _manual_plan(float(p["importe_credito"]), float(p["tasa_interes"]), 4),
+    })
+
+
+def _pago(ctx: Contexto, i: int):
+    c = ctx.rot(ctx.proximas_cuotas, i)
+    return ctx.cliente.post(f"/cuotas/{c['id']}/pago", json={"interes_pagado": float(c["interes"] or 0)})
+
+
+def _abono(ctx: Contexto, i: int):
+    return ctx.cliente.post(f"/cuotas/{ctx.rot(ctx.cuotas_abonables, i)}/abono-capital", json={"monto": 1.0})
+
+
+def _lote(ctx: Contexto, i: int, tam: int = 20):
+    ops = [{"tipo": "abono", "cuota_id": ctx.rot(ctx.cuotas_abonables, i * tam + k), "monto": 1.0} for k in range(tam)]
+    return ctx.cliente.post("/cuotas/lote", json={"operaciones": ops})
+
+
+def _detalle_cuatro_llamadas(ctx: Contexto, i: int):
+    """Lo que la app hacía al abrir un préstamo antes de GET /prestamos/{id}/detalle."""
+    pid = ctx.rot(ctx.prestamos, i)
+    r = None
+    for url in (f"/cuotas/prestamo/{pid}/resumen", f"/cuotas?id_prestamo={pid}",
+                f"/cuotas/estado/prestamo/{pid}", f"/prestamos/{pid}/plan"):
+        r = ctx.cliente.get(url)
+        if r.status_code >= 400:
+            return r
+    return r
+
+
+def _ids_csv(ctx: Contexto, i: int, n: int = 50) -> str:
+    base = (i * n) % max(len(ctx.prestamos), 1)
+    return ",".join(str(ctx.rot(ctx.prestamos, base + k)) for k in range(n))
+
+
+# --- internos (sin HTTP) ---
+
+def _build_recordatorios(ctx: Contexto, i: int):
+    from app.deps import get_conn
+    from app.routers import cuotas
+    with get_conn() as conn:
+        return cuotas._build_recordatorios(conn, ctx.dias_recordatorio)
+
+
+def _render_loan_created(ctx: Contexto, i: int):
+    from app import notifications
+    bundles = ctx.extra.get("bundles")
+    if bundles is None:
+        bundles = ctx.extra["bundles"] = [
+            notifications._fetch_loan_bundle(pid) for pid in ctx.prestamos[:50]
+        ]
+        bundles[:] = [b for b in bundles if b[0] and b[1]]
+    cliente, prestamo, cuotas = ctx.rot(bundles, i)
+    return notifications._render_loan_created(cliente, prestamo, cuotas)
+
+
+def _fetch_loan_bundle(ctx: Contexto, i: int):
+    from app import notifications
+    return notifications._fetch_loan_bundle(ctx.rot(ctx.prestamos, i))
+
+
+ESCENARIOS: List[Escenario] = [
+    # clientes
+    Escenario("clientes.listar", "clientes", _get(lambda c, i: "/clientes")),
+    Escenario("clientes.obtener", "clientes", _get(lambda c, i: f"/clientes/{c.rot(c.clientes, i)}"), requiere="clientes"),
+    Escenario("clientes.detalle", "clientes", _get(lambda c, i: f"/clientes/{c.rot(c.clientes, i)}/detalle"), requiere="clientes"),
+    Escenario("clientes.siguiente_codigo", "clientes", _get(lambda c, i: "/clientes/siguiente-codigo")),
+    Escenario("clientes.crear", "clientes", _crear_cliente, muta=True),
+    Escenario("clientes.actualizar", "clientes", _actualizar_cliente, muta=True, requiere="clientes"),
+    # préstamos
+    Escenario("prestamos.estado_lote_50", "prestamos", _get(lambda c, i: f"/prestamos/estado-lote?ids={_ids_csv(c, i)}"), requiere="prestamos"),
+    Escenario("prestamos.plan", "prestamos", _get(lambda c, i: f"/prestamos/{c.rot(c.prestamos, i)}/plan"), requiere="prestamos"),
+    Escenario("prestamos.detalle", "prestamos", _get(lambda c, i: f"/prestamos/{c.rot(c.prestamos, i)}/detalle"), requiere="prestamos"),
+    Escenario("prestamos.detalle_4_llamadas", "prestamos", _detalle_cuatro_llamadas, requiere="prestamos"),
+    Escenario("prestamos.crear_auto", "prestamos", _crear_prestamo, muta=True, requiere="codigos"),
+    Escenario("prestamos.crear_manual", "prestamos", _crear_prestamo_manual, muta=True, requiere="codigos"),
+    Escenario("prestamos.actualizar_auto", "prestamos", _actualizar_prestamo, muta=True, requiere="prestamos_auto"),
+    Escenario("prestamos.replan", "prestamos", _replan, muta=True, requiere="manuales_sin_pagos"),
+    # cuotas
+    Escenario("cuotas.resumen_prestamos", "cuotas", _get(lambda c, i: "/cuotas/resumen-prestamos")),
+    Escenario("cuotas.resumen_prestamo", "cuotas", _get(lambda c, i: f"/cuotas/prestamo/{c.rot(c.prestamos, i)}/resumen"), requiere="prestamos"),
+    Escenario("cuotas.listar_todas", "cuotas", _get(lambda c, i: "/cuotas")),
+    Escenario("cuotas.listar_vencidas", "cuotas", _get(lambda c, i: "/cuotas?vencidas=true")),
+    Escenario("cuotas.listar_por_prestamo", "cuotas", _get(lambda c, i: f"/cuotas?id_prestamo={c.rot(c.prestamos, i)}"), requiere="prestamos"),
+    Escenario("cuotas.obtener", "cuotas", _get(lambda c, i: f"/cuotas/{c.rot(c.cuotas, i)}"), requiere="cuotas"),
+    Escenario("cuotas.estado_prestamo", "cuotas", _get(lambda c, i: f"/cuotas/estado/prestamo/{c.rot(c.prestamos, i)}"), requiere="prestamos"),
+    Escenario("cuotas.estado_resumen_50", "cuotas", _get(lambda c, i: f"/cuotas/estado/resumen-prestamos?ids={_ids_csv(c, i)}"), requiere="prestamos"),
+    Escenario("cuotas.recordatorios_preview", "cuotas", _get(lambda c, i: f"/cuotas/recordatorios/preview?dias={c.dias_recordatorio}")),
+    Escenario("cuotas.recordatorios_enviar_dry_run", "cuotas",
+              lambda c, i: c.cliente.post(f"/cuotas/recordatorios/enviar?dias={c.dias_recordatorio}&dry_run=true")),
+    Escenario("cuotas.pago", "cuotas", _pago, muta=True, requiere="proximas_cuotas"),
+    Escenario("cuotas.abono_capital", "cuotas", _abono, muta=True, requiere="cuotas_abonables"),
+    Escenario("cuotas.lote_20_abonos", "cuotas", _lote, muta=True, requiere="cuotas_abonables"),
+    # internos
+    Escenario("interno.build_recordatorios", "interno", _build_recordatorios),
+    Escenario("interno.fetch_loan_bundle", "interno", _fetch_loan_bundle, requiere="prestamos"),
+    Escenario("interno.render_loan_created", "interno", _render_loan_created, requiere="prestamos"),
+]
@@ -0,0 +1,248 @@
+# backend/benchmarks/generador.py
+# Generador de carteras sintéticas en SQLite para benchmarks.
+# - Clientes, préstamos auto y manuales, cuotas con historial de pagos y abonos, mezcla de mora.
+# - Dos variantes de nombres de columnas en 'cuotas' ("b" = base heredada: la normaliza la migración 2):
+#     "a": id_prestamo, cod_cli, cuota_numero, fecha_vencimiento, interes_a_pagar
+#     "b": prestamo_id, codigo_cliente, numero, fecha, interes
+# - Determinista: misma semilla + mismos parámetros + misma fecha 'hoy' => misma base.
+#
+# Uso:
+#   python -m benchmarks.generador /tmp/bench.db --clientes 2000 --variante b
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Tuple
+
+VARIANTES: Dict[str, Dict[str, str]] = {
+    "a": {"fk": "id_prestamo", "cod_cli": "cod_cli", "numero": "cuota_numero",
+          "venc": "fecha_vencimiento", "interes": "interes_a_pagar"},
+    "b": {"fk": "prestamo_id", "cod_cli": "codigo_cliente", "numero": "numero",
+          "venc": "fecha", "interes": "interes"},
+}
+
+NOMBRES = ["Ana", "Luis", "María", "Jorge", "Lucía", "Pedro", "Carmen", "José", "Rosa", "Diego",
+           "Elena", "Raúl", "Sofía", "Andrés", "Paula", "Tomás", "Valeria", "Hugo", "Inés", "Mateo"]
+APELLIDOS = ["García", "Pérez", "López", "Gómez", "Díaz", "Ruiz", "Torres", "Ramírez", "Flores", "Vargas"]
+
+
+@dataclass
+class Parametros:
+    clientes: int = 500
+    prestamos_por_cliente: float = 2.0
+    cuotas_min: int = 4
+    cuotas_max: int = 24
+    proporcion_manual: float = 0.3
+    proporcion_quincenal: float = 0.3
+    proporcion_morosos: float = 0.15   # préstamos que dejan de pagar en algún punto
+    prob_pago_puntual: float = 0.92    # cuotas vencidas de buenos pagadores
+    prob_abono: float = 0.35           # préstamos con al menos un abono a capital
+    proporcion_sin_email: float = 0.1
+    antiguedad_max_dias: int = 720
+    variante: str = "a"
+    semilla: int = 42
+    hoy: str = ""                      # YYYY-MM-DD; vacío = date.today()
+
+
+def _esquema(conn: sqlite3.Connection, v: Dict[str, str]) -> None:
+    conn.executescript(
+        f"""
+        CREATE TABLE clientes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo TEXT UNIQUE, nombre TEXT, identificacion TEXT,
+            direccion TEXT, telefono TEXT, email TEXT
+        );
+        CREATE TABLE prestamos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cod_cli TEXT, fecha_credito TEXT, importe_credito REAL, modalidad TEXT,
+            tasa_interes REAL, num_cuotas INTEGER, estado TEXT DEFAULT 'PENDIENTE',
+            plan_mode TEXT DEFAULT 'auto'
+        );
+        CREATE TABLE cuotas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {v['fk']} INTEGER, {v['cod_cli']} TEXT, nombre_cliente TEXT, modalidad TEXT,
+            {v['numero']} INTEGER, {v['venc']} TEXT, {v['interes']} REAL,
+            fecha_pago TEXT, estado TEXT DEFAULT 'PENDIENTE', dias_mora INTEGER DEFAULT 0,
+            abono_capital REAL DEFAULT 0, interes_pagado REAL DEFAULT 0,
+            capital_plan REAL NOT NULL DEFAULT 0, interes_plan REAL NOT NULL DEFAULT 0,
+            total_plan REAL NOT NULL DEFAULT 0
+        );
+        CREATE TABLE abonos_capital (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_prestamo INTEGER, nombre_cliente TEXT, fecha TEXT, monto REAL
+        );
+        CREATE INDEX idx_cuotas_prestamo ON cuotas({v['fk']});
+        CREATE INDEX idx_prestamos_cli ON prestamos(cod_cli);
+        CREATE INDEX idx_abonos_prestamo ON abonos_capital(id_prestamo);
+        """
+    )
+
+
+def _add_months(d: date, n: int) -> date:
+    y = d.year + (d.month - 1 + n) // 12
+    m = (d.month - 1 + n) % 12 + 1
+    dias = [31, 29 if (y % 4 == 0 and (y % 100 != 0 or y % 400 == 0)) else 28,
+            31, 30, 31, 30, 31, 31, 30, 31, 30, 31][m - 1]
+    return date(y, m, min(d.day, dias))
+
+
+def _vencimiento(inicio: date, modalidad: str, i: int) -> date:
+    return _add_months(inicio, i) if modalidad == "Mensual" else inicio + timedelta(days=15 * i)
+
+
+def _plan(importe: float, tasa: float, n: int, manual: bool) -> List[Tuple[float, float]]:
+    """(capital, interés) por cuota: auto = interés fijo sin capital; manual = amortización con saldo."""
+    if not manual:
+        return [(0.0, round(importe * tasa / 100.0, 2))] * n
+    cap = round(importe / n, 2)
+    out, saldo = [], importe
+    for i in range(1, n + 1):
+        c = round(saldo, 2) if i == n else cap
+        out.append((c, round(saldo * tasa / 100.0, 2)))
+        saldo = round(saldo - c, 2)
+    return out
+
+
+def columnas(conn: sqlite3.Connection, variante: str) -> Dict[str, str]:
+    """Nombres de 'cuotas' a usar en 'conn': los de la variante, o los canónicos si la app ya migró la base."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(cuotas);")}
+    return VARIANTES[variante] if VARIANTES[variante]["fk"] in cols else VARIANTES["a"]
+
+
+def generar(ruta: str, params: Parametros) -> Dict[str, Any]:
+    """Crea (sobrescribe) la base en 'ruta'. Devuelve conteos y parámetros usados."""
+    if params.variante not in VARIANTES:
+        raise ValueError(f"variante debe ser una de {sorted(VARIANTES)}")
+    v = VARIANTES[params.variante]
+    rnd = random.Random(params.semilla)
+    hoy = date.fromisoformat(params.hoy) if params.hoy else date.today()
+
+    for suf in ("", "-wal", "-shm"):
+        if os.path.exists(ruta + suf):
+            os.remove(ruta + suf)
+    conn = sqlite3.connect(ruta)
+    _esquema(conn, v)
+
+    clientes = []
+    for i in range(1, params.clientes + 1):
+        nombre = f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {i}"
+        email = None if rnd.random() < params.proporcion_sin_email else f"cliente{i}@example.com"
+        clientes.append((f"{i:05d}", nombre, f"ID{i:08d}", f"Calle {i}", f"300{i:07d}", email))
+    conn.executemany(
+        "INSERT INTO clientes (codigo, nombre, identificacion, direccion, telefono, email) VALUES (?,?,?,?,?,?);",
+        clientes,
+    )
+
+    sql_cuota = (
+        f"INSERT INTO cuotas ({v['fk']}, {v['cod_cli']}, nombre_cliente, modalidad, {v['numero']}, {v['venc']}, "
+        f"{v['interes']}, fecha_pago, estado, dias_mora, abono_capital, interes_pagado, "
+        f"capital_plan, interes_plan, total_plan) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);"
+    )
+    n_prestamos = max(int(params.clientes * params.prestamos_por_cliente), 1)
+    cuotas: List[tuple] = []
+    abonos: List[tuple] = []
+    pagados = 0
+    for pid in range(1, n_prestamos + 1):
+        codigo, nombre = clientes[rnd.randrange(len(clientes))][:2]
+        manual = rnd.random() < params.proporcion_manual
+        modalidad = "Quincenal" if rnd.random() < params.proporcion_quincenal else "Mensual"
+        n = rnd.randint(params.cuotas_min, params.cuotas_max)
+        importe = float(rnd.randrange(200, 5000, 50))
+        tasa = float(rnd.choice([2, 3, 4, 5, 6, 8, 10]))
+        inicio = hoy - timedelta(days=rnd.randint(0, params.antiguedad_max_dias))
+        moroso = rnd.random() < params.proporcion_morosos
+        corte_pago = rnd.randint(1, n) if moroso else n + 1  # desde esta cuota deja de pagar
+
+        filas = []
+        todas_pagadas = True
+        for i, (cap, inte) in enumerate(_plan(importe, tasa, n, manual), start=1):
+            fv = _vencimiento(inicio, modalidad, i)
+            vencida = fv <= hoy
+            paga = vencida and i < corte_pago and rnd.random() < params.prob_pago_puntual
+            if paga:
+                fp = min(fv + timedelta(days=rnd.choice([0, 0, 0, 1, 2, 5, 12])), hoy)
+                filas.append([pid, codigo, nombre, modalidad, i, fv.isoformat(), inte, fp.isoformat(),
+                              "PAGADO", 0, 0.0, inte, cap, inte, round(cap + inte, 2)])
+            else:
+                todas_pagadas = False
+                mora = (hoy - fv).days if vencida else 0
+                filas.append([pid, codigo, nombre, modalidad, i, fv.isoformat(), inte, None,
+                              "PENDIENTE", mora, 0.0, 0.0, cap, inte, round(cap + inte, 2)])
+
+        # Abonos a capital sobre cuotas pendientes (no sobre las de interés ya pagado)
+        pendientes = [f for f in filas if f[8] == "PENDIENTE"]
+        if pendientes and not manual and rnd.random() < params.prob_abono:
+            restante = importe
+            for _ in range(rnd.randint(1, 3)):
+                monto = round(min(restante, importe * rnd.uniform(0.05, 0.3)), 2)
+                if monto <= 0:
+                    break
+                f = rnd.choice(pendientes)
+                f[10] = round(f[10] + monto, 2)
+                restante = round(restante - monto, 2)
+                fecha_ab = min(date.fromisoformat(f[5]), hoy).isoformat()
+                abonos.append((pid, nombre, fecha_ab, monto))
+
+        estado = "PAGADO" if todas_pagadas else "PENDIENTE"
+        pagados += estado == "PAGADO"
+        conn.execute(
+            "INSERT INTO prestamos (id, cod_cli, fecha_credito, importe_credito, modalidad, tasa_interes, "
+            "num_cuotas, estado, plan_mode) VALUES (?,?,?,?,?,?,?,?,?);",
+            (pid, codigo, inicio.isoformat(), importe, modalidad, tasa, n, estado, "manual" if manual else "auto"),
+        )
+        cuotas.extend(tuple(f) for f in filas)
+        if len(cuotas) >= 20000:
+            conn.executemany(sql_cuota, cuotas)
+            cuotas.clear()
+    if cuotas:
+        conn.executemany(sql_cuota, cuotas)
+    conn.executemany("INSERT INTO abonos_capital (id_prestamo, nombre_cliente, fecha, monto) VALUES (?,?,?,?);", abonos)
+    conn.commit()
+
+    resumen = {
+        "ruta": ruta,
+        "parametros": asdict(params),
+        "hoy": hoy.isoformat(),
+        "clientes": params.clientes,
+        "prestamos": n_prestamos,
+        "prestamos_pagados": pagados,
+        "cuotas": conn.execute("SELECT COUNT(*) FROM cuotas;").fetchone()[0],
+        "cuotas_vencidas_pendientes": conn.execute(
+            f"SELECT COUNT(*) FROM cuotas WHERE estado='PENDIENTE' AND date({v['venc']}) < date(?);",
+            (hoy.isoformat(),),
+        ).fetchone()[0],
+        "abonos": len(abonos),
+    }
+    conn.close()
+    return resumen
+
+
+def _args_a_parametros(ns: argparse.Namespace) -> Parametros:
+    p = Parametros()
+    for k in asdict(p):
+        if getattr(ns, k, None) is not None:
+            setattr(p, k, getattr(ns, k))
+    return p
+
+
+def agregar_argumentos(ap: argparse.ArgumentParser) -> None:
+    """Opciones del generador (compartidas con benchmarks.ejecutar)."""
+    for k, val in asdict(Parametros()).items():
+        ap.add_argument(f"--{k.replace('_', '-')}", dest=k, type=type(val), default=None)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Genera una cartera sintética SQLite")
+    ap.add_argument("ruta")
+    agregar_argumentos(ap)
+    ns = ap.parse_args()
+    print(json.dumps(generar(ns.ruta, _args_a_parametros(ns)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
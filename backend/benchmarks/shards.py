@@ -0,0 +1,121 @@
+# backend/benchmarks/shards.py
+# Latencia de los endpoints que recorren todos los shards (scatter-gather de app.deps.dispersar)
+# frente a la misma cartera en una sola base.
+#
+#   cd backend
+#   python -m benchmarks.shards                                     # 2000 clientes en 1, 2 y 4 shards
+#   python -m benchmarks.shards --shards 1,4,8 --clientes 8000 --repeticiones 30 --salida shards.json
+#
+# - Por disposición, la cartera se reparte en N archivos generados por separado (clientes/N cada uno,
+#   semilla distinta por shard). Los ids se repiten entre archivos: solo se miden lecturas, no se
+#   enruta por id.
+# - Por endpoint (/cuotas/resumen-prestamos, /cuotas, /clientes y el preview de recordatorios):
+#   filas devueltas, p50/p99 en ms y aceleración frente a una sola base.
+# - Las consultas de cada shard corren en hilos aparte (DB_SHARD_HILOS); SQLite suelta el GIL mientras
+#   consulta, así que la ganancia depende de los núcleos libres.
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks import generador
+from benchmarks.ejecutar import _meta, _percentil
+
+# Igual que benchmarks.ejecutar: sin correo ni tareas en segundo plano
+for _k, _v in {"MAIL_SEND_ON_CREATE": "off", "EMAIL_ON_LOAN_CREATED": "off", "MORA_REFRESH_AUTO": "off",
+               "SMTP_HOST": "", "SQL_TRACE": "off", "REPLICA_AUTO": "off"}.items():
+    os.environ[_k] = _v
+
+RUTAS = ("/cuotas/resumen-prestamos", "/cuotas", "/clientes",
+         "/cuotas/recordatorios/preview?dias=1&incluir_sin_email=true")
+
+
+def _disposicion(trabajo: str, params: generador.Parametros, n: int) -> Dict[str, str]:
+    """Genera los N archivos de la cartera repartida; nombre de shard -> ruta."""
+    rutas: Dict[str, str] = {}
+    total = params.clientes
+    for k in range(n):
+        ruta = os.path.join(trabajo, f"n{n}_s{k}.db")
+        parte = generador.Parametros(**{**params.__dict__, "clientes": total // n + (1 if k < total % n else 0),
+                                        "semilla": params.semilla + k})
+        generador.generar(ruta, parte)
+        rutas[f"s{k}"] = ruta
+    return rutas
+
+
+def _medir(cliente, ruta: str, repeticiones: int) -> Dict[str, Any]:
+    filas = len(cliente.get(ruta).json())  # calentamiento: conexiones y sentencias
+    tiempos: List[float] = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        r = cliente.get(ruta)
+        tiempos.append((time.perf_counter() - t0) * 1000.0)
+        if r.status_code != 200:
+            raise RuntimeError(f"{ruta}: {r.status_code} {r.text[:200]}")
+    ordenados = sorted(tiempos)
+    return {"filas": filas, "p50_ms": round(_percentil(ordenados, 50), 2), "p99_ms": round(_percentil(ordenados, 99), 2)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de consultas dispersas entre shards")
+    ap.add_argument("--shards", default="1,2,4", help="Cantidades de shards a probar (1 = una sola base)")
+    ap.add_argument("--repeticiones", type=int, default=20, help="Llamadas por endpoint y disposición")
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    generador.agregar_argumentos(ap)
+    ap.set_defaults(clientes=2000)
+    args = ap.parse_args(argv)
+    niveles = [int(x) for x in args.shards.split(",") if x.strip()]
+    args.iteraciones, args.calentamiento = args.repeticiones, 1
+
+    from fastapi.testclient import TestClient
+    from app import deps
+    from app.main import app
+
+    trabajo = tempfile.mkdtemp(prefix="shards_")
+    params = generador._args_a_parametros(args)
+    resultado: Dict[str, Any] = {
+        "meta": {**_meta(args), "clientes": params.clientes, "hilos_dispersion": deps.HILOS_DISPERSION},
+        "disposiciones": {},
+    }
+    previo = (deps.DB_PATH, deps.SHARDS_CONF)
+    try:
+        for n in niveles:
+            rutas = _disposicion(trabajo, params, n)
+            deps.cerrar_pool()
+            deps.DB_PATH = rutas["s0"]
+            deps.configurar_shards(",".join(f"{k}={r}" for k, r in rutas.items()) if n > 1 else "")
+            cliente = TestClient(app, raise_server_exceptions=False)
+            medidas = {ruta: _medir(cliente, ruta, args.repeticiones) for ruta in RUTAS}
+            resultado["disposiciones"][str(n)] = medidas
+            for ruta, m in medidas.items():
+                print(f"[{n} shard(s)] {ruta:<60} {m['filas']:>7} filas  p50={m['p50_ms']} p99={m['p99_ms']} ms",
+                      file=sys.stderr)
+        if "1" in resultado["disposiciones"]:
+            base = resultado["disposiciones"]["1"]
+            resultado["aceleracion_p50"] = {
+                n: {ruta: round(base[ruta]["p50_ms"] / m["p50_ms"], 2) for ruta, m in medidas.items() if m["p50_ms"]}
+                for n, medidas in resultado["disposiciones"].items() if n != "1"
+            }
+    finally:
+        deps.cerrar_pool()
+        deps.DB_PATH = previo[0]
+        deps.configurar_shards(previo[1])
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# backend/tests/conftest.py
+# Fixtures de pytest para el backend.
+# - La cartera sintética (benchmarks.generador) se genera una vez por sesión; cada test trabaja sobre
+#   una copia fresca: deps.DB_PATH apunta a ella y el pool se vacía al entrar y al salir.
+# - Sin correo ni tareas en segundo plano (mismas variables que los benchmarks); el TestClient no corre
+#   el startup: get_conn migra cada archivo la primera vez que lo abre.
+#
+#   cd backend
+#   pip install -r requirements-dev.txt
+#   python -m pytest -q tests
+from __future__ import annotations
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+for _k, _v in {"MAIL_SEND_ON_CREATE": "off", "EMAIL_ON_LOAN_CREATED": "off", "MORA_REFRESH_AUTO": "off",
+               "SMTP_HOST": "", "SQL_TRACE": "off", "REPLICA_AUTO": "off", "DB_SHARDS": "",
+               "DB_ESCRITOR_SOCKET": ""}.items():
+    os.environ[_k] = _v
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.gettempdir(), "pytest_prestamos_sin_usar.db"))
+
+import pytest  # noqa: E402
+
+from benchmarks import generador  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def cartera(tmp_path_factory) -> str:
+    ruta = str(tmp_path_factory.mktemp("cartera") / "cartera.db")
+    generador.generar(ruta, generador.Parametros(clientes=40, semilla=7))
+    return ruta
+
+
+@pytest.fixture
+def db(cartera, tmp_path) -> str:
+    """Copia fresca de la cartera como base activa (deps.DB_PATH)."""
+    from app import deps
+
+    ruta = str(tmp_path / "prestamos.db")
+    shutil.copyfile(cartera, ruta)
+    previo = deps.DB_PATH
+    deps.cerrar_pool()
+    deps.DB_PATH = ruta
+    try:
+        yield ruta
+    finally:
+        deps.cerrar_pool()
+        deps.DB_PATH = previo
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def consultar(db: str, sql: str, params=()):
+    """Lectura directa del archivo (fuera del pool de la app) para preparar y verificar tests."""
+    conn = sqlite3.connect(db)
+    conn.row_factory = sqlite3.Row
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def cuotas_abonables(db):
+    """
+    Ids de cuotas PENDIENTES con interés sin cubrir, una por préstamo y con capital pendiente de sobra
+    para abonos chicos. Abrir una conexión de la app deja la base migrada.
+    """
+    from app import deps
+
+    with deps.get_conn():
+        pass
+    filas = consultar(db, """
+        SELECT MIN(c.id) AS id FROM cuotas c JOIN prestamos p ON p.id = c.id_prestamo
+        WHERE c.estado = 'PENDIENTE' AND COALESCE(c.interes_pagado, 0) + 0.005 < c.interes_a_pagar
+          AND p.capital_pendiente > 100
+        GROUP BY c.id_prestamo ORDER BY c.id_prestamo;
+    """)
+    ids = [r["id"] for r in filas]
+    assert len(ids) >= 4, "la cartera de prueba debería tener préstamos con cuotas pendientes"
+    return ids
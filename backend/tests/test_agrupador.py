@@ -0,0 +1,84 @@
+# backend/tests/test_agrupador.py
+# Commit agrupado (app.agrupador): una operación fallida no arrastra a las de su lote, y un escritor
+# trabado responde 503 en vez de dejar al llamador esperando para siempre.
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import consultar
+from app import agrupador, deps, metrics
+
+pytestmark = pytest.mark.skipif(not agrupador.ACTIVO, reason="COMMIT_AGRUPADO=off")
+
+
+@pytest.fixture
+def tabla(db):
+    with deps.get_conn() as conn, deps.escritura(conn):
+        conn.execute("CREATE TABLE prueba_agrupador (x INTEGER NOT NULL);")
+    return db
+
+
+def _insertar(x, falla=False):
+    def fn(conn):
+        conn.execute("INSERT INTO prueba_agrupador (x) VALUES (?);", (x,))
+        if falla:
+            raise HTTPException(status_code=409, detail=f"falla {x}")
+        return x
+    return fn
+
+
+def _bloquear(liberar: threading.Event, dentro: threading.Event):
+    def fn(conn):
+        dentro.set()
+        liberar.wait(10)
+        return "bloqueo"
+    return fn
+
+
+def test_fallo_no_revierte_el_resto_del_lote(tabla):
+    liberar, dentro = threading.Event(), threading.Event()
+    lotes_antes, ops_antes = metrics.COMMIT_AGRUPADO_LOTE.resumen()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        primera = pool.submit(agrupador.ejecutar, _bloquear(liberar, dentro))
+        assert dentro.wait(5)
+        # Con el escritor ocupado estas tres se encolan y salen juntas en el lote siguiente
+        futs = [pool.submit(agrupador.ejecutar, _insertar(x, falla=(x == 2))) for x in (1, 2, 3)]
+        while agrupador._cola.qsize() < 3:
+            threading.Event().wait(0.005)
+        liberar.set()
+        assert primera.result(5) == "bloqueo"
+        assert futs[0].result(5) == 1 and futs[2].result(5) == 3
+        with pytest.raises(HTTPException) as e:
+            futs[1].result(5)
+    assert e.value.status_code == 409
+
+    lotes, ops = metrics.COMMIT_AGRUPADO_LOTE.resumen()
+    assert (lotes - lotes_antes, ops - ops_antes) == (2, 4)
+    assert sorted(r["x"] for r in consultar(tabla, "SELECT x FROM prueba_agrupador;")) == [1, 3]
+
+
+def test_escritor_trabado_responde_503(tabla, monkeypatch):
+    liberar, dentro = threading.Event(), threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        trabada = pool.submit(agrupador.ejecutar, _bloquear(liberar, dentro))  # espera con el límite normal
+        assert dentro.wait(5)
+        monkeypatch.setattr(agrupador, "ESPERA_S", 0.2)
+        try:
+            with pytest.raises(HTTPException) as e:
+                agrupador.ejecutar(_insertar(7))
+        finally:
+            liberar.set()
+        trabada.result(5)
+    assert e.value.status_code == 503
+    assert e.value.headers == {"Retry-After": "1"}
+
+    # No se canceló: al destrabarse el escritor la operación se confirma igual
+    for _ in range(200):
+        if consultar(tabla, "SELECT x FROM prueba_agrupador;"):
+            break
+        threading.Event().wait(0.01)
+    assert [r["x"] for r in consultar(tabla, "SELECT x FROM prueba_agrupador;")] == [7]
@@ -0,0 +1,143 @@
+# backend/tests/test_idempotencia.py
+# Idempotency-Key (app.idempotencia): replay, conflicto de clave y respuesta guardada en la misma
+# transacción que la mutación (un fallo entre el commit y el guardado final no la repite).
+from __future__ import annotations
+
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from conftest import consultar
+from app import deps, idempotencia
+
+
+def _abonos(db) -> int:
+    return consultar(db, "SELECT COUNT(*) AS n FROM abonos_capital;")[0]["n"]
+
+
+def _caida(*a, **kw):
+    raise RuntimeError("el proceso muere antes de guardar la respuesta final")
+
+
+def test_replay_no_repite_el_abono(client, db, cuotas_abonables):
+    url = f"/cuotas/{cuotas_abonables[0]}/abono-capital"
+    antes = _abonos(db)
+    r1 = client.post(url, json={"monto": 10}, headers={"Idempotency-Key": "abono-1"})
+    r2 = client.post(url, json={"monto": 10}, headers={"Idempotency-Key": "abono-1"})
+    assert r1.status_code == r2.status_code == 200, r1.text
+    assert r2.content == r1.content
+    assert r2.headers["idempotency-replayed"] == "true"
+    assert r2.headers["content-type"] == r1.headers["content-type"]
+    assert "idempotency-replayed" not in r1.headers
+    assert _abonos(db) == antes + 1
+
+
+def test_clave_reutilizada_con_otra_peticion(client, db, cuotas_abonables):
+    a, b = cuotas_abonables[:2]
+    antes = _abonos(db)
+    assert client.post(f"/cuotas/{a}/abono-capital", json={"monto": 10},
+                       headers={"Idempotency-Key": "k"}).status_code == 200
+    otro_cuerpo = client.post(f"/cuotas/{a}/abono-capital", json={"monto": 11}, headers={"Idempotency-Key": "k"})
+    otra_ruta = client.post(f"/cuotas/{b}/abono-capital", json={"monto": 10}, headers={"Idempotency-Key": "k"})
+    assert otro_cuerpo.status_code == otra_ruta.status_code == 422
+    assert _abonos(db) == antes + 1
+
+
+def test_fallo_tras_el_commit_agrupado_no_repite(client, db, cuotas_abonables, monkeypatch):
+    url = f"/cuotas/{cuotas_abonables[0]}/abono-capital"
+    antes = _abonos(db)
+    monkeypatch.setattr(idempotencia, "_guardar", _caida)
+    assert client.post(url, json={"monto": 10}, headers={"Idempotency-Key": "caida"}).status_code == 500
+    monkeypatch.undo()
+
+    r = client.post(url, json={"monto": 10}, headers={"Idempotency-Key": "caida"})
+    assert r.status_code == 200, r.text
+    assert r.headers["idempotency-replayed"] == "true"
+    assert r.json()["monto"] == 10.0 and "_log" not in r.json()
+    assert _abonos(db) == antes + 1
+
+
+def test_fallo_tras_escritura_no_repite(client, db, monkeypatch):
+    antes = consultar(db, "SELECT COUNT(*) AS n FROM clientes;")[0]["n"]
+    monkeypatch.setattr(idempotencia, "_guardar", _caida)
+    cuerpo = {"nombre": "Cliente Idempotente", "email": "x@y.com"}
+    assert client.post("/clientes", json=cuerpo, headers={"Idempotency-Key": "alta"}).status_code == 500
+    monkeypatch.undo()
+
+    r = client.post("/clientes", json=cuerpo, headers={"Idempotency-Key": "alta"})
+    assert r.status_code == 409
+    assert "ya se aplicó" in r.json()["detail"]
+    assert consultar(db, "SELECT COUNT(*) AS n FROM clientes;")[0]["n"] == antes + 1
+
+
+def test_replay_devuelve_todas_las_cabeceras(db):
+    mini = FastAPI()
+    mini.add_middleware(idempotencia.IdempotenciaMiddleware)
+    llamadas = []
+
+    @mini.post("/eco")
+    def eco(response: Response):
+        llamadas.append(1)
+        response.status_code = 201
+        response.headers["Location"] = "/eco/1"
+        response.headers["X-Version"] = "7"
+        response.set_cookie("a", "1")
+        response.set_cookie("b", "2")
+        return {"ok": True}
+
+    c = TestClient(mini)
+    r1 = c.post("/eco", json={}, headers={"Idempotency-Key": "eco"})
+    r2 = c.post("/eco", json={}, headers={"Idempotency-Key": "eco"})
+    assert len(llamadas) == 1
+    assert (r1.status_code, r2.status_code) == (201, 201)
+    assert r2.content == r1.content
+    for k in ("location", "x-version", "content-type"):
+        assert r2.headers[k] == r1.headers[k]
+    assert r2.headers.get_list("set-cookie") == r1.headers.get_list("set-cookie")
+    assert len(r2.headers.get_list("set-cookie")) == 2
+
+
+def _app_que_falla_tras_confirmar():
+    mini = FastAPI()
+    mini.add_middleware(idempotencia.IdempotenciaMiddleware)
+
+    @mini.post("/alta")
+    def alta(modo: str):
+        with deps.get_conn() as conn, deps.escritura(conn):
+            conn.execute("CREATE TABLE IF NOT EXISTS prueba_alta (x INTEGER);")
+            conn.execute("INSERT INTO prueba_alta (x) VALUES (1);")
+        if modo == "excepcion":
+            raise RuntimeError("falla después del commit")
+        return JSONResponse(status_code=502, content={"detail": "aviso externo caído"})
+
+    return mini
+
+
+def test_5xx_tras_confirmar_queda_como_respuesta(db):
+    c = TestClient(_app_que_falla_tras_confirmar(), raise_server_exceptions=False)
+    r1 = c.post("/alta?modo=respuesta", headers={"Idempotency-Key": "k5"})
+    r2 = c.post("/alta?modo=respuesta", headers={"Idempotency-Key": "k5"})
+    assert (r1.status_code, r2.status_code) == (502, 502)
+    assert r2.content == r1.content and r2.headers["idempotency-replayed"] == "true"
+
+    r3 = c.post("/alta?modo=excepcion", headers={"Idempotency-Key": "kx"})
+    r4 = c.post("/alta?modo=excepcion", headers={"Idempotency-Key": "kx"})
+    assert (r3.status_code, r4.status_code) == (500, 500)
+    assert "después de aplicar" in r4.json()["detail"]
+    assert consultar(db, "SELECT COUNT(*) AS n FROM prueba_alta;")[0]["n"] == 2
+
+
+def test_5xx_sin_confirmar_libera_la_clave(db):
+    mini = FastAPI()
+    mini.add_middleware(idempotencia.IdempotenciaMiddleware)
+    llamadas = []
+
+    @mini.post("/falla")
+    def falla():
+        llamadas.append(1)
+        return JSONResponse(status_code=503, content={"detail": "ocupado"})
+
+    c = TestClient(mini)
+    for _ in range(2):
+        assert c.post("/falla", headers={"Idempotency-Key": "libre"}).status_code == 503
+    assert len(llamadas) == 2
@@ -0,0 +1,134 @@
+# backend/tests/test_lote.py
+# POST /cuotas/lote: cada operación en su SAVEPOINT; con atomico=true un error revierte el lote entero.
+# Con shards el lote se parte por shard; atomico=true entre shards se rechaza.
+from __future__ import annotations
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import consultar
+from app.routers import cuotas as rc
+
+
+def _estado(db, cuota_ids):
+    filas = consultar(db, f"""
+        SELECT c.id, c.estado, c.interes_pagado, c.abono_capital, p.capital_abonado
+        FROM cuotas c JOIN prestamos p ON p.id = c.id_prestamo
+        WHERE c.id IN ({','.join('?' * len(cuota_ids))}) ORDER BY c.id;
+    """, cuota_ids)
+    abonos = consultar(db, "SELECT COUNT(*) AS n FROM abonos_capital;")[0]["n"]
+    return [dict(f) for f in filas], abonos
+
+
+def test_fallo_revierte_solo_su_operacion(client, db, cuotas_abonables):
+    a, b, c = cuotas_abonables[:3]
+    _, abonos_antes = _estado(db, [a, b, c])
+    r = client.post("/cuotas/lote", json={"operaciones": [
+        {"tipo": "abono", "cuota_id": a, "monto": 5},
+        {"tipo": "abono", "cuota_id": b, "monto": 10_000_000},  # excede el capital: 422
+        {"tipo": "pago", "cuota_id": c, "interes_pagado": 1},
+        {"tipo": "pago", "cuota_id": 999999, "interes_pagado": 1},  # no existe: 404
+    ]})
+    assert r.status_code == 200, r.text
+    out = r.json()
+    assert (out["aplicadas"], out["fallidas"]) == (2, 2)
+    assert [x["ok"] for x in out["resultados"]] == [True, False, True, False]
+    assert [x.get("status_code") for x in out["resultados"]] == [None, 422, None, 404]
+
+    filas, abonos = _estado(db, [a, b, c])
+    por_id = {f["id"]: f for f in filas}
+    assert abonos == abonos_antes + 1
+    assert por_id[a]["abono_capital"] >= 5
+    assert por_id[c]["estado"] == "PAGADO"
+    assert por_id[c]["interes_pagado"] == 1
+
+
+def test_fallo_tras_escribir_revierte_su_savepoint(client, db, cuotas_abonables, monkeypatch):
+    a, b = cuotas_abonables[:2]
+    original = rc._aplicar_abono
+
+    def _abono_que_falla_al_final(conn, m, cuota_id, payload):
+        res = original(conn, m, cuota_id, payload)  # abonos_capital, saldo y cuota ya escritos
+        if cuota_id == b:
+            raise HTTPException(status_code=409, detail="falla después de escribir")
+        return res
+
+    monkeypatch.setattr(rc, "_aplicar_abono", _abono_que_falla_al_final)
+    antes_a, antes_b = _estado(db, [a]), _estado(db, [b])[0]
+    r = client.post("/cuotas/lote", json={"operaciones": [
+        {"tipo": "abono", "cuota_id": b, "monto": 7},
+        {"tipo": "abono", "cuota_id": a, "monto": 3},
+    ]})
+    assert r.status_code == 200, r.text
+    assert [x["ok"] for x in r.json()["resultados"]] == [False, True]
+
+    filas_b, abonos = _estado(db, [b])
+    assert filas_b == antes_b  # la escritura de la operación fallida se deshizo
+    assert abonos == antes_a[1] + 1  # solo el abono de 'a'
+    assert _estado(db, [a])[0][0]["abono_capital"] == (antes_a[0][0]["abono_capital"] or 0) + 3
+
+
+def test_atomico_revierte_todo(client, db, cuotas_abonables):
+    a, b, c = cuotas_abonables[:3]
+    antes = _estado(db, [a, b, c])
+    r = client.post("/cuotas/lote", json={"atomico": True, "operaciones": [
+        {"tipo": "abono", "cuota_id": a, "monto": 5},
+        {"tipo": "pago", "cuota_id": c, "interes_pagado": 1},
+        {"tipo": "abono", "cuota_id": b, "monto": 10_000_000},
+    ]})
+    assert r.status_code == 422, r.text
+    assert r.json()["detail"].startswith(f"Operación 2 (cuota {b})")
+    assert _estado(db, [a, b, c]) == antes
+
+
+@pytest.fixture
+def dos_shards(db):
+    """La cartera como shard 'norte' y un shard 'sur' vacío junto a ella (rutas por defecto de deps)."""
+    from app import deps
+
+    previo = deps.SHARDS_CONF
+    deps.cerrar_pool()
+    deps.configurar_shards("norte,sur")
+    try:
+        yield deps.rutas()
+    finally:
+        deps.cerrar_pool()
+        deps.configurar_shards(previo)
+
+
+def _cuota_en_sur(client):
+    cliente = client.post("/clientes", json={"nombre": "Cliente Sur"}, headers={"X-Sucursal": "sur"})
+    assert cliente.status_code == 200, cliente.text
+    prestamo = client.post("/prestamos", json={"cod_cli": cliente.json()["codigo"], "monto": 900, "tasa_interes": 2,
+                                               "modalidad": "Mensual", "num_cuotas": 3, "fecha_inicio": "2026-10-01"})
+    assert prestamo.status_code == 200, prestamo.text
+    return min(c["id"] for c in client.get(f"/cuotas?id_prestamo={prestamo.json()['id']}").json())
+
+
+def test_lote_con_shards_aplica_cada_operacion_en_su_shard(client, dos_shards, cuotas_abonables):
+    norte, sur = cuotas_abonables[0], _cuota_en_sur(client)
+    r = client.post("/cuotas/lote", json={"operaciones": [
+        {"tipo": "abono", "cuota_id": sur, "monto": 4},
+        {"tipo": "abono", "cuota_id": norte, "monto": 5},
+        {"tipo": "pago", "cuota_id": sur, "interes_pagado": 1},
+    ]})
+    assert r.status_code == 200, r.text
+    out = r.json()
+    assert (out["aplicadas"], out["fallidas"]) == (3, 0), out
+    assert [x["indice"] for x in out["resultados"]] == [0, 1, 2]
+
+    assert _estado(dos_shards["norte"], [norte])[0][0]["abono_capital"] >= 5
+    fila_sur = _estado(dos_shards["sur"], [sur])[0][0]
+    assert (fila_sur["abono_capital"], fila_sur["interes_pagado"]) == (4, 1)
+
+
+def test_lote_atomico_entre_shards_se_rechaza(client, dos_shards, cuotas_abonables):
+    norte, sur = cuotas_abonables[0], _cuota_en_sur(client)
+    antes = _estado(dos_shards["norte"], [norte]), _estado(dos_shards["sur"], [sur])
+    r = client.post("/cuotas/lote", json={"atomico": True, "operaciones": [
+        {"tipo": "abono", "cuota_id": norte, "monto": 5},
+        {"tipo": "abono", "cuota_id": sur, "monto": 4},
+    ]})
+    assert r.status_code == 422, r.text
+    assert "varios shards" in r.json()["detail"]
+    assert (_estado(dos_shards["norte"], [norte]), _estado(dos_shards["sur"], [sur])) == antes
@@ -0,0 +1,48 @@
+# backend/tests/test_presupuesto_sql.py
+# Presupuesto de sentencias SQL por endpoint (app.sqltrace): una regresión N+1 falla aquí.
+# La cartera de prueba tiene decenas de préstamos, así que una consulta por préstamo o por cuota
+# excede cualquiera de estos presupuestos.
+from __future__ import annotations
+
+import pytest
+
+from app import deps, sqltrace
+
+
+def test_resumen_prestamos(client):
+    resp = sqltrace.assert_query_budget(client, "GET", "/cuotas/resumen-prestamos", 2)
+    assert resp.status_code == 200
+    assert len(resp.json()) > 20
+
+
+@pytest.mark.parametrize("query", ["", "?estado=PENDIENTE", "?vencidas=true", "?id_prestamo=3"])
+def test_listar_cuotas(client, query):
+    resp = sqltrace.assert_query_budget(client, "GET", f"/cuotas{query}", 2)
+    assert resp.status_code == 200
+
+
+def test_obtener_cuota(client):
+    resp = sqltrace.assert_query_budget(client, "GET", "/cuotas/1", 2)
+    assert resp.status_code == 200
+
+
+def test_pago(client, cuotas_abonables):
+    resp = sqltrace.assert_query_budget(client, "POST", f"/cuotas/{cuotas_abonables[0]}/pago", 6,
+                                        json={"interes_pagado": 1})
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["estado"] == "PAGADO"
+
+
+def test_abono(client, cuotas_abonables):
+    resp = sqltrace.assert_query_budget(client, "POST", f"/cuotas/{cuotas_abonables[0]}/abono-capital", 6,
+                                        json={"monto": 10})
+    assert resp.status_code == 200, resp.text
+
+
+def test_presupuesto_detecta_n_mas_1(db):
+    with deps.get_conn() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM prestamos;")]
+        with pytest.raises(AssertionError, match="N\\+1"):
+            with sqltrace.presupuesto_sql(conn=conn):
+                for i in ids:
+                    conn.execute("SELECT COUNT(*) FROM cuotas WHERE id_prestamo=?;", (i,)).fetchone()
@@ -0,0 +1,66 @@
+# backend/tests/test_saldos.py
+# Saldos corrientes (prestamos.capital_abonado / capital_pendiente, app.saldos) frente al libro
+# 'abonos_capital': tras abonos confirmados y revertidos la conciliación no encuentra descuadres.
+from __future__ import annotations
+
+from conftest import consultar
+
+from app import deps, saldos
+
+
+def _saldo(db, cuota_id):
+    return consultar(db, """
+        SELECT p.id, p.capital_abonado, p.capital_pendiente,
+               (SELECT COUNT(*) FROM abonos_capital a WHERE a.id_prestamo = p.id) AS abonos
+        FROM prestamos p JOIN cuotas c ON c.id_prestamo = p.id WHERE c.id = ?;
+    """, (cuota_id,))[0]
+
+
+def test_abonos_cuadran_con_el_libro(client, db, cuotas_abonables):
+    a, b, c = cuotas_abonables[:3]
+    antes = _saldo(db, a)
+    for cuota_id, monto in ((a, 10), (a, 2.5), (b, 40)):
+        r = client.post(f"/cuotas/{cuota_id}/abono-capital", json={"monto": monto})
+        assert r.status_code == 200, r.text
+
+    # Abono revertido: el lote atómico falla en la segunda operación y deshace la primera
+    previo_c = _saldo(db, c)
+    r = client.post("/cuotas/lote", json={"atomico": True, "operaciones": [
+        {"tipo": "abono", "cuota_id": c, "monto": 25},
+        {"tipo": "abono", "cuota_id": 999999, "monto": 1},
+    ]})
+    assert r.status_code == 404, r.text
+    assert dict(_saldo(db, c)) == dict(previo_c)
+
+    # Abono rechazado por exceder el capital pendiente: no toca nada
+    r = client.post(f"/cuotas/{b}/abono-capital", json={"monto": 10_000_000})
+    assert r.status_code == 422, r.text
+
+    despues = _saldo(db, a)
+    assert despues["capital_abonado"] - antes["capital_abonado"] == 12.5
+    assert despues["abonos"] == antes["abonos"] + 2
+
+    with deps.get_conn() as conn:
+        res = saldos.conciliar(conn)
+    assert res["descuadrados"] == 0, res["detalle"]
+    assert client.get("/mantenimiento/saldos/conciliacion").json()["descuadrados"] == 0
+
+
+def test_conciliar_corrige_en_transaccion(client, db, cuotas_abonables):
+    prestamo_id = _saldo(db, cuotas_abonables[0])["id"]
+    with deps.get_conn() as conn, deps.escritura(conn):
+        conn.execute("UPDATE prestamos SET capital_abonado = capital_abonado + 7 WHERE id = ?;", (prestamo_id,))
+
+    r = client.post("/mantenimiento/saldos/conciliacion")
+    assert r.status_code == 200, r.text
+    assert [d["id"] for d in r.json()["detalle"]] == [prestamo_id]
+    assert r.json()["corregidos"] == 1
+
+    # Confirmado: otra conexión (fuera del pool) ya ve el saldo corregido
+    fila = consultar(db, "SELECT capital_abonado, capital_pendiente, importe_credito FROM prestamos WHERE id = ?;",
+                     (prestamo_id,))[0]
+    libro = consultar(db, "SELECT COALESCE(SUM(monto), 0) AS s FROM abonos_capital WHERE id_prestamo = ?;",
+                      (prestamo_id,))[0]["s"]
+    assert abs(fila["capital_abonado"] - libro) < saldos.TOL
+    assert abs(fila["capital_pendiente"] - (fila["importe_credito"] - libro)) < saldos.TOL
+    assert client.get("/mantenimiento/saldos/conciliacion").json()["descuadrados"] == 0
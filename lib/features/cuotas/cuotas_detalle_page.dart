@@ -38,6 +38,20 @@ class _CuotasDetallePageState extends ConsumerState<CuotasDetallePage> {
   }
 
   Future<_DetalleData> _load() async {
+    // Una sola llamada (resumen + cuotas + estado); si el backend aún no la tiene, las de siempre
+    try {
+      final det = await service.obtenerDetallePrestamo(
+        widget.prestamoId,
+        secciones: const ['resumen', 'cuotas', 'estado'],
+      );
+      final e = ((det['estado'] as Map?)?['estado'] ?? '').toString();
+      return _DetalleData(
+        resumen: PrestamoResumen.fromJson(det['resumen'] as Map<String, dynamic>),
+        cuotas: List<Map<String, dynamic>>.from(det['cuotas'] as List),
+        estadoCanonico: e.isNotEmpty ? e.toUpperCase() : null,
+      );
+    } catch (_) {}
+
     final raw = await service.obtenerResumenDePrestamo(widget.prestamoId);
     final resumenJson = (raw['resumen'] as Map<String, dynamic>);
     final resumen = PrestamoResumen.fromJson(resumenJson);
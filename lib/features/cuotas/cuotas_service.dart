@@ -115,6 +115,29 @@ class CuotasService {
     }
   }
 
+  /// GET /prestamos/{id}/detalle?secciones=...
+  /// Resumen, cuotas, estado canónico, plan y abonos en una sola llamada (misma foto de la BD).
+  /// Devuelve solo las secciones pedidas: { "resumen": {...}, "cuotas": [...], "estado": {...}, ... }
+  Future<Map<String, dynamic>> obtenerDetallePrestamo(
+    int prestamoId, {
+    List<String>? secciones,
+  }) async {
+    try {
+      final res = await dio.get(
+        '/prestamos/$prestamoId/detalle',
+        queryParameters: {
+          if (secciones != null && secciones.isNotEmpty) 'secciones': secciones.join(','),
+        },
+      );
+      if (res.statusCode != 200 || res.data is! Map) {
+        throw Exception('Respuesta inesperada: ${res.statusCode} ${res.data}');
+      }
+      return Map<String, dynamic>.from(res.data as Map);
+    } on DioException catch (e) {
+      _throwDio(e);
+    }
+  }
+
   /// POST /cuotas/{cuotaId}/pago
   /// Retorna la cuota actualizada.
   Future<Cuota> pagarCuota(
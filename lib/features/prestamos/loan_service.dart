@@ -54,6 +54,17 @@ class PrestamosApi {
     return _toJsonMap(resp.data);
   }
 
+  // Detalle compuesto: plan + estado (y demás secciones) en una sola llamada
+  Future<Map<String, dynamic>> getDetalleByPrestamoId(int id, {List<String>? secciones}) async {
+    final resp = await _dio.get(
+      '/prestamos/$id/detalle',
+      queryParameters: <String, dynamic>{
+        if (secciones != null && secciones.isNotEmpty) 'secciones': secciones.join(','),
+      },
+    );
+    return _toJsonMap(resp.data);
+  }
+
   // ================== crear AUTOMÁTICO ==================
   Future<Map<String, dynamic>> create({
     required String codCli,
@@ -47,7 +47,19 @@ class _LoanDetailPageUIState extends ConsumerState<LoanDetailPageUI>
 
   Future<Map<String, dynamic>> _fetch() async {
     final api = ref.read(prestamosApiProvider);
-    
+
+    // Plan + estado canónico en una sola llamada; si falla, las dos de siempre
+    try {
+      final det = await api.getDetalleByPrestamoId(widget.id, secciones: const ['plan', 'estado']);
+      final plan = det['plan'];
+      if (plan is Map) {
+        final res = Map<String, dynamic>.from(plan);
+        final s = ((det['estado'] as Map?)?['estado'] ?? '').toString();
+        if (s.isNotEmpty) res['__estadoCanonico'] = s.toUpperCase();
+        return res;
+      }
+    } catch (_) {}
+
 final res = await api.getResumenByPrestamoId(widget.id); // usa RESUMEN
 try {
   final est = await api.getEstadoByPrestamoId(widget.id);